@@ -0,0 +1,559 @@
+"""
+Generador de carga para los servicios de libros.
+
+Lanza una mezcla configurable de queries y comandos contra micro.py
+(reporte5), microservicioCQRS.py (reporte6) o microserviciosCQRS.py
+(reporte7) y mide la latencia de cada endpoint.
+
+Dos modelos de carga:
+
+- closed: `--concurrency` clientes que envían una petición tras otra
+  (opcionalmente limitados a `--rps` en total). Mide el throughput máximo
+  con esa concurrencia.
+- open: las peticiones llegan a `--rps` fijas (o Poisson con
+  `--arrival poisson`) aunque el servicio se atrase. La latencia se mide
+  desde el instante programado, así que la cola de espera cuenta (sin
+  "coordinated omission").
+
+Con `--service` el servicio se arranca en este proceso contra una BD
+embebida sembrada (standin_db.py, sqlite con la API de MySQLdb); con
+`--url` se ataca un servicio ya desplegado y las muestras (ISBNs,
+autores, formatos) se leen de su propia API.
+
+El resultado (p50/p95/p99 por endpoint, códigos de estado, bytes y
+throughput) se imprime y se guarda en JSON con `--out`; `--compare`
+muestra la diferencia con una ejecución anterior.
+
+    python loadgen.py --service reporte7 --model closed --concurrency 16 --duration 30 --out r7.json
+    python loadgen.py --service reporte6 --model open --rps 300 --mix isbn=60,page=20,insert=10,update=10
+    python loadgen.py --url http://localhost:5000 --token <jwt> --compare r7.json
+"""
+
+import argparse
+import http.client
+import importlib
+import json
+import logging
+import os
+import platform
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# servicio -> (directorio, módulo)
+SERVICES = {
+    'reporte5': ('reporte5', 'micro'),
+    'reporte6': ('reporte6', 'microservicioCQRS'),
+    'reporte7': ('reporte7/microLibros', 'microserviciosCQRS'),
+}
+
+DEFAULT_MIX = 'isbn=45,author=15,format=5,page=15,batch=5,insert=5,update=10'
+BATCH_SIZE = 20   # ISBNs por petición de la operación batch
+PAGE_SIZE = 100
+
+
+# --- Operaciones ---
+
+def _quote(value):
+    return urllib.parse.quote(str(value), safe='')
+
+
+class Operations:
+    """
+    Construye las peticiones de cada operación de la mezcla.
+
+    Cada operación devuelve (método, ruta, cuerpo JSON o None).
+    """
+
+    def __init__(self, samples, run_id):
+        self.samples = samples
+        self.run_id = run_id
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _next_isbn(self):
+        with self._lock:
+            self._counter += 1
+            return f"LT{self.run_id}{self._counter:08d}"
+
+    def catalog(self, rng):
+        return 'GET', '/api/books', None
+
+    def page(self, rng):
+        return 'GET', f'/api/books?limit={PAGE_SIZE}', None
+
+    def isbn(self, rng):
+        return 'GET', f"/api/books/isbn/{_quote(rng.choice(self.samples['isbns']))}", None
+
+    def batch(self, rng):
+        isbns = rng.sample(self.samples['isbns'], min(BATCH_SIZE, len(self.samples['isbns'])))
+        return 'GET', f"/api/books/isbn?ids={_quote(','.join(isbns))}", None
+
+    def author(self, rng):
+        return 'GET', f"/api/books/author/{_quote(rng.choice(self.samples['authors']))}", None
+
+    def format(self, rng):
+        return 'GET', f"/api/books/format/{_quote(rng.choice(self.samples['formats']))}", None
+
+    def search(self, rng):
+        return 'GET', f"/api/books/search?q={_quote(rng.choice(self.samples['words']))}", None
+
+    def insert(self, rng):
+        book = {
+            'isbn': self._next_isbn(),
+            'title': ' '.join(rng.choice(self.samples['words']) for _ in range(3)).capitalize(),
+            'year': rng.randint(1950, 2025),
+            'price': round(rng.uniform(5, 60), 2),
+            'stock': rng.randint(0, 200),
+            'genre': rng.choice(self.samples['genres']),
+            'format': rng.choice(self.samples['formats']),
+            'authors': rng.choice(self.samples['authors']),
+        }
+        return 'POST', '/api/books/insert', book
+
+    def update(self, rng):
+        isbn = rng.choice(self.samples['isbns'])
+        return 'PUT', f'/api/books/update/{_quote(isbn)}', {'stock': rng.randint(0, 200)}
+
+
+OPERATIONS = ('catalog', 'page', 'isbn', 'batch', 'author', 'format', 'search', 'insert', 'update')
+
+
+def parse_mix(spec):
+    """'isbn=60,page=40' -> [('isbn', 0.6), ('page', 1.0)] (pesos acumulados)."""
+    weights = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Operación desconocida: {name} (disponibles: {', '.join(OPERATIONS)})")
+        weights.append((name, float(weight or 1)))
+    total = sum(w for _, w in weights)
+    if total <= 0:
+        raise ValueError("La mezcla no tiene peso")
+    cumulative, acc = [], 0.0
+    for name, weight in weights:
+        acc += weight / total
+        cumulative.append((name, acc))
+    return cumulative
+
+
+def pick(mix, rng):
+    r = rng.random()
+    for name, threshold in mix:
+        if r < threshold:
+            return name
+    return mix[-1][0]
+
+
+# --- Cliente HTTP (una conexión keep-alive por hilo) ---
+
+class Client:
+    def __init__(self, base_url, headers, timeout):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.https = parsed.scheme == 'https'
+        self.headers = headers
+        self.timeout = timeout
+        self._conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None):
+        """Devuelve (status, bytes del cuerpo); status 0 si falla la conexión."""
+        headers = dict(self.headers)
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                self._conn.request(method, path, body=data, headers=headers)
+                response = self._conn.getresponse()
+                size = len(response.read())
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response.status, size
+            except (OSError, http.client.HTTPException):
+                self.close()
+                # Una conexión keep-alive cerrada por el servidor se reintenta una vez
+                if attempt == 2:
+                    return 0, 0
+        return 0, 0
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# --- Recogida de resultados ---
+
+class Recorder:
+    """Latencias, códigos y bytes por operación (listas por hilo, sin lock por petición)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parts = []
+
+    def local(self):
+        part = {}
+        with self._lock:
+            self._parts.append(part)
+        return part
+
+    @staticmethod
+    def add(part, op, latency, status, size):
+        entry = part.get(op)
+        if entry is None:
+            entry = part[op] = {'latencies': [], 'status': {}, 'bytes': 0}
+        entry['latencies'].append(latency)
+        entry['status'][status] = entry['status'].get(status, 0) + 1
+        entry['bytes'] += size
+
+    def merged(self):
+        merged = {}
+        with self._lock:
+            parts = list(self._parts)
+        for part in parts:
+            for op, entry in part.items():
+                target = merged.setdefault(op, {'latencies': [], 'status': {}, 'bytes': 0})
+                target['latencies'].extend(entry['latencies'])
+                target['bytes'] += entry['bytes']
+                for status, n in entry['status'].items():
+                    target['status'][status] = target['status'].get(status, 0) + n
+        return merged
+
+
+def percentile(sorted_values, p):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(sorted_values) + 0.4999)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(merged, elapsed):
+    endpoints = {}
+    total = errors = 0
+    for op in sorted(merged):
+        entry = merged[op]
+        latencies = sorted(entry['latencies'])
+        count = len(latencies)
+        failed = sum(n for status, n in entry['status'].items() if status == 0 or status >= 500)
+        total += count
+        errors += failed
+        endpoints[op] = {
+            'count': count,
+            'errors': failed,
+            'rps': round(count / elapsed, 2) if elapsed else None,
+            'status': {str(k): v for k, v in sorted(entry['status'].items())},
+            'mean_bytes': round(entry['bytes'] / count) if count else 0,
+            'mean_ms': round(sum(latencies) / count * 1000, 3) if count else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3) if count else None,
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3) if count else None,
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3) if count else None,
+            'max_ms': round(latencies[-1] * 1000, 3) if count else None,
+        }
+    return {
+        'requests': total,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(total / elapsed, 2) if elapsed else None,
+    }, endpoints
+
+
+# --- Modelos de carga ---
+
+def _execute(client, operations, op, rng):
+    method, path, body = getattr(operations, op)(rng)
+    return client.request(method, path, body)
+
+
+def run_closed(args, mix, operations, make_client, recorder):
+    """`concurrency` clientes en bucle; con rps, cada petición espera su turno global."""
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    end = measure_from + args.duration
+    slots = iter(range(sys.maxsize))
+    slot_lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        client = make_client()
+        part = recorder.local()
+        try:
+            while True:
+                if args.rps:
+                    with slot_lock:
+                        slot = next(slots)
+                    scheduled = start + slot / args.rps
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                sent = time.perf_counter()
+                if sent >= end:
+                    return
+                op = pick(mix, rng)
+                status, size = _execute(client, operations, op, rng)
+                if sent >= measure_from:
+                    Recorder.add(part, op, time.perf_counter() - sent, status, size)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return min(time.perf_counter(), end) - measure_from
+
+
+def run_open(args, mix, operations, make_client, recorder):
+    """Llegadas a ritmo fijo (o Poisson) servidas por un pool de hasta max_in_flight hilos."""
+    rng = random.Random(args.seed)
+    pending = queue.Queue()
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    end = measure_from + args.duration
+
+    def worker(index):
+        worker_rng = random.Random(args.seed * 1000 + index)
+        client = make_client()
+        part = recorder.local()
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                op, scheduled = item
+                status, size = _execute(client, operations, op, worker_rng)
+                if scheduled >= measure_from:
+                    # Desde el instante programado: incluye la espera en cola
+                    Recorder.add(part, op, time.perf_counter() - scheduled, status, size)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.max_in_flight)]
+    for t in threads:
+        t.start()
+    scheduled = start
+    while scheduled < end:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pending.put((pick(mix, rng), scheduled))
+        gap = rng.expovariate(args.rps) if args.arrival == 'poisson' else 1.0 / args.rps
+        scheduled += gap
+    for _ in threads:
+        pending.put(None)
+    for t in threads:
+        t.join()
+    # Las peticiones atrasadas alargan la medición más allá de `end`
+    return max(time.perf_counter(), end) - measure_from
+
+
+# --- Servicio embebido ---
+
+def start_embedded(service, books, db_path=None):
+    """
+    Arranca `service` en este proceso contra la BD embebida sembrada.
+
+    Returns:
+        (base_url, samples, module, stop)
+    """
+    sys.path.insert(0, HERE)
+    import standin_db
+
+    db_path = db_path or os.path.join(tempfile.mkdtemp(prefix='libros-loadtest-'), 'libros.db')
+    samples = standin_db.seed(db_path, books=books)
+    standin_db.install()
+
+    directory, module_name = SERVICES[service]
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    module = importlib.import_module(module_name)
+
+    # El mismo arranque por proceso que los workers de serve.py
+    app = module.create_app()
+
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        module.shutdown()
+
+    return f'http://127.0.0.1:{server.server_port}', samples, module, stop
+
+
+def make_token(secret):
+    import jwt
+    payload = {'user_id': 0, 'username': 'loadtest', 'exp': int(time.time()) + 24 * 3600}
+    return jwt.encode(payload, secret, algorithm='HS256')
+
+
+def remote_samples(client, limit=1000):
+    """ISBNs, autores, formatos y géneros leídos del propio servicio (JSON)."""
+    client.headers = dict(client.headers, Accept='application/json')
+    conn = client._connect()
+    try:
+        conn.request('GET', f'/api/books?limit={limit}', headers=client.headers)
+        response = conn.getresponse()
+        body = response.read()
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(f"GET /api/books?limit={limit} devolvió {response.status}")
+    rows = json.loads(body)['books']
+    if not rows:
+        raise RuntimeError("El servicio no tiene libros de los que tomar muestras")
+    authors = sorted({a.strip() for r in rows for a in (r.get('authors') or '').split(',') if a.strip()})
+    words = sorted({w.lower() for r in rows for w in (r.get('title') or '').split() if len(w) > 3})
+    return {
+        'isbns': [str(r['isbn']) for r in rows],
+        'authors': authors,
+        'formats': sorted({r['format'] for r in rows if r.get('format')}),
+        'genres': sorted({r['genre'] for r in rows if r.get('genre')}),
+        'words': words or ['a'],
+    }
+
+
+# --- Informe ---
+
+def print_report(result):
+    summary = result['summary']
+    print(f"\n{result['meta']['target']}  modelo={result['meta']['model']}  "
+          f"{summary['requests']} peticiones en {summary['elapsed_s']} s  "
+          f"({summary['rps']} rps, {summary['errors']} errores)")
+    print(f"{'endpoint':10} {'n':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9} {'bytes':>9}  estados")
+    for op, e in result['endpoints'].items():
+        statuses = ' '.join(f'{k}:{v}' for k, v in e['status'].items())
+        print(f"{op:10} {e['count']:>7} {e['rps']:>8} {e['p50_ms']:>9} {e['p95_ms']:>9} "
+              f"{e['p99_ms']:>9} {e['max_ms']:>9} {e['mean_bytes']:>9}  {statuses}")
+
+
+def print_comparison(result, baseline):
+    print(f"\nComparación con {baseline['meta']['target']} ({baseline['meta']['started_at']}):")
+    print(f"{'endpoint':10} {'rps':>16} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20}")
+
+    def delta(new, old):
+        if new is None or old is None:
+            return f"{new}".rjust(20)
+        change = (new - old) / old * 100 if old else 0.0
+        return f"{new} ({change:+.1f}%)".rjust(20)
+
+    for op, e in result['endpoints'].items():
+        old = baseline['endpoints'].get(op)
+        if old is None:
+            continue
+        rps_change = (e['rps'] - old['rps']) / old['rps'] * 100 if old['rps'] else 0.0
+        rps = f"{e['rps']} ({rps_change:+.1f}%)"
+        print(f"{op:10} {rps:>16}"
+              f"{delta(e['p50_ms'], old['p50_ms'])}{delta(e['p95_ms'], old['p95_ms'])}"
+              f"{delta(e['p99_ms'], old['p99_ms'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--service', choices=sorted(SERVICES), help="Arranca el servicio embebido")
+    target.add_argument('--url', help="URL base de un servicio ya desplegado")
+    parser.add_argument('--model', choices=('closed', 'open'), default='closed')
+    parser.add_argument('--concurrency', type=int, default=16, help="Clientes del modelo closed")
+    parser.add_argument('--rps', type=float, default=0, help="Peticiones/s (obligatorio en open)")
+    parser.add_argument('--arrival', choices=('constant', 'poisson'), default='constant')
+    parser.add_argument('--max-in-flight', type=int, default=256, help="Hilos del modelo open")
+    parser.add_argument('--duration', type=float, default=30.0, help="Segundos medidos")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Segundos iniciales sin medir")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Pesos por operación ({', '.join(OPERATIONS)})")
+    parser.add_argument('--books', type=int, default=10000, help="Libros sembrados (modo embebido)")
+    parser.add_argument('--db', help="Fichero sqlite de la BD embebida (se recrea en cada ejecución; por defecto, uno temporal)")
+    parser.add_argument('--accept', default='application/xml')
+    parser.add_argument('--accept-encoding', default='identity')
+    parser.add_argument('--token', help="JWT para microLibros (en modo embebido se genera)")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help="Guarda el resultado en este JSON")
+    parser.add_argument('--compare', help="JSON de una ejecución anterior")
+    args = parser.parse_args(argv)
+    if args.model == 'open' and args.rps <= 0:
+        parser.error("--model open necesita --rps")
+    mix = parse_mix(args.mix)
+
+    stop = None
+    token = args.token
+    if args.service:
+        base_url, samples, module, stop = start_embedded(args.service, args.books, args.db)
+        if token is None and hasattr(module, 'SECRET_KEY'):
+            token = make_token(module.SECRET_KEY)
+    else:
+        base_url = args.url.rstrip('/')
+
+    headers = {'Accept': args.accept, 'Accept-Encoding': args.accept_encoding}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    if not args.service:
+        samples = remote_samples(Client(base_url, dict(headers), args.timeout))
+
+    run_id = f"{int(time.time()) % 100000:05d}"
+    operations = Operations(samples, run_id)
+    recorder = Recorder()
+    make_client = lambda: Client(base_url, headers, args.timeout)
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    try:
+        runner = run_open if args.model == 'open' else run_closed
+        elapsed = runner(args, mix, operations, make_client, recorder)
+    finally:
+        if stop:
+            stop()
+
+    summary, endpoints = summarize(recorder.merged(), elapsed)
+    result = {
+        'meta': {
+            'target': args.service or base_url,
+            'started_at': started_at,
+            'model': args.model,
+            'concurrency': args.concurrency if args.model == 'closed' else args.max_in_flight,
+            'rps_target': args.rps or None,
+            'arrival': args.arrival if args.model == 'open' else None,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'mix': args.mix,
+            'books': args.books if args.service else len(samples['isbns']),
+            'accept': args.accept,
+            'accept_encoding': args.accept_encoding,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'summary': summary,
+        'endpoints': endpoints,
+    }
+    print_report(result)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fh:
+            print_comparison(result, json.load(fh))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            json.dump(result, fh, indent=2, ensure_ascii=False)
+        print(f"\nResultado guardado en {args.out}")
+
+
+if __name__ == '__main__':
+    main()
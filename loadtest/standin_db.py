@@ -0,0 +1,450 @@
+"""
+Sustituto embebido de MySQL (sobre sqlite3) para las pruebas de carga.
+
+Expone el subconjunto de la API de MySQLdb que usan los servicios
+(connect, cursores normales y DictCursor/SSDictCursor, excepciones con el
+código de error de MySQL en args[0]) y traduce al vuelo el SQL específico
+de MySQL que aparece en ellos:
+
+    %s                                  -> ?
+    GROUP_CONCAT(x SEPARATOR ', ')      -> GROUP_CONCAT(x, ', ')
+    INSERT IGNORE                       -> INSERT OR IGNORE
+    ON DUPLICATE KEY UPDATE c=VALUES(c) -> ON CONFLICT DO UPDATE SET c=excluded.c
+    ... FOR UPDATE [NOWAIT], LAST_INSERT_ID(), NOW(6), TIMESTAMPDIFF(MICROSECOND, ...),
+    CRC32(), CONCAT_WS() y BIT_XOR()
+    a <=> b                             -> a IS b
+
+El esquema (tablas de escritura, outbox, read model) lo crea seed() con
+DDL de sqlite, así que el DDL de MySQL que lanzan los servicios se ignora.
+Los nombres y títulos usan COLLATE NOCASE, como la colación *_ci de MySQL.
+
+No sustituye a MySQL para medir la BD: sirve para medir el servicio
+(Flask, serialización, cachés) con datos realistas sin instalar nada.
+
+    import standin_db
+    standin_db.seed('/tmp/libros.db', books=10000)
+    standin_db.install()    # sys.modules['MySQLdb'] = standin_db
+"""
+
+import datetime
+import decimal
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import types
+import zlib
+
+DATABASE = None  # ruta del fichero sqlite; la fija seed() o configure()
+BUSY_TIMEOUT = 10.0
+
+
+# --- Excepciones (misma jerarquía que MySQLdb) ---
+
+class Error(Exception):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+# Códigos de MySQL que comprueban los servicios
+ER_DUP_ENTRY = 1062
+ER_NO_REFERENCED_ROW = 1452
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_UNKNOWN_ERROR = 1105
+
+
+def _translate_error(e):
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        if 'UNIQUE' in message or 'PRIMARY KEY' in message:
+            return IntegrityError(ER_DUP_ENTRY, f"Duplicate entry: {message}")
+        if 'FOREIGN KEY' in message:
+            return IntegrityError(ER_NO_REFERENCED_ROW, message)
+        return IntegrityError(ER_UNKNOWN_ERROR, message)
+    if isinstance(e, sqlite3.OperationalError):
+        if 'locked' in message or 'busy' in message:
+            return OperationalError(ER_LOCK_WAIT_TIMEOUT, message)
+        return OperationalError(ER_UNKNOWN_ERROR, message)
+    return ProgrammingError(ER_UNKNOWN_ERROR, message)
+
+
+# --- Traducción de SQL ---
+
+_DDL = re.compile(r'\s*(CREATE|ALTER|DROP)\s', re.IGNORECASE)
+_LOCKS = re.compile(r'\s*SELECT\s+(GET_LOCK|RELEASE_LOCK)\s*\(', re.IGNORECASE)
+_REWRITES = (
+    (re.compile(r'GROUP_CONCAT\((.+?)\s+SEPARATOR\s+(\'[^\']*\')\)', re.IGNORECASE), r'GROUP_CONCAT(\1, \2)'),
+    (re.compile(r'INSERT\s+IGNORE', re.IGNORECASE), 'INSERT OR IGNORE'),
+    (re.compile(r'ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(\w+)\s*=\s*VALUES\(\1\)', re.IGNORECASE),
+     r'ON CONFLICT DO UPDATE SET \1=excluded.\1'),
+    (re.compile(r'\s+FOR\s+UPDATE(\s+NOWAIT)?', re.IGNORECASE), ''),
+    (re.compile(r'LAST_INSERT_ID\(\)', re.IGNORECASE), 'last_insert_rowid()'),
+    (re.compile(r'TIMESTAMPDIFF\(\s*MICROSECOND\s*,', re.IGNORECASE), "TIMESTAMPDIFF('MICROSECOND',"),
+    (re.compile(r'NOW\(6\)', re.IGNORECASE), 'NOW()'),
+    (re.compile(r'<=>'), ' IS '),
+    (re.compile(r'%s'), '?'),
+)
+_translated = {}
+
+
+def translate(query):
+    """SQL de MySQL -> sqlite (memoizado por texto de la consulta)."""
+    sql = _translated.get(query)
+    if sql is None:
+        sql = query
+        for pattern, replacement in _REWRITES:
+            sql = pattern.sub(replacement, sql)
+        _translated[query] = sql
+    return sql
+
+
+def _now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _crc32(value):
+    return None if value is None else zlib.crc32(str(value).encode('utf-8'))
+
+
+def _concat_ws(separator, *values):
+    return separator.join(str(v) for v in values if v is not None)
+
+
+class _BitXor:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= int(value)
+
+    def finalize(self):
+        return self.value
+
+
+def _timestampdiff(unit, start, end):
+    if start is None or end is None:
+        return None
+    delta = datetime.datetime.fromisoformat(end) - datetime.datetime.fromisoformat(start)
+    return int(delta / datetime.timedelta(microseconds=1))
+
+
+sqlite3.register_converter('DECIMAL', lambda raw: decimal.Decimal(raw.decode('ascii')))
+sqlite3.register_adapter(decimal.Decimal, str)
+
+
+# --- Cursores y conexiones ---
+
+class Cursor:
+    """Cursor con filas en tuplas (MySQLdb.cursors.Cursor)."""
+
+    _as_dict = False
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cur = connection._db.cursor()
+        self._static = None  # filas de las sentencias que no llegan a sqlite
+        self._insert = False
+        self.description = None
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        # MySQL da el id de la primera fila de un INSERT multi-fila; sqlite el de la última
+        if self._insert and self._cur.rowcount > 1:
+            return self._cur.lastrowid - self._cur.rowcount + 1
+        return self._cur.lastrowid
+
+    def _run(self, method, query, args):
+        self._static = None
+        self._insert = query.lstrip()[:6].upper() == 'INSERT'
+        if _DDL.match(query):
+            self.description = None
+            self._static = []
+            return 0
+        if _LOCKS.match(query):
+            # Un solo proceso usa el fichero: los locks con nombre siempre se obtienen
+            self.description = (('lock', None, None, None, None, None, None),)
+            self._static = [(1,)]
+            return 1
+        try:
+            getattr(self._cur, method)(translate(query), args if args is not None else ())
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+        self.description = self._cur.description
+        return self._cur.rowcount
+
+    def execute(self, query, args=None):
+        if isinstance(args, dict):
+            raise ProgrammingError(ER_UNKNOWN_ERROR, "Parámetros con nombre no soportados")
+        return self._run('execute', query, tuple(args) if args is not None else None)
+
+    def executemany(self, query, args):
+        return self._run('executemany', query, [tuple(a) for a in args])
+
+    def _row(self, row):
+        if row is None or not self._as_dict:
+            return row
+        return {d[0]: value for d, value in zip(self.description, row)}
+
+    def fetchone(self):
+        if self._static is not None:
+            return self._row(self._static.pop(0)) if self._static else None
+        return self._row(self._cur.fetchone())
+
+    def fetchmany(self, size=None):
+        if self._static is not None:
+            rows, self._static = self._static[:size], self._static[size:]
+        else:
+            rows = self._cur.fetchmany(size or self._cur.arraysize)
+        return tuple(self._row(r) for r in rows)
+
+    def fetchall(self):
+        if self._static is not None:
+            rows, self._static = self._static, []
+        else:
+            rows = self._cur.fetchall()
+        return tuple(self._row(r) for r in rows)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class DictCursor(Cursor):
+    _as_dict = True
+
+
+class SSDictCursor(DictCursor):
+    # sqlite ya lee las filas bajo demanda
+    pass
+
+
+cursors = types.SimpleNamespace(Cursor=Cursor, DictCursor=DictCursor, SSCursor=Cursor,
+                                SSDictCursor=SSDictCursor)
+
+
+class Connection:
+    def __init__(self, path):
+        try:
+            self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                       detect_types=sqlite3.PARSE_DECLTYPES)
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.create_function('NOW', 0, _now)
+        self._db.create_function('TIMESTAMPDIFF', 3, _timestampdiff)
+        self._db.create_function('CRC32', 1, _crc32)
+        self._db.create_function('CONCAT_WS', -1, _concat_ws)
+        self._db.create_aggregate('BIT_XOR', 1, _BitXor)
+
+    def cursor(self, cursorclass=Cursor):
+        return cursorclass(self)
+
+    def commit(self):
+        try:
+            self._db.commit()
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+
+    def rollback(self):
+        self._db.rollback()
+
+    def ping(self, reconnect=False):
+        try:
+            self._db.execute('SELECT 1')
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+
+    def close(self):
+        self._db.close()
+
+
+def connect(*args, **kwargs):
+    """Como MySQLdb.connect(); host, usuario y base se ignoran."""
+    if DATABASE is None:
+        raise OperationalError(2003, "standin_db sin configurar: llama a seed() o configure()")
+    return Connection(DATABASE)
+
+
+def configure(path):
+    global DATABASE
+    DATABASE = path
+
+
+def install():
+    """Registra este módulo como MySQLdb para los imports posteriores."""
+    module = sys.modules[__name__]
+    sys.modules['MySQLdb'] = module
+    sys.modules['MySQLdb.cursors'] = cursors
+    return module
+
+
+# --- Esquema y datos de prueba ---
+
+SCHEMA = """
+CREATE TABLE genres (
+    genre_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+    name      VARCHAR(100) NOT NULL COLLATE NOCASE
+);
+CREATE INDEX idx_genres_name ON genres (name);
+CREATE TABLE formats (
+    format_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+    name       VARCHAR(100) NOT NULL COLLATE NOCASE
+);
+CREATE INDEX idx_formats_name ON formats (name);
+CREATE TABLE authors (
+    author_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+    name       VARCHAR(255) NOT NULL COLLATE NOCASE
+);
+CREATE INDEX idx_authors_name ON authors (name);
+CREATE TABLE books (
+    isbn       VARCHAR(32) NOT NULL PRIMARY KEY,
+    title      VARCHAR(255) NOT NULL COLLATE NOCASE,
+    year       INT,
+    price      DECIMAL(10,2),
+    stock      INT,
+    genre_id   INT REFERENCES genres (genre_id),
+    format_id  INT REFERENCES formats (format_id)
+);
+CREATE INDEX idx_books_title_isbn ON books (title, isbn);
+CREATE INDEX idx_books_format_title ON books (format_id, title);
+CREATE INDEX idx_books_genre ON books (genre_id);
+CREATE TABLE book_authors (
+    isbn       VARCHAR(32) NOT NULL REFERENCES books (isbn),
+    author_id  INT NOT NULL REFERENCES authors (author_id),
+    PRIMARY KEY (isbn, author_id)
+);
+CREATE INDEX idx_book_authors_author ON book_authors (author_id, isbn);
+CREATE TABLE outbox (
+    event_id    INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type  VARCHAR(32) NOT NULL,
+    isbn        VARCHAR(32) NOT NULL,
+    payload     TEXT,
+    created_at  TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+CREATE TABLE projector_checkpoint (
+    name      VARCHAR(64) NOT NULL PRIMARY KEY,
+    position  BIGINT NOT NULL
+);
+CREATE TABLE books_view (
+    isbn     VARCHAR(32) NOT NULL PRIMARY KEY,
+    title    VARCHAR(255) NOT NULL COLLATE NOCASE,
+    authors  VARCHAR(1024),
+    genre    VARCHAR(100) COLLATE NOCASE,
+    format   VARCHAR(100) COLLATE NOCASE,
+    price    DECIMAL(10,2),
+    stock    INT,
+    year     INT
+);
+CREATE INDEX idx_books_view_title ON books_view (title, isbn);
+CREATE INDEX idx_books_view_format ON books_view (format, title);
+CREATE TABLE books_view_authors (
+    author  VARCHAR(255) NOT NULL COLLATE NOCASE,
+    isbn    VARCHAR(32) NOT NULL,
+    PRIMARY KEY (author, isbn)
+);
+CREATE INDEX idx_books_view_authors_isbn ON books_view_authors (isbn);
+CREATE TABLE schema_migrations (
+    version     INT NOT NULL PRIMARY KEY,
+    name        VARCHAR(255) NOT NULL,
+    applied_at  TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO schema_migrations (version, name) VALUES (1, 'base_tables'), (2, 'query_indexes');
+"""
+
+GENRES = ['Novela', 'Ciencia ficción', 'Fantasía', 'Historia', 'Biografía', 'Ensayo',
+          'Poesía', 'Misterio', 'Infantil', 'Divulgación']
+FORMATS = ['Tapa dura', 'Tapa blanda', 'Ebook', 'Audiolibro']
+_FIRST = ['Ana', 'Luis', 'María', 'Jorge', 'Lucía', 'Pedro', 'Elena', 'Carlos', 'Sofía', 'Diego',
+          'Laura', 'Miguel', 'Paula', 'Andrés', 'Carmen', 'Javier', 'Isabel', 'Raúl', 'Teresa', 'Pablo']
+_LAST = ['García', 'Martínez', 'López', 'Sánchez', 'Pérez', 'Gómez', 'Ruiz', 'Díaz', 'Moreno',
+         'Álvarez', 'Romero', 'Navarro', 'Torres', 'Domínguez', 'Vázquez', 'Ramos', 'Gil', 'Serrano']
+_WORDS = ['sombra', 'viento', 'ciudad', 'río', 'memoria', 'noche', 'jardín', 'mar', 'fuego',
+          'silencio', 'camino', 'luz', 'tiempo', 'isla', 'montaña', 'espejo', 'lluvia', 'puerta',
+          'invierno', 'sueño', 'reino', 'verano', 'piedra', 'bosque', 'estrella', 'historia']
+
+_seed_lock = threading.Lock()
+
+
+def seed(path, books=10000, authors=None, random_seed=42):
+    """
+    Crea el fichero `path` con el esquema y un catálogo sintético
+    determinista, y deja configurado connect() para usarlo. Si `path` ya
+    existe se recrea: las escrituras de una ejecución anterior no deben
+    cambiar el punto de partida de la siguiente.
+
+    Returns:
+        dict: Muestras para generar peticiones: 'isbns', 'authors',
+        'formats', 'genres', 'words'
+    """
+    rng = random.Random(random_seed)
+    authors = authors or max(10, books // 5)
+    author_names = []
+    seen = set()
+    while len(author_names) < authors:
+        name = f"{rng.choice(_FIRST)} {rng.choice(_LAST)} {rng.choice(_LAST)}"
+        if name in seen:
+            name = f"{name} {len(author_names)}"
+        seen.add(name)
+        author_names.append(name)
+
+    with _seed_lock:
+        for stale in (path, path + '-wal', path + '-shm'):
+            if os.path.exists(stale):
+                os.remove(stale)
+        db = sqlite3.connect(path)
+        try:
+            db.execute('PRAGMA journal_mode = WAL')
+            db.executescript(SCHEMA)
+            db.executemany("INSERT INTO genres (name) VALUES (?)", [(g,) for g in GENRES])
+            db.executemany("INSERT INTO formats (name) VALUES (?)", [(f,) for f in FORMATS])
+            db.executemany("INSERT INTO authors (name) VALUES (?)", [(a,) for a in author_names])
+            isbns, rows, links = [], [], []
+            for i in range(books):
+                isbn = f"978{i:010d}"
+                isbns.append(isbn)
+                title = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(2, 4))).capitalize()
+                rows.append((isbn, title, rng.randint(1950, 2025), f"{rng.uniform(5, 60):.2f}",
+                             rng.randint(0, 200), rng.randint(1, len(GENRES)), rng.randint(1, len(FORMATS))))
+                for author_id in rng.sample(range(1, authors + 1), rng.choice((1, 1, 1, 2, 3))):
+                    links.append((isbn, author_id))
+            db.executemany("INSERT INTO books (isbn, title, year, price, stock, genre_id, format_id) "
+                           "VALUES (?,?,?,?,?,?,?)", rows)
+            db.executemany("INSERT INTO book_authors (isbn, author_id) VALUES (?,?)", links)
+            db.commit()
+        finally:
+            db.close()
+    configure(path)
+    return {'isbns': isbns, 'authors': author_names, 'formats': list(FORMATS),
+            'genres': list(GENRES), 'words': list(_WORDS)}
@@ -0,0 +1,140 @@
+"""
+Compresión de respuestas negociada con Accept-Encoding (brotli o gzip).
+
+El XML del catálogo es marcado muy repetitivo y se comprime más de 10x.
+Dos niveles de compresión:
+
+- Por petición (respuestas que no se guardan, streaming): niveles rápidos.
+- Variantes que se guardan (cuerpos de RenderedCache, /libros.xsl y
+  estáticos): se comprimen una sola vez, así que se usa un nivel mayor.
+
+brotli es una dependencia opcional: sin ella solo se ofrece gzip.
+"""
+
+import gzip
+import os
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+# brotli gana los empates (comprime ~2x mejor que gzip este XML)
+OFFERS = ([BROTLI] if brotli else []) + [GZIP]
+
+# Por debajo de esto la cabecera y la CPU no compensan
+MIN_SIZE = 1024
+COMPRESSIBLE = frozenset({
+    'application/xml', 'application/json', 'application/msgpack',
+    'application/javascript', 'image/svg+xml',
+})
+
+GZIP_LEVEL, GZIP_LEVEL_CACHED = 6, 9
+BROTLI_QUALITY, BROTLI_QUALITY_CACHED = 5, 9
+
+
+def negotiate_encoding(accept):
+    """'br', 'gzip' o None (sin comprimir) para una cabecera Accept-Encoding (werkzeug Accept)."""
+    return accept.best_match(OFFERS) if accept else None
+
+
+def is_compressible(mimetype):
+    # text/event-stream no: el compresor retendría cada evento hasta llenar su bloque
+    return (bool(mimetype) and mimetype != 'text/event-stream'
+            and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE))
+
+
+def should_compress(mimetype, size):
+    return size >= MIN_SIZE and is_compressible(mimetype)
+
+
+def compress(body, encoding, cached=False):
+    """
+    Cuerpo comprimido con `encoding`.
+
+    Args:
+        cached: True para las variantes que se guardan (nivel mayor)
+    """
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=BROTLI_QUALITY_CACHED if cached else BROTLI_QUALITY)
+    # mtime=0: los mismos bytes en todos los procesos y reinicios
+    return gzip.compress(body, GZIP_LEVEL_CACHED if cached else GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Comprime un cuerpo por chunks; cada chunk se vacía para no retrasar el primer byte."""
+    if encoding == BROTLI:
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # formato gzip
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def compress_response(response, encoding):
+    """
+    Comprime una Response de werkzeug ya generada (en memoria o streaming).
+
+    El ETag, si lo hay, recibe el sufijo de la codificación: cada variante
+    es una representación distinta.
+    """
+    if response.is_streamed:
+        original = response.response
+        if hasattr(original, 'close'):
+            response.call_on_close(original.close)
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+class CompressedFiles:
+    """
+    Variantes comprimidas de ficheros estáticos, en memoria.
+
+    Cada variante se comprime la primera vez que se pide y se recalcula
+    solo si el fichero cambia (mtime o tamaño).
+    """
+
+    def __init__(self):
+        self._entries = {}  # (ruta, encoding) -> (firma, cuerpo)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'compressions': 0}
+
+    def get(self, path, encoding):
+        """Devuelve (cuerpo comprimido, os.stat_result del fichero)."""
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get((path, encoding))
+            if entry is not None and entry[0] == signature:
+                self._stats['hits'] += 1
+                return entry[1], st
+        with open(path, 'rb') as fh:
+            body = compress(fh.read(), encoding, cached=True)
+        with self._lock:
+            self._entries[(path, encoding)] = (signature, body)
+            self._stats['compressions'] += 1
+        return body, st
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({'files': len(self._entries),
+                         'bytes': sum(len(body) for _, body in self._entries.values())})
+        return data
@@ -0,0 +1,267 @@
+"""
+Pool de conexiones MySQL thread-safe para los microservicios de Libros.
+
+Evita pagar connect+auth contra MySQL en cada petición: las conexiones se
+reutilizan, se validan con ping() al sacarlas del pool y se reciclan al
+superar su tiempo de vida máximo.
+"""
+
+import threading
+import time
+
+import MySQLdb
+
+
+class PoolError(Exception):
+    """Error al obtener una conexión del pool (agotado o BD inaccesible)."""
+
+
+class PooledConnection:
+    """
+    Envoltorio de una conexión MySQLdb prestada por el pool.
+
+    Se comporta como la conexión original, pero close() la devuelve al pool
+    en lugar de cerrarla, así los endpoints no necesitan cambiar su
+    patrón `cur.close(); conn.close()`.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = created_at
+        self.last_used = time.monotonic()
+        self.broken = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        """Devuelve la conexión al pool (idempotente)."""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, MySQLdb.OperationalError):
+            self.broken = True
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones con tamaño mínimo/máximo, health check y reciclado.
+
+    Args:
+        db_config: Parámetros para MySQLdb.connect()
+        min_size: Conexiones que se mantienen abiertas aunque estén ociosas
+        max_size: Máximo de conexiones abiertas simultáneamente
+        max_lifetime: Segundos tras los que una conexión se recicla
+        max_idle: Segundos ociosa tras los que se cierra (por encima de min_size)
+        health_check_interval: Si la conexión estuvo ociosa más de estos
+            segundos se hace ping() antes de entregarla
+        timeout: Segundos de espera cuando el pool está agotado
+    """
+
+    def __init__(self, db_config, min_size=2, max_size=10, max_lifetime=1800,
+                 max_idle=300, health_check_interval=30, timeout=5.0, name='default'):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Tamaños de pool inválidos")
+        self.db_config = dict(db_config)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.name = name
+
+        self._lock = threading.Condition()
+        self._idle = []        # pila LIFO de PooledConnection ociosas
+        self._size = 0         # conexiones abiertas (ociosas + prestadas)
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'connect_errors': 0,
+        }
+
+    # --- Ciclo de vida de conexiones ---
+
+    def _count(self, key):
+        # El Condition usa un RLock: vale también desde código que ya tiene el lock
+        with self._lock:
+            self._stats[key] += 1
+
+    def _connect(self):
+        raw = MySQLdb.connect(**self.db_config)
+        self._count('created')
+        return PooledConnection(self, raw, time.monotonic())
+
+    def _discard(self, conn):
+        """Cierra físicamente una conexión (el lock solo se toma para el contador)."""
+        try:
+            conn._raw.close()
+        except MySQLdb.Error:
+            pass
+        self._count('closed')
+
+    def _expired(self, conn, now):
+        return self.max_lifetime and now - conn.created_at > self.max_lifetime
+
+    def _healthy(self, conn, now):
+        if now - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            conn._raw.ping()
+            return True
+        except MySQLdb.Error:
+            self._count('failed_health_checks')
+            return False
+
+    def fill(self):
+        """Abre conexiones hasta alcanzar min_size (precalentamiento)."""
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except MySQLdb.Error:
+                with self._lock:
+                    self._size -= 1
+                    self._stats['connect_errors'] += 1
+                    self._lock.notify()
+                raise
+            conn._pool = None
+            self.release_raw(conn)
+
+    # --- Préstamo y devolución ---
+
+    def get_connection(self):
+        """
+        Saca una conexión sana del pool, abriendo una nueva si hace falta.
+
+        Raises:
+            PoolError: Si el pool está agotado tras `timeout` o no se puede conectar
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._lock:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolError(f"Pool '{self.name}' agotado ({self.max_size} conexiones)")
+                    self._stats['waits'] += 1
+                    self._lock.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except MySQLdb.Error as e:
+                    with self._lock:
+                        self._size -= 1
+                        self._stats['connect_errors'] += 1
+                        self._lock.notify()
+                    raise PoolError(f"No se pudo conectar a MySQL: {e}") from e
+            else:
+                now = time.monotonic()
+                if self._expired(conn, now) or not self._healthy(conn, now):
+                    if self._expired(conn, now):
+                        self._count('recycled')
+                    self._discard(conn)
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    continue
+                conn._pool = self
+
+            with self._lock:
+                self._stats['checkouts'] += 1
+            return conn
+
+    def release(self, conn):
+        """Devuelve una conexión prestada; la recicla si está rota o caducada."""
+        try:
+            # Cierra cualquier transacción abierta para que la siguiente
+            # petición no herede un snapshot antiguo ni cambios sin commit.
+            conn._raw.rollback()
+        except MySQLdb.Error:
+            conn.broken = True
+        self.release_raw(conn)
+
+    def release_raw(self, conn):
+        now = time.monotonic()
+        conn.last_used = now
+        if conn.broken or self._expired(conn, now):
+            if not conn.broken:
+                self._count('recycled')
+            self._discard(conn)
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            return
+        with self._lock:
+            self._idle.append(conn)
+            dropped = self._prune_idle(now)
+            self._lock.notify()
+        # El close() es de red: fuera del lock, para no frenar get_connection/release
+        for conn in dropped:
+            self._discard(conn)
+
+    def _prune_idle(self, now):
+        """
+        Saca de la pila las conexiones ociosas de más por encima de min_size
+        (con lock) y las devuelve para cerrarlas después de soltarlo.
+        """
+        if not self.max_idle:
+            return []
+        keep, dropped = [], []
+        # Las más antiguas están al fondo de la pila
+        for conn in self._idle:
+            if self._size > self.min_size and now - conn.last_used > self.max_idle:
+                dropped.append(conn)
+                self._size -= 1
+            else:
+                keep.append(conn)
+        self._idle = keep
+        return dropped
+
+    def close_all(self):
+        """Cierra las conexiones ociosas (las prestadas se cierran al devolverse)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    # --- Estadísticas ---
+
+    def stats(self):
+        """Snapshot de las estadísticas del pool."""
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                'name': self.name,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        return data
@@ -1,11 +1,30 @@
+import base64
+import json
+import mimetypes
+import os
+import time
 import xml.etree.ElementTree as ET
-from flask import Flask, request, Response, render_template, send_from_directory
+from flask import Flask, request, Response, render_template, send_from_directory, stream_with_context, jsonify
 import MySQLdb
 from flask_cors import CORS
+from werkzeug.security import safe_join
+from compression import CompressedFiles, compress_response, is_compressible, negotiate_encoding, should_compress
+from db_pool import ConnectionPool, PoolError
+from metrics import Metrics
+from migrations import migrate
+from slow_queries import SlowQueryLog
+from serializers import XML_MIMETYPE, negotiate, serialize_books
+from xml_writer import books_xml, catalog_xml, lookup_xml
 
 # --- Configuración Flask ---
 app = Flask(__name__)
 
+# Métricas por endpoint (/metrics). Se registran antes que los demás
+# after_request para medir la respuesta final, ya comprimida.
+METRICS = Metrics('micro', slow_request_ms=float(os.environ.get('SLOW_REQUEST_MS', 0)),
+                  directory=os.environ.get('METRICS_DIR') or None)
+METRICS.init_app(app)
+
 CORS(
     app,
     resources={r"/api/*": {"origins": ["*"]}},
@@ -22,31 +41,195 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
+# Pool compartido por todos los endpoints: conn.close() devuelve la conexión
+# al pool en lugar de cerrarla.
+DB_POOL = ConnectionPool(DB_CONFIG, min_size=2, max_size=10, max_lifetime=1800, name='libros')
+
+# Sentencias por encima de SLOW_QUERY_MS: se escriben con sus parámetros y
+# se agrupan por forma con su EXPLAIN (lanzado con una conexión del pool
+# sin instrumentar). Ver /debug/slow-queries.
+SLOW_QUERIES = SlowQueryLog(DB_POOL.get_connection, threshold_ms=float(os.environ.get('SLOW_QUERY_MS', 200)))
+METRICS.add_statement_listener(SLOW_QUERIES.record)
+
 def get_db_connection():
+    started = time.perf_counter()
     try:
-        return MySQLdb.connect(**DB_CONFIG)
-    except MySQLdb.Error as e:
+        conn = DB_POOL.get_connection()
+    except PoolError as e:
         print(f"Error DB: {e}")
         return None
+    return METRICS.instrument(conn, time.perf_counter() - started)
+
+def stream_query(conn, query, params=()):
+    """
+    Ejecuta `query` con un cursor de servidor (SSDictCursor) y devuelve un
+    generador de lotes de filas. La consulta se lanza ya, para que un error
+    de BD se detecte antes de empezar la respuesta; la conexión se libera
+    cuando el generador termina o se cierra (cliente desconectado).
+    """
+    cur = conn.cursor(MySQLdb.cursors.SSDictCursor)
+    try:
+        cur.execute(query, params)
+    except MySQLdb.Error:
+        cur.close(); conn.close()
+        raise
+    def batches():
+        try:
+            while True:
+                rows = cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows: break
+                yield rows
+        finally:
+            cur.close(); conn.close()
+    return batches()
 
 # --- Helpers XML ---
-def create_xml_response(books_data):
-    catalog = ET.Element('catalog')
-    for book_dict in books_data:
-        book = ET.SubElement(catalog, 'book', isbn=str(book_dict.get('isbn', '')))
-        ET.SubElement(book, 'title').text = book_dict.get('title', '')
-        ET.SubElement(book, 'author').text = book_dict.get('authors', '')
-        ET.SubElement(book, 'year').text = str(book_dict.get('year', ''))
-        ET.SubElement(book, 'genre').text = book_dict.get('genre', '')
-        ET.SubElement(book, 'price').text = str(book_dict.get('price', ''))
-        ET.SubElement(book, 'stock').text = str(book_dict.get('stock', ''))
-        ET.SubElement(book, 'format').text = book_dict.get('format', '')
-    return Response(
-        '<?xml version="1.0" encoding="UTF-8"?>\n'
-        '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n' +
-        ET.tostring(catalog, encoding='UTF-8').decode('utf-8'),
-        mimetype='application/xml'
-    )
+XML_PROLOG = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n')
+
+# Filas leídas del cursor de servidor por cada chunk del modo streaming
+STREAM_BATCH_SIZE = 500
+
+def create_xml_response(books_data, next_cursor=None):
+    # next_cursor: cursor para pedir la página siguiente con ?after=
+    # xmlcharrefreplace como ET.tostring: misma salida byte a byte
+    with METRICS.timed('render'):
+        body = (XML_PROLOG + catalog_xml(books_data, next_cursor)).encode('utf-8', 'xmlcharrefreplace')
+    return Response(body, mimetype='application/xml')
+
+def create_books_response(books_data, next_cursor=None):
+    """
+    Respuesta de una query en el formato que pide Accept: XML por defecto,
+    JSON o MessagePack (filas tal cual, sin un nodo por campo).
+    """
+    mimetype = negotiate(request.accept_mimetypes)
+    if mimetype == XML_MIMETYPE:
+        response = create_xml_response(books_data, next_cursor)
+    else:
+        with METRICS.timed('render'):
+            body = serialize_books(mimetype, books_data, next_cursor)
+        response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def isbn_key(isbn):
+    # La colación de MySQL no distingue mayúsculas: '...x' y '...X' son el mismo ISBN
+    return str(isbn).casefold()
+
+def by_requested_isbn(isbns, rows):
+    """{isbn pedido: fila}, emparejando con isbn_key igual que compara MySQL."""
+    by_key = {isbn_key(row['isbn']): row for row in rows}
+    return {isbn: by_key[isbn_key(isbn)] for isbn in isbns if isbn_key(isbn) in by_key}
+
+def create_lookup_response(isbns, books):
+    """
+    Respuesta de la consulta por lote: un libro por ISBN pedido, en el orden
+    de la petición. Los que no existen van como <not_found isbn="..." /> (o
+    {"isbn": ..., "not_found": true} en JSON/MessagePack) en lugar de un 404.
+    """
+    mimetype = negotiate(request.accept_mimetypes)
+    if mimetype == XML_MIMETYPE:
+        with METRICS.timed('render'):
+            body = (XML_PROLOG + lookup_xml(isbns, books)).encode('utf-8', 'xmlcharrefreplace')
+        response = Response(body, mimetype=XML_MIMETYPE)
+    else:
+        rows = [books.get(isbn) or {'isbn': isbn, 'not_found': True} for isbn in isbns]
+        with METRICS.timed('render'):
+            body = serialize_books(mimetype, rows)
+        response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def generate_xml_catalog(batches):
+    """Genera el catálogo por chunks: prólogo, los <book> de cada lote y el cierre."""
+    yield XML_PROLOG + '<catalog>'
+    for rows in batches:
+        with METRICS.timed('render'):
+            chunk = books_xml(rows)
+        yield chunk
+    yield '</catalog>'
+
+def create_xml_stream_response(batches):
+    """Respuesta streaming: memoria constante y primer byte sin esperar al catálogo entero."""
+    return Response(stream_with_context(generate_xml_catalog(batches)),
+                    mimetype='application/xml')
+
+# --- Paginación keyset (?limit=N&after=<cursor>) ---
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_page_cursor(title, isbn):
+    """Cursor opaco con la clave (title, isbn) del último libro de la página."""
+    raw = json.dumps([title, str(isbn)], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(token):
+    """Devuelve (title, isbn); lanza ValueError si el cursor no es válido."""
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError("Cursor inválido")
+    # Solo [title, isbn]: un dict o una cadena de 2 elementos también se desempaquetarían
+    if (not isinstance(cursor, list) or len(cursor) != 2
+            or not all(isinstance(part, str) for part in cursor)):
+        raise ValueError("Cursor inválido")
+    title, isbn = cursor
+    return title, isbn
+
+def parse_page_args():
+    """
+    Lee ?limit y ?after de la petición.
+
+    Returns:
+        (limit, after): (None, None) si no se pidió paginar; after es
+        (title, isbn) o None para la primera página.
+
+    Raises:
+        ValueError: Si limit o el cursor no son válidos
+    """
+    limit_raw = request.args.get('limit')
+    after_raw = request.args.get('after')
+    if limit_raw is None and after_raw is None:
+        return None, None
+    try:
+        limit = int(limit_raw) if limit_raw is not None else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError("limit inválido")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+    after = decode_page_cursor(after_raw) if after_raw else None
+    return limit, after
+
+def split_page(rows, limit):
+    """Recorta las limit+1 filas leídas y calcula el cursor de la página siguiente."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_page_cursor(rows[-1]['title'], rows[-1]['isbn'])
+
+# --- Consulta por lote de ISBNs (?ids=a,b,c o POST) ---
+# Máximo de ISBNs por petición: todos caben en un único IN (...)
+ISBN_BATCH_MAX = 1000
+
+def parse_isbns_arg():
+    """
+    ISBNs pedidos, en orden: ?ids=a,b,c en GET; en POST una lista JSON o
+    {"isbns": [...]} (para listas que no caben en la URL).
+
+    Raises:
+        ValueError: Si no hay ISBNs o el cuerpo no tiene el formato esperado
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        raw = data.get('isbns') if isinstance(data, dict) else data
+        if not isinstance(raw, list) or not all(isinstance(i, (str, int)) for i in raw):
+            raise ValueError("Se esperaba una lista de ISBNs")
+    else:
+        raw = request.args.get('ids', '').split(',')
+    isbns = [str(i).strip() for i in raw if str(i).strip()]
+    if not isbns:
+        raise ValueError("No se indicó ningún ISBN")
+    return isbns
 
 def create_message_xml(message, status_code=200):
     root = ET.Element('response')
@@ -55,64 +238,145 @@ def create_message_xml(message, status_code=200):
     return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
                     mimetype='application/xml', status=status_code)
 
+# Página de libros por keyset: la subconsulta recorre el índice (title, isbn)
+# desde el cursor y solo agrupa los `limit` libros de la página, así que una
+# página profunda cuesta lo mismo que la primera. El índice lo crea
+# migrations.py (idx_books_title_isbn).
+BOOKS_PAGE_QUERY = """
+SELECT b.isbn, b.title, b.year, b.price, b.stock,
+       g.name AS genre, f.name AS format,
+       GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+FROM (
+    SELECT isbn FROM books
+    {where}
+    ORDER BY title, isbn
+    LIMIT %s
+) p
+JOIN books b ON b.isbn = p.isbn
+LEFT JOIN genres g ON b.genre_id = g.genre_id
+LEFT JOIN formats f ON b.format_id = f.format_id
+LEFT JOIN book_authors ba ON b.isbn = ba.isbn
+LEFT JOIN authors a ON ba.author_id = a.author_id
+GROUP BY b.isbn
+ORDER BY b.title, b.isbn;
+"""
+
+# --- Compresión gzip/brotli (Accept-Encoding) ---
+COMPRESSED_FILES = CompressedFiles()
+
+def send_compressed_file(directory, filename, mimetype=None):
+    """
+    Como send_from_directory, pero si el cliente acepta gzip/brotli sirve
+    la variante precomprimida del fichero (se comprime una vez por versión
+    del fichero, no en cada petición).
+    """
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = negotiate_encoding(request.accept_encodings)
+    # Rutas relativas a la raíz de la app, como en send_from_directory
+    path = safe_join(os.path.join(app.root_path, directory), filename)
+    if (encoding is None or path is None or not os.path.isfile(path)
+            or not should_compress(mimetype, os.path.getsize(path))):
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+    else:
+        body, st = COMPRESSED_FILES.get(path, encoding)
+        response = Response(body, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}-{encoding}")
+        response.last_modified = st.st_mtime
+        response.make_conditional(request)
+    if is_compressible(mimetype):
+        response.vary.add('Accept-Encoding')
+    return response
+
+# Los estáticos de Flask (/static/...) también pasan por las variantes precomprimidas
+app.view_functions['static'] = lambda filename: send_compressed_file(app.static_folder, filename)
+
+@app.after_request
+def compress_body(response):
+    """Comprime al vuelo las respuestas que no traen ya una variante precomprimida."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding and (response.is_streamed or should_compress(response.mimetype, response.content_length or 0)):
+        compress_response(response, encoding)
+    return response
+
 # --- Endpoint para servir el XSL ---
 @app.route('/libros.xsl')
 def get_xsl():
-    return send_from_directory('.', 'libros.xsl', mimetype='application/xml')
+    return send_compressed_file('.', 'libros.xsl', mimetype='application/xml')
 
-# --- Endpoints API ---
-@app.route('/api/books', methods=['GET'])
-def get_books():
-    conn = get_db_connection()
-    if not conn: return create_message_xml("Error DB", 500)
-    cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
+# --- Consultas ---
+# Toda la SQL de lectura pasa por estas funciones handle_get_*_query, de modo
+# que `python migrations.py check` puede hacer EXPLAIN de cada una.
+BOOK_COLUMNS = """
     SELECT b.isbn, b.title, b.year, b.price, b.stock,
            g.name AS genre, f.name AS format,
            GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+"""
+
+BOOK_JOINS = """
     FROM books b
     LEFT JOIN genres g ON b.genre_id = g.genre_id
     LEFT JOIN formats f ON b.format_id = f.format_id
     LEFT JOIN book_authors ba ON b.isbn = ba.isbn
     LEFT JOIN authors a ON ba.author_id = a.author_id
-    GROUP BY b.isbn
-    ORDER BY b.title;
-    """
-    cur.execute(query)
-    rows = cur.fetchall()
-    cur.close(); conn.close()
-    return create_xml_response(rows)
+"""
 
-@app.route('/api/books/isbn/<isbn>', methods=['GET'])
-def get_book(isbn):
-    conn = get_db_connection()
-    if not conn: return create_message_xml("Error DB", 500)
+def fetch_rows(conn, query, params=(), one=False):
+    """Ejecuta `query` con un DictCursor y libera la conexión."""
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
-    LEFT JOIN authors a ON ba.author_id = a.author_id
-    WHERE b.isbn=%s GROUP BY b.isbn;
+    try:
+        cur.execute(query, params)
+        return cur.fetchone() if one else cur.fetchall()
+    finally:
+        cur.close(); conn.close()
+
+def handle_get_all_books_query(stream=False):
     """
-    cur.execute(query, (isbn,))
-    row = cur.fetchone()
-    cur.close(); conn.close()
-    return create_xml_response([row]) if row else create_message_xml("No encontrado", 404)
+    Catálogo completo ordenado por título; None si no hay conexión.
 
-@app.route('/api/books/author/<author>', methods=['GET'])
-def get_books_by_author(author):
+    Con stream=True devuelve un generador de lotes leídos con un cursor de
+    servidor en lugar de la lista completa.
+    """
     conn = get_db_connection()
-    if not conn: return create_message_xml("Error DB", 500)
-    cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+    if not conn: return None
+    query = BOOK_COLUMNS + BOOK_JOINS + "GROUP BY b.isbn ORDER BY b.title;"
+    if stream:
+        return stream_query(conn, query)
+    return fetch_rows(conn, query)
+
+def handle_get_books_page_query(limit, after=None):
+    """Página keyset del catálogo: WHERE (title, isbn) > cursor ... LIMIT limit+1."""
+    conn = get_db_connection()
+    if not conn: return None
+    where = "WHERE (title, isbn) > (%s, %s)" if after else ""
+    params = (after or ()) + (limit + 1,)
+    return list(fetch_rows(conn, BOOKS_PAGE_QUERY.format(where=where), params))
+
+def handle_get_book_by_isbn_query(isbn):
+    """Libro con ese ISBN (lista de 0 o 1 filas); None si no hay conexión."""
+    conn = get_db_connection()
+    if not conn: return None
+    row = fetch_rows(conn, BOOK_COLUMNS + BOOK_JOINS + "WHERE b.isbn=%s GROUP BY b.isbn;", (isbn,), one=True)
+    return [row] if row else []
+
+def handle_get_books_by_isbns_query(isbns):
+    """{isbn pedido: fila} de los que existen; None si no hay conexión."""
+    conn = get_db_connection()
+    if not conn: return None
+    unique = list(dict.fromkeys(isbns))
+    # Una sola consulta para todo el lote en lugar de una petición por ISBN
+    placeholders = ','.join(['%s'] * len(unique))
+    query = BOOK_COLUMNS + BOOK_JOINS + f"WHERE b.isbn IN ({placeholders}) GROUP BY b.isbn;"
+    return by_requested_isbn(isbns, fetch_rows(conn, query, unique))
+
+def handle_get_books_by_author_query(author):
+    conn = get_db_connection()
+    if not conn: return None
+    query = BOOK_COLUMNS + """
     FROM books b
     JOIN book_authors ba ON b.isbn = ba.isbn
     JOIN authors a ON ba.author_id = a.author_id
@@ -120,31 +384,66 @@ def get_books_by_author(author):
     LEFT JOIN formats f ON b.format_id = f.format_id
     WHERE a.name=%s GROUP BY b.isbn;
     """
-    cur.execute(query, (author,))
-    rows = cur.fetchall()
-    cur.close(); conn.close()
-    return create_xml_response(rows) if rows else create_message_xml("No se encontraron libros", 404)
+    return fetch_rows(conn, query, (author,))
+
+def handle_get_books_by_format_query(format_name):
+    conn = get_db_connection()
+    if not conn: return None
+    return fetch_rows(conn, BOOK_COLUMNS + BOOK_JOINS + "WHERE f.name=%s GROUP BY b.isbn;", (format_name,))
+
+# --- Endpoints API ---
+@app.route('/api/books', methods=['GET'])
+def get_books():
+    try:
+        limit, after = parse_page_args()
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if limit:
+        rows = handle_get_books_page_query(limit, after)
+        if rows is None: return create_message_xml("Error DB", 500)
+        rows, next_cursor = split_page(rows, limit)
+        return create_books_response(rows, next_cursor)
+    # ?stream=1: cursor de servidor + respuesta por chunks (memoria constante)
+    if request.args.get('stream') == '1':
+        try:
+            batches = handle_get_all_books_query(stream=True)
+        except MySQLdb.Error:
+            return create_message_xml("Error DB", 500)
+        if batches is None: return create_message_xml("Error DB", 500)
+        return create_xml_stream_response(batches)
+    rows = handle_get_all_books_query()
+    if rows is None: return create_message_xml("Error DB", 500)
+    return create_books_response(rows)
+
+@app.route('/api/books/isbn/<isbn>', methods=['GET'])
+def get_book(isbn):
+    rows = handle_get_book_by_isbn_query(isbn)
+    if rows is None: return create_message_xml("Error DB", 500)
+    return create_books_response(rows) if rows else create_message_xml("No encontrado", 404)
+
+@app.route('/api/books/isbn', methods=['GET', 'POST'])
+def get_books_by_isbns():
+    try:
+        isbns = parse_isbns_arg()
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if len(isbns) > ISBN_BATCH_MAX:
+        return create_message_xml(f"Máximo {ISBN_BATCH_MAX} ISBNs por petición", 413)
+    found = handle_get_books_by_isbns_query(isbns)
+    if found is None: return create_message_xml("Error DB", 500)
+    return create_lookup_response(isbns, found)
+
+@app.route('/api/books/author/<author>', methods=['GET'])
+def get_books_by_author(author):
+    rows = handle_get_books_by_author_query(author)
+    if rows is None: return create_message_xml("Error DB", 500)
+    return create_books_response(rows) if rows else create_message_xml("No se encontraron libros", 404)
 
 @app.route('/api/books/format/<format>', methods=['GET'])
 def get_books_by_format(format):
-    conn = get_db_connection()
-    if not conn: return create_message_xml("Error DB", 500)
-    cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
-    LEFT JOIN authors a ON ba.author_id = a.author_id
-    WHERE f.name=%s GROUP BY b.isbn;
-    """
-    cur.execute(query, (format,))
-    rows = cur.fetchall()
-    cur.close(); conn.close()
-    return create_xml_response(rows) if rows else create_message_xml("No se encontraron libros", 404)
+    rows = handle_get_books_by_format_query(format)
+    if rows is None: return create_message_xml("Error DB", 500)
+    return create_books_response(rows) if rows else create_message_xml("No se encontraron libros", 404)
 
 @app.route('/api/books/insert', methods=['POST'])
 def insert_book():
@@ -209,6 +508,159 @@ def update_book(isbn):
     finally:
         cur.close(); conn.close()
 
+# --- Ajustes de stock ---
+
+# Suma atómica con condición: sin leer antes el stock, dos ventas a la vez
+# no se pisan (la segunda espera al bloqueo de fila de la primera y evalúa
+# la condición con el valor ya actualizado) y el stock nunca baja de 0.
+# Un stock NULL cuenta como 0.
+STOCK_UPDATE = ("UPDATE books SET stock = COALESCE(stock, 0) + %s "
+                "WHERE isbn=%s AND COALESCE(stock, 0) + %s >= 0")
+STOCK_BATCH_MAX = 1000
+
+def valid_stock_delta(delta):
+    # Con delta 0 el UPDATE no cambia la fila y rowcount sería 0, como un fallo
+    return isinstance(delta, int) and not isinstance(delta, bool) and delta != 0
+
+def parse_stock_items(items):
+    """
+    Valida los elementos {"isbn", "delta"} del ajuste por lotes.
+
+    Returns:
+        (items, error): [(isbn, delta)] y None, o None y el mensaje de error
+    """
+    parsed, seen = [], set()
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('isbn'), str):
+            return None, "Cada elemento necesita isbn y delta"
+        if not valid_stock_delta(item.get('delta')):
+            return None, f"delta inválido para {item['isbn']} (entero distinto de 0)"
+        # 'x' y 'X' son el mismo libro para la colación de MySQL
+        if isbn_key(item['isbn']) in seen:
+            return None, f"ISBN repetido en la petición: {item['isbn']}"
+        seen.add(isbn_key(item['isbn']))
+        parsed.append((item['isbn'], item['delta']))
+    return parsed, None
+
+def create_stock_xml(isbn, stock, status_code=200):
+    """Respuesta de un ajuste de stock con el stock resultante."""
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = "Stock actualizado"
+    ET.SubElement(root, 'status').text = str(status_code)
+    ET.SubElement(root, 'isbn').text = isbn
+    ET.SubElement(root, 'stock').text = str(stock)
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml', status=status_code)
+
+def create_stock_results_xml(results):
+    """Respuesta del ajuste de stock por lotes con un <result> por libro."""
+    failed = {r['status'] for r in results} - {200}
+    status_code = 200 if not failed else (409 if 409 in failed or 404 not in failed else 404)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = ("Stock actualizado" if not failed
+                                           else "Ningún ajuste aplicado: el lote es atómico")
+    ET.SubElement(root, 'status').text = str(status_code)
+    items = ET.SubElement(root, 'results')
+    for r in results:
+        attrs = {'isbn': r['isbn'], 'status': str(r['status'])}
+        if r['stock'] is not None:
+            attrs['stock'] = str(r['stock'])
+        ET.SubElement(items, 'result', attrs).text = r['message']
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml', status=status_code)
+
+def stock_results(items, stocks, applied):
+    """Resultado por libro del lote: aplicado, no encontrado, sin stock o arrastrado por otro."""
+    results = []
+    for isbn, delta in items:
+        stock = stocks.get(isbn_key(isbn))
+        if applied:
+            results.append({'isbn': isbn, 'status': 200, 'message': "Stock actualizado", 'stock': stock})
+        elif isbn_key(isbn) not in stocks:
+            results.append({'isbn': isbn, 'status': 404, 'message': "Libro no encontrado", 'stock': None})
+        elif (stock or 0) + delta < 0:
+            results.append({'isbn': isbn, 'status': 409, 'message': "Stock insuficiente", 'stock': stock})
+        else:
+            results.append({'isbn': isbn, 'status': 424, 'message': "No aplicado: falló otro libro del lote",
+                            'stock': stock})
+    return results
+
+@app.route('/api/books/<isbn>/stock', methods=['POST'])
+def adjust_stock(isbn):
+    """Suma un delta (con signo) al stock con un único UPDATE condicional."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not valid_stock_delta(data.get('delta')):
+        return create_message_xml("Se esperaba un delta entero distinto de 0", 400)
+    delta = data['delta']
+    conn = get_db_connection()
+    if not conn: return create_message_xml("Error DB", 500)
+    cur = conn.cursor()
+    try:
+        cur.execute(STOCK_UPDATE, (delta, isbn, delta))
+        updated = cur.rowcount
+        cur.execute("SELECT stock FROM books WHERE isbn=%s", (isbn,))
+        row = cur.fetchone()
+        if not updated:
+            conn.rollback()
+            if row is None:
+                return create_message_xml(f"No se encontró ningún libro con el ISBN {isbn}", 404)
+            return create_message_xml(f"Stock insuficiente para {isbn} (disponible: {row[0] or 0})", 409)
+        conn.commit()
+        return create_stock_xml(isbn, row[0])
+    except MySQLdb.Error as e:
+        conn.rollback()
+        return create_message_xml(f"Error: {e}", 500)
+    finally:
+        cur.close(); conn.close()
+
+@app.route('/api/books/stock', methods=['POST'])
+def adjust_stock_batch():
+    """
+    Aplica muchos ajustes en una sola transacción: todos o ninguno (p. ej.
+    los libros de un pedido).
+
+    Un solo UPDATE con CASE recorre la clave primaria en orden, así que dos
+    lotes concurrentes bloquean sus filas en el mismo orden y no se
+    interbloquean. Si alguna fila no cumple la condición se deshace todo y
+    se indica qué libros fallaron.
+    """
+    data = request.get_json(silent=True)
+    # Acepta una lista de {isbn, delta} o {"items": [...]}
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return create_message_xml("Se esperaba una lista de {isbn, delta}", 400)
+    if len(items) > STOCK_BATCH_MAX:
+        return create_message_xml(f"Máximo {STOCK_BATCH_MAX} libros por petición", 413)
+    items, error = parse_stock_items(items)
+    if error: return create_message_xml(error, 400)
+
+    isbns = [isbn for isbn, _ in items]
+    cases = ' '.join(['WHEN %s THEN %s'] * len(items))
+    case_params = [v for item in items for v in item]
+    in_list = ','.join(['%s'] * len(items))
+    sql = (f"UPDATE books SET stock = COALESCE(stock, 0) + CASE isbn {cases} END "
+           f"WHERE isbn IN ({in_list}) AND COALESCE(stock, 0) + CASE isbn {cases} END >= 0")
+
+    conn = get_db_connection()
+    if not conn: return create_message_xml("Error DB", 500)
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, case_params + isbns + case_params)
+        applied = cur.rowcount == len(items)
+        if not applied:
+            conn.rollback()
+        cur.execute(f"SELECT isbn, stock FROM books WHERE isbn IN ({in_list})", isbns)
+        # Por isbn_key: el ISBN pedido puede diferir del guardado en mayúsculas
+        stocks = {isbn_key(isbn): stock for isbn, stock in cur.fetchall()}
+        if applied:
+            conn.commit()
+        return create_stock_results_xml(stock_results(items, stocks, applied))
+    except MySQLdb.Error as e:
+        conn.rollback()
+        return create_message_xml(f"Error: {e}", 500)
+    finally:
+        cur.close(); conn.close()
+
 @app.route('/api/books/delete', methods=['DELETE'])
 def delete_books():
     data = request.get_json()
@@ -229,11 +681,54 @@ def delete_books():
     finally:
         cur.close(); conn.close()
 
+@app.route('/api/pool/stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(DB_POOL.stats())
+
+@app.route('/debug/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """Peores formas de query (?order=total_ms|max_ms|count, ?limit=20) con su EXPLAIN."""
+    try:
+        limit = int(request.args.get('limit', 20))
+        shapes = SLOW_QUERIES.top(limit, request.args.get('order', 'total_ms'))
+    except ValueError as e:
+        return create_message_xml(f"Parámetros inválidos: {e}", 400)
+    return jsonify({'threshold_ms': SLOW_QUERIES.threshold_ms, 'queries': shapes})
+
 # --- Página principal ---
 @app.route('/')
 def home():
     return render_template('index.html')
 
-# --- Run ---
+# --- Arranque por proceso ---
+def startup():
+    """
+    Prepara este proceso antes de atender peticiones: abre las conexiones
+    mínimas del pool y aplica las migraciones (con lock e idempotentes).
+
+    Cada worker de serve.py importa el módulo después del fork, así que
+    tiene su propio DB_POOL.
+    """
+    try:
+        DB_POOL.fill()
+        conn = DB_POOL.get_connection()
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+    except (MySQLdb.Error, PoolError) as e:
+        print(f"Aviso: no se pudo preparar la BD: {e}")
+
+def shutdown():
+    """Cierra las conexiones ociosas del pool (apagado ordenado del worker)."""
+    DB_POOL.close_all()
+
+def create_app():
+    """Punto de entrada WSGI: serve.py o gunicorn 'micro:create_app()'."""
+    startup()
+    return app
+
+# --- Run (servidor de desarrollo; en producción, serve.py) ---
 if __name__ == '__main__':
+    create_app()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,122 @@
+"""
+Servidor de producción del servicio (en lugar del app.run() de desarrollo).
+
+    python serve.py                                      # gunicorn, 4 workers x 8 hilos
+    python serve.py --workers 8 --threads 16 --bind 0.0.0.0:5000
+    python serve.py --server waitress --threads 32       # un proceso (Windows)
+
+gunicorn (prefork): cada worker importa el servicio después del fork (sin
+preload), así que tiene su propio pool de conexiones, cachés e hilos de
+fondo, y create_app() los prepara antes de que el worker acepte
+conexiones. SIGTERM deja de aceptar, espera a las peticiones en curso
+hasta --graceful-timeout y llama a shutdown() en cada worker.
+
+El worker por defecto es gthread: mysqlclient es una extensión en C que
+bloquea el hub de gevent, así que --worker-class gevent solo compensa con
+un driver MySQL cooperativo.
+
+waitress: un solo proceso con --threads hilos; SIGTERM o Ctrl+C cierran
+el servidor y llaman a shutdown().
+"""
+
+import argparse
+import os
+import signal
+import sys
+
+SERVICE = 'micro'
+
+
+def load_service():
+    """Importa el servicio (en el worker, no en el proceso maestro)."""
+    import micro as service
+    return service
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    def worker_exit(server, worker):
+        service = sys.modules.get(SERVICE)
+        if service is not None:
+            service.shutdown()
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': args.worker_class,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'keepalive': args.keepalive,
+        # Sin preload: nada de conexiones ni hilos creados antes del fork
+        'preload_app': False,
+        # Recicla workers de vez en cuando (fugas de memoria, conexiones viejas)
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'accesslog': '-' if args.access_log else None,
+        'worker_exit': worker_exit,
+    }
+
+    class ServiceApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load_service().create_app()
+
+    ServiceApplication().run()
+
+
+def run_waitress(args):
+    from waitress import create_server
+
+    service = load_service()
+    app = service.create_app()
+    host, _, port = args.bind.rpartition(':')
+    server = create_server(app, host=host or '0.0.0.0', port=int(port), threads=args.threads,
+                           channel_timeout=args.timeout)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Sirviendo {SERVICE} en http://{args.bind} ({args.threads} hilos)")
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        service.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f"Servidor de producción de {SERVICE}")
+    parser.add_argument('--server', choices=('gunicorn', 'waitress'),
+                        default='waitress' if os.name == 'nt' else 'gunicorn')
+    parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 4)),
+                        help="Procesos (solo gunicorn)")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 8)),
+                        help="Hilos por proceso")
+    parser.add_argument('--worker-class', default='gthread', help="Clase de worker de gunicorn")
+    parser.add_argument('--timeout', type=int, default=30,
+                        help="Segundos antes de reiniciar un worker colgado")
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help="Segundos para terminar las peticiones en curso al parar")
+    parser.add_argument('--keepalive', type=int, default=5)
+    parser.add_argument('--max-requests', type=int, default=10000,
+                        help="Peticiones antes de reciclar un worker (0 = nunca)")
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.server == 'gunicorn':
+        run_gunicorn(args)
+    else:
+        run_waitress(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""
+Pruebas de reporte5 sin MySQL: loadtest/standin_db.py (sqlite) se registra
+como MySQLdb antes de importar el servicio.
+
+    python -m pytest reporte5/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), os.path.join(HERE, '..', '..', 'loadtest')]
+
+import standin_db  # noqa: E402
+
+standin_db.install()
+
+
+@pytest.fixture(scope='session')
+def catalog(tmp_path_factory):
+    """BD sembrada una vez por sesión (el pool del servicio se conecta a ella)."""
+    return standin_db.seed(str(tmp_path_factory.mktemp('db') / 'libros.db'), books=50)
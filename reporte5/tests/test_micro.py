@@ -0,0 +1,82 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_cors')
+
+import micro  # noqa: E402
+
+
+@pytest.fixture
+def client(catalog):
+    micro.app.testing = True
+    return micro.app.test_client()
+
+
+# --- Cursor de paginación ---
+
+def test_page_cursor_round_trip():
+    token = micro.encode_page_cursor('Ñandú, el río', '978-X')
+    assert micro.decode_page_cursor(token) == ('Ñandú, el río', '978-X')
+
+
+@pytest.mark.parametrize('value', [
+    '{"a":1,"b":2}', '"ab"', '["t",1]', '["a","b","c"]', '[]', 'null',
+])
+def test_page_cursor_rejects_other_json(value):
+    import base64
+    token = base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+    with pytest.raises(ValueError):
+        micro.decode_page_cursor(token)
+
+
+@pytest.mark.parametrize('token', ['%%%', 'ñ', '', 'bm90IGpzb24'])
+def test_page_cursor_rejects_garbage(token):
+    with pytest.raises(ValueError):
+        micro.decode_page_cursor(token)
+
+
+def test_invalid_cursor_is_400(client):
+    assert client.get('/api/books?limit=5&after=e30').status_code == 400
+
+
+def test_keyset_pages_cover_catalog_once(client):
+    seen, after = [], None
+    while True:
+        url = '/api/books?limit=7' + (f'&after={after}' if after else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        root = ET.fromstring(response.data)
+        seen.extend(book.get('isbn') for book in root.iter('book'))
+        after = root.findtext('next')
+        if not after:
+            break
+    assert len(seen) == len(set(seen)) == 50
+
+
+# --- Ajuste de stock por lotes (todo o nada) ---
+
+def _stock(isbn):
+    conn = micro.get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT stock FROM books WHERE isbn=%s", (isbn,))
+        return cur.fetchone()[0] or 0
+    finally:
+        cur.close(); conn.close()
+
+
+def test_stock_batch_is_all_or_nothing(client, catalog):
+    first, second = catalog['isbns'][:2]
+    before = _stock(first), _stock(second)
+    response = client.post('/api/books/stock', json=[
+        {'isbn': first, 'delta': 1},
+        {'isbn': second, 'delta': -(before[1] + 1)},
+    ])
+    assert response.status_code == 409
+    assert (_stock(first), _stock(second)) == before
+
+    response = client.post('/api/books/stock', json=[{'isbn': first, 'delta': 2}])
+    assert response.status_code == 200
+    assert _stock(first) == before[0] + 2
@@ -0,0 +1,103 @@
+"""
+Escritura directa del XML del catálogo.
+
+Sustituye a construir un ET.Element con ocho SubElement por libro y
+serializarlo con ET.tostring: cada libro se escribe como texto en una
+única lista de fragmentos que se une al final. La salida es idéntica byte
+a byte a la de ElementTree (mismo escape, mismas etiquetas vacías
+"<tag />"), así que el XSLT, las ETags y los clientes no notan el cambio.
+
+El escape usa tablas de str.translate precalculadas y solo se aplica a
+los valores que contienen algún carácter especial (casi ninguno).
+"""
+
+_TEXT_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+# Mismos reemplazos que ElementTree en los atributos (incluidos \r \n \t)
+_ATTRIB_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+                               '\r': '&#13;', '\n': '&#10;', '\t': '&#09;'})
+
+# (clave de la fila, etiqueta, convertir con str()) en el orden del XML
+_BOOK_FIELDS = (
+    ('title', 'title', False),
+    ('authors', 'author', False),
+    ('year', 'year', True),
+    ('genre', 'genre', False),
+    ('price', 'price', True),
+    ('stock', 'stock', True),
+    ('format', 'format', False),
+)
+# Fragmentos precalculados: (clave, apertura, cierre, vacía, str())
+_BOOK_SPEC = tuple((key, f'<{tag}>', f'</{tag}>', f'<{tag} />', as_str)
+                   for key, tag, as_str in _BOOK_FIELDS)
+
+
+def escape_text(text):
+    if '&' in text or '<' in text or '>' in text:
+        return text.translate(_TEXT_TABLE)
+    return text
+
+
+def escape_attrib(text):
+    if ('&' in text or '<' in text or '>' in text or '"' in text
+            or '\r' in text or '\n' in text or '\t' in text):
+        return text.translate(_ATTRIB_TABLE)
+    return text
+
+
+def write_book(book, out):
+    """Añade a `out` los fragmentos de un <book> (misma forma que la fila del cursor)."""
+    out.append(f'<book isbn="{escape_attrib(str(book.get("isbn", "")))}">')
+    for key, opening, closing, empty, as_str in _BOOK_SPEC:
+        value = book.get(key, '')
+        if as_str:
+            value = str(value)
+        if value:
+            out.append(opening)
+            out.append(escape_text(value))
+            out.append(closing)
+        else:
+            out.append(empty)
+    out.append('</book>')
+
+
+def books_xml(books):
+    """Los <book> de una lista de filas, concatenados (chunks del modo streaming)."""
+    out = []
+    for book in books:
+        write_book(book, out)
+    return ''.join(out)
+
+
+def catalog_xml(books, next_cursor=None):
+    """Documento <catalog> completo, sin el prólogo."""
+    out = ['<catalog>']
+    for book in books:
+        write_book(book, out)
+    if next_cursor:
+        out.append(f'<next>{escape_text(next_cursor)}</next>')
+    if len(out) == 1:
+        return '<catalog />'
+    out.append('</catalog>')
+    return ''.join(out)
+
+
+def lookup_xml(isbns, books):
+    """
+    <catalog> de una consulta por lote: el <book> de cada ISBN pedido, en el
+    orden de la petición, o <not_found isbn="..." /> si no existe.
+
+    Args:
+        isbns: ISBNs en el orden pedido
+        books: {isbn: fila} con los encontrados
+    """
+    out = ['<catalog>']
+    for isbn in isbns:
+        book = books.get(isbn)
+        if book is None:
+            out.append(f'<not_found isbn="{escape_attrib(str(isbn))}" />')
+        else:
+            write_book(book, out)
+    if len(out) == 1:
+        return '<catalog />'
+    out.append('</catalog>')
+    return ''.join(out)
@@ -0,0 +1,300 @@
+"""
+Catálogo en memoria con índices para el lado Query.
+
+El catálogo cabe en RAM: se carga entero al arrancar en registros
+compactos (namedtuple) con índices dict por isbn, autor y formato y un
+array ordenado por título, de modo que las consultas por autor o formato
+son búsquedas O(resultado) sin ida y vuelta a la BD. Mantiene además el
+índice de búsqueda de texto y autocompletado de autores (search_index.py).
+
+Un único hilo lo mantiene al día: cada poll_interval segundos (o antes si
+alguien llama a notify()) pregunta a `changes(version)` qué ISBNs
+cambiaron desde la versión cargada y solo relee esos; si la fuente no
+puede decirlo, recarga el catálogo completo. Los lectores nunca esperan
+a la BD. Los suscriptores (subscribe()) reciben cada refresco ya aplicado,
+p. ej. el feed de cambios de change_feed.py.
+"""
+
+import bisect
+import heapq
+import threading
+import time
+from collections import namedtuple
+
+from search_index import SearchIndex, normalize
+
+BookRecord = namedtuple('BookRecord', 'isbn title year price stock genre format authors')
+
+
+def _fold(text):
+    # Las comparaciones de MySQL (colación *_ai_ci) no distinguen mayúsculas
+    # ni acentos: 'fiodor dostoyevski' encuentra a 'Fiódor Dostoyevski' y
+    # 'Álgebra' se ordena antes que 'Crimen', igual que con QUERY_BACKEND=mysql
+    return normalize(text)
+
+
+def _title_key(record):
+    return (_fold(record.title), str(record.isbn))
+
+
+def _split_authors(authors):
+    return {_fold(name.strip()) for name in (authors or '').split(',') if name.strip()}
+
+
+class CatalogStore:
+    """
+    Catálogo completo en memoria, refrescado de forma incremental.
+
+    Args:
+        load_rows: load_rows(isbns) -> filas (dicts) de esos ISBNs, o de todo
+            el catálogo si isbns es None; None si no hay conexión
+        changes: changes(version) -> (nueva_version, isbns); isbns es None
+            cuando hay que recargar todo (siempre en la primera carga, con
+            version None)
+        poll_interval: Segundos entre sondeos de cambios
+    """
+
+    def __init__(self, load_rows, changes, poll_interval=1.0):
+        self.load_rows = load_rows
+        self.changes = changes
+        self.poll_interval = poll_interval
+        self.version = None
+        self.synced_at = None       # time.time() del último sondeo correcto
+        self._books = {}            # isbn -> BookRecord
+        self._isbns = {}            # isbn (_fold) -> isbn guardado
+        self._by_author = {}        # autor (_fold) -> set(isbn)
+        self._by_format = {}        # formato (_fold) -> set(isbn)
+        self._titles = []           # [(título _fold, isbn)] ordenado
+        self._search = SearchIndex()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._subscribers = []
+        self._stats = {'loads': 0, 'refreshes': 0, 'refreshed_books': 0, 'errors': 0}
+
+    @property
+    def ready(self):
+        return self.version is not None
+
+    # --- Mantenimiento ---
+
+    def start(self):
+        """Carga el catálogo y lanza el hilo que lo mantiene al día."""
+        if self._thread and self._thread.is_alive():
+            return
+        self.sync()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='catalog-store', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def notify(self):
+        """Adelanta el próximo sondeo (p. ej. tras un comando en este proceso)."""
+        self._wake.set()
+
+    def subscribe(self, callback):
+        """
+        Registra callback(version, books) tras cada carga o refresco: books
+        es {isbn: fila o None si se borró}, o None si se recargó todo.
+        """
+        self._subscribers.append(callback)
+
+    def _publish(self, version, books):
+        for callback in self._subscribers:
+            try:
+                callback(version, books)
+            except Exception as e:
+                print(f"Error en suscriptor del catálogo: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.sync()
+
+    def sync(self):
+        """
+        Aplica los cambios pendientes.
+
+        Returns:
+            bool: False si la fuente de cambios o la BD fallaron
+        """
+        try:
+            started = time.time()
+            version, isbns = self.changes(self.version)
+            if isbns is None:
+                self._load(version)
+            elif version != self.version:
+                self._refresh(isbns, version)
+            self.synced_at = started
+            return True
+        except Exception as e:
+            self._stats['errors'] += 1
+            print(f"Error al sincronizar el catálogo en memoria: {e}")
+            return False
+
+    def _load(self, version):
+        rows = self.load_rows(None)
+        if rows is None:
+            raise RuntimeError("Sin conexión a la BD")
+        books, isbns, by_author, by_format, search = {}, {}, {}, {}, SearchIndex()
+        for row in rows:
+            record = BookRecord(**{field: row.get(field) for field in BookRecord._fields})
+            books[record.isbn] = record
+            isbns[_fold(record.isbn)] = record.isbn
+            search.add(record.isbn, record.title, record.authors)
+            for author in _split_authors(record.authors):
+                by_author.setdefault(author, set()).add(record.isbn)
+            by_format.setdefault(_fold(record.format), set()).add(record.isbn)
+        titles = sorted(_title_key(record) for record in books.values())
+        with self._lock:
+            self._books, self._by_author, self._by_format, self._titles = books, by_author, by_format, titles
+            self._isbns = isbns
+            self._search = search
+            self.version = version
+            self._stats['loads'] += 1
+        self._publish(version, None)
+
+    def _refresh(self, isbns, version):
+        rows = self.load_rows(sorted(isbns)) if isbns else []
+        if rows is None:
+            raise RuntimeError("Sin conexión a la BD")
+        # Los eventos traen el ISBN como lo escribió el cliente; el libro
+        # está guardado (y lo conocen los suscriptores) con el de MySQL
+        requested = {_fold(isbn): isbn for isbn in isbns}
+        with self._lock:
+            previous = {key: self._isbns.get(key) for key in requested}
+            for isbn in isbns:
+                self._remove(isbn)
+            for row in rows:
+                self._add(BookRecord(**{field: row.get(field) for field in BookRecord._fields}))
+            self.version = version
+            self._stats['refreshes'] += 1
+            self._stats['refreshed_books'] += len(isbns)
+            books = {}
+            for key, isbn in requested.items():
+                current = self._isbns.get(key)
+                books[current or previous[key] or isbn] = self._books[current]._asdict() if current else None
+        self._publish(version, books)
+
+    def _add(self, record):
+        self._remove(record.isbn)
+        self._books[record.isbn] = record
+        self._isbns[_fold(record.isbn)] = record.isbn
+        for author in _split_authors(record.authors):
+            self._by_author.setdefault(author, set()).add(record.isbn)
+        self._by_format.setdefault(_fold(record.format), set()).add(record.isbn)
+        bisect.insort(self._titles, _title_key(record))
+        self._search.add(record.isbn, record.title, record.authors)
+
+    def _remove(self, isbn):
+        isbn = self._isbns.get(_fold(isbn), isbn)
+        record = self._books.pop(isbn, None)
+        if record is None:
+            return
+        self._isbns.pop(_fold(isbn), None)
+        self._search.remove(isbn)
+        for author in _split_authors(record.authors):
+            self._discard(self._by_author, author, isbn)
+        self._discard(self._by_format, _fold(record.format), isbn)
+        title_key = _title_key(record)
+        pos = bisect.bisect_left(self._titles, title_key)
+        if pos < len(self._titles) and self._titles[pos] == title_key:
+            del self._titles[pos]
+
+    @staticmethod
+    def _discard(index, key, isbn):
+        members = index.get(key)
+        if members is not None:
+            members.discard(isbn)
+            if not members:
+                del index[key]
+
+    # --- Consultas (listas de dicts, como las de MySQL) ---
+
+    def _first_by_title(self, isbns, n):
+        """Los n primeros de `isbns` por título: recorre el array ordenado si son muchos."""
+        if len(isbns) * 8 < len(self._titles):
+            return heapq.nsmallest(n, (self._books[isbn] for isbn in isbns), key=_title_key)
+        found = []
+        for _, isbn in self._titles:
+            if isbn in isbns:
+                found.append(self._books[isbn])
+                if len(found) >= n:
+                    break
+        return found
+
+    def _sorted_records(self, isbns):
+        return sorted((self._books[isbn] for isbn in isbns), key=_title_key)
+
+    def _lookup(self, isbn):
+        # Como la clave primaria de MySQL: '...x' encuentra el libro '...X'
+        return self._books.get(isbn) or self._books.get(self._isbns.get(_fold(isbn)))
+
+    def get(self, isbn):
+        with self._lock:
+            record = self._lookup(isbn)
+        return [record._asdict()] if record else []
+
+    def get_many(self, isbns):
+        """{isbn guardado: fila} de los `isbns` que existen (los demás no aparecen)."""
+        with self._lock:
+            records = [self._lookup(isbn) for isbn in isbns]
+        return {r.isbn: r._asdict() for r in records if r is not None}
+
+    def by_author(self, author):
+        with self._lock:
+            records = self._sorted_records(self._by_author.get(_fold(author), ()))
+        return [r._asdict() for r in records]
+
+    def by_format(self, format_name):
+        with self._lock:
+            records = self._sorted_records(self._by_format.get(_fold(format_name), ()))
+        return [r._asdict() for r in records]
+
+    def all(self):
+        """Catálogo completo ordenado por título."""
+        with self._lock:
+            records = [self._books[isbn] for _, isbn in self._titles]
+        return [r._asdict() for r in records]
+
+    def page(self, limit, after=None):
+        """Hasta limit+1 libros posteriores al cursor (title, isbn), como la query keyset."""
+        with self._lock:
+            start = bisect.bisect_right(self._titles, (_fold(after[0]), str(after[1]))) if after else 0
+            records = [self._books[isbn] for _, isbn in self._titles[start:start + limit + 1]]
+        return [r._asdict() for r in records]
+
+    def search(self, query, limit=20):
+        """Libros que contienen todos los términos de `query`; los que coinciden en el título primero."""
+        with self._lock:
+            tiers = self._search.search(query)
+            records = []
+            for score in sorted(tiers, reverse=True):
+                if len(records) >= limit:
+                    break
+                records.extend(self._first_by_title(tiers[score], limit - len(records)))
+        return [r._asdict() for r in records]
+
+    def suggest_authors(self, prefix, limit=10):
+        with self._lock:
+            return self._search.suggest_authors(prefix, limit)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                'ready': self.ready,
+                'version': self.version,
+                'books': len(self._books),
+                'authors': len(self._by_author),
+                'formats': len(self._by_format),
+                'search': self._search.stats(),
+                'synced_seconds_ago': round(time.time() - self.synced_at, 3) if self.synced_at else None,
+            })
+        return data
@@ -0,0 +1,124 @@
+"""
+Feed de cambios del catálogo para los clientes (/api/books/changes).
+
+Se alimenta del catálogo en memoria (catalog_store.py): cada refresco
+publica un lote con la versión alcanzada y el estado actual de los libros
+que cambiaron, o su borrado. La versión es global (la posición del
+proyector en reporte6, la versión de la caché compartida 'epoch-n' en
+reporte7), así que el id de un evento vale en cualquier worker: un cliente
+que reconecta con Last-Event-ID recibe solo los lotes posteriores.
+
+Los eventos llevan el estado del libro, no la diferencia, y aplicar uno
+dos veces no cambia nada; por eso da igual que dos workers agrupen los
+cambios en lotes distintos. Si el cliente viene de antes de lo que
+conserva el buffer, de otro epoch, o el catálogo se recargó entero,
+recibe un 'reset' y debe volver a pedir /api/books.
+"""
+
+import json
+import threading
+from collections import deque
+
+
+def sequence_of(version):
+    """
+    (epoch, n) de una versión: 'epoch-n' o un entero.
+
+    Raises:
+        ValueError: Si no es una versión válida
+    """
+    epoch, _, n = str(version).rpartition('-')
+    return epoch, int(n)
+
+
+class ChangeFeed:
+    """
+    Últimos lotes de cambios del catálogo, con espera para SSE y long-poll.
+
+    Args:
+        max_batches: Lotes que se conservan para los clientes que reconectan
+    """
+
+    def __init__(self, max_batches=1000):
+        self.max_batches = max_batches
+        self.version = None      # última versión publicada
+        self._floor = None       # (epoch, n) desde la que el buffer está completo
+        self._batches = deque()  # (n, {isbn: fila o None})
+        self._cond = threading.Condition()
+        self._stats = {'batches': 0, 'resets': 0}
+
+    @property
+    def ready(self):
+        return self.version is not None
+
+    def publish(self, version, books):
+        """Suscriptor de CatalogStore: books es {isbn: fila o None}, o None si se recargó todo."""
+        epoch, n = sequence_of(version)
+        with self._cond:
+            if books is None or self._floor is None or epoch != self._floor[0]:
+                self._batches.clear()
+                self._floor = (epoch, n)
+                self._stats['resets'] += 1
+            elif books:
+                if len(self._batches) >= self.max_batches:
+                    dropped = self._batches.popleft()
+                    self._floor = (epoch, dropped[0])
+                self._batches.append((n, books))
+                self._stats['batches'] += 1
+            self.version = str(version)
+            self._cond.notify_all()
+
+    def since(self, last_id):
+        """
+        Cambios posteriores a `last_id`.
+
+        Returns:
+            (version, changes): changes es una lista de {'isbn', 'book'}
+            ('book' None si se borró), vacía si no hay nada nuevo, o None si
+            el cliente debe recargar el catálogo entero
+        """
+        with self._cond:
+            return self._since(last_id)
+
+    def _since(self, last_id):
+        if last_id == self.version:
+            return self.version, []
+        try:
+            epoch, n = sequence_of(last_id)
+        except ValueError:
+            return self.version, None
+        if self._floor is None or epoch != self._floor[0] or n < self._floor[1]:
+            return self.version, None
+        merged = {}
+        for batch_n, books in self._batches:
+            if batch_n > n:
+                merged.update(books)
+        return self.version, [{'isbn': isbn, 'book': book} for isbn, book in merged.items()]
+
+    def wait(self, last_id, timeout):
+        """Como since(), pero espera hasta `timeout` segundos a que haya algo nuevo."""
+        with self._cond:
+            result = None
+            def changed():
+                nonlocal result
+                result = self._since(last_id)
+                return result[1] is None or bool(result[1])
+            self._cond.wait_for(changed, timeout)
+            return result
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            data.update({'version': self.version, 'buffered_batches': len(self._batches),
+                         'floor': self._floor[1] if self._floor else None})
+            return data
+
+
+def sse_message(version, changes, event='changes'):
+    """Evento SSE con su id: un lote de cambios, o 'reset' si changes es None."""
+    if changes is None:
+        event, payload = 'reset', {'seq': version}
+    else:
+        payload = {'seq': version, 'changes': changes}
+    data = json.dumps(payload, separators=(',', ':'), default=str)
+    return f"id: {version}\nevent: {event}\ndata: {data}\n\n"
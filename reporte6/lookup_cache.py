@@ -0,0 +1,137 @@
+"""
+Caché en proceso nombre → id para las tablas de dimensión (genres, formats,
+authors).
+
+Estas tablas casi nunca cambian, así que los comandos resuelven los
+nombres en memoria en lugar de lanzar un SELECT por cada uno:
+
+- se precalienta al arrancar (warm),
+- está acotada (LRU de max_size entradas),
+- un fallo se resuelve contra la BD y se guarda,
+- cada check_interval segundos se compara una firma de la tabla
+  (COUNT(*) y un XOR de los CRC32 de cada id|nombre, que cambia también
+  al renombrar); si cambió, la caché se vacía y se recarga.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from search_index import normalize
+
+
+class LookupCache:
+    """
+    Caché acotada nombre → id de una tabla de dimensión.
+
+    Args:
+        table: Nombre de la tabla (genres, formats, authors)
+        id_column: Columna de id de la tabla
+        max_size: Máximo de nombres en memoria
+        check_interval: Segundos entre comprobaciones de versión
+    """
+
+    LOOKUP_CHUNK = 1000  # valores por cada IN (...) al resolver fallos
+
+    def __init__(self, table, id_column, max_size=10000, check_interval=30.0):
+        self.table = table
+        self.id_column = id_column
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._ids = OrderedDict()
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+    # --- Versión ---
+
+    def _signature(self, cur):
+        cur.execute(f"SELECT COUNT(*), COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', {self.id_column}, name))), 0) "
+                    f"FROM {self.table}")
+        return tuple(cur.fetchone())
+
+    def _check_version(self, cur):
+        """Recarga la caché si la firma de la tabla cambió (como mucho cada check_interval)."""
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        version = self._signature(cur)
+        with self._lock:
+            self._checked_at = now
+            changed = version != self._version
+        if changed:
+            self.warm(cur, version)
+
+    def warm(self, cur, version=None):
+        """Carga hasta max_size nombres de la tabla."""
+        if version is None:
+            version = self._signature(cur)
+        cur.execute(f"SELECT name, {self.id_column} FROM {self.table} "
+                    f"ORDER BY {self.id_column} LIMIT %s", (self.max_size,))
+        rows = cur.fetchall()
+        with self._lock:
+            self._ids = OrderedDict((row[0], row[1]) for row in rows)
+            self._version = version
+            self._checked_at = time.monotonic()
+            self._stats['reloads'] += 1
+
+    def invalidate(self):
+        """Fuerza la comprobación de versión en el próximo acceso."""
+        with self._lock:
+            self._version = None
+
+    # --- Consultas ---
+
+    def _remember(self, name, id_):
+        self._ids[name] = id_
+        self._ids.move_to_end(name)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def get(self, cur, name):
+        """Id de `name` o None si no existe en la tabla."""
+        return self.get_many(cur, [name]).get(name)
+
+    def get_many(self, cur, names):
+        """
+        Resuelve varios nombres; los que no están en memoria se buscan con
+        SELECT ... IN (...) por bloques. Los nombres inexistentes no aparecen
+        en el resultado (y no se cachean, para ver altas posteriores).
+        """
+        self._check_version(cur)
+        found, missing = {}, []
+        with self._lock:
+            for name in dict.fromkeys(names):
+                if name in self._ids:
+                    self._ids.move_to_end(name)
+                    found[name] = self._ids[name]
+                else:
+                    missing.append(name)
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(missing)
+        if not missing:
+            return found
+
+        rows = []
+        for i in range(0, len(missing), self.LOOKUP_CHUNK):
+            chunk = missing[i:i + self.LOOKUP_CHUNK]
+            cur.execute(f"SELECT name, {self.id_column} FROM {self.table} "
+                        f"WHERE name IN ({','.join(['%s'] * len(chunk))})", chunk)
+            rows.extend(cur.fetchall())
+        # La colación de MySQL no distingue mayúsculas ni acentos: se busca igual aquí
+        by_name = {row[0]: row[1] for row in rows}
+        by_folded = {normalize(row[0]): row[1] for row in rows}
+        with self._lock:
+            for name in missing:
+                id_ = by_name.get(name, by_folded.get(normalize(name)))
+                if id_ is not None:
+                    found[name] = id_
+                    self._remember(name, id_)
+        return found
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({'table': self.table, 'size': len(self._ids)})
+        return data
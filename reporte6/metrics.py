@@ -0,0 +1,456 @@
+"""
+Métricas por endpoint en formato de exposición de Prometheus (/metrics).
+
+Por cada petición se registra, con la regla de la ruta como etiqueta
+('/api/books/isbn/<isbn>', no la URL):
+
+- libros_http_requests_total{route,method,status}
+- libros_http_request_duration_seconds{route,method} (histograma)
+- libros_http_response_bytes_total{route,method} (bytes enviados, ya comprimidos)
+- libros_phase_seconds_total{route,phase}: tiempo en 'connect' (obtener
+  la conexión), 'query' (execute), 'fetch' (leer filas) y 'render'
+  (construir el XML/JSON/HTML de la respuesta)
+- libros_db_request_seconds{route} (histograma del tiempo de BD por petición)
+- libros_db_rows_total{route} y libros_db_statements_total{route}
+- libros_slow_requests_total{route}
+
+Las conexiones que devuelven las funciones get_db_connection* se envuelven
+con instrument(): sus cursores cronometran execute() y fetch*() y cuentan
+filas en los tiempos de la petición en curso (fuera de una petición la
+conexión se devuelve tal cual, sin coste, salvo que haya listeners de
+sentencias como el registro de queries lentas de slow_queries.py).
+
+Con SLOW_REQUEST_MS > 0 las peticiones más lentas se escriben en la salida
+con el desglose por fase.
+
+Con varios workers de gunicorn cada proceso tiene sus contadores; si
+METRICS_DIR apunta a un directorio compartido, cada worker vuelca ahí su
+snapshot y /metrics suma los de todos. Los snapshots de workers ya
+terminados (gunicorn los recicla con max_requests) se suman a un único
+{service}-dead.json y se borran: los contadores no bajan y el directorio
+no crece con cada worker.
+"""
+
+import glob
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # Windows: un solo proceso (waitress), no hay workers que plegar
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ('connect', 'query', 'fetch', 'render')
+
+HELP = {
+    'libros_http_requests_total': ('counter', "Peticiones atendidas"),
+    'libros_http_request_duration_seconds': ('histogram', "Latencia de las peticiones"),
+    'libros_http_response_bytes_total': ('counter', "Bytes de cuerpo enviados"),
+    'libros_phase_seconds_total': ('counter', "Tiempo por fase de la petición (connect, query, fetch, render)"),
+    'libros_db_request_seconds': ('histogram', "Tiempo de BD por petición"),
+    'libros_db_rows_total': ('counter', "Filas leídas de la BD"),
+    'libros_db_statements_total': ('counter', "Sentencias ejecutadas"),
+    'libros_slow_requests_total': ('counter', "Peticiones por encima de SLOW_REQUEST_MS"),
+}
+
+
+class RequestTimings:
+    """Tiempos acumulados de una petición (los rellenan los cursores instrumentados)."""
+
+    __slots__ = ('started', 'phases', 'rows', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.rows = 0
+        self.statements = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    @property
+    def db_seconds(self):
+        return self.phases['connect'] + self.phases['query'] + self.phases['fetch']
+
+
+class InstrumentedCursor:
+    """
+    Cursor que suma el tiempo de execute()/fetch*() y las filas leídas, y
+    pasa la duración de cada sentencia a los listeners (p. ej. el registro
+    de queries lentas). `timings` es None fuera de una petición.
+    """
+
+    def __init__(self, cursor, timings, listeners=()):
+        self._cursor = cursor
+        self._timings = timings
+        self._listeners = listeners
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, phase, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            if self._timings is not None:
+                self._timings.add(phase, time.perf_counter() - started)
+
+    def _statement(self, fn, query, args):
+        if self._timings is not None:
+            self._timings.statements += 1
+        started = time.perf_counter()
+        try:
+            return fn(query, args)
+        finally:
+            elapsed = time.perf_counter() - started
+            if self._timings is not None:
+                self._timings.add('query', elapsed)
+            for listener in self._listeners:
+                listener(query, args, elapsed)
+
+    def execute(self, query, args=None):
+        return self._statement(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._statement(self._cursor.executemany, query, args)
+
+    def _count(self, n):
+        if self._timings is not None:
+            self._timings.rows += n
+
+    def fetchone(self):
+        row = self._timed('fetch', self._cursor.fetchone)
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed('fetch', self._cursor.fetchmany, *(() if size is None else (size,)))
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._timed('fetch', self._cursor.fetchall)
+        self._count(len(rows))
+        return rows
+
+
+class InstrumentedConnection:
+    """Conexión (cruda, del pool o del router) cuyos cursores se cronometran."""
+
+    def __init__(self, conn, timings, listeners=()):
+        self._conn = conn
+        self._timings = timings
+        self._listeners = listeners
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._timings, self._listeners)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+
+class Metrics:
+    """
+    Registro de métricas de un servicio Flask.
+
+    Args:
+        service: Nombre del servicio (prefijo de los ficheros de METRICS_DIR)
+        slow_request_ms: Umbral del log de peticiones lentas (0 = desactivado)
+        directory: Directorio compartido entre workers (None = por proceso)
+        buckets: Límites superiores de los histogramas, en segundos
+        flush_interval: Segundos entre volcados del snapshot a `directory`
+    """
+
+    def __init__(self, service, slow_request_ms=0, directory=None, buckets=DEFAULT_BUCKETS,
+                 flush_interval=5.0):
+        self.service = service
+        self.slow_request_ms = slow_request_ms
+        self.directory = directory
+        self.buckets = tuple(buckets)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}     # (nombre, etiquetas) -> valor
+        self._histograms = {}   # (nombre, etiquetas) -> [cuentas por bucket..., suma, total]
+        self._flusher = None
+        self._pid = self._token = None
+        self.statement_listeners = []   # fn(query, params, segundos) por sentencia
+
+    # --- Registro ---
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+
+    # --- Integración con Flask ---
+
+    def init_app(self, app):
+        """
+        Registra los hooks de la petición y la ruta /metrics. Debe llamarse
+        nada más crear la app: su after_request se ejecuta el último y ve
+        la respuesta ya comprimida.
+        """
+        from flask import Response, g, request
+
+        @app.before_request
+        def start_timings():
+            g.metrics = RequestTimings()
+
+        @app.after_request
+        def record_request(response):
+            timings = g.get('metrics')
+            if timings is None:
+                return response
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            method, status = request.method, response.status_code
+            if not response.is_streamed or response.direct_passthrough:
+                # Ficheros (send_from_directory) con su Content-Length, sin perder sendfile
+                self.record(route, method, status, timings, response.content_length or 0)
+                return response
+            # Respuesta por chunks: se registra al terminar de enviarla
+            body, chunks = response.response, response.iter_encoded()
+            def counted():
+                size = 0
+                try:
+                    for chunk in chunks:
+                        size += len(chunk)
+                        yield chunk
+                finally:
+                    if hasattr(body, 'close'):
+                        body.close()
+                    self.record(route, method, status, timings, size)
+            response.response = counted()
+            return response
+
+        @app.route('/metrics')
+        def metrics():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def current(self):
+        """RequestTimings de la petición en curso, o None."""
+        from flask import g, has_request_context
+        return g.get('metrics') if has_request_context() else None
+
+    def add_statement_listener(self, listener):
+        """Registra `listener(query, params, segundos)`, llamado tras cada sentencia."""
+        self.statement_listeners.append(listener)
+
+    def instrument(self, conn, connect_seconds=0.0):
+        """
+        Envuelve `conn` para cronometrar sus cursores dentro de la petición en
+        curso. Fuera de una petición solo se envuelve si hay listeners.
+        """
+        timings = self.current()
+        if conn is None or (timings is None and not self.statement_listeners):
+            return conn
+        if timings is not None:
+            timings.add('connect', connect_seconds)
+        return InstrumentedConnection(conn, timings, self.statement_listeners)
+
+    @contextmanager
+    def timed(self, phase):
+        """Suma a `phase` el tiempo del bloque (no hace nada fuera de una petición)."""
+        timings = self.current()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if timings is not None:
+                timings.add(phase, time.perf_counter() - started)
+
+    def record(self, route, method, status, timings, size):
+        elapsed = time.perf_counter() - timings.started
+        self.inc('libros_http_requests_total', (('route', route), ('method', method), ('status', str(status))))
+        self.observe('libros_http_request_duration_seconds', (('route', route), ('method', method)), elapsed)
+        self.inc('libros_http_response_bytes_total', (('route', route), ('method', method)), size)
+        if timings.statements:
+            self.observe('libros_db_request_seconds', (('route', route),), timings.db_seconds)
+            self.inc('libros_db_statements_total', (('route', route),), timings.statements)
+            self.inc('libros_db_rows_total', (('route', route),), timings.rows)
+        for phase, seconds in timings.phases.items():
+            if seconds:
+                self.inc('libros_phase_seconds_total', (('route', route), ('phase', phase)), seconds)
+        if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+            self.inc('libros_slow_requests_total', (('route', route),))
+            phases = ' '.join(f'{p}={s * 1000:.1f}ms' for p, s in timings.phases.items())
+            print(f"Petición lenta: {method} {route} {status} {elapsed * 1000:.1f}ms {phases} "
+                  f"sentencias={timings.statements} filas={timings.rows} bytes={size}")
+
+    # --- Exposición ---
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(h)] for (name, labels), h in self._histograms.items()],
+            }
+
+    def _snapshot_path(self):
+        # El token distingue a un worker nuevo que reutiliza el pid de uno muerto
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid, self._token = pid, os.urandom(4).hex()
+        return os.path.join(self.directory, f'{self.service}-{pid}-{self._token}.json')
+
+    def _dead_path(self):
+        return os.path.join(self.directory, f'{self.service}-dead.json')
+
+    def _worker_files(self):
+        """[(fichero, pid)] de los snapshots por proceso de METRICS_DIR."""
+        pattern = re.compile(re.escape(self.service) + r'-(\d+)(?:-[0-9a-f]+)?\.json$')
+        files = []
+        for path in glob.glob(os.path.join(self.directory, f'{self.service}-*.json')):
+            match = pattern.match(os.path.basename(path))
+            if match:
+                files.append((path, int(match.group(1))))
+        return files
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, snap):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(snap, fh)
+        os.replace(tmp, path)
+
+    def fold_dead(self):
+        """
+        Suma a {service}-dead.json los snapshots de los procesos que ya no
+        existen y los borra. Un cerrojo de fichero evita que dos workers
+        plieguen a la vez el mismo snapshot.
+        """
+        if fcntl is None:
+            return
+        with open(os.path.join(self.directory, f'.{self.service}.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                dead = [path for path, pid in self._worker_files() if pid != os.getpid() and not _alive(pid)]
+                if not dead:
+                    return
+                snapshots = [self._read(path) for path in [self._dead_path()] + dead]
+                counters, histograms = self._combine(snap for snap in snapshots if snap)
+                self._write(self._dead_path(), {
+                    'buckets': list(self.buckets),
+                    'counters': [[name, list(labels), v] for (name, labels), v in counters.items()],
+                    'histograms': [[name, list(labels), h] for (name, labels), h in histograms.items()],
+                })
+                for path in dead:
+                    os.remove(path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def flush(self):
+        """Vuelca el snapshot de este proceso a METRICS_DIR (escritura atómica)."""
+        self._write(self._snapshot_path(), self.snapshot())
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Error al volcar métricas: {e}")
+
+    def collect(self):
+        """Snapshots a exponer: el de este proceso o, con METRICS_DIR, los de todos los workers."""
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        try:
+            self.fold_dead()
+        except OSError as e:
+            print(f"Error al plegar métricas de workers terminados: {e}")
+        paths = [path for path, _ in self._worker_files()] + [self._dead_path()]
+        return [snap for snap in map(self._read, paths) if snap]
+
+    def _combine(self, snapshots):
+        """Suma de los snapshots: ({(nombre, etiquetas): valor}, {(nombre, etiquetas): histograma})."""
+        counters, histograms = {}, {}
+        for snap in snapshots:
+            for name, labels, value in snap['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snap['histograms']:
+                if snap['buckets'] != list(self.buckets):
+                    continue  # worker con otros buckets (versión anterior)
+                key = (name, tuple(map(tuple, labels)))
+                current = histograms.setdefault(key, [0] * len(values))
+                for i, v in enumerate(values):
+                    current[i] += v
+        return counters, histograms
+
+    def render(self):
+        """Texto de exposición de Prometheus con la suma de todos los snapshots."""
+        counters, histograms = self._combine(self.collect())
+        lines = []
+        for name, (kind, help_text) in HELP.items():
+            series = [(labels, v) for (n, labels), v in sorted(counters.items()) if n == name]
+            hists = [(labels, h) for (n, labels), h in sorted(histograms.items()) if n == name]
+            if not series and not hists:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in series:
+                lines.append(f'{name}{_labels(labels)} {value}')
+            for labels, hist in hists:
+                cumulative = 0
+                for bound, count in zip(self.buckets, hist):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", f"{bound:g}"),))} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {hist[-1]}')
+                lines.append(f'{name}_sum{_labels(labels)} {hist[-2]}')
+                lines.append(f'{name}_count{_labels(labels)} {hist[-1]}')
+        return '\n'.join(lines) + '\n'
@@ -1,16 +1,45 @@
+import base64
+import json
+import math
+import mimetypes
+import os
+import threading
+import time
 import xml.etree.ElementTree as ET
-from flask import Flask, request, Response, render_template, send_from_directory
+from flask import Flask, request, Response, render_template, send_from_directory, stream_with_context, jsonify, g, has_request_context
 import MySQLdb
 from flask_cors import CORS
+from werkzeug.security import safe_join
+from catalog_store import CatalogStore
+from change_feed import ChangeFeed, sse_message
+from compression import CompressedFiles, compress_response, is_compressible, negotiate_encoding, should_compress
+from lookup_cache import LookupCache
+from metrics import Metrics
+from migrations import migrate
+from replica_router import ReplicaRouter
+from slow_queries import SlowQueryLog
+from serializers import XML_MIMETYPE, negotiate, serialize_books
+from xml_writer import books_xml, catalog_xml, lookup_xml
+from read_model import VIEW_COLUMNS
+from search_index import tokenize
+from outbox import BOOK_INSERTED, BOOK_UPDATED, BOOK_DELETED, append_event, append_events
+from projector import Projector
 
 # --- Configuración Flask ---
 app = Flask(__name__)
 
+# Métricas por endpoint (/metrics). Se registran antes que los demás
+# after_request para medir la respuesta final, ya comprimida.
+METRICS = Metrics('microservicioCQRS', slow_request_ms=float(os.environ.get('SLOW_REQUEST_MS', 0)),
+                  directory=os.environ.get('METRICS_DIR') or None)
+METRICS.init_app(app)
+
 CORS(
     app,
     resources={r"/api/*": {"origins": ["*"]}},
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Accept"],
+    allow_headers=["Content-Type", "Accept", "X-Min-Position", "X-Session-Token"],
+    expose_headers=["X-Event-Position", "X-Read-Position", "X-Session-Token"],
 )
 
 # ==============================================================================
@@ -39,42 +68,386 @@ DB_CONFIG_COMMAND = {
     'charset': 'utf8mb4'
 }
 
+# Réplicas de solo lectura (misma forma que DB_CONFIG_QUERY). Con la lista
+# vacía todas las lecturas van a DB_CONFIG_QUERY, que también es el destino
+# de respaldo cuando ninguna réplica está sana o al día.
+DB_CONFIG_REPLICAS = []
+REPLICA_MAX_LAG = 5.0  # segundos
+READ_ROUTER = ReplicaRouter(DB_CONFIG_QUERY, DB_CONFIG_REPLICAS, max_lag=REPLICA_MAX_LAG,
+                            strategy='least_connections')
+
+# Sentencias por encima de SLOW_QUERY_MS (lecturas y comandos, también las
+# del proyector y del catálogo): se escriben con sus parámetros y se agrupan
+# por forma con su EXPLAIN, lanzado contra la primaria con una conexión sin
+# instrumentar. Ver /debug/slow-queries.
+SLOW_QUERIES = SlowQueryLog(lambda: MySQLdb.connect(**DB_CONFIG_COMMAND),
+                            threshold_ms=float(os.environ.get('SLOW_QUERY_MS', 200)))
+METRICS.add_statement_listener(SLOW_QUERIES.record)
+
 # --- Conexiones de Base de Datos ---
 
 def get_db_connection_query():
-    """Obtiene una conexión de BD para operaciones de LECTURA (Queries)."""
+    """
+    Obtiene una conexión de BD para operaciones de LECTURA (Queries).
+
+    El router elige réplica; si la petición trae X-Session-Token (emitido
+    tras un comando) solo usa réplicas que ya tengan esos escritos.
+    """
+    started = time.perf_counter()
     try:
-        return MySQLdb.connect(**DB_CONFIG_QUERY)
+        if has_request_context():
+            conn = READ_ROUTER.get_connection(request.headers.get('X-Session-Token'),
+                                              force_primary=g.get('read_from_primary', False))
+        else:
+            conn = READ_ROUTER.get_connection()
     except MySQLdb.Error as e:
         print(f"Error DB (Query): {e}")
         return None
+    return METRICS.instrument(conn, time.perf_counter() - started)
+
+def track_session(cur):
+    """Tras el commit de un comando, prepara el token read-your-writes de la respuesta."""
+    if READ_ROUTER.replicas and has_request_context():
+        g.session_token = READ_ROUTER.session_token(cur)
+
+@app.after_request
+def add_session_token(response):
+    token = g.get('session_token')
+    if token:
+        response.headers['X-Session-Token'] = token
+    return response
 
 def get_db_connection_command():
     """Obtiene una conexión de BD para operaciones de ESCRITURA (Commands)."""
+    started = time.perf_counter()
     try:
-        return MySQLdb.connect(**DB_CONFIG_COMMAND)
+        conn = MySQLdb.connect(**DB_CONFIG_COMMAND)
     except MySQLdb.Error as e:
         print(f"Error DB (Command): {e}")
         return None
+    return METRICS.instrument(conn, time.perf_counter() - started)
+
+# --- Proyector de read models ---
+
+# Los comandos solo escriben en el outbox; el proyector actualiza books_view
+# de forma asíncrona. Con PROJECTOR_EMBEDDED=0 se ejecuta aparte
+# (python projector.py) y este proceso solo consulta su checkpoint.
+# reporte5 y reporte7 escriben en las mismas tablas sin outbox: cada
+# RECONCILE_INTERVAL segundos el proyector reproyecta lo que se haya desviado.
+PROJECTOR = Projector(get_db_connection_command,
+                      reconcile_interval=float(os.environ.get('RECONCILE_INTERVAL', 300)))
+PROJECTOR_EMBEDDED = os.environ.get('PROJECTOR_EMBEDDED', '1') == '1'
+# Máximo que una lectura espera a que el read model alcance su posición
+READ_WAIT_TIMEOUT = 2.0
+
+def wait_for_read_model():
+    """
+    Lectura opcional "read-your-writes": si el cliente envía ?min_position=N
+    (o la cabecera X-Min-Position) espera a que el proyector haya aplicado
+    el evento N. Devuelve una respuesta de error si no lo alcanza a tiempo.
+    """
+    raw = request.args.get('min_position') or request.headers.get('X-Min-Position')
+    if not raw: return None
+    try:
+        position = int(raw)
+    except ValueError:
+        return create_message_xml("min_position inválido", 400)
+    try:
+        reached = PROJECTOR.wait_for(position, READ_WAIT_TIMEOUT)
+    except MySQLdb.Error:
+        return create_message_xml("Error DB (Query)", 500)
+    if not reached:
+        return create_message_xml(f"El read model aún no alcanza la posición {position}", 503)
+    # El checkpoint alcanzado está en la primaria; una réplica podría no tenerlo aún
+    g.read_from_primary = True
+    g.min_position = position
+    return None
+
+def with_read_position(response):
+    response.headers['X-Read-Position'] = str(g.get('read_position', PROJECTOR.position))
+    return response
+
+# --- Catálogo en memoria (opcional) ---
+# QUERY_BACKEND=memory carga books_view en RAM al arrancar y lo mantiene al
+# día siguiendo el checkpoint del proyector y el outbox; con 'mysql' (por
+# defecto) todas las queries van a la BD.
+QUERY_BACKEND = os.environ.get('QUERY_BACKEND', 'mysql')
+# La búsqueda (/api/books/search, /api/authors/suggest) usa el índice del
+# catálogo en memoria y, si no está cargado, LIKE sobre books_view (correcto
+# pero recorre la tabla). SEARCH_INDEX=1 carga el catálogo aunque
+# QUERY_BACKEND sea 'mysql'; es opcional porque cada worker guarda y sondea
+# el catálogo entero. El feed de cambios (/api/books/changes) solo existe
+# con el catálogo en memoria: sin él responde 404 y el cliente deja de pedirlo.
+SEARCH_INDEX = os.environ.get('SEARCH_INDEX', '0') == '1'
+CATALOG_IN_MEMORY = QUERY_BACKEND == 'memory' or SEARCH_INDEX
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Con más ISBNs cambiados desde el último sondeo se recarga el catálogo entero
+CATALOG_RELOAD_THRESHOLD = 10000
+
+def load_catalog_rows(isbns=None):
+    """Filas de books_view (todas o las de `isbns`) leídas de la primaria."""
+    conn = get_db_connection_command()
+    if not conn: return None
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    try:
+        if isbns is None:
+            cur.execute(f"SELECT {VIEW_COLUMNS} FROM books_view")
+            return list(cur.fetchall())
+        rows = []
+        for i in range(0, len(isbns), BULK_LOOKUP_CHUNK):
+            chunk = isbns[i:i + BULK_LOOKUP_CHUNK]
+            cur.execute(f"SELECT {VIEW_COLUMNS} FROM books_view "
+                        f"WHERE isbn IN ({','.join(['%s'] * len(chunk))})", chunk)
+            rows.extend(cur.fetchall())
+        return rows
+    finally:
+        cur.close(); conn.close()
+
+def catalog_changes(position):
+    """
+    Feed de cambios del catálogo en memoria: posición actual del proyector
+    y los ISBNs de los eventos del outbox aplicados desde `position`.
+    """
+    conn = get_db_connection_command()
+    if not conn: raise MySQLdb.OperationalError("Sin conexión a la BD")
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT position FROM projector_checkpoint WHERE name=%s", (PROJECTOR.name,))
+        row = cur.fetchone()
+        current = row[0] if row else 0
+        if position is None or current < position:
+            return current, None
+        if current == position:
+            return current, set()
+        cur.execute("SELECT DISTINCT isbn FROM outbox WHERE event_id > %s AND event_id <= %s LIMIT %s",
+                    (position, current, CATALOG_RELOAD_THRESHOLD + 1))
+        isbns = {row[0] for row in cur.fetchall()}
+        return current, (isbns if len(isbns) <= CATALOG_RELOAD_THRESHOLD else None)
+    finally:
+        cur.close(); conn.close()
+
+CATALOG_STORE = CatalogStore(load_catalog_rows, catalog_changes, poll_interval=1.0)
+
+def catalog_store():
+    """
+    CATALOG_STORE si está cargado y alcanza la posición pedida con
+    min_position; si no, None y la query va a MySQL.
+    """
+    if QUERY_BACKEND != 'memory' or not CATALOG_STORE.ready: return None
+    if has_request_context():
+        if CATALOG_STORE.version < g.get('min_position', 0):
+            CATALOG_STORE.notify()
+            return None
+        g.read_position = CATALOG_STORE.version
+    return CATALOG_STORE
 
 # --- Helpers XML (Sin cambios, son parte de la capa de presentación) ---
-def create_xml_response(books_data):
-    catalog = ET.Element('catalog')
-    for book_dict in books_data:
-        book = ET.SubElement(catalog, 'book', isbn=str(book_dict.get('isbn', '')))
-        ET.SubElement(book, 'title').text = book_dict.get('title', '')
-        ET.SubElement(book, 'author').text = book_dict.get('authors', '')
-        ET.SubElement(book, 'year').text = str(book_dict.get('year', ''))
-        ET.SubElement(book, 'genre').text = book_dict.get('genre', '')
-        ET.SubElement(book, 'price').text = str(book_dict.get('price', ''))
-        ET.SubElement(book, 'stock').text = str(book_dict.get('stock', ''))
-        ET.SubElement(book, 'format').text = book_dict.get('format', '')
-    return Response(
-        '<?xml version="1.0" encoding="UTF-8"?>\n'
-        '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n' +
-        ET.tostring(catalog, encoding='UTF-8').decode('utf-8'),
-        mimetype='application/xml'
-    )
+XML_PROLOG = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n')
+
+# Filas leídas del cursor de servidor por cada chunk del modo streaming
+STREAM_BATCH_SIZE = 500
+
+def create_xml_response(books_data, next_cursor=None):
+    # next_cursor: cursor para pedir la página siguiente con ?after=
+    # xmlcharrefreplace como ET.tostring: misma salida byte a byte
+    with METRICS.timed('render'):
+        body = (XML_PROLOG + catalog_xml(books_data, next_cursor)).encode('utf-8', 'xmlcharrefreplace')
+    return Response(body, mimetype='application/xml')
+
+def create_books_response(books_data, next_cursor=None):
+    """
+    Respuesta de una query en el formato que pide Accept: XML por defecto,
+    JSON o MessagePack (filas tal cual, sin un nodo por campo).
+    """
+    mimetype = negotiate(request.accept_mimetypes)
+    if mimetype == XML_MIMETYPE:
+        response = create_xml_response(books_data, next_cursor)
+    else:
+        with METRICS.timed('render'):
+            body = serialize_books(mimetype, books_data, next_cursor)
+        response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def isbn_key(isbn):
+    # La colación de MySQL no distingue mayúsculas: '...x' y '...X' son el mismo ISBN
+    return str(isbn).casefold()
+
+def by_requested_isbn(isbns, rows):
+    """{isbn pedido: fila}, emparejando con isbn_key igual que compara MySQL."""
+    by_key = {isbn_key(row['isbn']): row for row in rows}
+    return {isbn: by_key[isbn_key(isbn)] for isbn in isbns if isbn_key(isbn) in by_key}
+
+def create_lookup_response(isbns, books):
+    """
+    Respuesta de la consulta por lote: un libro por ISBN pedido, en el orden
+    de la petición. Los que no existen van como <not_found isbn="..." /> (o
+    {"isbn": ..., "not_found": true} en JSON/MessagePack) en lugar de un 404.
+    """
+    mimetype = negotiate(request.accept_mimetypes)
+    if mimetype == XML_MIMETYPE:
+        with METRICS.timed('render'):
+            body = (XML_PROLOG + lookup_xml(isbns, books)).encode('utf-8', 'xmlcharrefreplace')
+        response = Response(body, mimetype=XML_MIMETYPE)
+    else:
+        rows = [books.get(isbn) or {'isbn': isbn, 'not_found': True} for isbn in isbns]
+        with METRICS.timed('render'):
+            body = serialize_books(mimetype, rows)
+        response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def generate_xml_catalog(batches):
+    """Genera el catálogo por chunks: prólogo, los <book> de cada lote y el cierre."""
+    yield XML_PROLOG + '<catalog>'
+    for rows in batches:
+        with METRICS.timed('render'):
+            chunk = books_xml(rows)
+        yield chunk
+    yield '</catalog>'
+
+def create_xml_stream_response(batches):
+    """Respuesta streaming: memoria constante y primer byte sin esperar al catálogo entero."""
+    return Response(stream_with_context(generate_xml_catalog(batches)),
+                    mimetype='application/xml')
+
+# --- Paginación keyset (?limit=N&after=<cursor>) ---
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_page_cursor(title, isbn):
+    """Cursor opaco con la clave (title, isbn) del último libro de la página."""
+    raw = json.dumps([title, str(isbn)], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(token):
+    """Devuelve (title, isbn); lanza ValueError si el cursor no es válido."""
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError("Cursor inválido")
+    # Solo [title, isbn]: un dict o una cadena de 2 elementos también se desempaquetarían
+    if (not isinstance(cursor, list) or len(cursor) != 2
+            or not all(isinstance(part, str) for part in cursor)):
+        raise ValueError("Cursor inválido")
+    title, isbn = cursor
+    return title, isbn
+
+def parse_page_args():
+    """
+    Lee ?limit y ?after de la petición.
+
+    Returns:
+        (limit, after): (None, None) si no se pidió paginar; after es
+        (title, isbn) o None para la primera página.
+
+    Raises:
+        ValueError: Si limit o el cursor no son válidos
+    """
+    limit_raw = request.args.get('limit')
+    after_raw = request.args.get('after')
+    if limit_raw is None and after_raw is None:
+        return None, None
+    try:
+        limit = int(limit_raw) if limit_raw is not None else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError("limit inválido")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+    after = decode_page_cursor(after_raw) if after_raw else None
+    return limit, after
+
+def parse_limit_arg(default, maximum):
+    """Lee ?limit (entre 1 y maximum); lanza ValueError si no es válido."""
+    raw = request.args.get('limit')
+    if raw is None: return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError("limit inválido")
+    if not 1 <= limit <= maximum:
+        raise ValueError(f"limit debe estar entre 1 y {maximum}")
+    return limit
+
+# --- Consulta por lote de ISBNs (?ids=a,b,c o POST) ---
+# Máximo de ISBNs por petición: todos caben en un único IN (...)
+ISBN_BATCH_MAX = 1000
+
+def parse_isbns_arg():
+    """
+    ISBNs pedidos, en orden: ?ids=a,b,c en GET; en POST una lista JSON o
+    {"isbns": [...]} (para listas que no caben en la URL).
+
+    Raises:
+        ValueError: Si no hay ISBNs o el cuerpo no tiene el formato esperado
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        raw = data.get('isbns') if isinstance(data, dict) else data
+        if not isinstance(raw, list) or not all(isinstance(i, (str, int)) for i in raw):
+            raise ValueError("Se esperaba una lista de ISBNs")
+    else:
+        raw = request.args.get('ids', '').split(',')
+    isbns = [str(i).strip() for i in raw if str(i).strip()]
+    if not isbns:
+        raise ValueError("No se indicó ningún ISBN")
+    return isbns
+
+def split_page(rows, limit):
+    """Recorta las limit+1 filas leídas y calcula el cursor de la página siguiente."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_page_cursor(rows[-1]['title'], rows[-1]['isbn'])
+
+def create_bulk_results_xml(results):
+    """Respuesta de la inserción masiva con un <result> por libro."""
+    inserted = sum(1 for r in results if r['status'] == 201)
+    status_code = 201 if inserted == len(results) else (207 if inserted else 400)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = f"{inserted} de {len(results)} libros insertados"
+    ET.SubElement(root, 'status').text = str(status_code)
+    items = ET.SubElement(root, 'results')
+    for r in results:
+        ET.SubElement(items, 'result', isbn=str(r['isbn'] or ''), status=str(r['status'])).text = r['message']
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml', status=status_code)
+
+def create_stock_xml(isbn, stock, status_code=200):
+    """Respuesta de un ajuste de stock con el stock resultante."""
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = "Stock actualizado"
+    ET.SubElement(root, 'status').text = str(status_code)
+    ET.SubElement(root, 'isbn').text = isbn
+    ET.SubElement(root, 'stock').text = str(stock)
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml', status=status_code)
+
+def create_stock_results_xml(results):
+    """Respuesta del ajuste de stock por lotes con un <result> por libro."""
+    failed = {r['status'] for r in results} - {200}
+    status_code = 200 if not failed else (409 if 409 in failed or 404 not in failed else 404)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = ("Stock actualizado" if not failed
+                                           else "Ningún ajuste aplicado: el lote es atómico")
+    ET.SubElement(root, 'status').text = str(status_code)
+    items = ET.SubElement(root, 'results')
+    for r in results:
+        attrs = {'isbn': r['isbn'], 'status': str(r['status'])}
+        if r['stock'] is not None:
+            attrs['stock'] = str(r['stock'])
+        ET.SubElement(items, 'result', attrs).text = r['message']
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml', status=status_code)
+
+def create_authors_xml(names):
+    root = ET.Element('authors')
+    for name in names:
+        ET.SubElement(root, 'author').text = name
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml')
 
 def create_message_xml(message, status_code=200):
     root = ET.Element('response')
@@ -83,33 +456,101 @@ def create_message_xml(message, status_code=200):
     return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
                     mimetype='application/xml', status=status_code)
 
+# --- Compresión gzip/brotli (Accept-Encoding) ---
+COMPRESSED_FILES = CompressedFiles()
+
+def send_compressed_file(directory, filename, mimetype=None):
+    """
+    Como send_from_directory, pero si el cliente acepta gzip/brotli sirve
+    la variante precomprimida del fichero (se comprime una vez por versión
+    del fichero, no en cada petición).
+    """
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = negotiate_encoding(request.accept_encodings)
+    # Rutas relativas a la raíz de la app, como en send_from_directory
+    path = safe_join(os.path.join(app.root_path, directory), filename)
+    if (encoding is None or path is None or not os.path.isfile(path)
+            or not should_compress(mimetype, os.path.getsize(path))):
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+    else:
+        body, st = COMPRESSED_FILES.get(path, encoding)
+        response = Response(body, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}-{encoding}")
+        response.last_modified = st.st_mtime
+        response.make_conditional(request)
+    if is_compressible(mimetype):
+        response.vary.add('Accept-Encoding')
+    return response
+
+# Los estáticos de Flask (/static/...) también pasan por las variantes precomprimidas
+app.view_functions['static'] = lambda filename: send_compressed_file(app.static_folder, filename)
+
+@app.after_request
+def compress_body(response):
+    """Comprime al vuelo las respuestas que no traen ya una variante precomprimida."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding and (response.is_streamed or should_compress(response.mimetype, response.content_length or 0)):
+        compress_response(response, encoding)
+    return response
+
 # --- Endpoint para servir el XSL (Sin cambios) ---
 @app.route('/libros.xsl')
 def get_xsl():
     # Asume que libros.xsl está en el mismo directorio que este script
-    return send_from_directory('.', 'libros.xsl', mimetype='application/xml')
+    return send_compressed_file('.', 'libros.xsl', mimetype='application/xml')
 
 # ==============================================================================
 # --- SECCIÓN DE QUERIES (Lecturas) ---
 # ==============================================================================
 
-def handle_get_all_books_query():
-    """Lógica de negocio para obtener todos los libros."""
+def stream_query(conn, query, params=()):
+    """
+    Ejecuta `query` con un cursor de servidor (SSDictCursor) y devuelve un
+    generador de lotes de filas. La consulta se lanza ya, para que un error
+    de BD se detecte antes de empezar la respuesta; la conexión se cierra
+    cuando el generador termina o se cierra (cliente desconectado).
+    """
+    cur = conn.cursor(MySQLdb.cursors.SSDictCursor)
+    try:
+        cur.execute(query, params)
+    except MySQLdb.Error:
+        cur.close(); conn.close()
+        raise
+    def batches():
+        try:
+            while True:
+                rows = cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows: break
+                yield rows
+        finally:
+            cur.close(); conn.close()
+    return batches()
+
+def handle_get_all_books_query(stream=False):
+    """
+    Lógica de negocio para obtener todos los libros.
+
+    Con stream=True devuelve un generador de lotes leídos con un cursor de
+    servidor en lugar de la lista completa.
+    """
+    store = catalog_store()
+    if store and not stream: return store.all()
     conn = get_db_connection_query()
     if not conn: return None
+    # Lee del read model: recorrido del índice (title, isbn), sin JOINs
+    query = f"SELECT {VIEW_COLUMNS} FROM books_view ORDER BY title;"
+    if stream:
+        try:
+            return stream_query(conn, query)
+        except MySQLdb.Error as e:
+            print(f"Error DB (Query): {e}")
+            return None
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
-    LEFT JOIN authors a ON ba.author_id = a.author_id
-    GROUP BY b.isbn
-    ORDER BY b.title;
-    """
     cur.execute(query)
     rows = cur.fetchall()
     cur.close(); conn.close()
@@ -117,42 +558,50 @@ def handle_get_all_books_query():
 
 def handle_get_book_by_isbn_query(isbn):
     """Lógica de negocio para obtener un libro por ISBN."""
+    store = catalog_store()
+    if store: return store.get(isbn)
     conn = get_db_connection_query()
     if not conn: return None
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    # --- QUERY CORREGIDA ---
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
-    LEFT JOIN authors a ON ba.author_id = a.author_id
-    WHERE b.isbn=%s GROUP BY b.isbn;
-    """
+    # Búsqueda por clave primaria en el read model
+    query = f"SELECT {VIEW_COLUMNS} FROM books_view WHERE isbn=%s;"
     cur.execute(query, (isbn,))
     row = cur.fetchone()
     cur.close(); conn.close()
     return [row] if row else []
 
+def handle_get_books_by_isbns_query(isbns):
+    """
+    Lógica de negocio para obtener varios libros por ISBN.
+
+    Returns:
+        dict: {isbn pedido: fila} de los que existen, con una sola consulta
+        IN (...) por clave primaria en el read model; None si falla la BD
+    """
+    store = catalog_store()
+    if store: return by_requested_isbn(isbns, store.get_many(isbns).values())
+    conn = get_db_connection_query()
+    if not conn: return None
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    query = f"SELECT {VIEW_COLUMNS} FROM books_view WHERE isbn IN ({','.join(['%s'] * len(isbns))});"
+    cur.execute(query, isbns)
+    rows = cur.fetchall()
+    cur.close(); conn.close()
+    return by_requested_isbn(isbns, rows)
+
 def handle_get_books_by_author_query(author):
     """Lógica de negocio para obtener libros por autor."""
+    store = catalog_store()
+    if store: return store.by_author(author)
     conn = get_db_connection_query()
     if not conn: return None
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    # --- QUERY CORREGIDA ---
+    # Índice autor -> isbn del read model + búsqueda por PK en books_view
     query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    JOIN book_authors ba ON b.isbn = ba.isbn
-    JOIN authors a ON ba.author_id = a.author_id
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    WHERE a.name=%s GROUP BY b.isbn;
+    SELECT v.isbn, v.title, v.year, v.price, v.stock, v.genre, v.format, v.authors
+    FROM books_view_authors va
+    JOIN books_view v ON v.isbn = va.isbn
+    WHERE va.author=%s;
     """
     cur.execute(query, (author,))
     rows = cur.fetchall()
@@ -161,59 +610,296 @@ def handle_get_books_by_author_query(author):
 
 def handle_get_books_by_format_query(format_name):
     """Lógica de negocio para obtener libros por formato."""
+    store = catalog_store()
+    if store: return store.by_format(format_name)
     conn = get_db_connection_query()
     if not conn: return None
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    # --- QUERY CORREGIDA ---
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
-    LEFT JOIN authors a ON ba.author_id = a.author_id
-    WHERE f.name=%s GROUP BY b.isbn;
-    """
+    # Índice (format, title) del read model
+    query = f"SELECT {VIEW_COLUMNS} FROM books_view WHERE format=%s;"
     cur.execute(query, (format_name,))
     rows = cur.fetchall()
     cur.close(); conn.close()
     return rows
 
+def handle_get_books_page_query(limit, after=None):
+    """
+    Lógica de negocio para obtener una página del catálogo por keyset.
+
+    Rango sobre el índice (title, isbn) de books_view a partir del cursor;
+    devuelve hasta limit+1 filas (la extra indica que hay página siguiente).
+    """
+    store = catalog_store()
+    if store: return store.page(limit, after)
+    conn = get_db_connection_query()
+    if not conn: return None
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    where = "WHERE (title, isbn) > (%s, %s)" if after else ""
+    query = f"SELECT {VIEW_COLUMNS} FROM books_view {where} ORDER BY title, isbn LIMIT %s;"
+    cur.execute(query, (after or ()) + (limit + 1,))
+    rows = cur.fetchall()
+    cur.close(); conn.close()
+    return list(rows)
+
+def like_escape(term):
+    """Término literal para LIKE ... ESCAPE '!' (sin los comodines % y _)."""
+    return term.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+def handle_search_books_query(text, limit):
+    """
+    Búsqueda contra MySQL cuando el catálogo en memoria no está cargado:
+    libros con todos los términos de `text` en el título o en los autores
+    (LIKE sobre books_view; la collation ignora mayúsculas y acentos), los
+    que coinciden en el título primero. Recorre books_view entero, así que
+    con catálogos grandes conviene el índice (SEARCH_INDEX=1).
+    """
+    terms = [f"%{like_escape(term)}%" for term in tokenize(text)]
+    if not terms: return []
+    conn = get_db_connection_query()
+    if not conn: return None
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    matches = " AND ".join(["(title LIKE %s ESCAPE '!' OR authors LIKE %s ESCAPE '!')"] * len(terms))
+    in_title = " + ".join(["(title LIKE %s ESCAPE '!')"] * len(terms))
+    query = (f"SELECT {VIEW_COLUMNS} FROM books_view WHERE {matches} "
+             f"ORDER BY {in_title} DESC, title, isbn LIMIT %s;")
+    cur.execute(query, [p for term in terms for p in (term, term)] + terms + [limit])
+    rows = cur.fetchall()
+    cur.close(); conn.close()
+    return list(rows)
+
+def handle_suggest_authors_query(prefix, limit):
+    """
+    Autocompletado contra MySQL cuando el catálogo en memoria no está
+    cargado: autores con algún nombre o apellido que empieza por cada
+    término de `prefix`, en orden alfabético.
+    """
+    terms = [like_escape(term) for term in tokenize(prefix)]
+    if not terms: return []
+    conn = get_db_connection_query()
+    if not conn: return None
+    cur = conn.cursor()
+    where = " AND ".join(["(author LIKE %s ESCAPE '!' OR author LIKE %s ESCAPE '!')"] * len(terms))
+    query = f"SELECT DISTINCT author FROM books_view_authors WHERE {where} ORDER BY author LIMIT %s;"
+    cur.execute(query, [p for term in terms for p in (f"{term}%", f"% {term}%")] + [limit])
+    names = [row[0] for row in cur.fetchall()]
+    cur.close(); conn.close()
+    return names
+
 # --- Endpoints de la API (Queries) ---
 
 @app.route('/api/books', methods=['GET'])
 def get_books():
+    try:
+        limit, after = parse_page_args()
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    error = wait_for_read_model()
+    if error: return error
+    if limit:
+        rows = handle_get_books_page_query(limit, after)
+        if rows is None: return create_message_xml("Error DB (Query)", 500)
+        return with_read_position(create_books_response(*split_page(rows, limit)))
+    # ?stream=1: cursor de servidor + respuesta por chunks (memoria constante)
+    if request.args.get('stream') == '1':
+        batches = handle_get_all_books_query(stream=True)
+        if batches is None: return create_message_xml("Error DB (Query)", 500)
+        return with_read_position(create_xml_stream_response(batches))
     rows = handle_get_all_books_query()
     if rows is None: return create_message_xml("Error DB (Query)", 500)
-    return create_xml_response(rows)
+    return with_read_position(create_books_response(rows))
 
 @app.route('/api/books/isbn/<isbn>', methods=['GET'])
 def get_book(isbn):
+    error = wait_for_read_model()
+    if error: return error
     rows = handle_get_book_by_isbn_query(isbn)
     if rows is None: return create_message_xml("Error DB (Query)", 500)
     if not rows: return create_message_xml("No encontrado", 404)
-    return create_xml_response(rows)
+    return with_read_position(create_books_response(rows))
+
+@app.route('/api/books/isbn', methods=['GET', 'POST'])
+def get_books_by_isbns():
+    try:
+        isbns = parse_isbns_arg()
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if len(isbns) > ISBN_BATCH_MAX:
+        return create_message_xml(f"Máximo {ISBN_BATCH_MAX} ISBNs por petición", 413)
+    error = wait_for_read_model()
+    if error: return error
+    books = handle_get_books_by_isbns_query(list(dict.fromkeys(isbns)))
+    if books is None: return create_message_xml("Error DB (Query)", 500)
+    return with_read_position(create_lookup_response(isbns, books))
 
 @app.route('/api/books/author/<author>', methods=['GET'])
 def get_books_by_author(author):
+    error = wait_for_read_model()
+    if error: return error
     rows = handle_get_books_by_author_query(author)
     if rows is None: return create_message_xml("Error DB (Query)", 500)
     if not rows: return create_message_xml("No se encontraron libros", 404)
-    return create_xml_response(rows)
+    return with_read_position(create_books_response(rows))
 
 @app.route('/api/books/format/<format>', methods=['GET'])
 def get_books_by_format(format):
+    error = wait_for_read_model()
+    if error: return error
     rows = handle_get_books_by_format_query(format)
     if rows is None: return create_message_xml("Error DB (Query)", 500)
     if not rows: return create_message_xml("No se encontraron libros", 404)
-    return create_xml_response(rows)
+    return with_read_position(create_books_response(rows))
+
+# --- Búsqueda (índice en memoria; con LIKE en MySQL si no está cargado) ---
+
+@app.route('/api/books/search', methods=['GET'])
+def search_books():
+    query = request.args.get('q', '').strip()
+    if not query: return create_message_xml("El parámetro q es obligatorio", 400)
+    try:
+        limit = parse_limit_arg(SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if CATALOG_STORE.ready:
+        g.read_position = CATALOG_STORE.version
+        rows = CATALOG_STORE.search(query, limit)
+    else:
+        error = wait_for_read_model()
+        if error: return error
+        rows = handle_search_books_query(query, limit)
+        if rows is None: return create_message_xml("Error DB (Query)", 500)
+    if not rows: return create_message_xml("No se encontraron libros", 404)
+    return with_read_position(create_books_response(rows))
+
+@app.route('/api/authors/suggest', methods=['GET'])
+def suggest_authors():
+    prefix = request.args.get('prefix', '').strip()
+    if not prefix: return create_message_xml("El parámetro prefix es obligatorio", 400)
+    try:
+        limit = parse_limit_arg(10, SEARCH_MAX_LIMIT)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if CATALOG_STORE.ready:
+        g.read_position = CATALOG_STORE.version
+        names = CATALOG_STORE.suggest_authors(prefix, limit)
+    else:
+        error = wait_for_read_model()
+        if error: return error
+        names = handle_suggest_authors_query(prefix, limit)
+        if names is None: return create_message_xml("Error DB (Query)", 500)
+    return with_read_position(create_authors_xml(names))
+
+# --- Feed de cambios (SSE, con long-poll de respaldo) ---
+# El catálogo en memoria publica cada refresco en CHANGE_FEED; los clientes
+# parchean su tabla con los libros cambiados en lugar de volver a pedir
+# /api/books. El id de cada evento es la posición del proyector. Cada stream
+# SSE ocupa un hilo del worker: se cierra a los FEED_STREAM_SECONDS (el
+# cliente reconecta con Last-Event-ID) y, por encima de FEED_MAX_STREAMS por
+# proceso, se responde 503 para que el cliente siga con long-poll y queden
+# hilos para el resto de la API (con muchos clientes, servir el feed con la
+# variante ASGI, que no ocupa hilos).
+CHANGE_FEED = ChangeFeed()
+CATALOG_STORE.subscribe(CHANGE_FEED.publish)
+FEED_HEARTBEAT = 15.0
+FEED_STREAM_SECONDS = 300.0
+FEED_RETRY_MS = 3000
+FEED_POLL_TIMEOUT = 25.0
+FEED_MAX_STREAMS = int(os.environ.get('FEED_MAX_STREAMS', 4))
+FEED_STREAM_SLOTS = threading.BoundedSemaphore(FEED_MAX_STREAMS)
+
+def parse_feed_timeout(raw):
+    """?timeout= del long-poll acotado a [0, FEED_POLL_TIMEOUT]; ValueError si no es un número finito."""
+    timeout = float(raw)
+    # NaN pasa por min()/max() y haría esperar al hilo hasta el próximo cambio
+    if not math.isfinite(timeout):
+        raise ValueError(raw)
+    return min(max(timeout, 0.0), FEED_POLL_TIMEOUT)
+
+def stream_changes(last_id):
+    """Eventos SSE desde `last_id` (o desde ahora, con un 'ready' inicial)."""
+    yield f"retry: {FEED_RETRY_MS}\n\n"
+    if last_id is None:
+        last_id = CHANGE_FEED.version
+        yield sse_message(last_id, [], event='ready')
+    deadline = time.monotonic() + FEED_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        version, changes = CHANGE_FEED.wait(last_id, FEED_HEARTBEAT)
+        if changes is None or changes:
+            yield sse_message(version, changes)
+            last_id = version
+        else:
+            yield ": ping\n\n"
+
+@app.route('/api/books/changes', methods=['GET'])
+def get_book_changes():
+    """
+    Con Accept: text/event-stream, stream SSE de eventos 'changes' / 'reset'
+    (reanuda desde Last-Event-ID o ?since=). Si no, long-poll: responde JSON
+    {seq, changes[, reset]} en cuanto hay cambios posteriores a ?since= o a
+    los ?timeout= segundos (máximo FEED_POLL_TIMEOUT) con changes vacío.
+    """
+    # Desactivado por configuración: 404, que el cliente no reintenta (503 = reintentar)
+    if not CATALOG_IN_MEMORY: return create_message_xml("Feed de cambios desactivado (SEARCH_INDEX=1)", 404)
+    if not CHANGE_FEED.ready: return create_message_xml("Feed de cambios no disponible", 503)
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    headers = {'Cache-Control': 'no-store'}
+    if request.accept_mimetypes.best == 'text/event-stream':
+        # X-Accel-Buffering: que nginx no retenga los eventos
+        headers['X-Accel-Buffering'] = 'no'
+        if not FEED_STREAM_SLOTS.acquire(blocking=False):
+            return create_message_xml("Demasiados streams abiertos: usa long-poll", 503)
+        response = Response(stream_changes(last_id), mimetype='text/event-stream', headers=headers)
+        # call_on_close corre aunque el generador no llegue a empezar
+        response.call_on_close(FEED_STREAM_SLOTS.release)
+        return response
+
+    try:
+        timeout = parse_feed_timeout(request.args.get('timeout', FEED_POLL_TIMEOUT))
+    except ValueError:
+        return create_message_xml("timeout inválido", 400)
+    if last_id is None:
+        version, changes = CHANGE_FEED.version, []
+    else:
+        version, changes = CHANGE_FEED.wait(last_id, timeout)
+    body = {'seq': version, 'changes': changes or []}
+    if changes is None:
+        body['reset'] = True
+    response = jsonify(body)
+    response.headers.update(headers)
+    return response
+
+@app.route('/api/books/changes/status', methods=['GET'])
+def get_changes_status():
+    return jsonify(CHANGE_FEED.stats())
 
 # ==============================================================================
 # --- SECCIÓN DE COMMANDS (Escrituras) ---
 # ==============================================================================
 
+# --- Caché de dimensiones (nombre -> id) para el camino de escritura ---
+GENRE_IDS = LookupCache('genres', 'genre_id')
+FORMAT_IDS = LookupCache('formats', 'format_id')
+AUTHOR_IDS = LookupCache('authors', 'author_id')
+LOOKUP_CACHES = (GENRE_IDS, FORMAT_IDS, AUTHOR_IDS)
+
+def warm_lookup_caches():
+    """Precarga las cachés de dimensiones antes de atender peticiones."""
+    conn = get_db_connection_command()
+    if not conn: return
+    cur = conn.cursor()
+    try:
+        for cache in LOOKUP_CACHES:
+            cache.warm(cur)
+    except MySQLdb.Error as e:
+        print(f"Aviso: no se pudieron precargar las cachés de dimensiones: {e}")
+    finally:
+        cur.close(); conn.close()
+
+def invalidate_lookup_caches_on_fk_error(error):
+    """Un fallo de clave foránea (1452) puede venir de un id cacheado ya borrado."""
+    if error.args and error.args[0] == 1452:
+        for cache in LOOKUP_CACHES:
+            cache.invalidate()
+
 class CommandError(Exception):
     """Excepción personalizada para errores de lógica de negocio en comandos."""
     def __init__(self, message, status_code=400):
@@ -222,31 +908,37 @@ class CommandError(Exception):
         super().__init__(self.message)
 
 def handle_insert_book_command(data):
-    """Lógica de negocio para insertar un libro."""
+    """Lógica de negocio para insertar un libro. Devuelve la posición del evento."""
     conn = get_db_connection_command()
     if not conn: raise CommandError("Error DB (Command)", 500)
     cur = conn.cursor()
     try:
-        cur.execute("SELECT genre_id FROM genres WHERE name=%s", (data['genre'],))
-        g = cur.fetchone()
-        if not g: raise CommandError("Género inválido")
+        # Nombres -> ids desde la caché en memoria (sin SELECT salvo fallo)
+        genre_id = GENRE_IDS.get(cur, data['genre'])
+        if genre_id is None: raise CommandError("Género inválido")
+
+        format_id = FORMAT_IDS.get(cur, data['format'])
+        if format_id is None: raise CommandError("Formato inválido")
 
-        cur.execute("SELECT format_id FROM formats WHERE name=%s", (data['format'],))
-        f = cur.fetchone()
-        if not f: raise CommandError("Formato inválido")
+        author_names = [a.strip() for a in data['authors'].split(',')]
+        author_ids = AUTHOR_IDS.get_many(cur, author_names)
 
         cur.execute("INSERT INTO books (isbn,title,year,price,stock,genre_id,format_id) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-            (data['isbn'], data['title'], data['year'], data['price'], data['stock'], g[0], f[0]))
+            (data['isbn'], data['title'], data['year'], data['price'], data['stock'], genre_id, format_id))
 
-        for author_name in [a.strip() for a in data['authors'].split(',')]:
-            cur.execute("SELECT author_id FROM authors WHERE name=%s", (author_name,))
-            a = cur.fetchone()
-            if not a: raise CommandError(f"Autor {author_name} inválido")
-            cur.execute("INSERT INTO book_authors (isbn,author_id) VALUES (%s,%s)", (data['isbn'], a[0]))
+        for author_name in author_names:
+            if author_name not in author_ids: raise CommandError(f"Autor {author_name} inválido")
+            cur.execute("INSERT INTO book_authors (isbn,author_id) VALUES (%s,%s)", (data['isbn'], author_ids[author_name]))
 
+        # El evento se confirma en la misma transacción que el libro
+        position = append_event(cur, BOOK_INSERTED, data['isbn'])
         conn.commit()
+        track_session(cur)
+        PROJECTOR.notify()
+        return position
     except MySQLdb.Error as e:
         conn.rollback()
+        invalidate_lookup_caches_on_fk_error(e)
         # Devuelve un código de error más específico si es una clave duplicada
         if e.args[0] == 1062: # Código de error 'Duplicate entry'
             raise CommandError(f"Error: Ya existe un libro con el ISBN {data['isbn']}", 409)
@@ -254,18 +946,151 @@ def handle_insert_book_command(data):
     finally:
         cur.close(); conn.close()
 
+# --- Inserción masiva ---
+
+BOOK_FIELDS = ['isbn','title','year','price','stock','genre','format','authors']
+BOOK_TEXT_FIELDS = ['isbn','title','genre','format','authors']
+BULK_MAX_ITEMS = 10000
+BULK_CHUNK_SIZE = 500      # libros por transacción
+BULK_LOOKUP_CHUNK = 1000   # valores por cada IN (...)
+
+def _fetch_names(cur, sql, values):
+    """Ejecuta `sql` (con un IN ({})) por bloques y devuelve {col0: col1}."""
+    values = list(values)
+    found = {}
+    for i in range(0, len(values), BULK_LOOKUP_CHUNK):
+        chunk = values[i:i + BULK_LOOKUP_CHUNK]
+        cur.execute(sql.format(','.join(['%s'] * len(chunk))), chunk)
+        found.update((row[0], row[1]) for row in cur.fetchall())
+    return found
+
+def _split_authors(authors):
+    names = []
+    for name in (a.strip() for a in authors.split(',')):
+        if name not in names: names.append(name)
+    return names
+
+def _insert_books_chunk(cur, chunk, genres, formats, authors):
+    """Inserta un bloque de libros con dos executemany (books y book_authors)."""
+    cur.executemany(
+        "INSERT INTO books (isbn,title,year,price,stock,genre_id,format_id) VALUES (%s,%s,%s,%s,%s,%s,%s)",
+        [(d['isbn'], d['title'], d['year'], d['price'], d['stock'], genres[d['genre']], formats[d['format']])
+         for _, d, _ in chunk])
+    cur.executemany(
+        "INSERT INTO book_authors (isbn,author_id) VALUES (%s,%s)",
+        [(d['isbn'], authors[name]) for _, d, names in chunk for name in names])
+
+def _append_insert_events(cur, chunk):
+    """Un BookInserted por libro del bloque, en la misma transacción."""
+    return append_events(cur, BOOK_INSERTED, [d['isbn'] for _, d, _ in chunk])
+
+def handle_bulk_insert_books_command(books):
+    """
+    Lógica de negocio para insertar muchos libros a la vez.
+
+    Géneros, formatos, autores e ISBNs existentes se resuelven con unas
+    pocas consultas IN (...) y los libros válidos se insertan con
+    executemany en transacciones de BULK_CHUNK_SIZE. Si un bloque falla se
+    reintenta libro a libro para aislar los erróneos.
+
+    Returns:
+        (results, position): Un dict {'isbn', 'status', 'message'} por libro,
+        en el orden recibido, y la posición del último evento (o None)
+    """
+    results = [None] * len(books)
+    position = None
+    def result(i, isbn, status, message):
+        results[i] = {'isbn': isbn, 'status': status, 'message': message}
+
+    conn = get_db_connection_command()
+    if not conn: raise CommandError("Error DB (Command)", 500)
+    cur = conn.cursor()
+    try:
+        # Validación local (campos y duplicados dentro de la petición)
+        pending, seen = [], set()
+        for i, data in enumerate(books):
+            if not isinstance(data, dict) or not all(k in data for k in BOOK_FIELDS):
+                result(i, data.get('isbn') if isinstance(data, dict) else None, 400, "Faltan campos")
+            elif not all(isinstance(data[k], str) for k in BOOK_TEXT_FIELDS):
+                # Una lista o un dict aquí rompería los sets/dicts de abajo (500)
+                result(i, data['isbn'] if isinstance(data['isbn'], str) else None, 400,
+                       f"{', '.join(BOOK_TEXT_FIELDS)} deben ser texto")
+            elif data['isbn'] in seen:
+                result(i, data['isbn'], 409, "ISBN repetido en la petición")
+            else:
+                seen.add(data['isbn'])
+                pending.append((i, data, _split_authors(data['authors'])))
+
+        # Resolución de nombres -> ids en bloque (caché + IN (...) para los fallos)
+        genres = GENRE_IDS.get_many(cur, [d['genre'] for _, d, _ in pending])
+        formats = FORMAT_IDS.get_many(cur, [d['format'] for _, d, _ in pending])
+        authors = AUTHOR_IDS.get_many(cur, [name for _, _, names in pending for name in names])
+        existing = _fetch_names(cur, "SELECT isbn, 1 FROM books WHERE isbn IN ({})",
+                                [d['isbn'] for _, d, _ in pending])
+
+        valid = []
+        for i, data, names in pending:
+            missing = [name for name in names if name not in authors]
+            if data['isbn'] in existing:
+                result(i, data['isbn'], 409, f"Ya existe un libro con el ISBN {data['isbn']}")
+            elif data['genre'] not in genres:
+                result(i, data['isbn'], 400, "Género inválido")
+            elif data['format'] not in formats:
+                result(i, data['isbn'], 400, "Formato inválido")
+            elif missing:
+                result(i, data['isbn'], 400, f"Autor {missing[0]} inválido")
+            else:
+                valid.append((i, data, names))
+        conn.rollback()
+
+        # Inserción por bloques, una transacción por bloque
+        for start in range(0, len(valid), BULK_CHUNK_SIZE):
+            chunk = valid[start:start + BULK_CHUNK_SIZE]
+            try:
+                _insert_books_chunk(cur, chunk, genres, formats, authors)
+                position = _append_insert_events(cur, chunk)
+                conn.commit()
+                for i, data, _ in chunk:
+                    result(i, data['isbn'], 201, "Libro insertado")
+            except MySQLdb.Error:
+                conn.rollback()
+                for item in chunk:
+                    i, data, _ = item
+                    try:
+                        _insert_books_chunk(cur, [item], genres, formats, authors)
+                        position = _append_insert_events(cur, [item])
+                        conn.commit()
+                        result(i, data['isbn'], 201, "Libro insertado")
+                    except MySQLdb.Error as e:
+                        conn.rollback()
+                        invalidate_lookup_caches_on_fk_error(e)
+                        if e.args[0] == 1062:
+                            result(i, data['isbn'], 409, f"Ya existe un libro con el ISBN {data['isbn']}")
+                        else:
+                            result(i, data['isbn'], 500, f"Error MySQL: {e}")
+        track_session(cur)
+    except MySQLdb.Error as e:
+        conn.rollback()
+        raise CommandError(f"Error MySQL: {e}", 500)
+    finally:
+        cur.close(); conn.close()
+    if position is not None:
+        PROJECTOR.notify()
+    return results, position
+
 def handle_update_book_command(isbn, data):
-    """Lógica de negocio para actualizar un libro."""
+    """Lógica de negocio para actualizar un libro. Devuelve la posición del evento."""
     conn = get_db_connection_command()
     if not conn: raise CommandError("Error DB (Command)", 500)
     cur = conn.cursor()
     try:
-        fields, vals = [], []
+        fields, vals, changes = [], [], {}
         # Solo permite actualizar estos campos
         for k in ['title','year','price','stock']:
             if k in data:
                 fields.append(f"{k}=%s")
                 vals.append(data[k])
+                changes[k] = data[k]
 
         if not fields: raise CommandError("No hay campos para actualizar", 400)
 
@@ -277,7 +1102,11 @@ def handle_update_book_command(isbn, data):
         if cur.rowcount == 0:
             raise CommandError(f"No se encontró ningún libro con el ISBN {isbn} para actualizar", 404)
 
+        position = append_event(cur, BOOK_UPDATED, isbn, changes)
         conn.commit()
+        track_session(cur)
+        PROJECTOR.notify()
+        return position
     except MySQLdb.Error as e:
         conn.rollback()
         raise CommandError(f"Error MySQL: {e}", 500)
@@ -285,31 +1114,181 @@ def handle_update_book_command(isbn, data):
         cur.close(); conn.close()
 
 def handle_delete_books_command(isbns):
-    """Lógica de negocio para borrar libros."""
+    """Lógica de negocio para borrar libros. Devuelve la posición del último evento."""
     conn = get_db_connection_command()
     if not conn: raise CommandError("Error DB (Command)", 500)
     cur = conn.cursor()
     try:
         format_str = ','.join(['%s']*len(isbns))
 
+        # Solo los libros que existen, con el ISBN tal como está guardado:
+        # los eventos no deben llevar ISBNs inexistentes ni la grafía del cliente
+        cur.execute(f"SELECT isbn FROM books WHERE isbn IN ({format_str}) FOR UPDATE", tuple(isbns))
+        stored = [row[0] for row in cur.fetchall()]
+        if not stored:
+            conn.rollback()
+            raise CommandError("No se encontraron libros con esos ISBNs para borrar", 404)
+        format_str = ','.join(['%s']*len(stored))
+
         # Borrar de book_authors primero por la restricción de clave foránea
-        cur.execute(f"DELETE FROM book_authors WHERE isbn IN ({format_str})", tuple(isbns))
+        cur.execute(f"DELETE FROM book_authors WHERE isbn IN ({format_str})", stored)
         # Borrar de books después
-        cur.execute(f"DELETE FROM books WHERE isbn IN ({format_str})", tuple(isbns))
+        cur.execute(f"DELETE FROM books WHERE isbn IN ({format_str})", stored)
 
-        # Comprobar si se borró algo
-        if cur.rowcount == 0:
-             raise CommandError("No se encontraron libros con esos ISBNs para borrar", 404)
+        position = append_events(cur, BOOK_DELETED, stored)
+        conn.commit()
+        track_session(cur)
+        PROJECTOR.notify()
+        return position
+    except MySQLdb.Error as e:
+        conn.rollback()
+        raise CommandError(f"Error MySQL: {e}", 500)
+    finally:
+        cur.close(); conn.close()
 
+# --- Ajustes de stock ---
+
+# Suma atómica con condición: sin leer antes el stock, dos ventas a la vez
+# no se pisan (la segunda espera al bloqueo de fila de la primera y evalúa
+# la condición con el valor ya actualizado) y el stock nunca baja de 0.
+# Un stock NULL cuenta como 0.
+STOCK_UPDATE = ("UPDATE books SET stock = COALESCE(stock, 0) + %s "
+                "WHERE isbn=%s AND COALESCE(stock, 0) + %s >= 0")
+STOCK_BATCH_MAX = 1000
+
+def valid_stock_delta(delta):
+    # Con delta 0 el UPDATE no cambia la fila y rowcount sería 0, como un fallo
+    return isinstance(delta, int) and not isinstance(delta, bool) and delta != 0
+
+def parse_stock_items(items):
+    """
+    Valida los elementos {"isbn", "delta"} del ajuste por lotes.
+
+    Returns:
+        (items, error): [(isbn, delta)] y None, o None y el mensaje de error
+    """
+    parsed, seen = [], set()
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('isbn'), str):
+            return None, "Cada elemento necesita isbn y delta"
+        if not valid_stock_delta(item.get('delta')):
+            return None, f"delta inválido para {item['isbn']} (entero distinto de 0)"
+        # 'x' y 'X' son el mismo libro para la colación de MySQL
+        if isbn_key(item['isbn']) in seen:
+            return None, f"ISBN repetido en la petición: {item['isbn']}"
+        seen.add(isbn_key(item['isbn']))
+        parsed.append((item['isbn'], item['delta']))
+    return parsed, None
+
+def _stock_failure(cur, isbn):
+    """Tras un UPDATE sin filas: 404 si el libro no existe, 409 si no hay stock."""
+    cur.execute("SELECT stock FROM books WHERE isbn=%s", (isbn,))
+    row = cur.fetchone()
+    if row is None:
+        return CommandError(f"No se encontró ningún libro con el ISBN {isbn}", 404)
+    return CommandError(f"Stock insuficiente para {isbn} (disponible: {row[0] or 0})", 409)
+
+def handle_adjust_stock_command(isbn, delta):
+    """
+    Suma `delta` (con signo) al stock de un libro con un único UPDATE
+    condicional.
+
+    Returns:
+        (stock, position): Stock resultante y posición del evento
+    """
+    conn = get_db_connection_command()
+    if not conn: raise CommandError("Error DB (Command)", 500)
+    cur = conn.cursor()
+    try:
+        cur.execute(STOCK_UPDATE, (delta, isbn, delta))
+        if cur.rowcount == 0:
+            conn.rollback()
+            raise _stock_failure(cur, isbn)
+        # La ISBN tal como está guardada: la de la URL puede diferir en mayúsculas
+        cur.execute("SELECT isbn, stock FROM books WHERE isbn=%s", (isbn,))
+        stored, stock = cur.fetchone()
+        position = append_event(cur, BOOK_UPDATED, stored, {'stock': stock})
         conn.commit()
+        track_session(cur)
+        PROJECTOR.notify()
+        return stock, position
     except MySQLdb.Error as e:
         conn.rollback()
         raise CommandError(f"Error MySQL: {e}", 500)
     finally:
         cur.close(); conn.close()
 
+def handle_adjust_stock_batch_command(items):
+    """
+    Aplica muchos ajustes [(isbn, delta)] en una sola transacción: todos o
+    ninguno (p. ej. los libros de un pedido).
+
+    Un solo UPDATE con CASE recorre la clave primaria en orden, así que dos
+    lotes concurrentes bloquean sus filas en el mismo orden y no se
+    interbloquean, y la transacción retiene los bloqueos solo unos pocos
+    viajes a la BD. Si alguna fila no cumple la condición se deshace todo y
+    se indica qué libros fallaron.
+
+    Returns:
+        (results, position): Un dict {'isbn', 'status', 'message', 'stock'}
+        por libro, en el orden recibido, y la posición del último evento
+        (None si no se aplicó)
+    """
+    isbns = [isbn for isbn, _ in items]
+    cases = ' '.join(['WHEN %s THEN %s'] * len(items))
+    case_params = [v for item in items for v in item]
+    in_list = ','.join(['%s'] * len(items))
+    sql = (f"UPDATE books SET stock = COALESCE(stock, 0) + CASE isbn {cases} END "
+           f"WHERE isbn IN ({in_list}) AND COALESCE(stock, 0) + CASE isbn {cases} END >= 0")
+
+    conn = get_db_connection_command()
+    if not conn: raise CommandError("Error DB (Command)", 500)
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, case_params + isbns + case_params)
+        applied = cur.rowcount == len(items)
+        if not applied:
+            conn.rollback()
+        cur.execute(f"SELECT isbn, stock FROM books WHERE isbn IN ({in_list})", isbns)
+        # Por isbn_key: el ISBN pedido puede diferir del guardado en mayúsculas
+        found = {isbn_key(isbn): (isbn, stock) for isbn, stock in cur.fetchall()}
+        stocks = {key: stock for key, (_, stock) in found.items()}
+        position = None
+        if applied:
+            # Todos los eventos con un solo INSERT, aún con las filas bloqueadas
+            stored = [found[isbn_key(isbn)] for isbn in isbns]
+            position = append_events(cur, BOOK_UPDATED, [isbn for isbn, _ in stored],
+                                     [{'stock': stock} for _, stock in stored])
+            conn.commit()
+            track_session(cur)
+            PROJECTOR.notify()
+    except MySQLdb.Error as e:
+        conn.rollback()
+        raise CommandError(f"Error MySQL: {e}", 500)
+    finally:
+        cur.close(); conn.close()
+
+    results = []
+    for isbn, delta in items:
+        stock = stocks.get(isbn_key(isbn))
+        if applied:
+            results.append({'isbn': isbn, 'status': 200, 'message': "Stock actualizado", 'stock': stock})
+        elif isbn_key(isbn) not in stocks:
+            results.append({'isbn': isbn, 'status': 404, 'message': "Libro no encontrado", 'stock': None})
+        elif (stock or 0) + delta < 0:
+            results.append({'isbn': isbn, 'status': 409, 'message': "Stock insuficiente", 'stock': stock})
+        else:
+            results.append({'isbn': isbn, 'status': 424, 'message': "No aplicado: falló otro libro del lote",
+                            'stock': stock})
+    return results, position
+
 # --- Endpoints de la API (Commands) ---
 
+def with_event_position(response, position):
+    """Añade la posición del evento para que el cliente pueda pedir min_position."""
+    response.headers['X-Event-Position'] = str(position)
+    return response
+
 @app.route('/api/books/insert', methods=['POST'])
 def insert_book():
     data = request.get_json()
@@ -319,10 +1298,27 @@ def insert_book():
         return create_message_xml("Faltan campos", 400)
 
     try:
-        handle_insert_book_command(data)
-        return create_message_xml("Libro insertado", 201)
+        position = handle_insert_book_command(data)
+        return with_event_position(create_message_xml("Libro insertado", 201), position)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+
+@app.route('/api/books/bulk', methods=['POST'])
+def bulk_insert_books():
+    data = request.get_json()
+    # Acepta una lista de libros o {"books": [...]}
+    books = data.get('books') if isinstance(data, dict) else data
+    if not isinstance(books, list) or not books:
+        return create_message_xml("Se esperaba una lista de libros", 400)
+    if len(books) > BULK_MAX_ITEMS:
+        return create_message_xml(f"Máximo {BULK_MAX_ITEMS} libros por petición", 413)
+
+    try:
+        results, position = handle_bulk_insert_books_command(books)
     except CommandError as e:
         return create_message_xml(e.message, e.status_code)
+    response = create_bulk_results_xml(results)
+    return with_event_position(response, position) if position is not None else response
 
 @app.route('/api/books/update/<isbn>', methods=['PUT'])
 def update_book(isbn):
@@ -330,10 +1326,41 @@ def update_book(isbn):
     if not data: return create_message_xml("Sin JSON", 400)
 
     try:
-        handle_update_book_command(isbn, data)
-        return create_message_xml("Libro actualizado", 200)
+        position = handle_update_book_command(isbn, data)
+        return with_event_position(create_message_xml("Libro actualizado", 200), position)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+
+@app.route('/api/books/<isbn>/stock', methods=['POST'])
+def adjust_stock(isbn):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not valid_stock_delta(data.get('delta')):
+        return create_message_xml("Se esperaba un delta entero distinto de 0", 400)
+
+    try:
+        stock, position = handle_adjust_stock_command(isbn, data['delta'])
+        return with_event_position(create_stock_xml(isbn, stock), position)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+
+@app.route('/api/books/stock', methods=['POST'])
+def adjust_stock_batch():
+    data = request.get_json(silent=True)
+    # Acepta una lista de {isbn, delta} o {"items": [...]}
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return create_message_xml("Se esperaba una lista de {isbn, delta}", 400)
+    if len(items) > STOCK_BATCH_MAX:
+        return create_message_xml(f"Máximo {STOCK_BATCH_MAX} libros por petición", 413)
+    items, error = parse_stock_items(items)
+    if error: return create_message_xml(error, 400)
+
+    try:
+        results, position = handle_adjust_stock_batch_command(items)
     except CommandError as e:
         return create_message_xml(e.message, e.status_code)
+    response = create_stock_results_xml(results)
+    return with_event_position(response, position) if position is not None else response
 
 @app.route('/api/books/delete', methods=['DELETE'])
 def delete_books():
@@ -342,11 +1369,38 @@ def delete_books():
         return create_message_xml("Formato incorrecto o lista de ISBNs vacía", 400)
 
     try:
-        handle_delete_books_command(data['isbns'])
-        return create_message_xml("Libros borrados", 200)
+        position = handle_delete_books_command(data['isbns'])
+        return with_event_position(create_message_xml("Libros borrados", 200), position)
     except CommandError as e:
         return create_message_xml(e.message, e.status_code)
 
+@app.route('/api/projector/status', methods=['GET'])
+def get_projector_status():
+    try:
+        return jsonify(PROJECTOR.stats())
+    except MySQLdb.Error:
+        return create_message_xml("Error DB (Command)", 500)
+
+@app.route('/api/catalog/status', methods=['GET'])
+def get_catalog_status():
+    data = CATALOG_STORE.stats()
+    data.update({'backend': QUERY_BACKEND, 'search_index': SEARCH_INDEX})
+    return jsonify(data)
+
+@app.route('/api/replicas/status', methods=['GET'])
+def get_replicas_status():
+    return jsonify(READ_ROUTER.stats())
+
+@app.route('/debug/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """Peores formas de query (?order=total_ms|max_ms|count, ?limit=20) con su EXPLAIN."""
+    try:
+        limit = int(request.args.get('limit', 20))
+        shapes = SLOW_QUERIES.top(limit, request.args.get('order', 'total_ms'))
+    except ValueError as e:
+        return create_message_xml(f"Parámetros inválidos: {e}", 400)
+    return jsonify({'threshold_ms': SLOW_QUERIES.threshold_ms, 'queries': shapes})
+
 # ==============================================================================
 # --- FIN DE IMPLEMENTACIÓN CQRS ---
 # ==============================================================================
@@ -357,6 +1411,52 @@ def home():
     # Asume que index.html está en una carpeta 'templates'
     return render_template('index.html')
 
-# --- Run (Sin cambios) ---
+# --- Arranque por proceso ---
+def startup():
+    """
+    Prepara este proceso antes de atender peticiones: migraciones (con
+    lock e idempotentes), outbox y read model, proyector embebido, cachés
+    de dimensiones, sondeo de réplicas y catálogo en memoria.
+
+    Cada worker de serve.py importa el módulo después del fork, así que
+    sus conexiones, cachés e hilos de fondo son propios. Varios
+    proyectores embebidos se serializan con el FOR UPDATE del checkpoint.
+    """
+    # Esquema e índices de las tablas de escritura (migrations.py)
+    conn = get_db_connection_command()
+    if conn:
+        try:
+            migrate(conn)
+        except MySQLdb.Error as e:
+            print(f"Aviso: no se pudieron aplicar las migraciones: {e}")
+        finally:
+            conn.close()
+    # Crea outbox y read model y arranca el proyector antes de atender peticiones
+    try:
+        PROJECTOR.bootstrap()
+        if PROJECTOR_EMBEDDED:
+            PROJECTOR.start()
+    except MySQLdb.Error as e:
+        print(f"Aviso: no se pudo iniciar el proyector: {e}")
+    warm_lookup_caches()
+    READ_ROUTER.start()
+    if CATALOG_IN_MEMORY:
+        # Cada lote aplicado por el proyector embebido adelanta el refresco
+        PROJECTOR.subscribe(lambda events: CATALOG_STORE.notify())
+        CATALOG_STORE.start()
+
+def shutdown():
+    """Para los hilos de fondo del proceso (apagado ordenado del worker)."""
+    PROJECTOR.stop()
+    CATALOG_STORE.stop()
+    READ_ROUTER.stop()
+
+def create_app():
+    """Punto de entrada WSGI: serve.py o gunicorn 'microservicioCQRS:create_app()'."""
+    startup()
+    return app
+
+# --- Run (servidor de desarrollo; en producción, serve.py) ---
 if __name__ == '__main__':
+    create_app()
     app.run(host='0.0.0.0', port=5000, debug=True)
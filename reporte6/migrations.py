@@ -0,0 +1,332 @@
+"""
+Migraciones versionadas del esquema de la BD Libros.
+
+Cada migración tiene un número de versión y se aplica una sola vez; las
+aplicadas quedan en `schema_migrations`. El runner toma un GET_LOCK para
+que varios procesos arrancando a la vez no migren en paralelo.
+
+Además de las tablas base, crea los índices que usan las queries:
+nombres de autores, formatos y géneros (filtros y cachés nombre -> id),
+book_authors por isbn y por autor (JOINs) y el índice compuesto
+(title, isbn) que cubre el orden por título y la paginación keyset. Un
+índice no se crea si ya existe otro con las mismas columnas iniciales
+(p. ej. la PK de book_authors ya empieza por isbn).
+
+check_explain() ejecuta EXPLAIN sobre la SQL real de cada
+handle_get_*_query del servicio y falla si alguna recorre una tabla
+entera.
+
+    python migrations.py            # aplica las pendientes
+    python migrations.py status     # versión actual y pendientes
+    python migrations.py check      # EXPLAIN de las queries
+"""
+
+import inspect
+import sys
+
+import MySQLdb
+
+LOCK_NAME = 'libros_schema_migrations'
+LOCK_TIMEOUT = 30  # segundos
+
+DDL_SCHEMA_MIGRATIONS = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version     INT           NOT NULL,
+    name        VARCHAR(255)  NOT NULL,
+    applied_at  TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (version)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+# Esquema base que usan los servicios (no hace nada si las tablas ya existen)
+DDL_BASE_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS genres (
+        genre_id  INT           NOT NULL AUTO_INCREMENT,
+        name      VARCHAR(100)  NOT NULL,
+        PRIMARY KEY (genre_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS formats (
+        format_id  INT           NOT NULL AUTO_INCREMENT,
+        name       VARCHAR(100)  NOT NULL,
+        PRIMARY KEY (format_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS authors (
+        author_id  INT           NOT NULL AUTO_INCREMENT,
+        name       VARCHAR(255)  NOT NULL,
+        PRIMARY KEY (author_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS books (
+        isbn       VARCHAR(32)    NOT NULL,
+        title      VARCHAR(255)   NOT NULL,
+        year       INT            NULL,
+        price      DECIMAL(10,2)  NULL,
+        stock      INT            NULL,
+        genre_id   INT            NULL,
+        format_id  INT            NULL,
+        PRIMARY KEY (isbn),
+        FOREIGN KEY (genre_id) REFERENCES genres (genre_id),
+        FOREIGN KEY (format_id) REFERENCES formats (format_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS book_authors (
+        isbn       VARCHAR(32)  NOT NULL,
+        author_id  INT          NOT NULL,
+        PRIMARY KEY (isbn, author_id),
+        FOREIGN KEY (isbn) REFERENCES books (isbn),
+        FOREIGN KEY (author_id) REFERENCES authors (author_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+)
+
+# (tabla, nombre del índice, columnas)
+QUERY_INDEXES = (
+    ('authors', 'idx_authors_name', ('name',)),
+    ('formats', 'idx_formats_name', ('name',)),
+    ('genres', 'idx_genres_name', ('name',)),
+    ('book_authors', 'idx_book_authors_isbn', ('isbn',)),
+    ('book_authors', 'idx_book_authors_author', ('author_id', 'isbn')),
+    # Orden por título y keyset (title, isbn) sin filesort ni leer la fila
+    ('books', 'idx_books_title_isbn', ('title', 'isbn')),
+    ('books', 'idx_books_format_title', ('format_id', 'title')),
+    ('books', 'idx_books_genre', ('genre_id',)),
+)
+
+
+def ensure_index(cur, table, name, columns):
+    """
+    Crea el índice salvo que ya haya uno cuyas primeras columnas sean
+    `columns`. Devuelve True si lo creó.
+    """
+    cur.execute("SELECT index_name, seq_in_index, column_name FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = %s "
+                "ORDER BY index_name, seq_in_index", (table,))
+    existing = {}
+    for index_name, _, column in cur.fetchall():
+        existing.setdefault(index_name, []).append(column.lower())
+    wanted = [c.lower() for c in columns]
+    if any(cols[:len(wanted)] == wanted for cols in existing.values()):
+        return False
+    cur.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    return True
+
+
+def _create_base_tables(cur):
+    for ddl in DDL_BASE_TABLES:
+        cur.execute(ddl)
+
+
+def _create_query_indexes(cur):
+    for table, name, columns in QUERY_INDEXES:
+        ensure_index(cur, table, name, columns)
+
+
+# (versión, nombre, función(cursor)); solo se añaden al final
+MIGRATIONS = (
+    (1, 'base_tables', _create_base_tables),
+    (2, 'query_indexes', _create_query_indexes),
+)
+
+
+def applied_versions(cur):
+    cur.execute(DDL_SCHEMA_MIGRATIONS)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def pending_migrations(conn):
+    cur = conn.cursor()
+    try:
+        done = applied_versions(cur)
+    finally:
+        cur.close()
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def migrate(conn):
+    """
+    Aplica en orden las migraciones pendientes.
+
+    Returns:
+        list: Versiones aplicadas en esta llamada
+
+    Raises:
+        MySQLdb.OperationalError: Si otro proceso mantiene el lock más de LOCK_TIMEOUT
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+        if cur.fetchone()[0] != 1:
+            raise MySQLdb.OperationalError("No se pudo obtener el lock de migraciones")
+        try:
+            done = applied_versions(cur)
+            applied = []
+            for version, name, apply in MIGRATIONS:
+                if version in done:
+                    continue
+                # El DDL de MySQL hace commit implícito: cada paso es idempotente
+                apply(cur)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s,%s)", (version, name))
+                conn.commit()
+                applied.append(version)
+            return applied
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cur.fetchone()
+    finally:
+        cur.close()
+
+
+# --- Comprobación de planes (EXPLAIN) ---
+
+# Queries que por diseño leen el catálogo entero
+FULL_SCAN_ALLOWED = {'handle_get_all_books_query'}
+
+
+class _RecordingCursor:
+    """Cursor que guarda las sentencias en lugar de ejecutarlas."""
+
+    rowcount = 0
+
+    def __init__(self, statements):
+        self._statements = statements
+
+    def execute(self, query, params=None):
+        self._statements.append((query, params))
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return ()
+
+    def fetchmany(self, size=None):
+        return ()
+
+    def close(self):
+        pass
+
+
+class _RecordingConnection:
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self, *args):
+        return _RecordingCursor(self.statements)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _sample_args(cur):
+    """Argumentos reales de la BD para cada nombre de parámetro de las queries."""
+    cur.execute("SELECT isbn, title FROM books ORDER BY title, isbn LIMIT 1")
+    book = cur.fetchone()
+    if book is None:
+        print("Aviso: la tabla books está vacía; los planes pueden no ser representativos")
+        book = ('0', '')
+    cur.execute("SELECT name FROM authors LIMIT 1")
+    author = cur.fetchone()
+    cur.execute("SELECT name FROM formats LIMIT 1")
+    format_name = cur.fetchone()
+    return {
+        'isbn': book[0],
+        'isbns': [book[0]],
+        'author': author[0] if author else '',
+        'format_name': format_name[0] if format_name else '',
+        'limit': 10,
+        'after': (book[1], str(book[0])),
+    }
+
+
+def _full_scans(cur, query, params):
+    """Tablas de `query` que EXPLAIN recorre enteras (type ALL)."""
+    cur.execute("EXPLAIN " + query.strip().rstrip(';'), params)
+    columns = [d[0].lower() for d in cur.description]
+    scans = []
+    for row in cur.fetchall():
+        plan = dict(zip(columns, row))
+        table = plan.get('table') or ''
+        # <derived2>, <subquery3>...: tablas temporales ya acotadas
+        if plan.get('type') == 'ALL' and not table.startswith('<'):
+            scans.append(table)
+    return scans
+
+
+def check_explain(service, conn, connect_name='get_db_connection_query'):
+    """
+    Ejecuta cada handle_get_*_query de `service` contra una conexión que
+    solo registra la SQL y hace EXPLAIN de cada sentencia. `connect_name`
+    es la función de `service` con la que los handlers piden conexión.
+
+    Returns:
+        list: (función, tablas recorridas enteras) de las que fallan
+    """
+    handlers = [(name, fn) for name, fn in inspect.getmembers(service, inspect.isfunction)
+                if name.startswith('handle_get_') and name.endswith('_query')]
+    if not handlers:
+        raise ValueError(f"{service.__name__} no define funciones handle_get_*_query")
+    cur = conn.cursor()
+    failures = []
+    original = getattr(service, connect_name)
+    try:
+        samples = _sample_args(cur)
+        for name, fn in handlers:
+            recorder = _RecordingConnection()
+            setattr(service, connect_name, lambda: recorder)
+            params = inspect.signature(fn).parameters
+            fn(**{p: samples[p] for p in params if p in samples})
+            scans = []
+            for query, query_params in recorder.statements:
+                scans.extend(_full_scans(cur, query, query_params))
+            status = 'OK'
+            if scans and name not in FULL_SCAN_ALLOWED:
+                failures.append((name, scans))
+                status = 'FULL SCAN: ' + ', '.join(scans)
+            elif scans:
+                status = 'OK (lectura completa permitida)'
+            print(f"{name:40} {len(recorder.statements)} sentencia(s)  {status}")
+    finally:
+        setattr(service, connect_name, original)
+        cur.close()
+    return failures
+
+
+if __name__ == '__main__':
+    import microservicioCQRS as service
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+    conn = service.get_db_connection_command()
+    if not conn:
+        sys.exit("Sin conexión a la BD")
+    try:
+        if command == 'migrate':
+            applied = migrate(conn)
+            print(f"Migraciones aplicadas: {applied or 'ninguna'}")
+        elif command == 'status':
+            pending = pending_migrations(conn)
+            print(f"Última versión: {MIGRATIONS[-1][0]}; pendientes: {[m[0] for m in pending] or 'ninguna'}")
+        elif command == 'check':
+            try:
+                failures = check_explain(service, conn)
+            except ValueError as e:
+                sys.exit(str(e))
+            if failures:
+                sys.exit(f"{len(failures)} query(s) con recorrido completo de tabla")
+        else:
+            sys.exit("Uso: python migrations.py [migrate|status|check]")
+    finally:
+        conn.close()
@@ -0,0 +1,81 @@
+"""
+Outbox transaccional de eventos de dominio del catálogo.
+
+Cada comando escribe aquí un evento compacto (BookInserted, BookUpdated,
+BookDeleted) con el mismo cursor y en la misma transacción que los
+cambios en las tablas de escritura. El proyector (projector.py) lee la
+tabla en orden de event_id y actualiza los read models.
+"""
+
+import json
+
+BOOK_INSERTED = 'BookInserted'
+BOOK_UPDATED = 'BookUpdated'
+BOOK_DELETED = 'BookDeleted'
+
+DDL_OUTBOX = """
+CREATE TABLE IF NOT EXISTS outbox (
+    event_id    BIGINT        NOT NULL AUTO_INCREMENT,
+    event_type  VARCHAR(32)   NOT NULL,
+    isbn        VARCHAR(32)   NOT NULL,
+    payload     TEXT          NULL,
+    created_at  TIMESTAMP(6)  NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (event_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+DDL_CHECKPOINT = """
+CREATE TABLE IF NOT EXISTS projector_checkpoint (
+    name      VARCHAR(64)  NOT NULL,
+    position  BIGINT       NOT NULL,
+    PRIMARY KEY (name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def _encode(payload):
+    return json.dumps(payload, separators=(',', ':'), default=str) if payload else None
+
+
+def append_event(cur, event_type, isbn, payload=None):
+    """
+    Añade un evento al outbox usando la transacción abierta de `cur`.
+
+    Returns:
+        int: event_id asignado (posición del evento en el outbox)
+    """
+    cur.execute("INSERT INTO outbox (event_type, isbn, payload) VALUES (%s,%s,%s)",
+                (event_type, isbn, _encode(payload)))
+    return cur.lastrowid
+
+
+def append_events(cur, event_type, isbns, payloads=None):
+    """
+    Añade un evento por cada ISBN con un solo INSERT; `payloads`, si se da,
+    es la lista de payloads en el mismo orden que `isbns`.
+
+    Returns:
+        int: Posición del último evento insertado (o None si no hay ISBNs)
+    """
+    if not isbns:
+        return None
+    # Un único INSERT multi-fila (executemany podría partirlo en varios):
+    # sus ids son consecutivos a partir de LAST_INSERT_ID() (cur.lastrowid).
+    # Un MAX(event_id) podría devolver ids de otras transacciones.
+    payloads = payloads or [None] * len(isbns)
+    values = ','.join(['(%s,%s,%s)'] * len(isbns))
+    cur.execute(f"INSERT INTO outbox (event_type, isbn, payload) VALUES {values}",
+                [v for isbn, payload in zip(isbns, payloads)
+                 for v in (event_type, isbn, _encode(payload))])
+    return cur.lastrowid + cur.rowcount - 1
+
+
+def ensure_outbox(conn):
+    """Crea las tablas del outbox y del checkpoint del proyector si no existen."""
+    cur = conn.cursor()
+    try:
+        cur.execute(DDL_OUTBOX)
+        cur.execute(DDL_CHECKPOINT)
+        conn.commit()
+    finally:
+        cur.close()
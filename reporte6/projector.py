@@ -0,0 +1,359 @@
+"""
+Proyector asíncrono: aplica los eventos del outbox a los read models.
+
+Lee la tabla `outbox` por lotes en orden de event_id y, por cada lote,
+reproyecta los libros afectados en `books_view` y guarda su posición en
+`projector_checkpoint` dentro de la misma transacción. Reproyectar desde
+las tablas de escritura es idempotente, así que reaplicar un lote tras un
+fallo no corrompe el read model.
+
+Otros read stores (cachés, índice de búsqueda) se registran con
+subscribe() y reciben los eventos de cada lote ya confirmado.
+
+Cada reconcile_interval segundos, con el outbox al día, reconcile() busca
+libros cuyo books_view no coincide con las tablas de escritura (los
+escriben también reporte5 y reporte7, que no usan el outbox) y añade sus
+eventos al outbox, así que se reproyectan por el camino normal.
+
+Se puede ejecutar embebido en el servicio (hilo de fondo) o como proceso
+separado:  python projector.py
+"""
+
+import json
+import threading
+import time
+
+import MySQLdb
+
+from outbox import BOOK_DELETED, BOOK_UPDATED, append_events, ensure_outbox
+from read_model import delete_from_books_view, drifted_books, ensure_books_view, refresh_books_view
+
+# Error de MySQL de un SELECT ... NOWAIT sobre filas bloqueadas por otra transacción
+ER_LOCK_NOWAIT = 3572
+
+
+class Projector:
+    """
+    Worker que sigue el outbox y mantiene los read models.
+
+    Args:
+        connect: Función que devuelve una conexión a la BD primaria (o None)
+        name: Nombre del checkpoint en `projector_checkpoint`
+        batch_size: Eventos leídos por lote
+        poll_interval: Segundos de espera cuando no hay eventos nuevos
+        gap_timeout: Segundos que se espera a que aparezca un event_id
+            intermedio (transacción aún sin commit) antes de comprobar si
+            su transacción hizo rollback
+        reconcile_interval: Segundos entre comparaciones de books_view con
+            las tablas de escritura (0 = nunca)
+    """
+
+    def __init__(self, connect, name='books_view', batch_size=500,
+                 poll_interval=0.2, gap_timeout=5.0, reconcile_interval=300.0):
+        self.connect = connect
+        self.name = name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+        self.reconcile_interval = reconcile_interval
+        self._reconciled_at = time.monotonic()
+
+        self._position = 0
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._subscribers = []
+        self._gap_seen = {}
+        self._blocked_at = None   # event_id de un hueco que sigue sin commit pasado gap_timeout
+        self._stats = {'applied': 0, 'batches': 0, 'skipped_gaps': 0, 'reconciled': 0, 'errors': 0}
+
+    # --- Arranque ---
+
+    def bootstrap(self):
+        """
+        Crea las tablas necesarias y fija el checkpoint inicial.
+
+        La posición de cabeza se lee antes de (re)construir books_view: los
+        eventos que lleguen durante la reconstrucción se vuelven a aplicar,
+        lo cual es inocuo.
+        """
+        conn = self._get_conn()
+        cur = conn.cursor()
+        try:
+            ensure_outbox(conn)
+            cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM outbox")
+            head = cur.fetchone()[0]
+            ensure_books_view(conn)
+            cur.execute("INSERT IGNORE INTO projector_checkpoint (name, position) VALUES (%s,%s)",
+                        (self.name, head))
+            cur.execute("SELECT position FROM projector_checkpoint WHERE name=%s", (self.name,))
+            position = cur.fetchone()[0]
+            conn.commit()
+        finally:
+            cur.close(); conn.close()
+        self._set_position(position)
+
+    def subscribe(self, callback):
+        """Registra callback(events) para cada lote aplicado (lista de dicts)."""
+        self._subscribers.append(callback)
+
+    def start(self):
+        """Lanza el hilo de proyección en segundo plano."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'projector-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def notify(self):
+        """Despierta al proyector (los comandos lo llaman tras el commit)."""
+        self._wake.set()
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    # --- Bucle principal ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                applied = self.run_once()
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"Error en proyector: {e}")
+                applied = 0
+            if (applied == 0 and self.reconcile_interval
+                    and time.monotonic() - self._reconciled_at >= self.reconcile_interval):
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    print(f"Error al reconciliar books_view: {e}")
+                self._reconciled_at = time.monotonic()
+            if applied < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _get_conn(self):
+        conn = self.connect()
+        if not conn:
+            raise MySQLdb.OperationalError("Proyector sin conexión a la BD")
+        return conn
+
+    def run_once(self):
+        """
+        Aplica un lote de eventos pendientes.
+
+        Returns:
+            int: Número de eventos aplicados
+        """
+        conn = self._get_conn()
+        cur = conn.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            # El FOR UPDATE serializa varios proyectores con el mismo nombre
+            cur.execute("SELECT position FROM projector_checkpoint WHERE name=%s FOR UPDATE",
+                        (self.name,))
+            row = cur.fetchone()
+            position = row['position'] if row else 0
+            cur.execute("SELECT event_id, event_type, isbn, payload FROM outbox "
+                        "WHERE event_id > %s ORDER BY event_id LIMIT %s",
+                        (position, self.batch_size))
+            events = self._contiguous(cur, position, cur.fetchall())
+            if not events:
+                conn.rollback()
+                return 0
+
+            # Solo importa el último evento de cada ISBN dentro del lote
+            last_type = {}
+            for ev in events:
+                last_type[ev['isbn']] = ev['event_type']
+            deleted = [isbn for isbn, t in last_type.items() if t == BOOK_DELETED]
+            changed = [isbn for isbn, t in last_type.items() if t != BOOK_DELETED]
+            delete_from_books_view(cur, deleted)
+            refresh_books_view(cur, changed)
+
+            position = events[-1]['event_id']
+            cur.execute("INSERT INTO projector_checkpoint (name, position) VALUES (%s,%s) "
+                        "ON DUPLICATE KEY UPDATE position=VALUES(position)",
+                        (self.name, position))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close(); conn.close()
+
+        self._stats['applied'] += len(events)
+        self._stats['batches'] += 1
+        self._set_position(position)
+        for ev in events:
+            if ev['payload']:
+                ev['payload'] = json.loads(ev['payload'])
+        for callback in self._subscribers:
+            try:
+                callback(events)
+            except Exception as e:
+                print(f"Error en suscriptor del proyector: {e}")
+        return len(events)
+
+    def reconcile(self):
+        """
+        Añade al outbox un evento por cada libro desviado en books_view.
+
+        Returns:
+            int: Número de libros reencolados
+        """
+        conn = self._get_conn()
+        cur = conn.cursor()
+        try:
+            changed, deleted = drifted_books(cur)
+            append_events(cur, BOOK_UPDATED, changed)
+            append_events(cur, BOOK_DELETED, deleted)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close(); conn.close()
+        if changed or deleted:
+            self._stats['reconciled'] += len(changed) + len(deleted)
+            print(f"books_view desviado: {len(changed)} a reproyectar, {len(deleted)} a borrar")
+            self.notify()
+        return len(changed) + len(deleted)
+
+    def _contiguous(self, cur, position, rows):
+        """
+        Recorta el lote en el primer hueco de event_id que no se pueda descartar.
+
+        Un hueco puede ser una transacción que todavía no ha hecho commit
+        (su evento aparecerá después) o una que hizo rollback (nunca
+        aparecerá). Pasado gap_timeout se comprueba cuál de las dos es; el
+        checkpoint solo avanza sobre huecos confirmados como rollback, así
+        que el evento de una transacción lenta nunca se salta.
+        """
+        now = time.monotonic()
+        expected = position + 1
+        events = []
+        self._blocked_at = None
+        for row in rows:
+            if row['event_id'] != expected:
+                first_seen = self._gap_seen.setdefault(expected, now)
+                if now - first_seen < self.gap_timeout:
+                    break
+                if not self._rolled_back(cur, expected, row['event_id']):
+                    self._blocked_at = expected
+                    break
+                self._stats['skipped_gaps'] += 1
+            events.append(row)
+            expected = row['event_id'] + 1
+        self._gap_seen = {k: v for k, v in self._gap_seen.items() if k >= expected}
+        return events
+
+    def _rolled_back(self, cur, first, end):
+        """
+        True si los event_id [first, end) no existen ni los retiene nadie.
+
+        Un INSERT sin commit mantiene bloqueada su fila: la lectura con
+        FOR UPDATE NOWAIT falla en vez de esperar. Si la transacción hizo
+        commit entretanto la fila aparece y el hueco tampoco se descarta
+        (el evento se lee en la siguiente vuelta).
+        """
+        try:
+            cur.execute("SELECT event_id FROM outbox WHERE event_id >= %s AND event_id < %s "
+                        "FOR UPDATE NOWAIT", (first, end))
+        except MySQLdb.OperationalError as e:
+            if e.args and e.args[0] == ER_LOCK_NOWAIT:
+                return False
+            raise
+        return not cur.fetchall()
+
+    # --- Posición y lag ---
+
+    def _set_position(self, position):
+        with self._cond:
+            self._position = position
+            self._cond.notify_all()
+
+    @property
+    def position(self):
+        return self._position
+
+    def _read_checkpoint(self):
+        conn = self._get_conn()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT position FROM projector_checkpoint WHERE name=%s", (self.name,))
+            row = cur.fetchone()
+            return row[0] if row else 0
+        finally:
+            cur.close(); conn.close()
+
+    def wait_for(self, position, timeout=2.0):
+        """
+        Espera a que el read model haya aplicado el evento `position`.
+
+        Si el proyector corre en otro proceso, consulta el checkpoint en BD.
+
+        Returns:
+            bool: True si se alcanzó la posición antes del timeout
+        """
+        deadline = time.monotonic() + timeout
+        if self.running:
+            self.notify()
+            with self._cond:
+                return self._cond.wait_for(lambda: self._position >= position,
+                                           max(0.0, deadline - time.monotonic()))
+        while True:
+            current = self._read_checkpoint()
+            self._set_position(current)
+            if current >= position:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def stats(self):
+        """Posición, cabeza del outbox y lag (en eventos y segundos)."""
+        data = dict(self._stats)
+        data.update({'name': self.name, 'running': self.running, 'blocked_at': self._blocked_at})
+        conn = self._get_conn()
+        cur = conn.cursor()
+        try:
+            position = self._position if self.running else self._read_checkpoint()
+            cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM outbox")
+            head = cur.fetchone()[0]
+            cur.execute("SELECT TIMESTAMPDIFF(MICROSECOND, created_at, NOW(6)) FROM outbox "
+                        "WHERE event_id > %s ORDER BY event_id LIMIT 1", (position,))
+            row = cur.fetchone()
+        finally:
+            cur.close(); conn.close()
+        data.update({
+            'position': position,
+            'head': head,
+            'lag_events': max(0, head - position),
+            'lag_seconds': (row[0] / 1e6) if row else 0.0,
+        })
+        return data
+
+
+if __name__ == '__main__':
+    # Proyector como proceso independiente del servicio web
+    from microservicioCQRS import get_db_connection_command
+
+    projector = Projector(get_db_connection_command)
+    projector.bootstrap()
+    print(f"Proyector '{projector.name}' en posición {projector.position}")
+    projector.start()
+    try:
+        while projector.running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        projector.stop()
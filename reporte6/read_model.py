@@ -0,0 +1,179 @@
+"""
+Modelo de lectura (read model) desnormalizado para el lado Query de CQRS.
+
+La tabla `books_view` guarda una fila por libro con los nombres ya resueltos
+(autores concatenados, género y formato), de modo que las queries se
+resuelven con búsquedas indexadas sobre una sola tabla en lugar del
+LEFT JOIN de 5 tablas con GROUP_CONCAT. `books_view_authors` es el índice
+autor → isbn necesario para la consulta por autor exacto.
+
+Las tablas las mantiene el proyector (projector.py) a partir de los
+eventos del outbox, llamando a refresh_books_view() /
+delete_from_books_view() dentro de la transacción de cada lote.
+
+reporte5 y reporte7 escriben en las mismas tablas sin pasar por el outbox:
+drifted_books() compara el read model con el esquema de escritura y el
+proyector la usa periódicamente para reproyectar lo que se haya desviado.
+"""
+
+DDL_BOOKS_VIEW = """
+CREATE TABLE IF NOT EXISTS books_view (
+    isbn     VARCHAR(32)    NOT NULL,
+    title    VARCHAR(255)   NOT NULL,
+    authors  VARCHAR(1024)  NULL,
+    genre    VARCHAR(100)   NULL,
+    format   VARCHAR(100)   NULL,
+    price    DECIMAL(10,2)  NULL,
+    stock    INT            NULL,
+    year     INT            NULL,
+    PRIMARY KEY (isbn),
+    INDEX idx_books_view_title (title, isbn),
+    INDEX idx_books_view_format (format, title)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+DDL_BOOKS_VIEW_AUTHORS = """
+CREATE TABLE IF NOT EXISTS books_view_authors (
+    author  VARCHAR(255)  NOT NULL,
+    isbn    VARCHAR(32)   NOT NULL,
+    PRIMARY KEY (author, isbn),
+    INDEX idx_books_view_authors_isbn (isbn)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+# Columnas en el mismo orden en que las devuelven las queries del read model
+VIEW_COLUMNS = "isbn, title, year, price, stock, genre, format, authors"
+
+# Proyección desde el esquema de escritura; el WHERE lo añade quien la usa
+_PROJECT_BOOKS_SQL = """
+INSERT INTO books_view (isbn, title, year, price, stock, genre, format, authors)
+SELECT b.isbn, b.title, b.year, b.price, b.stock,
+       g.name, f.name,
+       GROUP_CONCAT(a.name SEPARATOR ', ')
+FROM books b
+LEFT JOIN genres g ON b.genre_id = g.genre_id
+LEFT JOIN formats f ON b.format_id = f.format_id
+LEFT JOIN book_authors ba ON b.isbn = ba.isbn
+LEFT JOIN authors a ON ba.author_id = a.author_id
+{where}
+GROUP BY b.isbn
+"""
+
+_PROJECT_AUTHORS_SQL = """
+INSERT INTO books_view_authors (author, isbn)
+SELECT DISTINCT a.name, ba.isbn
+FROM book_authors ba
+JOIN authors a ON ba.author_id = a.author_id
+{where}
+"""
+
+
+# Libros cuyo read model no coincide con el esquema de escritura (o que
+# faltan en él). Los autores se comparan por la suma de CRC32 de sus
+# nombres: no depende del orden de GROUP_CONCAT y detecta renombrados.
+_DRIFTED_SQL = """
+SELECT w.isbn
+FROM (
+    SELECT b.isbn, b.title, b.year, b.price, b.stock,
+           g.name AS genre, f.name AS format,
+           COALESCE(SUM(DISTINCT CRC32(a.name)), 0) AS authors_sum
+    FROM books b
+    LEFT JOIN genres g ON b.genre_id = g.genre_id
+    LEFT JOIN formats f ON b.format_id = f.format_id
+    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
+    LEFT JOIN authors a ON ba.author_id = a.author_id
+    GROUP BY b.isbn
+) w
+LEFT JOIN (
+    SELECT v.isbn, v.title, v.year, v.price, v.stock, v.genre, v.format,
+           (SELECT COALESCE(SUM(CRC32(va.author)), 0) FROM books_view_authors va
+            WHERE va.isbn = v.isbn) AS authors_sum
+    FROM books_view v
+) r ON r.isbn = w.isbn
+WHERE r.isbn IS NULL
+   OR NOT (r.title <=> w.title AND r.year <=> w.year AND r.price <=> w.price
+           AND r.stock <=> w.stock AND r.genre <=> w.genre AND r.format <=> w.format
+           AND r.authors_sum = w.authors_sum)
+"""
+
+# Libros del read model que ya no existen en el esquema de escritura
+_ORPHANED_SQL = """
+SELECT v.isbn FROM books_view v
+LEFT JOIN books b ON b.isbn = v.isbn
+WHERE b.isbn IS NULL
+"""
+
+
+def _in_clause(isbns):
+    return ','.join(['%s'] * len(isbns))
+
+
+def delete_from_books_view(cur, isbns):
+    """Elimina los libros indicados del read model (usa la transacción de `cur`)."""
+    isbns = tuple(isbns)
+    if not isbns:
+        return
+    placeholders = _in_clause(isbns)
+    cur.execute(f"DELETE FROM books_view_authors WHERE isbn IN ({placeholders})", isbns)
+    cur.execute(f"DELETE FROM books_view WHERE isbn IN ({placeholders})", isbns)
+
+
+def refresh_books_view(cur, isbns):
+    """
+    Reproyecta los libros indicados desde las tablas de escritura.
+
+    Debe llamarse con el cursor de la transacción que la confirma (la del
+    lote del proyector) para que el cambio sea atómico.
+    """
+    isbns = tuple(isbns)
+    if not isbns:
+        return
+    placeholders = _in_clause(isbns)
+    delete_from_books_view(cur, isbns)
+    cur.execute(_PROJECT_BOOKS_SQL.format(where=f"WHERE b.isbn IN ({placeholders})"), isbns)
+    cur.execute(_PROJECT_AUTHORS_SQL.format(where=f"WHERE ba.isbn IN ({placeholders})"), isbns)
+
+
+def drifted_books(cur):
+    """
+    Libros en los que books_view se ha desviado de las tablas de escritura
+    (escritos por un servicio que no usa el outbox).
+
+    Returns:
+        (changed, deleted): ISBNs a reproyectar y ISBNs a borrar del read model
+    """
+    cur.execute(_DRIFTED_SQL)
+    changed = [row[0] for row in cur.fetchall()]
+    cur.execute(_ORPHANED_SQL)
+    deleted = [row[0] for row in cur.fetchall()]
+    return changed, deleted
+
+
+def rebuild_books_view(conn):
+    """Reconstruye el read model completo a partir del esquema de escritura."""
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM books_view_authors")
+        cur.execute("DELETE FROM books_view")
+        cur.execute(_PROJECT_BOOKS_SQL.format(where=""))
+        cur.execute(_PROJECT_AUTHORS_SQL.format(where=""))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def ensure_books_view(conn):
+    """Crea las tablas del read model si no existen y las puebla si están vacías."""
+    cur = conn.cursor()
+    try:
+        cur.execute(DDL_BOOKS_VIEW)
+        cur.execute(DDL_BOOKS_VIEW_AUTHORS)
+        cur.execute("SELECT COUNT(*) FROM books_view")
+        empty = cur.fetchone()[0] == 0
+    finally:
+        cur.close()
+    if empty:
+        rebuild_books_view(conn)
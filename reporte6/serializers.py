@@ -0,0 +1,80 @@
+"""
+Serialización de las filas de las queries en JSON y MessagePack.
+
+XML sigue siendo el formato por defecto; negotiate() elige JSON o
+MessagePack solo si la cabecera Accept los prefiere. Las filas se
+serializan tal cual salen del cursor, sin construir un árbol por campo:
+
+    {"books": [{"isbn": ..., "title": ..., ...}], "next": "<cursor>"}
+
+Las dependencias son opcionales: con `orjson` el JSON se genera en C (si
+no, se usa json de la biblioteca estándar) y MessagePack solo se ofrece
+si está instalado `msgpack`.
+"""
+
+import datetime
+import decimal
+import json
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # dependencia opcional
+    msgpack = None
+
+XML_MIMETYPE = 'application/xml'
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+_MSGPACK_ALIASES = ('application/x-msgpack', 'application/vnd.msgpack')
+
+OFFERS = [XML_MIMETYPE, JSON_MIMETYPE] + ([MSGPACK_MIMETYPE, *_MSGPACK_ALIASES] if msgpack else [])
+
+
+def negotiate(accept):
+    """
+    Tipo de respuesta para una cabecera Accept (werkzeug MIMEAccept).
+
+    XML gana los empates, así que sin Accept, con */* o con la cabecera
+    típica de un navegador la respuesta sigue siendo XML.
+    """
+    best = accept.best_match(OFFERS, default=XML_MIMETYPE) if accept else XML_MIMETYPE
+    return MSGPACK_MIMETYPE if best in _MSGPACK_ALIASES else best
+
+
+def _default(value):
+    # DECIMAL como texto (sin pérdida de precisión, igual que en el XML)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def books_payload(rows, next_cursor=None):
+    payload = {'books': rows if isinstance(rows, list) else list(rows)}
+    if next_cursor:
+        payload['next'] = next_cursor
+    return payload
+
+
+def dumps_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def dumps_msgpack(payload):
+    return msgpack.packb(payload, default=_default, use_bin_type=True)
+
+
+def serialize_books(mimetype, rows, next_cursor=None):
+    """Cuerpo JSON o MessagePack de una lista de libros."""
+    payload = books_payload(rows, next_cursor)
+    if mimetype == MSGPACK_MIMETYPE:
+        return dumps_msgpack(payload)
+    return dumps_json(payload)
@@ -57,42 +57,19 @@ document.addEventListener("DOMContentLoaded", () => {
     // ...
     utils.loadConfig();
     try {
-      // Limpiar selects antes de poblar
-      authorSelect.innerHTML = '<option value="">-- Selecciona Autor --</option>';
-      formatSelect.innerHTML = '<option value="">-- Selecciona Formato --</option>';
-
       const url = utils.getBaseApiUrl();
       const res = await fetch(url);
       if (!res.ok) throw new Error(`Error ${res.status}: ${res.statusText}`);
       const xml = await res.text();
       const parser = new DOMParser();
       const xmlDoc = parser.parseFromString(xml, "application/xml");
-      const authors = new Set();
-      const formats = new Set();
+      // El catálogo queda en memoria; el feed de cambios lo mantiene al día
+      catalog.clear();
       for (let book of xmlDoc.getElementsByTagName("book")) {
-        const authorNode = book.getElementsByTagName("author")[0];
-        const formatNode = book.getElementsByTagName("format")[0];
-        if (authorNode && authorNode.textContent) {
-          authorNode.textContent.split(',').forEach(a => authors.add(a.trim()));
-        }
-        if (formatNode && formatNode.textContent) {
-          formats.add(formatNode.textContent);
-        }
+        const data = bookFromXml(book);
+        catalog.set(data.isbn, data);
       }
-      const sortedAuthors = [...authors].sort();
-      const sortedFormats = [...formats].sort();
-      sortedAuthors.forEach(a => {
-        const opt = document.createElement("option");
-        opt.value = a;
-        opt.textContent = a;
-        authorSelect.appendChild(opt);
-      });
-      sortedFormats.forEach(f => {
-        const opt = document.createElement("option");
-        opt.value = f;
-        opt.textContent = f;
-        formatSelect.appendChild(opt);
-      });
+      fillSelects();
     } catch (err) {
       console.error("Error cargando catálogo para selects:", err);
       utils.statusEl.textContent = "Error al cargar datos iniciales.";
@@ -100,12 +77,45 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
+  /**
+   * Rellena los selects de autor y formato a partir del catálogo local
+   * (conserva la opción elegida)
+   */
+  function fillSelects() {
+    const selectedAuthor = authorSelect.value;
+    const selectedFormat = formatSelect.value;
+    authorSelect.innerHTML = '<option value="">-- Selecciona Autor --</option>';
+    formatSelect.innerHTML = '<option value="">-- Selecciona Formato --</option>';
+    const authors = new Set();
+    const formats = new Set();
+    for (const book of catalog.values()) {
+      splitAuthors(book.authors).forEach(a => authors.add(a));
+      if (book.format) formats.add(book.format);
+    }
+    [...authors].sort().forEach(a => {
+      const opt = document.createElement("option");
+      opt.value = a;
+      opt.textContent = a;
+      authorSelect.appendChild(opt);
+    });
+    [...formats].sort().forEach(f => {
+      const opt = document.createElement("option");
+      opt.value = f;
+      opt.textContent = f;
+      formatSelect.appendChild(opt);
+    });
+    authorSelect.value = selectedAuthor;
+    formatSelect.value = selectedFormat;
+  }
+
   // --- Lógica de Carga de Resultados (Existente) ---
 
-  async function loadResults(url) {
+  async function loadResults(url, matches) {
     // (Tu función loadResults existente va aquí...)
     // ...
     if (!url) return;
+    // Vista que el feed de cambios mantendrá al día (null = no se parchea)
+    currentView = matches ? { url, matches, isbns: new Set() } : null;
     resultsContainer.style.display = "none";
     statusInfo.style.display = "none";
     loadStatus.textContent = "";
@@ -122,7 +132,11 @@ document.addEventListener("DOMContentLoaded", () => {
       }
       const parser = new DOMParser();
       const xmlDoc = parser.parseFromString(xmlText, "application/xml");
-      const count = xmlDoc.getElementsByTagName("book").length;
+      const bookNodes = xmlDoc.getElementsByTagName("book");
+      const count = bookNodes.length;
+      if (currentView) {
+        for (let book of bookNodes) currentView.isbns.add(book.getAttribute("isbn"));
+      }
       statusInfo.style.display = "block";
       if (count === 0) {
         loadStatus.textContent = "No se encontró ningún dato para cargar";
@@ -136,6 +150,7 @@ document.addEventListener("DOMContentLoaded", () => {
         resultsFrame.style.display = "block";
         xmlSource.style.display = "none";
         toggleResultsBtn.textContent = "Mostrar XML";
+        resultsFrame.removeAttribute("srcdoc");
         resultsFrame.src = url;
         xmlSource.textContent = formatXml(xmlText);
       }
@@ -196,22 +211,24 @@ document.addEventListener("DOMContentLoaded", () => {
   testConfigBtn.addEventListener("click", utils.testConnection.bind(utils));
   resetConfigBtn.addEventListener("click", utils.resetConfig.bind(utils));
   getAllBtn.addEventListener("click", () => {
-    loadResults(utils.getBaseApiUrl());
+    loadResults(utils.getBaseApiUrl(), () => true);
   });
   getByIsbnBtn.addEventListener("click", () => {
     const isbn = isbnInput.value.trim();
     if (!isbn) return alert("Introduce un ISBN");
-    loadResults(`${utils.getBaseApiUrl()}/isbn/${isbn}`);
+    loadResults(`${utils.getBaseApiUrl()}/isbn/${isbn}`, book => book.isbn === isbn);
   });
   getByAuthorBtn.addEventListener("click", () => {
     const author = authorSelect.value.trim();
     if (!author) return alert("Selecciona un autor");
-    loadResults(`${utils.getBaseApiUrl()}/author/${author}`);
+    loadResults(`${utils.getBaseApiUrl()}/author/${author}`,
+                book => splitAuthors(book.authors).some(a => a.toLowerCase() === author.toLowerCase()));
   });
   getByFormatBtn.addEventListener("click", () => {
     const format = formatSelect.value.trim();
     if (!format) return alert("Selecciona un formato");
-    loadResults(`${utils.getBaseApiUrl()}/format/${format}`);
+    loadResults(`${utils.getBaseApiUrl()}/format/${format}`,
+                book => book.format.toLowerCase() === format.toLowerCase());
   });
   toggleResultsBtn.addEventListener("click", toggleResultView);
 
@@ -279,9 +296,10 @@ document.addEventListener("DOMContentLoaded", () => {
       await showOperationStatus(insertStatus, response);
 
       if (response.ok) {
-        // Limpiar campos y refrescar dropdowns
+        // Limpiar campos; con el feed activo el libro llega como evento
+        // y parchea los dropdowns, sin él se recarga el catálogo
         requiredFields.forEach(f => f.value = "");
-        initializeApp(); // Recarga los autores y formatos
+        if (!feedActive) reloadCatalog();
       }
     } catch (err) {
       insertStatus.textContent = `Error de red: ${err.message}`;
@@ -356,6 +374,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
       if (response.ok) {
         deleteIsbns.value = ""; // Limpiar textarea
+        if (!feedActive) reloadCatalog();
       }
 
     } catch (err) {
@@ -369,6 +388,225 @@ document.addEventListener("DOMContentLoaded", () => {
   updateBtn.addEventListener("click", handleUpdate);
   deleteBtn.addEventListener("click", handleDelete);
 
+  // ==== Catálogo local y feed de cambios (/api/books/changes) ====
+  // El catálogo se pide una sola vez (initializeApp) y queda en memoria
+  // (isbn -> libro). Cada inserción, modificación o borrado, de este
+  // cliente o de cualquier otro, llega como evento del feed con el estado
+  // del libro (o null si se borró): se parchean los selects y la tabla que
+  // se está viendo sin volver a pedir /api/books. Un evento 'reset' (el
+  // servidor no conserva los cambios desde nuestro último id) recarga todo.
+
+  const catalog = new Map();
+  const pendingChanges = [];   // eventos recibidos durante una recarga
+  const XML_FIELDS = [["title", "title"], ["authors", "author"], ["year", "year"],
+                      ["genre", "genre"], ["price", "price"], ["stock", "stock"],
+                      ["format", "format"]];
+  let currentView = null;      // { url, matches(libro), isbns } de la tabla mostrada
+  let catalogLoading = null;   // promesa de la recarga en curso
+  let feedActive = false;
+  let changeSource = null;
+  let lastEventId = null;
+  let xsltProcessor = null;
+
+  function splitAuthors(authors) {
+    return authors ? authors.split(',').map(a => a.trim()).filter(a => a) : [];
+  }
+
+  function asText(value) {
+    return value === null || value === undefined ? "" : String(value);
+  }
+
+  /** Libro del XML de /api/books con los mismos campos que los eventos */
+  function bookFromXml(node) {
+    const book = { isbn: node.getAttribute("isbn") };
+    for (const [key, tag] of XML_FIELDS) {
+      book[key] = node.getElementsByTagName(tag)[0]?.textContent || "";
+    }
+    return book;
+  }
+
+  /** Libro de un evento del feed (valores numéricos y null como texto) */
+  function bookFromEvent(isbn, data) {
+    const book = { isbn };
+    for (const [key] of XML_FIELDS) book[key] = asText(data[key]);
+    return book;
+  }
+
+  /** Documento <catalog> como el que devuelve el servidor */
+  function catalogXml(books) {
+    const doc = document.implementation.createDocument(null, "catalog", null);
+    for (const book of books) {
+      const node = doc.createElement("book");
+      node.setAttribute("isbn", book.isbn);
+      for (const [key, tag] of XML_FIELDS) {
+        const child = doc.createElement(tag);
+        child.textContent = book[key];
+        node.appendChild(child);
+      }
+      doc.documentElement.appendChild(node);
+    }
+    return doc;
+  }
+
+  /** La misma hoja libros.xsl que usa el navegador, cargada una vez */
+  async function getXslt() {
+    if (xsltProcessor || !window.XSLTProcessor) return xsltProcessor;
+    try {
+      const res = await fetch(new URL("/libros.xsl", utils.getRootApiUrl()));
+      if (!res.ok) return null;
+      const xsl = new DOMParser().parseFromString(await res.text(), "application/xml");
+      xsltProcessor = new XSLTProcessor();
+      xsltProcessor.importStylesheet(xsl);
+    } catch (err) {
+      console.error("Error cargando libros.xsl:", err);
+      xsltProcessor = null;
+    }
+    return xsltProcessor;
+  }
+
+  /**
+   * Rehace la tabla mostrada desde el catálogo local
+   * (mismo orden que el servidor: título y, a igualdad, ISBN)
+   */
+  async function renderView() {
+    const view = currentView;
+    const books = [...catalog.values()].filter(view.matches).sort((a, b) =>
+      a.title.toLowerCase().localeCompare(b.title.toLowerCase()) || a.isbn.localeCompare(b.isbn));
+    view.isbns = new Set(books.map(b => b.isbn));
+    const doc = catalogXml(books);
+    const xsl = await getXslt();
+    if (view !== currentView) return;   // el usuario cambió de consulta mientras tanto
+    if (!xsl) {
+      loadResults(view.url, view.matches);   // sin XSLT en el navegador: se vuelve a pedir
+      return;
+    }
+    statusInfo.style.display = "block";
+    bookCount.textContent = `Total de libros: ${books.length}`;
+    if (books.length === 0) {
+      resultsContainer.style.display = "none";
+      loadStatus.textContent = "No se encontró ningún dato para cargar";
+      loadStatus.style.color = "orange";
+      return;
+    }
+    loadStatus.textContent = "Datos actualizados en tiempo real";
+    loadStatus.style.color = "green";
+    if (resultsContainer.style.display !== "block") {
+      resultsContainer.style.display = "block";
+      resultsFrame.style.display = "block";
+      xmlSource.style.display = "none";
+      toggleResultsBtn.textContent = "Mostrar XML";
+    }
+    resultsFrame.srcdoc = xsl.transformToDocument(doc).documentElement.outerHTML;
+    xmlSource.textContent = formatXml(new XMLSerializer().serializeToString(doc));
+  }
+
+  /** Aplica un lote [{isbn, book}] al catálogo local, los selects y la tabla */
+  function applyChanges(changes) {
+    if (changes.length === 0) return;
+    let viewTouched = false;
+    for (const { isbn, book } of changes) {
+      const data = book ? bookFromEvent(isbn, book) : null;
+      if (currentView && (currentView.isbns.has(isbn) || (data && currentView.matches(data)))) {
+        viewTouched = true;
+      }
+      if (data) catalog.set(isbn, data);
+      else catalog.delete(isbn);
+    }
+    fillSelects();
+    if (viewTouched) renderView();
+  }
+
+  /** Recarga el catálogo entero; los eventos que llegan mientras tanto se aplican después */
+  async function reloadCatalog() {
+    if (catalogLoading) return catalogLoading;
+    catalogLoading = initializeApp();
+    try {
+      await catalogLoading;
+    } finally {
+      catalogLoading = null;
+    }
+    applyChanges(pendingChanges.splice(0));
+    if (currentView) renderView();
+  }
+
+  function onFeedMessage(type, payload) {
+    lastEventId = payload.seq;
+    if (type === "reset") {
+      reloadCatalog();
+    } else if (type === "ready") {
+      // El feed ya está escuchando: lo que cambie desde aquí llegará como evento
+      feedActive = true;
+      reloadCatalog();
+    } else if (catalogLoading) {
+      pendingChanges.push(...payload.changes);
+    } else {
+      applyChanges(payload.changes);
+    }
+  }
+
+  /** Conecta (o reconecta, si cambia la configuración) con el feed */
+  function connectChanges() {
+    if (changeSource) changeSource.close();
+    changeSource = null;
+    feedActive = false;
+    lastEventId = null;
+    xsltProcessor = null;
+    const url = `${utils.getRootApiUrl()}/books/changes`;
+    if (!window.EventSource) {
+      pollChanges(url);
+      return;
+    }
+    const source = changeSource = new EventSource(url);
+    for (const type of ["ready", "changes", "reset"]) {
+      source.addEventListener(type, e => onFeedMessage(type, JSON.parse(e.data)));
+    }
+    // EventSource reconecta solo y manda Last-Event-ID; si el servidor lo
+    // rechaza (404: feed desactivado; 503: aún no disponible o demasiados
+    // streams abiertos) se cierra y long-poll decide si seguir o no
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && changeSource === source) {
+        feedActive = false;
+        if (!catalog.size) reloadCatalog();
+        pollChanges(url);
+      }
+    };
+  }
+
+  /**
+   * Alternativa sin EventSource: long-poll con ?since=. Un 404 (feed
+   * desactivado en el servidor) es definitivo: se deja de pedir y cada
+   * escritura recarga el catálogo (feedActive = false).
+   */
+  async function pollChanges(url) {
+    const marker = changeSource = {};
+    while (changeSource === marker) {
+      try {
+        const query = lastEventId === null ? "" : `?since=${encodeURIComponent(lastEventId)}`;
+        const res = await fetch(`${url}${query}`, { headers: { "Accept": "application/json" } });
+        if (changeSource !== marker) return;
+        if (res.status === 404) {
+          changeSource = null;
+          feedActive = false;
+          reloadCatalog();
+          return;
+        }
+        if (!res.ok) throw new Error(`Error ${res.status}: ${res.statusText}`);
+        const payload = await res.json();
+        if (lastEventId === null) onFeedMessage("ready", payload);
+        else if (payload.reset) onFeedMessage("reset", payload);
+        else onFeedMessage("changes", payload);
+      } catch (err) {
+        console.error("Error en el feed de cambios:", err);
+        feedActive = false;
+        if (!catalog.size) reloadCatalog();
+        await new Promise(resolve => setTimeout(resolve, 3000));
+      }
+    }
+  }
+
+  saveConfigBtn.addEventListener("click", connectChanges);
+
   // --- Iniciar App ---
-  initializeApp(); // Carga inicial
+  utils.loadConfig();
+  connectChanges(); // La carga inicial se lanza al recibir 'ready'
 });
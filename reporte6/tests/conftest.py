@@ -0,0 +1,24 @@
+"""
+Pruebas de reporte6 sin MySQL: loadtest/standin_db.py (sqlite) se registra
+como MySQLdb para el outbox y el proyector.
+
+    python -m pytest reporte6/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), os.path.join(HERE, '..', '..', 'loadtest')]
+
+import standin_db  # noqa: E402
+
+standin_db.install()
+
+
+@pytest.fixture
+def db(tmp_path):
+    """BD sembrada nueva por prueba; devuelve las muestras de seed()."""
+    return standin_db.seed(str(tmp_path / 'libros.db'), books=20)
@@ -0,0 +1,101 @@
+from catalog_store import CatalogStore
+
+
+def row(isbn, title, authors='Ana Gil', format_name='Ebook', stock=1):
+    return {'isbn': isbn, 'title': title, 'year': 2000, 'price': '10.00', 'stock': stock,
+            'genre': 'Novela', 'format': format_name, 'authors': authors}
+
+
+class FakeSource:
+    """load_rows/changes de CatalogStore sobre un dict en memoria."""
+
+    def __init__(self, rows):
+        self.rows = {r['isbn']: r for r in rows}
+        self.version = 0
+        self.changed = None   # None = recarga completa
+
+    def load_rows(self, isbns):
+        if isbns is None:
+            return list(self.rows.values())
+        # Como la clave primaria de MySQL (colación *_ci)
+        wanted = {i.casefold() for i in isbns}
+        return [r for isbn, r in self.rows.items() if isbn.casefold() in wanted]
+
+    def changes(self, version):
+        changed, self.changed = self.changed, set()
+        return self.version, (None if version is None else changed)
+
+    def write(self, isbn, new_row=None):
+        if new_row is None:
+            self.rows.pop(isbn, None)
+        else:
+            self.rows[isbn] = new_row
+        self.version += 1
+        self.changed.add(isbn)
+
+
+def make_store(rows):
+    source = FakeSource(rows)
+    store = CatalogStore(source.load_rows, source.changes)
+    assert store.sync()
+    return store, source
+
+
+def test_refresh_updates_indexes_and_publishes():
+    store, source = make_store([row('1', 'Crimen'), row('2', 'Álgebra', authors='Fiódor Dostoyevski')])
+    published = []
+    store.subscribe(lambda version, books: published.append((version, books)))
+
+    source.write('1', row('1', 'Crimen y castigo', authors='Luis Ruiz', format_name='Audiolibro', stock=7))
+    source.write('2')
+    assert store.sync()
+
+    assert store.get('1')[0]['stock'] == 7
+    assert store.get('2') == []
+    assert [r['isbn'] for r in store.by_author('luis ruiz')] == ['1']
+    assert store.by_author('Ana Gil') == [] and store.by_format('ebook') == []
+    assert [r['isbn'] for r in store.all()] == ['1']
+    assert published[-1][0] == 2
+    assert published[-1][1]['2'] is None and published[-1][1]['1']['stock'] == 7
+
+
+def test_accent_and_case_insensitive_like_mysql():
+    store, _ = make_store([row('1', 'Crimen'), row('2', 'Álgebra', authors='Fiódor Dostoyevski')])
+    assert [r['isbn'] for r in store.by_author('fiodor dostoyevski')] == ['2']
+    assert [r['title'] for r in store.all()] == ['Álgebra', 'Crimen']
+
+
+def test_get_finds_stored_isbn_in_other_case():
+    store, _ = make_store([row('123X', 'Crimen')])
+    assert store.get('123x')[0]['isbn'] == '123X'
+    assert list(store.get_many(['123x'])) == ['123X']
+
+
+def test_page_follows_title_isbn_keyset():
+    store, _ = make_store([row(str(i), f'Libro {i:02d}') for i in range(10)])
+    first = store.page(3)
+    assert [r['isbn'] for r in first] == ['0', '1', '2', '3']
+    last = first[2]
+    assert [r['isbn'] for r in store.page(3, (last['title'], last['isbn']))] == ['3', '4', '5', '6']
+
+
+def test_refresh_with_isbn_in_other_case_uses_stored_isbn():
+    store, source = make_store([row('123X', 'Crimen'), row('456', 'Álgebra')])
+    published = []
+    store.subscribe(lambda version, books: published.append(books))
+
+    # Evento de un comando con el ISBN en minúsculas
+    source.rows['123X'] = row('123X', 'Crimen', stock=5)
+    source.version += 1
+    source.changed.add('123x')
+    assert store.sync()
+    assert store.get('123X')[0]['stock'] == 5
+    assert published[-1] == {'123X': store.get('123X')[0]}
+
+    del source.rows['123X']
+    source.version += 1
+    source.changed.add('123x')
+    assert store.sync()
+    assert store.get('123X') == [] and store.search('crimen') == []
+    assert [r['isbn'] for r in store.all()] == ['456']
+    assert published[-1] == {'123X': None}
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from change_feed import ChangeFeed, sse_message
+
+
+def book(isbn, stock=1):
+    return {'isbn': isbn, 'title': f'Libro {isbn}', 'stock': stock}
+
+
+def test_not_ready_until_first_publish():
+    feed = ChangeFeed()
+    assert not feed.ready
+    feed.publish('e-0', None)
+    assert feed.ready and feed.version == 'e-0'
+
+
+def test_since_merges_batches_after_last_id():
+    feed = ChangeFeed()
+    feed.publish('e-0', None)
+    feed.publish('e-1', {'A': book('A', 1)})
+    feed.publish('e-2', {'A': book('A', 2), 'B': None})
+    version, changes = feed.since('e-0')
+    assert version == 'e-2'
+    assert {c['isbn']: c['book'] for c in changes} == {'A': book('A', 2), 'B': None}
+    assert feed.since('e-1')[1] == [{'isbn': 'A', 'book': book('A', 2)}, {'isbn': 'B', 'book': None}]
+    assert feed.since('e-2') == ('e-2', [])
+
+
+def test_reset_for_unknown_epoch_old_floor_or_garbage():
+    feed = ChangeFeed(max_batches=2)
+    feed.publish('e-0', None)
+    for n in range(1, 4):
+        feed.publish(f'e-{n}', {'A': book('A', n)})
+    assert feed.since('e-0')[1] is None          # fuera del buffer
+    assert feed.since('other-3')[1] is None      # otro epoch
+    assert feed.since('no-es-version')[1] is None
+    assert feed.since('e-2')[1] == [{'isbn': 'A', 'book': book('A', 3)}]
+
+
+def test_full_reload_resets_clients():
+    feed = ChangeFeed()
+    feed.publish('e-0', None)
+    feed.publish('e-1', {'A': book('A')})
+    feed.publish('e-2', None)
+    assert feed.since('e-1') == ('e-2', None)
+
+
+def test_wait_returns_on_publish_and_times_out():
+    feed = ChangeFeed()
+    feed.publish('e-0', None)
+    started = time.monotonic()
+    assert feed.wait('e-0', 0.05) == ('e-0', [])
+    assert time.monotonic() - started >= 0.05
+
+    timer = threading.Timer(0.05, feed.publish, ('e-1', {'A': book('A')}))
+    timer.start()
+    version, changes = feed.wait('e-0', 5)
+    timer.join()
+    assert version == 'e-1' and changes == [{'isbn': 'A', 'book': book('A')}]
+
+
+def test_sse_message_format():
+    assert sse_message('e-1', None) == 'id: e-1\nevent: reset\ndata: {"seq":"e-1"}\n\n'
+    assert sse_message('e-1', []).startswith('id: e-1\nevent: changes\n')
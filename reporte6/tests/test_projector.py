@@ -0,0 +1,84 @@
+import MySQLdb
+
+from outbox import BOOK_DELETED, BOOK_UPDATED, append_event, append_events
+from projector import Projector
+
+
+def connect():
+    return MySQLdb.connect()
+
+
+def execute(sql, params=()):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        rows = list(cur.fetchall())
+        conn.commit()
+        return rows
+    finally:
+        cur.close(); conn.close()
+
+
+def test_append_events_returns_last_id_of_its_insert(db):
+    conn = connect()
+    cur = conn.cursor()
+    first = append_event(cur, BOOK_UPDATED, db['isbns'][0])
+    last = append_events(cur, BOOK_UPDATED, db['isbns'][:3], [{'stock': n} for n in range(3)])
+    conn.commit()
+    cur.close(); conn.close()
+    assert last == first + 3
+    rows = execute("SELECT event_id, isbn, payload FROM outbox ORDER BY event_id")
+    assert [r[1] for r in rows[-3:]] == db['isbns'][:3]
+    assert rows[-1][2] == '{"stock":2}'
+
+
+def test_projector_applies_events_in_order(db):
+    projector = Projector(connect, reconcile_interval=0)
+    projector.bootstrap()
+    received = []
+    projector.subscribe(received.extend)
+    isbn, gone = db['isbns'][:2]
+
+    execute("UPDATE books SET stock=123 WHERE isbn=%s", (isbn,))
+    execute("DELETE FROM book_authors WHERE isbn=%s", (gone,))
+    execute("DELETE FROM books WHERE isbn=%s", (gone,))
+    conn = connect()
+    cur = conn.cursor()
+    append_event(cur, BOOK_UPDATED, isbn)
+    position = append_event(cur, BOOK_DELETED, gone)
+    conn.commit()
+    cur.close(); conn.close()
+
+    assert projector.run_once() == 2
+    assert projector.position == position
+    assert execute("SELECT stock FROM books_view WHERE isbn=%s", (isbn,)) == [(123,)]
+    assert execute("SELECT isbn FROM books_view WHERE isbn=%s", (gone,)) == []
+    assert [e['event_type'] for e in received] == [BOOK_UPDATED, BOOK_DELETED]
+    assert projector.run_once() == 0
+
+
+def test_projector_waits_for_gap_until_timeout(db):
+    projector = Projector(connect, gap_timeout=60, reconcile_interval=0)
+    projector.bootstrap()
+    start = projector.position
+    # event_id start+1 sin commit todavía: solo aparece start+2
+    execute("INSERT INTO outbox (event_id, event_type, isbn) VALUES (%s,%s,%s)",
+            (start + 2, BOOK_UPDATED, db['isbns'][0]))
+    assert projector.run_once() == 0
+    assert projector.position == start
+    execute("INSERT INTO outbox (event_id, event_type, isbn) VALUES (%s,%s,%s)",
+            (start + 1, BOOK_UPDATED, db['isbns'][1]))
+    assert projector.run_once() == 2
+    assert projector.position == start + 2
+
+
+def test_reconcile_requeues_writes_made_without_outbox(db):
+    projector = Projector(connect, reconcile_interval=0)
+    projector.bootstrap()
+    assert projector.reconcile() == 0
+    execute("UPDATE books SET stock=999 WHERE isbn=%s", (db['isbns'][0],))
+    assert projector.reconcile() == 1
+    projector.run_once()
+    assert execute("SELECT stock FROM books_view WHERE isbn=%s", (db['isbns'][0],)) == [(999,)]
+    assert projector.reconcile() == 0
@@ -0,0 +1,47 @@
+import MySQLdb
+import pytest
+
+from read_model import rebuild_books_view
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_cors')
+
+import microservicioCQRS as service  # noqa: E402
+
+
+@pytest.fixture
+def view(db):
+    """books_view reconstruida; devuelve (título, autores) de un libro."""
+    conn = MySQLdb.connect()
+    rebuild_books_view(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT title, authors FROM books_view ORDER BY isbn LIMIT 1")
+    row = cur.fetchone()
+    cur.close(); conn.close()
+    return row
+
+
+def test_search_without_index_falls_back_to_mysql(view):
+    title, authors = view
+    word = title.split()[0]
+    last_name = authors.split(',')[0].split()[-1]
+    rows = service.handle_search_books_query(f"{word.lower()} {last_name[:3]}", 5)
+    assert rows and all(word.lower() in r['title'].lower() for r in rows)
+    assert title in [r['title'] for r in rows]
+    assert service.handle_search_books_query("zzz_%", 5) == []
+
+
+def test_suggest_authors_without_index_matches_word_prefixes(view):
+    _, authors = view
+    name = authors.split(',')[0]
+    names = service.handle_suggest_authors_query(name.split()[-1][:3], 10)
+    assert name in names
+    assert names == sorted(names, key=str.casefold)
+
+
+def test_search_endpoint_does_not_need_the_index(view):
+    assert not service.CATALOG_STORE.ready
+    with service.app.test_client() as client:
+        response = client.get('/api/books/search', query_string={'q': view[0].split()[0]})
+    assert response.status_code == 200
+    assert b'<book ' in response.data
@@ -0,0 +1,83 @@
+"""
+Benchmark de la variante ASGI frente a la versión Flask con mucha concurrencia.
+
+Lanza el modelo cerrado de loadtest/loadgen.py (N clientes en bucle) contra
+los dos servicios para cada nivel de concurrencia y compara throughput,
+p50/p99 y errores. La diferencia aparece con la BD lenta: arranca los dos
+servicios con el mismo número de procesos contra un MySQL con latencia
+añadida (p. ej. toxiproxy delante del 3306) y sube la concurrencia por
+encima de workers x hilos de la versión Flask.
+
+    python serve.py --workers 2 --threads 8 --bind 127.0.0.1:5000
+    uvicorn microserviciosASGI:app --workers 2 --port 5001
+    python bench_asgi.py --concurrency 16 64 256 --duration 20 --out asgi.json
+
+Usa la SECRET_KEY del servicio para generar el token.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'loadtest'))
+import loadgen
+from microserviciosCQRS import SECRET_KEY
+
+READ_MIX = 'isbn=50,author=20,format=10,page=20'
+
+
+def run_target(url, token, concurrency, args, samples):
+    """Una ejecución del modelo cerrado; devuelve el resumen y los endpoints de loadgen."""
+    headers = {'Accept': args.accept, 'Accept-Encoding': 'identity', 'Authorization': f'Bearer {token}'}
+    options = argparse.Namespace(concurrency=concurrency, rps=0, duration=args.duration,
+                                 warmup=args.warmup, seed=1)
+    recorder = loadgen.Recorder()
+    elapsed = loadgen.run_closed(options, loadgen.parse_mix(args.mix),
+                                 loadgen.Operations(samples, f"{concurrency:05d}"),
+                                 lambda: loadgen.Client(url, headers, args.timeout), recorder)
+    merged = recorder.merged()
+    latencies = sorted(l for entry in merged.values() for l in entry['latencies'])
+    summary, endpoints = loadgen.summarize(merged, elapsed)
+    if latencies:
+        summary['p50_ms'] = round(loadgen.percentile(latencies, 50) * 1000, 3)
+        summary['p99_ms'] = round(loadgen.percentile(latencies, 99) * 1000, 3)
+    return summary, endpoints
+
+
+def run(args):
+    token = args.token or loadgen.make_token(SECRET_KEY)
+    targets = [('flask', args.sync_url.rstrip('/')), ('asgi', args.asgi_url.rstrip('/'))]
+    probe = loadgen.Client(targets[0][1], {'Authorization': f'Bearer {token}'}, args.timeout)
+    samples = loadgen.remote_samples(probe)
+
+    header = f"{'clientes':>8}  {'servicio':<8} {'rps':>9} {'p50 ms':>9} {'p99 ms':>10} {'errores':>8}"
+    print(header)
+    print('-' * len(header))
+    results = []
+    for concurrency in args.concurrency:
+        for name, url in targets:
+            summary, endpoints = run_target(url, token, concurrency, args, samples)
+            results.append({'service': name, 'url': url, 'concurrency': concurrency,
+                            'summary': summary, 'endpoints': endpoints})
+            print(f"{concurrency:>8}  {name:<8} {summary['rps']:>9} {summary.get('p50_ms', '-'):>9} "
+                  f"{summary.get('p99_ms', '-'):>10} {summary['errors']:>8}")
+        print()
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            json.dump({'mix': args.mix, 'duration_s': args.duration, 'results': results}, fh, indent=2)
+        print(f"Resultado guardado en {args.out}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sync-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--asgi-url', default='http://127.0.0.1:5001')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--mix', default=READ_MIX)
+    parser.add_argument('--accept', default='application/xml')
+    parser.add_argument('--token', help="JWT (por defecto se firma uno con SECRET_KEY)")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    run(parser.parse_args())
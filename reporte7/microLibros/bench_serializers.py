@@ -0,0 +1,89 @@
+"""
+Benchmark de serialización de las respuestas de las queries.
+
+Compara, para un catálogo sintético, el XML actual (xml_writer) con JSON
+y MessagePack: tiempo de generación, tiempo de lectura en el cliente y
+tamaño del cuerpo (también comprimido con gzip).
+
+    python bench_serializers.py                 # 10.000 libros
+    python bench_serializers.py --books 1000 10000 --repeat 10
+
+Usa las funciones reales del servicio, así que necesita sus dependencias
+(no necesita una base de datos).
+"""
+
+import argparse
+import decimal
+import gzip
+import json
+import statistics
+import time
+import xml.etree.ElementTree as ET
+
+import serializers
+from microserviciosCQRS import app, create_xml_response
+
+
+def make_rows(n):
+    """Filas con la misma forma que devuelve el DictCursor de las queries."""
+    genres = ['Novela', 'Ensayo', 'Poesía', 'Ciencia ficción', 'Historia']
+    formats = ['Tapa dura', 'Tapa blanda', 'eBook']
+    return [{
+        'isbn': f'978{i:010d}',
+        'title': f'Título del libro número {i} — edición ñandú',
+        'year': 1900 + i % 125,
+        'price': decimal.Decimal(f'{5 + i % 90}.{i % 100:02d}'),
+        'stock': i % 50,
+        'genre': genres[i % len(genres)],
+        'format': formats[i % len(formats)],
+        'authors': f'Fiódor Dostoyevski, Autor {i % 997}',
+    } for i in range(n)]
+
+
+def timed(fn, repeat):
+    """Mediana en ms de `repeat` ejecuciones y el último resultado."""
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def candidates():
+    """(nombre, serializar(rows) -> bytes, deserializar(bytes))"""
+    items = [('xml (xml_writer)', lambda rows: create_xml_response(rows).get_data(), ET.fromstring)]
+    if serializers.orjson is not None:
+        items.append(('json (orjson)', lambda rows: serializers.dumps_json(serializers.books_payload(rows)),
+                      serializers.orjson.loads))
+    items.append(('json (stdlib)',
+                  lambda rows: json.dumps(serializers.books_payload(rows), default=serializers._default,
+                                          ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                  json.loads))
+    if serializers.msgpack is not None:
+        items.append(('msgpack', lambda rows: serializers.dumps_msgpack(serializers.books_payload(rows)),
+                      serializers.msgpack.unpackb))
+    return items
+
+
+def run(sizes, repeat):
+    header = f"{'libros':>8}  {'formato':<18} {'generar ms':>11} {'leer ms':>9} {'bytes':>11} {'gzip':>10}"
+    print(header)
+    print('-' * len(header))
+    with app.app_context():
+        for n in sizes:
+            rows = make_rows(n)
+            for name, dump, load in candidates():
+                dump_ms, body = timed(lambda: dump(rows), repeat)
+                load_ms, _ = timed(lambda: load(body), repeat)
+                print(f"{n:>8}  {name:<18} {dump_ms:>11.2f} {load_ms:>9.2f} "
+                      f"{len(body):>11,} {len(gzip.compress(body, 6)):>10,}")
+            print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, nargs='+', default=[10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.books, args.repeat)
@@ -0,0 +1,96 @@
+"""
+Benchmark del XML de las queries: ElementTree frente a xml_writer.
+
+Antes de medir comprueba que ambos generan exactamente los mismos bytes,
+tanto para un catálogo sintético como para filas con casos límite
+(caracteres especiales, None, cadenas vacías, claves ausentes).
+
+    python bench_xml_writer.py                  # 1.000, 10.000 y 100.000 libros
+    python bench_xml_writer.py --books 5000 --repeat 10
+
+Usa las funciones reales del servicio, así que necesita sus dependencias
+(no necesita una base de datos).
+"""
+
+import argparse
+import decimal
+import xml.etree.ElementTree as ET
+
+from bench_serializers import make_rows, timed
+from microserviciosCQRS import XML_PROLOG, app, create_xml_response, generate_xml_catalog
+
+EDGE_ROWS = [
+    {'isbn': '978"<&>\r\n\t', 'title': 'Tom & Jerry <ed. "especial">', 'authors': 'Ana > Luis',
+     'year': 2001, 'genre': '', 'price': decimal.Decimal('0.00'), 'stock': 0, 'format': None},
+    {'isbn': 9780000000001, 'title': None, 'authors': '', 'year': None, 'genre': 'Ensayo\tcorto',
+     'price': None, 'stock': None, 'format': 'eBook\n'},
+    {'isbn': '9780000000002', 'title': 'Ñandú — “comillas” \ud800 ✓', 'authors': 'Fiódor, Ü',
+     'year': '1999', 'genre': ']]>', 'price': 1.5, 'stock': -3, 'format': "l'apostrophe"},
+    {},
+]
+
+
+# --- Implementación anterior (referencia) ---
+
+def create_book_element(book_dict):
+    book = ET.Element('book', isbn=str(book_dict.get('isbn', '')))
+    ET.SubElement(book, 'title').text = book_dict.get('title', '')
+    ET.SubElement(book, 'author').text = book_dict.get('authors', '')
+    ET.SubElement(book, 'year').text = str(book_dict.get('year', ''))
+    ET.SubElement(book, 'genre').text = book_dict.get('genre', '')
+    ET.SubElement(book, 'price').text = str(book_dict.get('price', ''))
+    ET.SubElement(book, 'stock').text = str(book_dict.get('stock', ''))
+    ET.SubElement(book, 'format').text = book_dict.get('format', '')
+    return book
+
+
+def elementtree_xml(books_data, next_cursor=None):
+    catalog = ET.Element('catalog')
+    for book_dict in books_data:
+        catalog.append(create_book_element(book_dict))
+    if next_cursor:
+        ET.SubElement(catalog, 'next').text = next_cursor
+    return (XML_PROLOG + ET.tostring(catalog, encoding='UTF-8').decode('utf-8')).encode('utf-8')
+
+
+def elementtree_stream(rows):
+    return XML_PROLOG + '<catalog>' + ''.join(
+        ET.tostring(create_book_element(row), encoding='unicode') for row in rows) + '</catalog>'
+
+
+def writer_xml(books_data, next_cursor=None):
+    return create_xml_response(books_data, next_cursor).get_data()
+
+
+def writer_stream(rows):
+    return ''.join(generate_xml_catalog([rows]))
+
+
+def check_identical():
+    """Lanza AssertionError si alguna salida difiere de la de ElementTree."""
+    rows = make_rows(1000)
+    for books, cursor in ((rows, None), (rows, 'eyJ0Ijoi'), (EDGE_ROWS, None), ([], None), ([], 'abc')):
+        assert writer_xml(books, cursor) == elementtree_xml(books, cursor), (books[:1], cursor)
+    assert writer_stream(rows + EDGE_ROWS) == elementtree_stream(rows + EDGE_ROWS)
+
+
+def run(sizes, repeat):
+    header = f"{'libros':>8}  {'ElementTree ms':>15} {'xml_writer ms':>14} {'speedup':>8}"
+    print(header)
+    print('-' * len(header))
+    with app.app_context():
+        check_identical()
+        for n in sizes:
+            rows = make_rows(n)
+            old_ms, old_body = timed(lambda: elementtree_xml(rows), repeat)
+            new_ms, new_body = timed(lambda: writer_xml(rows), repeat)
+            assert old_body == new_body
+            print(f"{n:>8}  {old_ms:>15.2f} {new_ms:>14.2f} {old_ms / new_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.books, args.repeat)
@@ -0,0 +1,796 @@
+"""
+Variante ASGI de microserviciosCQRS.py: mismas rutas, mismo token JWT y
+mismo contrato XML/JSON/MessagePack.
+
+En la versión Flask cada query ocupa un hilo de worker mientras espera a
+MySQL; con la BD lenta los workers se agotan aunque la CPU esté ociosa.
+Aquí las queries van por un pool asíncrono (aiomysql): una consulta lenta
+solo ocupa una conexión del pool mientras espera, y un proceso atiende
+tantas a la vez como conexiones tenga (ASYNC_POOL_MAX).
+
+Todo lo que no es E/S se comparte con microserviciosCQRS.py: la SQL, el
+cursor de paginación, los serializadores, la hoja XSLT y la caché
+compartida (con Redis su versión del catálogo da los mismos ETag en las
+dos variantes). Los comandos ejecutan los handle_*_command de la versión
+Flask en el pool de hilos: son pocos comparados con las lecturas y así la
+lógica de escritura (cachés de dimensiones, invalidación) está en un solo
+sitio.
+
+Diferencias: las lecturas van siempre a DB_CONFIG_QUERY (sin enrutado a
+réplicas) y los cuerpos no se guardan en RENDERED_CACHE.
+
+    uvicorn microserviciosASGI:app --host 0.0.0.0 --port 5001 --workers 4
+
+Requiere starlette, uvicorn y aiomysql, además de las dependencias de
+microserviciosCQRS.py.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from functools import wraps
+
+import aiomysql
+import jwt as pyjwt
+from flask import render_template
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+from compression import compress, is_compressible, negotiate_encoding, should_compress
+from microserviciosCQRS import (
+    ALL_BOOKS_QUERY, BOOK_BY_ISBN_QUERY, BOOK_FIELDS, BOOKS_BY_AUTHOR_QUERY, BOOKS_BY_FORMAT_QUERY,
+    BOOKS_PAGE_QUERY, BULK_MAX_ITEMS, CATALOG_IN_MEMORY, CATALOG_QUERY, CATALOG_STORE, CHANGE_FEED,
+    DB_CONFIG_QUERY, DEFAULT_PAGE_SIZE, FEED_HEARTBEAT, FEED_POLL_TIMEOUT, FEED_RETRY_MS, FEED_STREAM_SECONDS,
+    ISBN_BATCH_MAX, MAX_PAGE_SIZE, QUERY_BACKEND, QUERY_CACHE_CONTROL, RESPONSE_CACHE,
+    SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, SECRET_KEY, SLOW_QUERIES, STOCK_BATCH_MAX,
+    STREAM_BATCH_SIZE, XML_PROLOG, XSLT_RENDERER, CommandError, app as flask_app, by_requested_isbn,
+    decode_page_cursor, handle_adjust_stock_batch_command, handle_adjust_stock_command,
+    handle_bulk_insert_books_command, handle_delete_books_command, handle_insert_book_command,
+    handle_update_book_command, html_representation, parse_feed_timeout, parse_stock_items, shutdown,
+    search_books_sql, split_page, sse_message, startup, suggest_authors_sql, valid_stock_delta,
+)
+from response_cache import MemoryBackend
+from serializers import XML_MIMETYPE, negotiate, serialize_books
+from xml_writer import books_xml, catalog_xml, lookup_xml
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Flask declara el charset en los tipos XML; se mantiene la misma cabecera
+XML_CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+# --- Pool asíncrono de conexiones (solo lecturas) ---
+ASYNC_POOL_MIN = int(os.environ.get('ASYNC_POOL_MIN', 2))
+ASYNC_POOL_MAX = int(os.environ.get('ASYNC_POOL_MAX', 50))
+QUERY_POOL = None  # aiomysql.Pool, creado en el arranque del proceso (lifespan)
+
+def aiomysql_config(db_config):
+    """Parámetros de MySQLdb (passwd, db) -> los de aiomysql."""
+    return {
+        'host': db_config['host'],
+        'user': db_config['user'],
+        'password': db_config['passwd'],
+        'db': db_config['db'],
+        'charset': db_config['charset'],
+        # Sin autocommit una conexión reutilizada seguiría leyendo la
+        # instantánea de su primera transacción (REPEATABLE READ)
+        'autocommit': True,
+        'minsize': ASYNC_POOL_MIN,
+        'maxsize': ASYNC_POOL_MAX,
+        'pool_recycle': 1800,
+    }
+
+async def fetch_rows(query, params=()):
+    """Filas (dicts) de `query`, o None si falla la BD, como las queries síncronas."""
+    try:
+        async with QUERY_POOL.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                started = time.perf_counter()
+                await cur.execute(query, params)
+                rows = list(await cur.fetchall())
+                SLOW_QUERIES.record(query, params, time.perf_counter() - started)
+                return rows
+    except (aiomysql.Error, OSError) as e:
+        print(f"Error DB (Query): {e}")
+        return None
+
+async def cache_call(fn, *args):
+    """Llamada a RESPONSE_CACHE: directa con MemoryBackend, en el pool de hilos con Redis."""
+    if isinstance(RESPONSE_CACHE.backend, MemoryBackend):
+        return fn(*args)
+    return await run_in_threadpool(fn, *args)
+
+async def catalog_store():
+    """
+    Como catalog_store() de microserviciosCQRS, pero la versión del catálogo
+    se lee con cache_call: con Redis es un GET que no debe bloquear el bucle.
+    """
+    if QUERY_BACKEND != 'memory' or not CATALOG_STORE.ready: return None
+    if CATALOG_STORE.version != await cache_call(RESPONSE_CACHE.version_tag):
+        CATALOG_STORE.notify()
+        return None
+    return CATALOG_STORE
+
+# ==============================================================================
+# --- DECORADOR DE VALIDACIÓN DE TOKEN ---
+# ==============================================================================
+
+def token_required(f):
+    @wraps(f)
+    async def decorated(request):
+        token = None
+        # Buscar el token en el header 'Authorization'
+        token_header = request.headers.get('Authorization')
+        if token_header and token_header.startswith('Bearer '):
+            token = token_header.split(" ")[1]
+
+        if not token:
+            return create_message_xml("Token es requerido", 401)
+
+        try:
+            pyjwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        except pyjwt.ExpiredSignatureError:
+            return create_message_xml("Token ha expirado", 401)
+        except pyjwt.InvalidTokenError:
+            return create_message_xml("Token inválido", 401)
+
+        return await f(request)
+    return decorated
+
+# --- Cabeceras de la petición ---
+
+def accept_mimetypes(request):
+    return parse_accept_header(request.headers.get('Accept'), MIMEAccept)
+
+def accept_encodings(request):
+    return parse_accept_header(request.headers.get('Accept-Encoding'))
+
+def add_vary(response, *fields):
+    current = [v.strip() for v in response.headers.get('Vary', '').split(',') if v.strip()]
+    for field in fields:
+        if field not in current:
+            current.append(field)
+    response.headers['Vary'] = ', '.join(current)
+
+# --- Helpers XML ---
+
+def create_message_xml(message, status_code=200):
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = message
+    ET.SubElement(root, 'status').text = str(status_code)
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True),
+                    status_code=status_code, media_type=XML_CONTENT_TYPE)
+
+def create_bulk_results_xml(results):
+    """Respuesta de la inserción masiva con un <result> por libro."""
+    inserted = sum(1 for r in results if r['status'] == 201)
+    status_code = 201 if inserted == len(results) else (207 if inserted else 400)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = f"{inserted} de {len(results)} libros insertados"
+    ET.SubElement(root, 'status').text = str(status_code)
+    items = ET.SubElement(root, 'results')
+    for r in results:
+        ET.SubElement(items, 'result', isbn=str(r['isbn'] or ''), status=str(r['status'])).text = r['message']
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True),
+                    status_code=status_code, media_type=XML_CONTENT_TYPE)
+
+def create_stock_xml(isbn, stock, status_code=200):
+    """Respuesta de un ajuste de stock con el stock resultante."""
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = "Stock actualizado"
+    ET.SubElement(root, 'status').text = str(status_code)
+    ET.SubElement(root, 'isbn').text = isbn
+    ET.SubElement(root, 'stock').text = str(stock)
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True),
+                    status_code=status_code, media_type=XML_CONTENT_TYPE)
+
+def create_stock_results_xml(results):
+    """Respuesta del ajuste de stock por lotes con un <result> por libro."""
+    failed = {r['status'] for r in results} - {200}
+    status_code = 200 if not failed else (409 if 409 in failed or 404 not in failed else 404)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = ("Stock actualizado" if not failed
+                                           else "Ningún ajuste aplicado: el lote es atómico")
+    ET.SubElement(root, 'status').text = str(status_code)
+    items = ET.SubElement(root, 'results')
+    for r in results:
+        attrs = {'isbn': r['isbn'], 'status': str(r['status'])}
+        if r['stock'] is not None:
+            attrs['stock'] = str(r['stock'])
+        ET.SubElement(items, 'result', attrs).text = r['message']
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True),
+                    status_code=status_code, media_type=XML_CONTENT_TYPE)
+
+def create_authors_xml(names):
+    root = ET.Element('authors')
+    for name in names:
+        ET.SubElement(root, 'author').text = name
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True), media_type=XML_CONTENT_TYPE)
+
+def response_mimetype(request):
+    # ?render=html siempre XML, que es la entrada del XSLT
+    if request.query_params.get('render') == 'html':
+        return XML_MIMETYPE
+    return negotiate(accept_mimetypes(request))
+
+def create_books_response(request, books_data, next_cursor=None):
+    """Respuesta de una query en el formato que pide Accept (XML por defecto)."""
+    mimetype = response_mimetype(request)
+    if mimetype == XML_MIMETYPE:
+        body = XML_PROLOG + catalog_xml(books_data, next_cursor)
+        response = Response(body.encode('utf-8', 'xmlcharrefreplace'), media_type=XML_CONTENT_TYPE)
+    else:
+        response = Response(serialize_books(mimetype, books_data, next_cursor), media_type=mimetype)
+    add_vary(response, 'Accept')
+    return response
+
+def create_lookup_response(request, isbns, books):
+    """Consulta por lote: un libro por ISBN pedido y <not_found isbn="..." /> para los que no existen."""
+    mimetype = response_mimetype(request)
+    if mimetype == XML_MIMETYPE:
+        body = XML_PROLOG + lookup_xml(isbns, books)
+        response = Response(body.encode('utf-8', 'xmlcharrefreplace'), media_type=XML_CONTENT_TYPE)
+    else:
+        rows = [books.get(isbn) or {'isbn': isbn, 'not_found': True} for isbn in isbns]
+        response = Response(serialize_books(mimetype, rows), media_type=mimetype)
+    add_vary(response, 'Accept')
+    return response
+
+async def generate_xml_catalog(batches):
+    """Genera el catálogo por chunks: prólogo, los <book> de cada lote y el cierre."""
+    yield XML_PROLOG + '<catalog>'
+    async for rows in batches:
+        yield books_xml(rows)
+    yield '</catalog>'
+
+# --- Argumentos de la petición (mismos mensajes de error que la versión Flask) ---
+
+def parse_page_args(request):
+    """(limit, after) de ?limit y ?after; (None, None) si no se pidió paginar."""
+    limit_raw = request.query_params.get('limit')
+    after_raw = request.query_params.get('after')
+    if limit_raw is None and after_raw is None:
+        return None, None
+    try:
+        limit = int(limit_raw) if limit_raw is not None else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError("limit inválido")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+    after = decode_page_cursor(after_raw) if after_raw else None
+    return limit, after
+
+def parse_limit_arg(request, default, maximum):
+    """Lee ?limit (entre 1 y maximum); lanza ValueError si no es válido."""
+    raw = request.query_params.get('limit')
+    if raw is None: return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError("limit inválido")
+    if not 1 <= limit <= maximum:
+        raise ValueError(f"limit debe estar entre 1 y {maximum}")
+    return limit
+
+async def read_json(request):
+    """Cuerpo JSON de la petición, o None si no lo es."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+async def parse_isbns_arg(request):
+    """ISBNs pedidos, en orden: ?ids=a,b,c en GET; lista JSON o {"isbns": [...]} en POST."""
+    if request.method == 'POST':
+        data = await read_json(request)
+        raw = data.get('isbns') if isinstance(data, dict) else data
+        if not isinstance(raw, list) or not all(isinstance(i, (str, int)) for i in raw):
+            raise ValueError("Se esperaba una lista de ISBNs")
+    else:
+        raw = request.query_params.get('ids', '').split(',')
+    isbns = [str(i).strip() for i in raw if str(i).strip()]
+    if not isbns:
+        raise ValueError("No se indicó ningún ISBN")
+    return isbns
+
+# --- Renderizado HTML y compresión ---
+
+async def render_requested(request, response):
+    """Con ?render=html aplica libros.xsl (en el pool de hilos: es CPU)."""
+    if request.query_params.get('render') != 'html' or response.status_code != 200:
+        return response
+    if not XSLT_RENDERER.available:
+        return create_message_xml("Renderizado HTML no disponible (falta lxml)", 501)
+    try:
+        html, timings = await run_in_threadpool(XSLT_RENDERER.render, response.body)
+    except Exception as e:
+        print(f"Error XSLT: {e}")
+        return create_message_xml("Error al renderizar HTML", 500)
+    return HTMLResponse(html, headers={
+        'Server-Timing': ', '.join(f'{phase};dur={ms:.3f}' for phase, ms in timings.items())})
+
+def compress_body(request, response):
+    """Comprime una respuesta 200 completa según Accept-Encoding (no las de streaming)."""
+    mimetype = (response.media_type or '').split(';')[0]
+    if (response.status_code != 200 or isinstance(response, StreamingResponse)
+            or 'Content-Encoding' in response.headers or not is_compressible(mimetype)):
+        return response
+    add_vary(response, 'Accept-Encoding')
+    encoding = negotiate_encoding(accept_encodings(request))
+    if not encoding or not should_compress(mimetype, len(response.body)):
+        return response
+    headers = {k: v for k, v in response.headers.items() if k != 'content-length'}
+    headers['Content-Encoding'] = encoding
+    return Response(compress(response.body, encoding), headers=headers, media_type=response.media_type)
+
+def compressible(f):
+    @wraps(f)
+    async def decorated(request):
+        return compress_body(request, await f(request))
+    return decorated
+
+# --- GET condicional (ETag = versión del catálogo) ---
+
+async def response_representation(request):
+    if request.query_params.get('render') == 'html':
+        # current_signature() puede hacer stat y recompilar la hoja: fuera del event loop
+        return html_representation(await run_in_threadpool(XSLT_RENDERER.current_signature))
+    if request.query_params.get('stream') == '1': return 'xml'
+    return negotiate(accept_mimetypes(request)).rsplit('/', 1)[1]
+
+def conditional_get(f):
+    """
+    ETag y Cache-Control a partir de la versión del catálogo, con los mismos
+    ETag que la versión Flask: If-None-Match con el ETag actual -> 304 sin
+    tocar MySQL. La versión se lee antes de la query.
+    """
+    @wraps(f)
+    async def decorated(request):
+        version = await cache_call(RESPONSE_CACHE.catalog_version)
+        if version is None:
+            response = compress_body(request, await render_requested(request, await f(request)))
+            response.headers['Cache-Control'] = QUERY_CACHE_CONTROL
+            return response
+
+        etag = f"{version}-{await response_representation(request)}"
+        encoding = negotiate_encoding(accept_encodings(request))
+        candidates = (etag, f"{etag}-{encoding}") if encoding else (etag,)
+        if_none_match = parse_etags(request.headers.get('If-None-Match'))
+        matched = next((tag for tag in candidates if if_none_match.contains(tag)), None)
+        if matched:
+            response = Response(status_code=304, headers={'ETag': quote_etag(matched)})
+        else:
+            response = await render_requested(request, await f(request))
+            if response.status_code != 200:
+                return response
+            response = compress_body(request, response)
+            content_encoding = response.headers.get('Content-Encoding')
+            response.headers['ETag'] = quote_etag(f"{etag}-{content_encoding}" if content_encoding else etag)
+        add_vary(response, 'Accept', 'Accept-Encoding')
+        response.headers['Cache-Control'] = QUERY_CACHE_CONTROL
+        return response
+    return decorated
+
+# ==============================================================================
+# --- SECCIÓN DE QUERIES (Lecturas) ---
+# ==============================================================================
+
+async def handle_get_all_books_query():
+    """Lógica de negocio para obtener todos los libros."""
+    store = await catalog_store()
+    if store: return store.all()
+    return await fetch_rows(ALL_BOOKS_QUERY)
+
+async def handle_get_all_books_stream_query():
+    """
+    Todos los libros como generador asíncrono de lotes leídos con un cursor
+    de servidor (None si falla la BD). La consulta se lanza ya; la conexión
+    vuelve al pool cuando el generador termina o se cierra.
+    """
+    try:
+        conn = await QUERY_POOL.acquire()
+    except (aiomysql.Error, OSError) as e:
+        print(f"Error DB (Query): {e}")
+        return None
+    cur = await conn.cursor(aiomysql.SSDictCursor)
+    try:
+        started = time.perf_counter()
+        await cur.execute(ALL_BOOKS_QUERY)
+        SLOW_QUERIES.record(ALL_BOOKS_QUERY, None, time.perf_counter() - started)
+    except aiomysql.Error as e:
+        print(f"Error DB (Query): {e}")
+        await cur.close()
+        await QUERY_POOL.release(conn)
+        return None
+    async def batches():
+        try:
+            while True:
+                rows = await cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows: break
+                yield rows
+        finally:
+            await cur.close()
+            await QUERY_POOL.release(conn)
+    return batches()
+
+async def handle_get_book_by_isbn_query(isbn):
+    """Lógica de negocio para obtener un libro por ISBN."""
+    store = await catalog_store()
+    if store: return store.get(isbn)
+    return await fetch_rows(BOOK_BY_ISBN_QUERY, (isbn,))
+
+async def handle_get_books_by_isbns_query(isbns):
+    """{isbn pedido: fila} de los ISBNs que existen, con una sola consulta IN (...); None si falla la BD."""
+    store = await catalog_store()
+    if store: return by_requested_isbn(isbns, store.get_many(isbns).values())
+    where = f"WHERE b.isbn IN ({','.join(['%s'] * len(isbns))})"
+    rows = await fetch_rows(CATALOG_QUERY.format(where=where), isbns)
+    if rows is None: return None
+    return by_requested_isbn(isbns, rows)
+
+async def handle_get_books_by_author_query(author):
+    """Lógica de negocio para obtener libros por autor."""
+    store = await catalog_store()
+    if store: return store.by_author(author)
+    return await fetch_rows(BOOKS_BY_AUTHOR_QUERY, (author,))
+
+async def handle_get_books_by_format_query(format_name):
+    """Lógica de negocio para obtener libros por formato."""
+    store = await catalog_store()
+    if store: return store.by_format(format_name)
+    return await fetch_rows(BOOKS_BY_FORMAT_QUERY, (format_name,))
+
+async def handle_search_books_query(text, limit):
+    """Búsqueda sin el índice en memoria (LIKE, el mismo SQL que la variante WSGI)."""
+    sql = search_books_sql(text, limit)
+    if sql is None: return []
+    return await fetch_rows(*sql)
+
+async def handle_suggest_authors_query(prefix, limit):
+    """Autocompletado sin el índice en memoria (LIKE, el mismo SQL que la variante WSGI)."""
+    sql = suggest_authors_sql(prefix, limit)
+    if sql is None: return []
+    rows = await fetch_rows(*sql)
+    return None if rows is None else [row['name'] for row in rows]
+
+async def handle_get_books_page_query(limit, after=None):
+    """Hasta limit+1 filas ordenadas por (title, isbn) posteriores al cursor `after`."""
+    store = await catalog_store()
+    if store: return store.page(limit, after)
+    where = "WHERE (title, isbn) > (%s, %s)" if after else ""
+    return await fetch_rows(BOOKS_PAGE_QUERY.format(where=where), (after or ()) + (limit + 1,))
+
+# --- Endpoints de la API (Queries) ---
+
+@token_required
+@conditional_get
+async def get_books(request):
+    try:
+        limit, after = parse_page_args(request)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if limit:
+        rows = await handle_get_books_page_query(limit, after)
+        if rows is None: return create_message_xml("Error DB (Query)", 500)
+        return create_books_response(request, *split_page(rows, limit))
+    # ?stream=1: cursor de servidor + respuesta por chunks (memoria constante)
+    if request.query_params.get('stream') == '1':
+        batches = await handle_get_all_books_stream_query()
+        if batches is None: return create_message_xml("Error DB (Query)", 500)
+        return StreamingResponse(generate_xml_catalog(batches), media_type=XML_CONTENT_TYPE)
+    rows = await handle_get_all_books_query()
+    if rows is None: return create_message_xml("Error DB (Query)", 500)
+    return create_books_response(request, rows)
+
+@token_required
+@conditional_get
+async def get_book(request):
+    rows = await handle_get_book_by_isbn_query(request.path_params['isbn'])
+    if rows is None: return create_message_xml("Error DB (Query)", 500)
+    if not rows: return create_message_xml("No encontrado", 404)
+    return create_books_response(request, rows)
+
+async def books_by_isbns_response(request):
+    try:
+        isbns = await parse_isbns_arg(request)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if len(isbns) > ISBN_BATCH_MAX:
+        return create_message_xml(f"Máximo {ISBN_BATCH_MAX} ISBNs por petición", 413)
+    found = await handle_get_books_by_isbns_query(list(dict.fromkeys(isbns)))
+    if found is None: return create_message_xml("Error DB (Query)", 500)
+    return create_lookup_response(request, isbns, found)
+
+@token_required
+@conditional_get
+async def get_books_by_isbns(request):
+    return await books_by_isbns_response(request)
+
+# POST para listas largas: sin ETag (la lista va en el cuerpo)
+@token_required
+@compressible
+async def post_books_by_isbns(request):
+    return await books_by_isbns_response(request)
+
+@token_required
+@conditional_get
+async def get_books_by_author(request):
+    rows = await handle_get_books_by_author_query(request.path_params['author'])
+    if rows is None: return create_message_xml("Error DB (Query)", 500)
+    if not rows: return create_message_xml("No se encontraron libros", 404)
+    return create_books_response(request, rows)
+
+@token_required
+@conditional_get
+async def get_books_by_format(request):
+    rows = await handle_get_books_by_format_query(request.path_params['format'])
+    if rows is None: return create_message_xml("Error DB (Query)", 500)
+    if not rows: return create_message_xml("No se encontraron libros", 404)
+    return create_books_response(request, rows)
+
+# --- Búsqueda (índice en memoria; con LIKE en MySQL si no está cargado) ---
+
+@token_required
+@compressible
+async def search_books(request):
+    query = request.query_params.get('q', '').strip()
+    if not query: return create_message_xml("El parámetro q es obligatorio", 400)
+    try:
+        limit = parse_limit_arg(request, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if CATALOG_STORE.ready:
+        rows = CATALOG_STORE.search(query, limit)
+    else:
+        rows = await handle_search_books_query(query, limit)
+        if rows is None: return create_message_xml("Error DB (Query)", 500)
+    if not rows: return create_message_xml("No se encontraron libros", 404)
+    return create_books_response(request, rows)
+
+@token_required
+@compressible
+async def suggest_authors(request):
+    prefix = request.query_params.get('prefix', '').strip()
+    if not prefix: return create_message_xml("El parámetro prefix es obligatorio", 400)
+    try:
+        limit = parse_limit_arg(request, 10, SEARCH_MAX_LIMIT)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if CATALOG_STORE.ready:
+        names = CATALOG_STORE.suggest_authors(prefix, limit)
+    else:
+        names = await handle_suggest_authors_query(prefix, limit)
+        if names is None: return create_message_xml("Error DB (Query)", 500)
+    return create_authors_xml(names)
+
+# ==============================================================================
+# --- SECCIÓN DE COMMANDS (Escrituras, en el pool de hilos) ---
+# ==============================================================================
+
+@token_required
+async def insert_book(request):
+    data = await read_json(request)
+    if not data: return create_message_xml("Sin JSON", 400)
+    if not all(k in data for k in BOOK_FIELDS):
+        return create_message_xml("Faltan campos", 400)
+
+    try:
+        await run_in_threadpool(handle_insert_book_command, data)
+        return create_message_xml("Libro insertado", 201)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+
+@token_required
+async def bulk_insert_books(request):
+    data = await read_json(request)
+    # Acepta una lista de libros o {"books": [...]}
+    books = data.get('books') if isinstance(data, dict) else data
+    if not isinstance(books, list) or not books:
+        return create_message_xml("Se esperaba una lista de libros", 400)
+    if len(books) > BULK_MAX_ITEMS:
+        return create_message_xml(f"Máximo {BULK_MAX_ITEMS} libros por petición", 413)
+
+    try:
+        results = await run_in_threadpool(handle_bulk_insert_books_command, books)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+    return create_bulk_results_xml(results)
+
+@token_required
+async def update_book(request):
+    data = await read_json(request)
+    if not data: return create_message_xml("Sin JSON", 400)
+
+    try:
+        await run_in_threadpool(handle_update_book_command, request.path_params['isbn'], data)
+        return create_message_xml("Libro actualizado", 200)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+
+@token_required
+async def adjust_stock(request):
+    data = await read_json(request)
+    if not isinstance(data, dict) or not valid_stock_delta(data.get('delta')):
+        return create_message_xml("Se esperaba un delta entero distinto de 0", 400)
+
+    isbn = request.path_params['isbn']
+    try:
+        stock = await run_in_threadpool(handle_adjust_stock_command, isbn, data['delta'])
+        return create_stock_xml(isbn, stock)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+
+@token_required
+async def adjust_stock_batch(request):
+    data = await read_json(request)
+    # Acepta una lista de {isbn, delta} o {"items": [...]}
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return create_message_xml("Se esperaba una lista de {isbn, delta}", 400)
+    if len(items) > STOCK_BATCH_MAX:
+        return create_message_xml(f"Máximo {STOCK_BATCH_MAX} libros por petición", 413)
+    items, error = parse_stock_items(items)
+    if error: return create_message_xml(error, 400)
+
+    try:
+        results = await run_in_threadpool(handle_adjust_stock_batch_command, items)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+    return create_stock_results_xml(results)
+
+@token_required
+async def delete_books(request):
+    data = await read_json(request)
+    if not data or 'isbns' not in data or not data['isbns']:
+        return create_message_xml("Formato incorrecto o lista de ISBNs vacía", 400)
+
+    try:
+        await run_in_threadpool(handle_delete_books_command, data['isbns'])
+        return create_message_xml("Libros borrados", 200)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+
+# --- Feed de cambios ---
+# Mismo CHANGE_FEED que la versión Flask; aquí la espera sondea su buffer en
+# memoria en vez de bloquear un hilo por cliente.
+FEED_POLL_INTERVAL = 0.25
+
+async def wait_changes(last_id, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        version, changes = CHANGE_FEED.since(last_id)
+        if changes is None or changes or time.monotonic() >= deadline:
+            return version, changes
+        await asyncio.sleep(FEED_POLL_INTERVAL)
+
+async def stream_changes(last_id):
+    yield f"retry: {FEED_RETRY_MS}\n\n"
+    if last_id is None:
+        last_id = CHANGE_FEED.version
+        yield sse_message(last_id, [], event='ready')
+    deadline = time.monotonic() + FEED_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        version, changes = await wait_changes(last_id, FEED_HEARTBEAT)
+        if changes is None or changes:
+            yield sse_message(version, changes)
+            last_id = version
+        else:
+            yield ": ping\n\n"
+
+@token_required
+async def get_book_changes(request):
+    # Desactivado por configuración: 404, que el cliente no reintenta (503 = reintentar)
+    if not CATALOG_IN_MEMORY: return create_message_xml("Feed de cambios desactivado (SEARCH_INDEX=1)", 404)
+    if not CHANGE_FEED.ready: return create_message_xml("Feed de cambios no disponible", 503)
+    last_id = request.headers.get('Last-Event-ID') or request.query_params.get('since')
+    headers = {'Cache-Control': 'no-store'}
+    if accept_mimetypes(request).best == 'text/event-stream':
+        headers['X-Accel-Buffering'] = 'no'
+        return StreamingResponse(stream_changes(last_id), media_type='text/event-stream', headers=headers)
+
+    try:
+        timeout = parse_feed_timeout(request.query_params.get('timeout', FEED_POLL_TIMEOUT))
+    except ValueError:
+        return create_message_xml("timeout inválido", 400)
+    if last_id is None:
+        version, changes = CHANGE_FEED.version, []
+    else:
+        version, changes = await wait_changes(last_id, timeout)
+    body = {'seq': version, 'changes': changes or []}
+    if changes is None:
+        body['reset'] = True
+    return Response(json.dumps(body, separators=(',', ':'), default=str), media_type='application/json',
+                    headers=headers)
+
+@token_required
+async def get_pool_status(request):
+    return JSONResponse({'minsize': QUERY_POOL.minsize, 'maxsize': QUERY_POOL.maxsize,
+                         'size': QUERY_POOL.size, 'free': QUERY_POOL.freesize})
+
+@token_required
+async def get_slow_queries(request):
+    """Las mismas formas que /debug/slow-queries de la versión Flask (SLOW_QUERIES es por proceso)."""
+    try:
+        limit = int(request.query_params.get('limit', 20))
+        shapes = SLOW_QUERIES.top(limit, request.query_params.get('order', 'total_ms'))
+    except ValueError as e:
+        return create_message_xml(f"Parámetros inválidos: {e}", 400)
+    return JSONResponse({'threshold_ms': SLOW_QUERIES.threshold_ms, 'queries': shapes})
+
+# --- Página principal y XSL ---
+INDEX_HTML = None  # index.html renderizado una vez con la plantilla de la versión Flask
+
+async def home(request):
+    return HTMLResponse(INDEX_HTML)
+
+async def get_xsl(request):
+    return FileResponse(os.path.join(BASE_DIR, 'libros.xsl'), media_type='application/xml')
+
+# --- Arranque por proceso ---
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """
+    Arranque del worker: el mismo startup() que la versión Flask
+    (migraciones, cachés de dimensiones, XSLT, catálogo en memoria) y el
+    pool asíncrono; al parar, lo cierra y llama a shutdown().
+    """
+    global QUERY_POOL, INDEX_HTML
+    await run_in_threadpool(startup)
+    with flask_app.test_request_context('/'):
+        INDEX_HTML = render_template('index.html')
+    QUERY_POOL = await aiomysql.create_pool(**aiomysql_config(DB_CONFIG_QUERY))
+    try:
+        yield
+    finally:
+        QUERY_POOL.close()
+        await QUERY_POOL.wait_closed()
+        await run_in_threadpool(shutdown)
+
+routes = [
+    Route('/api/books', get_books, methods=['GET']),
+    Route('/api/books/isbn/{isbn}', get_book, methods=['GET']),
+    Route('/api/books/isbn', get_books_by_isbns, methods=['GET']),
+    Route('/api/books/isbn', post_books_by_isbns, methods=['POST']),
+    Route('/api/books/author/{author}', get_books_by_author, methods=['GET']),
+    Route('/api/books/format/{format}', get_books_by_format, methods=['GET']),
+    Route('/api/books/search', search_books, methods=['GET']),
+    Route('/api/books/changes', get_book_changes, methods=['GET']),
+    Route('/api/authors/suggest', suggest_authors, methods=['GET']),
+    Route('/api/books/insert', insert_book, methods=['POST']),
+    Route('/api/books/bulk', bulk_insert_books, methods=['POST']),
+    Route('/api/books/update/{isbn}', update_book, methods=['PUT']),
+    Route('/api/books/{isbn}/stock', adjust_stock, methods=['POST']),
+    Route('/api/books/stock', adjust_stock_batch, methods=['POST']),
+    Route('/api/books/delete', delete_books, methods=['DELETE']),
+    Route('/api/pool/status', get_pool_status, methods=['GET']),
+    Route('/debug/slow-queries', get_slow_queries, methods=['GET']),
+    Route('/libros.xsl', get_xsl),
+    Route('/', home),
+    Mount('/static', StaticFiles(directory=os.path.join(BASE_DIR, 'static')), name='static'),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[Middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        allow_headers=["Content-Type", "Accept", "Authorization", "X-Session-Token", "If-None-Match"],
+        expose_headers=["X-Session-Token", "ETag"],
+    )],
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -1,18 +1,46 @@
+import base64
+import json
+import math
+import mimetypes
+import os
+import threading
+import time
 import xml.etree.ElementTree as ET
-from flask import Flask, request, Response, render_template, send_from_directory, jsonify
+from flask import Flask, request, Response, render_template, send_from_directory, stream_with_context, jsonify, g, has_request_context
 import MySQLdb
 from flask_cors import CORS
+from werkzeug.security import safe_join
+from catalog_store import CatalogStore
+from change_feed import ChangeFeed, sse_message
+from compression import CompressedFiles, compress_response, is_compressible, negotiate_encoding, should_compress
+from lookup_cache import LookupCache
+from metrics import Metrics
+from migrations import migrate
+from replica_router import ReplicaRouter
+from slow_queries import SlowQueryLog
+from serializers import XML_MIMETYPE, negotiate, serialize_books
+from xml_writer import books_xml, catalog_xml, lookup_xml
+from response_cache import RenderedCache, ResponseCache, create_backend
+from search_index import tokenize
+from xslt_renderer import XsltRenderer
 import jwt as pyjwt  # Importar PyJWT
 from functools import wraps # Importar wraps
 
 # --- Configuración Flask ---
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
+# Métricas por endpoint (/metrics). Se registran antes que los demás
+# after_request para medir la respuesta final, ya comprimida.
+METRICS = Metrics('microserviciosCQRS', slow_request_ms=float(os.environ.get('SLOW_REQUEST_MS', 0)),
+                  directory=os.environ.get('METRICS_DIR') or None)
+METRICS.init_app(app)
+
 CORS(
     app,
     resources={r"/api/*": {"origins": ["*"]}},
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Accept", "Authorization"], # <-- AÑADIR "Authorization"
+    allow_headers=["Content-Type", "Accept", "Authorization", "X-Session-Token", "If-None-Match"], # <-- AÑADIR "Authorization"
+    expose_headers=["X-Session-Token", "ETag"],
 )
 
 # ============================
@@ -73,41 +101,283 @@ DB_CONFIG_COMMAND = {
     'charset': 'utf8mb4'
 }
 
+# Réplicas de solo lectura (misma forma que DB_CONFIG_QUERY). Con la lista
+# vacía todas las lecturas van a DB_CONFIG_QUERY, que también es el destino
+# de respaldo cuando ninguna réplica está sana o al día.
+DB_CONFIG_REPLICAS = []
+REPLICA_MAX_LAG = 5.0  # segundos
+READ_ROUTER = ReplicaRouter(DB_CONFIG_QUERY, DB_CONFIG_REPLICAS, max_lag=REPLICA_MAX_LAG,
+                            strategy='least_connections')
+
+# Sentencias por encima de SLOW_QUERY_MS (lecturas y comandos, también las
+# del proyector y del catálogo): se escriben con sus parámetros y se agrupan
+# por forma con su EXPLAIN, lanzado contra la primaria con una conexión sin
+# instrumentar. Ver /debug/slow-queries.
+SLOW_QUERIES = SlowQueryLog(lambda: MySQLdb.connect(**DB_CONFIG_COMMAND),
+                            threshold_ms=float(os.environ.get('SLOW_QUERY_MS', 200)))
+METRICS.add_statement_listener(SLOW_QUERIES.record)
+
+# --- Caché compartida de resultados de queries ---
+# 'memory://' (por proceso: solo con un worker) o 'redis://host:6379/0'
+# (compartida por todos los workers de gunicorn).
+RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL', 'memory://')
+RESPONSE_CACHE = ResponseCache(create_backend(RESPONSE_CACHE_URL), ttl=300,
+                               settle_time=REPLICA_MAX_LAG if DB_CONFIG_REPLICAS else 0.0)
+
+# Cuerpos XML ya renderizados de la versión actual del catálogo (por proceso)
+RENDERED_CACHE = RenderedCache(max_entries=256)
+# Las respuestas llevan token: solo caché del navegador, siempre revalidada
+QUERY_CACHE_CONTROL = 'private, no-cache'
+
 # --- Conexiones de Base de Datos ---
 def get_db_connection_query():
-    """Obtiene una conexión de BD para operaciones de LECTURA (Queries)."""
+    """
+    Obtiene una conexión de BD para operaciones de LECTURA (Queries).
+
+    El router elige réplica; si la petición trae X-Session-Token (emitido
+    tras un comando) solo usa réplicas que ya tengan esos escritos.
+    """
+    started = time.perf_counter()
     try:
-        return MySQLdb.connect(**DB_CONFIG_QUERY)
+        if has_request_context():
+            conn = READ_ROUTER.get_connection(request.headers.get('X-Session-Token'),
+                                              force_primary=g.get('read_from_primary', False))
+        else:
+            conn = READ_ROUTER.get_connection()
     except MySQLdb.Error as e:
         print(f"Error DB (Query): {e}")
         return None
+    return METRICS.instrument(conn, time.perf_counter() - started)
+
+def track_session(cur):
+    """Tras el commit de un comando, prepara el token read-your-writes de la respuesta."""
+    if READ_ROUTER.replicas and has_request_context():
+        g.session_token = READ_ROUTER.session_token(cur)
+
+@app.after_request
+def add_session_token(response):
+    token = g.get('session_token')
+    if token:
+        response.headers['X-Session-Token'] = token
+    return response
 
 def get_db_connection_command():
     """Obtiene una conexión de BD para operaciones de ESCRITURA (Commands)."""
+    started = time.perf_counter()
     try:
-        return MySQLdb.connect(**DB_CONFIG_COMMAND)
+        conn = MySQLdb.connect(**DB_CONFIG_COMMAND)
     except MySQLdb.Error as e:
         print(f"Error DB (Command): {e}")
         return None
+    return METRICS.instrument(conn, time.perf_counter() - started)
 
 # --- Helpers XML ---
-def create_xml_response(books_data):
-    catalog = ET.Element('catalog')
-    for book_dict in books_data:
-        book = ET.SubElement(catalog, 'book', isbn=str(book_dict.get('isbn', '')))
-        ET.SubElement(book, 'title').text = book_dict.get('title', '')
-        ET.SubElement(book, 'author').text = book_dict.get('authors', '')
-        ET.SubElement(book, 'year').text = str(book_dict.get('year', ''))
-        ET.SubElement(book, 'genre').text = book_dict.get('genre', '')
-        ET.SubElement(book, 'price').text = str(book_dict.get('price', ''))
-        ET.SubElement(book, 'stock').text = str(book_dict.get('stock', ''))
-        ET.SubElement(book, 'format').text = book_dict.get('format', '')
-    return Response(
-        '<?xml version="1.0" encoding="UTF-8"?>\n'
-        '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n' +
-        ET.tostring(catalog, encoding='UTF-8').decode('utf-8'),
-        mimetype='application/xml'
-    )
+XML_PROLOG = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<?xml-stylesheet type="text/xsl" href="/libros.xsl"?>\n')
+
+# Filas leídas del cursor de servidor por cada chunk del modo streaming
+STREAM_BATCH_SIZE = 500
+
+def create_xml_response(books_data, next_cursor=None):
+    # next_cursor: cursor para pedir la página siguiente con ?after=
+    # xmlcharrefreplace como ET.tostring: misma salida byte a byte
+    with METRICS.timed('render'):
+        body = (XML_PROLOG + catalog_xml(books_data, next_cursor)).encode('utf-8', 'xmlcharrefreplace')
+    return Response(body, mimetype='application/xml')
+
+def create_books_response(books_data, next_cursor=None):
+    """
+    Respuesta de una query en el formato que pide Accept: XML por defecto,
+    JSON o MessagePack (filas tal cual, sin un nodo por campo). Con
+    ?render=html siempre XML, que es la entrada del XSLT.
+    """
+    mimetype = XML_MIMETYPE if request.args.get('render') == 'html' else negotiate(request.accept_mimetypes)
+    if mimetype == XML_MIMETYPE:
+        response = create_xml_response(books_data, next_cursor)
+    else:
+        with METRICS.timed('render'):
+            body = serialize_books(mimetype, books_data, next_cursor)
+        response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def isbn_key(isbn):
+    # La colación de MySQL no distingue mayúsculas: '...x' y '...X' son el mismo ISBN
+    return str(isbn).casefold()
+
+def by_requested_isbn(isbns, rows):
+    """{isbn pedido: fila}, emparejando con isbn_key igual que compara MySQL."""
+    by_key = {isbn_key(row['isbn']): row for row in rows}
+    return {isbn: by_key[isbn_key(isbn)] for isbn in isbns if isbn_key(isbn) in by_key}
+
+def create_lookup_response(isbns, books):
+    """
+    Respuesta de la consulta por lote: un libro por ISBN pedido, en el orden
+    de la petición. Los que no existen van como <not_found isbn="..." /> (o
+    {"isbn": ..., "not_found": true} en JSON/MessagePack) en lugar de un 404.
+    """
+    mimetype = XML_MIMETYPE if request.args.get('render') == 'html' else negotiate(request.accept_mimetypes)
+    if mimetype == XML_MIMETYPE:
+        with METRICS.timed('render'):
+            body = (XML_PROLOG + lookup_xml(isbns, books)).encode('utf-8', 'xmlcharrefreplace')
+        response = Response(body, mimetype=XML_MIMETYPE)
+    else:
+        rows = [books.get(isbn) or {'isbn': isbn, 'not_found': True} for isbn in isbns]
+        with METRICS.timed('render'):
+            body = serialize_books(mimetype, rows)
+        response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def generate_xml_catalog(batches):
+    """Genera el catálogo por chunks: prólogo, los <book> de cada lote y el cierre."""
+    yield XML_PROLOG + '<catalog>'
+    for rows in batches:
+        with METRICS.timed('render'):
+            chunk = books_xml(rows)
+        yield chunk
+    yield '</catalog>'
+
+def create_xml_stream_response(batches):
+    """Respuesta streaming: memoria constante y primer byte sin esperar al catálogo entero."""
+    return Response(stream_with_context(generate_xml_catalog(batches)),
+                    mimetype='application/xml')
+
+# --- Paginación keyset (?limit=N&after=<cursor>) ---
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_page_cursor(title, isbn):
+    """Cursor opaco con la clave (title, isbn) del último libro de la página."""
+    raw = json.dumps([title, str(isbn)], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(token):
+    """Devuelve (title, isbn); lanza ValueError si el cursor no es válido."""
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError("Cursor inválido")
+    # Solo [title, isbn]: un dict o una cadena de 2 elementos también se desempaquetarían
+    if (not isinstance(cursor, list) or len(cursor) != 2
+            or not all(isinstance(part, str) for part in cursor)):
+        raise ValueError("Cursor inválido")
+    title, isbn = cursor
+    return title, isbn
+
+def parse_page_args():
+    """
+    Lee ?limit y ?after de la petición.
+
+    Returns:
+        (limit, after): (None, None) si no se pidió paginar; after es
+        (title, isbn) o None para la primera página.
+
+    Raises:
+        ValueError: Si limit o el cursor no son válidos
+    """
+    limit_raw = request.args.get('limit')
+    after_raw = request.args.get('after')
+    if limit_raw is None and after_raw is None:
+        return None, None
+    try:
+        limit = int(limit_raw) if limit_raw is not None else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError("limit inválido")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+    after = decode_page_cursor(after_raw) if after_raw else None
+    return limit, after
+
+def parse_limit_arg(default, maximum):
+    """Lee ?limit (entre 1 y maximum); lanza ValueError si no es válido."""
+    raw = request.args.get('limit')
+    if raw is None: return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError("limit inválido")
+    if not 1 <= limit <= maximum:
+        raise ValueError(f"limit debe estar entre 1 y {maximum}")
+    return limit
+
+# --- Consulta por lote de ISBNs (?ids=a,b,c o POST) ---
+# Máximo de ISBNs por petición: todos caben en un único IN (...)
+ISBN_BATCH_MAX = 1000
+
+def parse_isbns_arg():
+    """
+    ISBNs pedidos, en orden: ?ids=a,b,c en GET; en POST una lista JSON o
+    {"isbns": [...]} (para listas que no caben en la URL).
+
+    Raises:
+        ValueError: Si no hay ISBNs o el cuerpo no tiene el formato esperado
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        raw = data.get('isbns') if isinstance(data, dict) else data
+        if not isinstance(raw, list) or not all(isinstance(i, (str, int)) for i in raw):
+            raise ValueError("Se esperaba una lista de ISBNs")
+    else:
+        raw = request.args.get('ids', '').split(',')
+    isbns = [str(i).strip() for i in raw if str(i).strip()]
+    if not isbns:
+        raise ValueError("No se indicó ningún ISBN")
+    return isbns
+
+def split_page(rows, limit):
+    """Recorta las limit+1 filas leídas y calcula el cursor de la página siguiente."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_page_cursor(rows[-1]['title'], rows[-1]['isbn'])
+
+def create_bulk_results_xml(results):
+    """Respuesta de la inserción masiva con un <result> por libro."""
+    inserted = sum(1 for r in results if r['status'] == 201)
+    status_code = 201 if inserted == len(results) else (207 if inserted else 400)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = f"{inserted} de {len(results)} libros insertados"
+    ET.SubElement(root, 'status').text = str(status_code)
+    items = ET.SubElement(root, 'results')
+    for r in results:
+        ET.SubElement(items, 'result', isbn=str(r['isbn'] or ''), status=str(r['status'])).text = r['message']
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml', status=status_code)
+
+def create_stock_xml(isbn, stock, status_code=200):
+    """Respuesta de un ajuste de stock con el stock resultante."""
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = "Stock actualizado"
+    ET.SubElement(root, 'status').text = str(status_code)
+    ET.SubElement(root, 'isbn').text = isbn
+    ET.SubElement(root, 'stock').text = str(stock)
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml', status=status_code)
+
+def create_stock_results_xml(results):
+    """Respuesta del ajuste de stock por lotes con un <result> por libro."""
+    failed = {r['status'] for r in results} - {200}
+    status_code = 200 if not failed else (409 if 409 in failed or 404 not in failed else 404)
+    root = ET.Element('response')
+    ET.SubElement(root, 'message').text = ("Stock actualizado" if not failed
+                                           else "Ningún ajuste aplicado: el lote es atómico")
+    ET.SubElement(root, 'status').text = str(status_code)
+    items = ET.SubElement(root, 'results')
+    for r in results:
+        attrs = {'isbn': r['isbn'], 'status': str(r['status'])}
+        if r['stock'] is not None:
+            attrs['stock'] = str(r['stock'])
+        ET.SubElement(items, 'result', attrs).text = r['message']
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml', status=status_code)
+
+def create_authors_xml(names):
+    root = ET.Element('authors')
+    for name in names:
+        ET.SubElement(root, 'author').text = name
+    return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
+                    mimetype='application/xml')
 
 def create_message_xml(message, status_code=200):
     root = ET.Element('response')
@@ -116,33 +386,256 @@ def create_message_xml(message, status_code=200):
     return Response(ET.tostring(root, encoding='UTF-8', xml_declaration=True).decode('utf-8'),
                     mimetype='application/xml', status=status_code)
 
+# Página de libros por keyset: la subconsulta recorre el índice (title, isbn)
+# desde el cursor y solo agrupa los `limit` libros de la página, así que una
+# página profunda cuesta lo mismo que la primera. El índice lo crea
+# migrations.py (idx_books_title_isbn).
+BOOKS_PAGE_QUERY = """
+SELECT b.isbn, b.title, b.year, b.price, b.stock,
+       g.name AS genre, f.name AS format,
+       GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+FROM (
+    SELECT isbn FROM books
+    {where}
+    ORDER BY title, isbn
+    LIMIT %s
+) p
+JOIN books b ON b.isbn = p.isbn
+LEFT JOIN genres g ON b.genre_id = g.genre_id
+LEFT JOIN formats f ON b.format_id = f.format_id
+LEFT JOIN book_authors ba ON b.isbn = ba.isbn
+LEFT JOIN authors a ON ba.author_id = a.author_id
+GROUP BY b.isbn
+ORDER BY b.title, b.isbn;
+"""
+
+# --- Renderizado HTML en el servidor (?render=html) ---
+XSLT_RENDERER = XsltRenderer(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'libros.xsl'))
+
+def render_requested(response):
+    """
+    Con ?render=html aplica libros.xsl en el servidor a una respuesta XML
+    correcta; los tiempos de parse/transform/serialize van en Server-Timing.
+    """
+    if request.args.get('render') != 'html' or response.status_code != 200:
+        return response
+    if not XSLT_RENDERER.available:
+        return create_message_xml("Renderizado HTML no disponible (falta lxml)", 501)
+    try:
+        with METRICS.timed('render'):
+            html, timings = XSLT_RENDERER.render(response.get_data())
+    except Exception as e:
+        print(f"Error XSLT: {e}")
+        return create_message_xml("Error al renderizar HTML", 500)
+    rendered = Response(html, mimetype='text/html')
+    rendered.headers['Server-Timing'] = ', '.join(f'{phase};dur={ms:.3f}' for phase, ms in timings.items())
+    return rendered
+
+# --- Compresión gzip/brotli (Accept-Encoding) ---
+COMPRESSED_FILES = CompressedFiles()
+
+def send_compressed_file(directory, filename, mimetype=None):
+    """
+    Como send_from_directory, pero si el cliente acepta gzip/brotli sirve
+    la variante precomprimida del fichero (se comprime una vez por versión
+    del fichero, no en cada petición).
+    """
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = negotiate_encoding(request.accept_encodings)
+    # Rutas relativas a la raíz de la app, como en send_from_directory
+    path = safe_join(os.path.join(app.root_path, directory), filename)
+    if (encoding is None or path is None or not os.path.isfile(path)
+            or not should_compress(mimetype, os.path.getsize(path))):
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+    else:
+        body, st = COMPRESSED_FILES.get(path, encoding)
+        response = Response(body, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}-{encoding}")
+        response.last_modified = st.st_mtime
+        response.make_conditional(request)
+    if is_compressible(mimetype):
+        response.vary.add('Accept-Encoding')
+    return response
+
+# Los estáticos de Flask (/static/...) también pasan por las variantes precomprimidas
+app.view_functions['static'] = lambda filename: send_compressed_file(app.static_folder, filename)
+
+@app.after_request
+def compress_body(response):
+    """Comprime al vuelo las respuestas que no traen ya una variante precomprimida."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding and (response.is_streamed or should_compress(response.mimetype, response.content_length or 0)):
+        compress_response(response, encoding)
+    return response
+
 # --- Endpoint para servir el XSL ---
 @app.route('/libros.xsl')
 def get_xsl():
     # Asume que libros.xsl está en el mismo directorio que este script
-    return send_from_directory('.', 'libros.xsl', mimetype='application/xml')
+    return send_compressed_file('.', 'libros.xsl', mimetype='application/xml')
 
 # ==============================================================================
 # --- SECCIÓN DE QUERIES (Lecturas) ---
 # ==============================================================================
 
-def handle_get_all_books_query():
-    """Lógica de negocio para obtener todos los libros."""
-    conn = get_db_connection_query()
+def stream_query(conn, query, params=()):
+    """
+    Ejecuta `query` con un cursor de servidor (SSDictCursor) y devuelve un
+    generador de lotes de filas. La consulta se lanza ya, para que un error
+    de BD se detecte antes de empezar la respuesta; la conexión se cierra
+    cuando el generador termina o se cierra (cliente desconectado).
+    """
+    cur = conn.cursor(MySQLdb.cursors.SSDictCursor)
+    try:
+        cur.execute(query, params)
+    except MySQLdb.Error:
+        cur.close(); conn.close()
+        raise
+    def batches():
+        try:
+            while True:
+                rows = cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows: break
+                yield rows
+        finally:
+            cur.close(); conn.close()
+    return batches()
+
+# --- Catálogo en memoria (opcional) ---
+# QUERY_BACKEND=memory carga el catálogo en RAM al arrancar y lo mantiene al
+# día con el log de cambios de RESPONSE_CACHE; con 'mysql' (por defecto)
+# todas las queries van a la BD.
+QUERY_BACKEND = os.environ.get('QUERY_BACKEND', 'mysql')
+# La búsqueda (/api/books/search, /api/authors/suggest) usa el índice del
+# catálogo en memoria y, si no está cargado, LIKE contra MySQL (correcto
+# pero recorre el catálogo). SEARCH_INDEX=1 carga el catálogo aunque
+# QUERY_BACKEND sea 'mysql'; es opcional porque cada worker guarda y sondea
+# el catálogo entero. El feed de cambios (/api/books/changes) solo existe
+# con el catálogo en memoria: sin él responde 404 y el cliente deja de pedirlo.
+SEARCH_INDEX = os.environ.get('SEARCH_INDEX', '0') == '1'
+CATALOG_IN_MEMORY = QUERY_BACKEND == 'memory' or SEARCH_INDEX
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+CATALOG_QUERY = """
+SELECT b.isbn, b.title, b.year, b.price, b.stock,
+       g.name AS genre, f.name AS format,
+       GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+FROM books b
+LEFT JOIN genres g ON b.genre_id = g.genre_id
+LEFT JOIN formats f ON b.format_id = f.format_id
+LEFT JOIN book_authors ba ON b.isbn = ba.isbn
+LEFT JOIN authors a ON ba.author_id = a.author_id
+{where}
+GROUP BY b.isbn
+"""
+
+def load_catalog_rows(isbns=None):
+    """Filas del catálogo (todas o las de `isbns`) leídas de la primaria, sin lag de réplica."""
+    conn = get_db_connection_command()
     if not conn: return None
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
-    LEFT JOIN authors a ON ba.author_id = a.author_id
-    GROUP BY b.isbn
-    ORDER BY b.title;
+    try:
+        if isbns is None:
+            cur.execute(CATALOG_QUERY.format(where=""))
+            return list(cur.fetchall())
+        rows = []
+        for i in range(0, len(isbns), BULK_LOOKUP_CHUNK):
+            chunk = isbns[i:i + BULK_LOOKUP_CHUNK]
+            cur.execute(CATALOG_QUERY.format(where=f"WHERE b.isbn IN ({','.join(['%s'] * len(chunk))})"), chunk)
+            rows.extend(cur.fetchall())
+        return rows
+    finally:
+        cur.close(); conn.close()
+
+CATALOG_STORE = CatalogStore(load_catalog_rows, RESPONSE_CACHE.changes_since, poll_interval=1.0)
+
+def catalog_store():
+    """
+    CATALOG_STORE si está cargado y al día con la versión del catálogo; si
+    no, None y la query va a MySQL (así nunca se sirve, ni se cachea con
+    un ETag nuevo, un catálogo en memoria atrasado).
+    """
+    if QUERY_BACKEND != 'memory' or not CATALOG_STORE.ready: return None
+    if CATALOG_STORE.version != RESPONSE_CACHE.version_tag():
+        CATALOG_STORE.notify()
+        return None
+    return CATALOG_STORE
+
+# SQL de las queries (la variante ASGI, microserviciosASGI.py, usa las mismas)
+ALL_BOOKS_QUERY = """
+SELECT b.isbn, b.title, b.year, b.price, b.stock,
+       g.name AS genre, f.name AS format,
+       GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+FROM books b
+LEFT JOIN genres g ON b.genre_id = g.genre_id
+LEFT JOIN formats f ON b.format_id = f.format_id
+LEFT JOIN book_authors ba ON b.isbn = ba.isbn
+LEFT JOIN authors a ON ba.author_id = a.author_id
+GROUP BY b.isbn
+ORDER BY b.title;
+"""
+
+BOOK_BY_ISBN_QUERY = """
+SELECT b.isbn, b.title, b.year, b.price, b.stock,
+       g.name AS genre, f.name AS format,
+       GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+FROM books b
+LEFT JOIN genres g ON b.genre_id = g.genre_id
+LEFT JOIN formats f ON b.format_id = f.format_id
+LEFT JOIN book_authors ba ON b.isbn = ba.isbn
+LEFT JOIN authors a ON ba.author_id = a.author_id
+WHERE b.isbn=%s GROUP BY b.isbn;
+"""
+
+BOOKS_BY_AUTHOR_QUERY = """
+SELECT b.isbn, b.title, b.year, b.price, b.stock,
+       g.name AS genre, f.name AS format,
+       GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+FROM books b
+JOIN book_authors ba ON b.isbn = ba.isbn
+JOIN authors a ON ba.author_id = a.author_id
+LEFT JOIN genres g ON b.genre_id = g.genre_id
+LEFT JOIN formats f ON b.format_id = f.format_id
+WHERE a.name=%s GROUP BY b.isbn;
+"""
+
+BOOKS_BY_FORMAT_QUERY = """
+SELECT b.isbn, b.title, b.year, b.price, b.stock,
+       g.name AS genre, f.name AS format,
+       GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
+FROM books b
+LEFT JOIN genres g ON b.genre_id = g.genre_id
+LEFT JOIN formats f ON b.format_id = f.format_id
+LEFT JOIN book_authors ba ON b.isbn = ba.isbn
+LEFT JOIN authors a ON ba.author_id = a.author_id
+WHERE f.name=%s GROUP BY b.isbn;
+"""
+
+def handle_get_all_books_query(stream=False):
     """
+    Lógica de negocio para obtener todos los libros.
+
+    Con stream=True devuelve un generador de lotes leídos con un cursor de
+    servidor en lugar de la lista completa.
+    """
+    store = catalog_store()
+    if store and not stream: return store.all()
+    conn = get_db_connection_query()
+    if not conn: return None
+    query = ALL_BOOKS_QUERY
+    if stream:
+        try:
+            return stream_query(conn, query)
+        except MySQLdb.Error as e:
+            print(f"Error DB (Query): {e}")
+            return None
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
     cur.execute(query)
     rows = cur.fetchall()
     cur.close(); conn.close()
@@ -150,104 +643,456 @@ def handle_get_all_books_query():
 
 def handle_get_book_by_isbn_query(isbn):
     """Lógica de negocio para obtener un libro por ISBN."""
+    store = catalog_store()
+    if store: return store.get(isbn)
     conn = get_db_connection_query()
     if not conn: return None
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
-    LEFT JOIN authors a ON ba.author_id = a.author_id
-    WHERE b.isbn=%s GROUP BY b.isbn;
-    """
-    cur.execute(query, (isbn,))
+    cur.execute(BOOK_BY_ISBN_QUERY, (isbn,))
     row = cur.fetchone()
     cur.close(); conn.close()
     return [row] if row else []
 
+def handle_get_books_by_isbns_query(isbns):
+    """
+    Lógica de negocio para obtener varios libros por ISBN con una sola
+    consulta IN (...).
+
+    Returns:
+        dict: {isbn pedido: [fila]} de los que existen (las mismas filas que
+        handle_get_book_by_isbn_query), o None si falla la BD
+    """
+    store = catalog_store()
+    if store:
+        rows = store.get_many(isbns).values()
+    else:
+        conn = get_db_connection_query()
+        if not conn: return None
+        cur = conn.cursor(MySQLdb.cursors.DictCursor)
+        where = f"WHERE b.isbn IN ({','.join(['%s'] * len(isbns))})"
+        cur.execute(CATALOG_QUERY.format(where=where), isbns)
+        rows = cur.fetchall()
+        cur.close(); conn.close()
+    return {isbn: [row] for isbn, row in by_requested_isbn(isbns, rows).items()}
+
 def handle_get_books_by_author_query(author):
     """Lógica de negocio para obtener libros por autor."""
+    store = catalog_store()
+    if store: return store.by_author(author)
     conn = get_db_connection_query()
     if not conn: return None
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    JOIN book_authors ba ON b.isbn = ba.isbn
-    JOIN authors a ON ba.author_id = a.author_id
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    WHERE a.name=%s GROUP BY b.isbn;
-    """
-    cur.execute(query, (author,))
+    cur.execute(BOOKS_BY_AUTHOR_QUERY, (author,))
     rows = cur.fetchall()
     cur.close(); conn.close()
     return rows
 
 def handle_get_books_by_format_query(format_name):
     """Lógica de negocio para obtener libros por formato."""
+    store = catalog_store()
+    if store: return store.by_format(format_name)
     conn = get_db_connection_query()
     if not conn: return None
     cur = conn.cursor(MySQLdb.cursors.DictCursor)
-    query = """
-    SELECT b.isbn, b.title, b.year, b.price, b.stock,
-           g.name AS genre, f.name AS format,
-           GROUP_CONCAT(a.name SEPARATOR ', ') AS authors
-    FROM books b
-    LEFT JOIN genres g ON b.genre_id = g.genre_id
-    LEFT JOIN formats f ON b.format_id = f.format_id
-    LEFT JOIN book_authors ba ON b.isbn = ba.isbn
-    LEFT JOIN authors a ON ba.author_id = a.author_id
-    WHERE f.name=%s GROUP BY b.isbn;
-    """
-    cur.execute(query, (format_name,))
+    cur.execute(BOOKS_BY_FORMAT_QUERY, (format_name,))
     rows = cur.fetchall()
     cur.close(); conn.close()
     return rows
 
+def handle_get_books_page_query(limit, after=None):
+    """
+    Lógica de negocio para obtener una página del catálogo por keyset.
+
+    Devuelve hasta limit+1 filas ordenadas por (title, isbn) posteriores al
+    cursor `after`; la fila extra indica que hay página siguiente.
+    """
+    store = catalog_store()
+    if store: return store.page(limit, after)
+    conn = get_db_connection_query()
+    if not conn: return None
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    where = "WHERE (title, isbn) > (%s, %s)" if after else ""
+    cur.execute(BOOKS_PAGE_QUERY.format(where=where), (after or ()) + (limit + 1,))
+    rows = cur.fetchall()
+    cur.close(); conn.close()
+    return list(rows)
+
+# --- Búsqueda con LIKE (respaldo si el catálogo en memoria no está cargado) ---
+
+def like_escape(term):
+    """Término literal para LIKE ... ESCAPE '!' (sin los comodines % y _)."""
+    return term.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+def search_books_sql(text, limit):
+    """
+    (SQL, parámetros) de la búsqueda contra MySQL: libros con todos los
+    términos de `text` en el título o en los autores (la collation ignora
+    mayúsculas y acentos), los que coinciden en el título primero. Recorre
+    el catálogo entero, así que con catálogos grandes conviene el índice
+    (SEARCH_INDEX=1). None si `text` no tiene términos.
+    """
+    terms = [f"%{like_escape(term)}%" for term in tokenize(text)]
+    if not terms: return None
+    having = " AND ".join(["(b.title LIKE %s ESCAPE '!' OR authors LIKE %s ESCAPE '!')"] * len(terms))
+    in_title = " + ".join(["(b.title LIKE %s ESCAPE '!')"] * len(terms))
+    query = (CATALOG_QUERY.format(where="") +
+             f"HAVING {having}\nORDER BY {in_title} DESC, b.title, b.isbn LIMIT %s;")
+    return query, [p for term in terms for p in (term, term)] + terms + [limit]
+
+def suggest_authors_sql(prefix, limit):
+    """
+    (SQL, parámetros) del autocompletado contra MySQL: autores con algún
+    nombre o apellido que empieza por cada término de `prefix`, en orden
+    alfabético. None si `prefix` no tiene términos.
+    """
+    terms = [like_escape(term) for term in tokenize(prefix)]
+    if not terms: return None
+    where = " AND ".join(["(name LIKE %s ESCAPE '!' OR name LIKE %s ESCAPE '!')"] * len(terms))
+    query = f"SELECT name FROM authors WHERE {where} ORDER BY name LIMIT %s;"
+    return query, [p for term in terms for p in (f"{term}%", f"% {term}%")] + [limit]
+
+def handle_search_books_query(text, limit):
+    """Lógica de negocio de la búsqueda sin el índice en memoria."""
+    sql = search_books_sql(text, limit)
+    if sql is None: return []
+    conn = get_db_connection_query()
+    if not conn: return None
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    cur.execute(*sql)
+    rows = cur.fetchall()
+    cur.close(); conn.close()
+    return list(rows)
+
+def handle_suggest_authors_query(prefix, limit):
+    """Lógica de negocio del autocompletado sin el índice en memoria."""
+    sql = suggest_authors_sql(prefix, limit)
+    if sql is None: return []
+    conn = get_db_connection_query()
+    if not conn: return None
+    cur = conn.cursor()
+    cur.execute(*sql)
+    names = [row[0] for row in cur.fetchall()]
+    cur.close(); conn.close()
+    return names
+
+# --- GET condicional (ETag = versión del catálogo) ---
+
+def html_representation(signature):
+    # La firma de libros.xsl: al cambiar la hoja cambian el ETag y la clave de RENDERED_CACHE
+    return f"html.{signature}" if signature else 'html'
+
+def response_representation():
+    """Formato que tendrá la respuesta de la query: parte del ETag y de la clave de RENDERED_CACHE."""
+    if request.args.get('render') == 'html': return html_representation(XSLT_RENDERER.current_signature())
+    if request.args.get('stream') == '1': return 'xml'
+    return negotiate(request.accept_mimetypes).rsplit('/', 1)[1]
+
+def conditional_get(f):
+    """
+    Sirve las queries con ETag y Cache-Control a partir de la versión del
+    catálogo que incrementan los comandos.
+
+    - If-None-Match con el ETag actual (versión + formato de la respuesta)
+      -> 304 sin tocar MySQL ni ElementTree.
+    - Si el cuerpo de esta petición ya se renderizó en esta versión, se
+      devuelven esos bytes (o su variante gzip/brotli según Accept-Encoding,
+      comprimida una sola vez por versión).
+    - Si no, se ejecuta la vista (y el XSLT con ?render=html) y se guarda
+      su cuerpo (salvo streaming): el HTML queda cacheado por versión.
+
+    La versión se lee antes de la query: si un comando confirma entre medias
+    el cuerpo puede ser más nuevo que su ETag, nunca más viejo.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        version = RESPONSE_CACHE.catalog_version()
+        if version is None:
+            response = render_requested(f(*args, **kwargs))
+            response.headers['Cache-Control'] = QUERY_CACHE_CONTROL
+            return response
+
+        # Cada representación (XML, JSON, MessagePack, HTML) tiene su ETag,
+        # y cada variante comprimida el suyo con el sufijo de la codificación
+        etag = f"{version}-{response_representation()}"
+        encoding = negotiate_encoding(request.accept_encodings)
+        candidates = (etag, f"{etag}-{encoding}") if encoding else (etag,)
+        matched = next((tag for tag in candidates if request.if_none_match.contains(tag)), None)
+        if matched:
+            response = Response(status=304)
+            response.set_etag(matched)
+        else:
+            key = etag + ' ' + request.full_path
+            cached = RENDERED_CACHE.get(version, key, encoding)
+            if cached is not None:
+                # Cuerpo guardado, o su variante gzip/brotli comprimida una sola vez
+                body, mimetype, content_encoding = cached
+                response = Response(body, mimetype=mimetype)
+            else:
+                response = render_requested(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                content_encoding = None
+                if not response.is_streamed:
+                    body, _, content_encoding = RENDERED_CACHE.put(
+                        version, key, response.get_data(), response.mimetype, encoding)
+                    if content_encoding:
+                        response.set_data(body)
+            if content_encoding:
+                response.headers['Content-Encoding'] = content_encoding
+            response.set_etag(f"{etag}-{content_encoding}" if content_encoding else etag)
+        response.vary.add('Accept')
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = QUERY_CACHE_CONTROL
+        return response
+    return decorated
+
 # --- Endpoints de la API (Queries) ---
 
 @app.route('/api/books', methods=['GET'])
 @token_required
+@conditional_get
 def get_books():
-    rows = handle_get_all_books_query()
+    try:
+        limit, after = parse_page_args()
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if limit:
+        rows = handle_get_books_page_query(limit, after)
+        if rows is None: return create_message_xml("Error DB (Query)", 500)
+        return create_books_response(*split_page(rows, limit))
+    # ?stream=1: cursor de servidor + respuesta por chunks (memoria constante)
+    if request.args.get('stream') == '1':
+        batches = handle_get_all_books_query(stream=True)
+        if batches is None: return create_message_xml("Error DB (Query)", 500)
+        return create_xml_stream_response(batches)
+    rows = RESPONSE_CACHE.fetch(('all',), handle_get_all_books_query)
     if rows is None: return create_message_xml("Error DB (Query)", 500)
-    return create_xml_response(rows)
+    return create_books_response(rows)
 
 @app.route('/api/books/isbn/<isbn>', methods=['GET'])
 @token_required
+@conditional_get
 def get_book(isbn):
-    rows = handle_get_book_by_isbn_query(isbn)
+    rows = RESPONSE_CACHE.fetch(('isbn', isbn), lambda: handle_get_book_by_isbn_query(isbn))
     if rows is None: return create_message_xml("Error DB (Query)", 500)
     if not rows: return create_message_xml("No encontrado", 404)
-    return create_xml_response(rows)
+    return create_books_response(rows)
+
+def books_by_isbns_response():
+    """
+    Consulta por lote: cada ISBN sale de su entrada ('isbn', X) de la caché
+    compartida (la misma que /api/books/isbn/<isbn>) y los que faltan se
+    leen juntos con una sola consulta.
+    """
+    try:
+        isbns = parse_isbns_arg()
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if len(isbns) > ISBN_BATCH_MAX:
+        return create_message_xml(f"Máximo {ISBN_BATCH_MAX} ISBNs por petición", 413)
+    found = RESPONSE_CACHE.fetch_many('isbn', list(dict.fromkeys(isbns)), handle_get_books_by_isbns_query)
+    if found is None: return create_message_xml("Error DB (Query)", 500)
+    return create_lookup_response(isbns, {isbn: rows[0] for isbn, rows in found.items() if rows})
+
+@app.route('/api/books/isbn', methods=['GET'])
+@token_required
+@conditional_get
+def get_books_by_isbns():
+    return books_by_isbns_response()
+
+# POST para listas largas: sin ETag ni RENDERED_CACHE, cuya clave es la URL
+@app.route('/api/books/isbn', methods=['POST'])
+@token_required
+def post_books_by_isbns():
+    return books_by_isbns_response()
 
 @app.route('/api/books/author/<author>', methods=['GET'])
 @token_required
+@conditional_get
 def get_books_by_author(author):
-    rows = handle_get_books_by_author_query(author)
+    rows = RESPONSE_CACHE.fetch(('author', author), lambda: handle_get_books_by_author_query(author))
     if rows is None: return create_message_xml("Error DB (Query)", 500)
     if not rows: return create_message_xml("No se encontraron libros", 404)
-    return create_xml_response(rows)
+    return create_books_response(rows)
 
 @app.route('/api/books/format/<format>', methods=['GET'])
 @token_required
+@conditional_get
 def get_books_by_format(format):
-    rows = handle_get_books_by_format_query(format)
+    rows = RESPONSE_CACHE.fetch(('format', format), lambda: handle_get_books_by_format_query(format))
     if rows is None: return create_message_xml("Error DB (Query)", 500)
     if not rows: return create_message_xml("No se encontraron libros", 404)
-    return create_xml_response(rows)
+    return create_books_response(rows)
+
+# --- Búsqueda (índice en memoria; con LIKE en MySQL si no está cargado) ---
+
+@app.route('/api/books/search', methods=['GET'])
+@token_required
+def search_books():
+    query = request.args.get('q', '').strip()
+    if not query: return create_message_xml("El parámetro q es obligatorio", 400)
+    try:
+        limit = parse_limit_arg(SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if CATALOG_STORE.ready:
+        rows = CATALOG_STORE.search(query, limit)
+    else:
+        rows = handle_search_books_query(query, limit)
+        if rows is None: return create_message_xml("Error DB (Query)", 500)
+    if not rows: return create_message_xml("No se encontraron libros", 404)
+    return create_books_response(rows)
+
+@app.route('/api/authors/suggest', methods=['GET'])
+@token_required
+def suggest_authors():
+    prefix = request.args.get('prefix', '').strip()
+    if not prefix: return create_message_xml("El parámetro prefix es obligatorio", 400)
+    try:
+        limit = parse_limit_arg(10, SEARCH_MAX_LIMIT)
+    except ValueError as e:
+        return create_message_xml(str(e), 400)
+    if CATALOG_STORE.ready:
+        names = CATALOG_STORE.suggest_authors(prefix, limit)
+    else:
+        names = handle_suggest_authors_query(prefix, limit)
+        if names is None: return create_message_xml("Error DB (Query)", 500)
+    return create_authors_xml(names)
+
+# --- Feed de cambios (SSE, con long-poll de respaldo) ---
+# El catálogo en memoria publica cada refresco en CHANGE_FEED; los clientes
+# parchean su tabla con los libros cambiados en lugar de volver a pedir
+# /api/books. El id de cada evento es la versión de la caché compartida
+# ('epoch-n', la misma en todos los workers con Redis). Cada stream SSE ocupa
+# un hilo del worker: se cierra a los FEED_STREAM_SECONDS (el cliente
+# reconecta con Last-Event-ID) y, por encima de FEED_MAX_STREAMS por proceso,
+# se responde 503 para que el cliente siga con long-poll y queden hilos para
+# el resto de la API (con muchos clientes, servir el feed con la variante
+# ASGI, que no ocupa hilos).
+CHANGE_FEED = ChangeFeed()
+CATALOG_STORE.subscribe(CHANGE_FEED.publish)
+FEED_HEARTBEAT = 15.0
+FEED_STREAM_SECONDS = 300.0
+FEED_RETRY_MS = 3000
+FEED_POLL_TIMEOUT = 25.0
+FEED_MAX_STREAMS = int(os.environ.get('FEED_MAX_STREAMS', 4))
+FEED_STREAM_SLOTS = threading.BoundedSemaphore(FEED_MAX_STREAMS)
+
+def parse_feed_timeout(raw):
+    """?timeout= del long-poll acotado a [0, FEED_POLL_TIMEOUT]; ValueError si no es un número finito."""
+    timeout = float(raw)
+    # NaN pasa por min()/max() y haría esperar al hilo hasta el próximo cambio
+    if not math.isfinite(timeout):
+        raise ValueError(raw)
+    return min(max(timeout, 0.0), FEED_POLL_TIMEOUT)
+
+def stream_changes(last_id):
+    """Eventos SSE desde `last_id` (o desde ahora, con un 'ready' inicial)."""
+    yield f"retry: {FEED_RETRY_MS}\n\n"
+    if last_id is None:
+        last_id = CHANGE_FEED.version
+        yield sse_message(last_id, [], event='ready')
+    deadline = time.monotonic() + FEED_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        version, changes = CHANGE_FEED.wait(last_id, FEED_HEARTBEAT)
+        if changes is None or changes:
+            yield sse_message(version, changes)
+            last_id = version
+        else:
+            yield ": ping\n\n"
+
+@app.route('/api/books/changes', methods=['GET'])
+@token_required
+def get_book_changes():
+    """
+    Con Accept: text/event-stream, stream SSE de eventos 'changes' / 'reset'
+    (reanuda desde Last-Event-ID o ?since=). Si no, long-poll: responde JSON
+    {seq, changes[, reset]} en cuanto hay cambios posteriores a ?since= o a
+    los ?timeout= segundos (máximo FEED_POLL_TIMEOUT) con changes vacío.
+    """
+    # Desactivado por configuración: 404, que el cliente no reintenta (503 = reintentar)
+    if not CATALOG_IN_MEMORY: return create_message_xml("Feed de cambios desactivado (SEARCH_INDEX=1)", 404)
+    if not CHANGE_FEED.ready: return create_message_xml("Feed de cambios no disponible", 503)
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    headers = {'Cache-Control': 'no-store'}
+    if request.accept_mimetypes.best == 'text/event-stream':
+        # X-Accel-Buffering: que nginx no retenga los eventos
+        headers['X-Accel-Buffering'] = 'no'
+        if not FEED_STREAM_SLOTS.acquire(blocking=False):
+            return create_message_xml("Demasiados streams abiertos: usa long-poll", 503)
+        response = Response(stream_changes(last_id), mimetype='text/event-stream', headers=headers)
+        # call_on_close corre aunque el generador no llegue a empezar
+        response.call_on_close(FEED_STREAM_SLOTS.release)
+        return response
+
+    try:
+        timeout = parse_feed_timeout(request.args.get('timeout', FEED_POLL_TIMEOUT))
+    except ValueError:
+        return create_message_xml("timeout inválido", 400)
+    if last_id is None:
+        version, changes = CHANGE_FEED.version, []
+    else:
+        version, changes = CHANGE_FEED.wait(last_id, timeout)
+    body = {'seq': version, 'changes': changes or []}
+    if changes is None:
+        body['reset'] = True
+    response = jsonify(body)
+    response.headers.update(headers)
+    return response
+
+@app.route('/api/books/changes/status', methods=['GET'])
+@token_required
+def get_changes_status():
+    return jsonify(CHANGE_FEED.stats())
 
 # ==============================================================================
 # --- SECCIÓN DE COMMANDS (Escrituras) ---
 # ==============================================================================
 
+# --- Caché de dimensiones (nombre -> id) para el camino de escritura ---
+GENRE_IDS = LookupCache('genres', 'genre_id')
+FORMAT_IDS = LookupCache('formats', 'format_id')
+AUTHOR_IDS = LookupCache('authors', 'author_id')
+LOOKUP_CACHES = (GENRE_IDS, FORMAT_IDS, AUTHOR_IDS)
+
+def warm_lookup_caches():
+    """Precarga las cachés de dimensiones antes de atender peticiones."""
+    conn = get_db_connection_command()
+    if not conn: return
+    cur = conn.cursor()
+    try:
+        for cache in LOOKUP_CACHES:
+            cache.warm(cur)
+    except MySQLdb.Error as e:
+        print(f"Aviso: no se pudieron precargar las cachés de dimensiones: {e}")
+    finally:
+        cur.close(); conn.close()
+
+def invalidate_lookup_caches_on_fk_error(error):
+    """Un fallo de clave foránea (1452) puede venir de un id cacheado ya borrado."""
+    if error.args and error.args[0] == 1452:
+        for cache in LOOKUP_CACHES:
+            cache.invalidate()
+
+def new_book_cache_keys(books):
+    """
+    Entradas de caché que un libro nuevo cambia aunque aún no lo contengan:
+    el catálogo completo y los listados de sus autores y su formato.
+    """
+    keys = {('all',)}
+    for data in books:
+        keys.add(('format', data['format']))
+        keys.update(('author', name) for name in _split_authors(data['authors']))
+    return keys
+
+def publish_changes(isbns, keys=()):
+    """
+    Tras el commit de un comando: invalida la caché compartida (lo que sube
+    la versión del catálogo) y adelanta el refresco del catálogo en memoria.
+    """
+    RESPONSE_CACHE.invalidate(isbns=isbns, keys=keys)
+    CATALOG_STORE.notify()
+
 class CommandError(Exception):
     """Excepción personalizada para errores de lógica de negocio en comandos."""
     def __init__(self, message, status_code=400):
@@ -261,32 +1106,160 @@ def handle_insert_book_command(data):
     if not conn: raise CommandError("Error DB (Command)", 500)
     cur = conn.cursor()
     try:
-        cur.execute("SELECT genre_id FROM genres WHERE name=%s", (data['genre'],))
-        g = cur.fetchone()
-        if not g: raise CommandError("Género inválido")
+        # Nombres -> ids desde la caché en memoria (sin SELECT salvo fallo)
+        genre_id = GENRE_IDS.get(cur, data['genre'])
+        if genre_id is None: raise CommandError("Género inválido")
+
+        format_id = FORMAT_IDS.get(cur, data['format'])
+        if format_id is None: raise CommandError("Formato inválido")
 
-        cur.execute("SELECT format_id FROM formats WHERE name=%s", (data['format'],))
-        f = cur.fetchone()
-        if not f: raise CommandError("Formato inválido")
+        author_names = [a.strip() for a in data['authors'].split(',')]
+        author_ids = AUTHOR_IDS.get_many(cur, author_names)
 
         cur.execute("INSERT INTO books (isbn,title,year,price,stock,genre_id,format_id) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-            (data['isbn'], data['title'], data['year'], data['price'], data['stock'], g[0], f[0]))
+            (data['isbn'], data['title'], data['year'], data['price'], data['stock'], genre_id, format_id))
 
-        for author_name in [a.strip() for a in data['authors'].split(',')]:
-            cur.execute("SELECT author_id FROM authors WHERE name=%s", (author_name,))
-            a = cur.fetchone()
-            if not a: raise CommandError(f"Autor {author_name} inválido")
-            cur.execute("INSERT INTO book_authors (isbn,author_id) VALUES (%s,%s)", (data['isbn'], a[0]))
+        for author_name in author_names:
+            if author_name not in author_ids: raise CommandError(f"Autor {author_name} inválido")
+            cur.execute("INSERT INTO book_authors (isbn,author_id) VALUES (%s,%s)", (data['isbn'], author_ids[author_name]))
 
         conn.commit()
+        track_session(cur)
+        publish_changes([data['isbn']], keys=new_book_cache_keys([data]))
     except MySQLdb.Error as e:
         conn.rollback()
+        invalidate_lookup_caches_on_fk_error(e)
         if e.args[0] == 1062:
             raise CommandError(f"Error: Ya existe un libro con el ISBN {data['isbn']}", 409)
         raise CommandError(f"Error MySQL: {e}", 500)
     finally:
         cur.close(); conn.close()
 
+# --- Inserción masiva ---
+
+BOOK_FIELDS = ['isbn','title','year','price','stock','genre','format','authors']
+BOOK_TEXT_FIELDS = ['isbn','title','genre','format','authors']
+BULK_MAX_ITEMS = 10000
+BULK_CHUNK_SIZE = 500      # libros por transacción
+BULK_LOOKUP_CHUNK = 1000   # valores por cada IN (...)
+
+def _fetch_names(cur, sql, values):
+    """Ejecuta `sql` (con un IN ({})) por bloques y devuelve {col0: col1}."""
+    values = list(values)
+    found = {}
+    for i in range(0, len(values), BULK_LOOKUP_CHUNK):
+        chunk = values[i:i + BULK_LOOKUP_CHUNK]
+        cur.execute(sql.format(','.join(['%s'] * len(chunk))), chunk)
+        found.update((row[0], row[1]) for row in cur.fetchall())
+    return found
+
+def _split_authors(authors):
+    names = []
+    for name in (a.strip() for a in authors.split(',')):
+        if name not in names: names.append(name)
+    return names
+
+def _insert_books_chunk(cur, chunk, genres, formats, authors):
+    """Inserta un bloque de libros con dos executemany (books y book_authors)."""
+    cur.executemany(
+        "INSERT INTO books (isbn,title,year,price,stock,genre_id,format_id) VALUES (%s,%s,%s,%s,%s,%s,%s)",
+        [(d['isbn'], d['title'], d['year'], d['price'], d['stock'], genres[d['genre']], formats[d['format']])
+         for _, d, _ in chunk])
+    cur.executemany(
+        "INSERT INTO book_authors (isbn,author_id) VALUES (%s,%s)",
+        [(d['isbn'], authors[name]) for _, d, names in chunk for name in names])
+
+def handle_bulk_insert_books_command(books):
+    """
+    Lógica de negocio para insertar muchos libros a la vez.
+
+    Géneros, formatos, autores e ISBNs existentes se resuelven con unas
+    pocas consultas IN (...) y los libros válidos se insertan con
+    executemany en transacciones de BULK_CHUNK_SIZE. Si un bloque falla se
+    reintenta libro a libro para aislar los erróneos.
+
+    Returns:
+        list: Un dict {'isbn', 'status', 'message'} por libro, en el orden recibido
+    """
+    results = [None] * len(books)
+    def result(i, isbn, status, message):
+        results[i] = {'isbn': isbn, 'status': status, 'message': message}
+
+    conn = get_db_connection_command()
+    if not conn: raise CommandError("Error DB (Command)", 500)
+    cur = conn.cursor()
+    try:
+        # Validación local (campos y duplicados dentro de la petición)
+        pending, seen = [], set()
+        for i, data in enumerate(books):
+            if not isinstance(data, dict) or not all(k in data for k in BOOK_FIELDS):
+                result(i, data.get('isbn') if isinstance(data, dict) else None, 400, "Faltan campos")
+            elif not all(isinstance(data[k], str) for k in BOOK_TEXT_FIELDS):
+                # Una lista o un dict aquí rompería los sets/dicts de abajo (500)
+                result(i, data['isbn'] if isinstance(data['isbn'], str) else None, 400,
+                       f"{', '.join(BOOK_TEXT_FIELDS)} deben ser texto")
+            elif data['isbn'] in seen:
+                result(i, data['isbn'], 409, "ISBN repetido en la petición")
+            else:
+                seen.add(data['isbn'])
+                pending.append((i, data, _split_authors(data['authors'])))
+
+        # Resolución de nombres -> ids en bloque (caché + IN (...) para los fallos)
+        genres = GENRE_IDS.get_many(cur, [d['genre'] for _, d, _ in pending])
+        formats = FORMAT_IDS.get_many(cur, [d['format'] for _, d, _ in pending])
+        authors = AUTHOR_IDS.get_many(cur, [name for _, _, names in pending for name in names])
+        existing = _fetch_names(cur, "SELECT isbn, 1 FROM books WHERE isbn IN ({})",
+                                [d['isbn'] for _, d, _ in pending])
+
+        valid = []
+        for i, data, names in pending:
+            missing = [name for name in names if name not in authors]
+            if data['isbn'] in existing:
+                result(i, data['isbn'], 409, f"Ya existe un libro con el ISBN {data['isbn']}")
+            elif data['genre'] not in genres:
+                result(i, data['isbn'], 400, "Género inválido")
+            elif data['format'] not in formats:
+                result(i, data['isbn'], 400, "Formato inválido")
+            elif missing:
+                result(i, data['isbn'], 400, f"Autor {missing[0]} inválido")
+            else:
+                valid.append((i, data, names))
+        conn.rollback()
+
+        # Inserción por bloques, una transacción por bloque
+        for start in range(0, len(valid), BULK_CHUNK_SIZE):
+            chunk = valid[start:start + BULK_CHUNK_SIZE]
+            try:
+                _insert_books_chunk(cur, chunk, genres, formats, authors)
+                conn.commit()
+                for i, data, _ in chunk:
+                    result(i, data['isbn'], 201, "Libro insertado")
+            except MySQLdb.Error:
+                conn.rollback()
+                for item in chunk:
+                    i, data, _ = item
+                    try:
+                        _insert_books_chunk(cur, [item], genres, formats, authors)
+                        conn.commit()
+                        result(i, data['isbn'], 201, "Libro insertado")
+                    except MySQLdb.Error as e:
+                        conn.rollback()
+                        invalidate_lookup_caches_on_fk_error(e)
+                        if e.args[0] == 1062:
+                            result(i, data['isbn'], 409, f"Ya existe un libro con el ISBN {data['isbn']}")
+                        else:
+                            result(i, data['isbn'], 500, f"Error MySQL: {e}")
+        track_session(cur)
+        inserted = [data for i, data, _ in valid if results[i]['status'] == 201]
+        if inserted:
+            publish_changes([d['isbn'] for d in inserted], keys=new_book_cache_keys(inserted))
+    except MySQLdb.Error as e:
+        conn.rollback()
+        raise CommandError(f"Error MySQL: {e}", 500)
+    finally:
+        cur.close(); conn.close()
+    return results
+
 def handle_update_book_command(isbn, data):
     """Lógica de negocio para actualizar un libro."""
     conn = get_db_connection_command()
@@ -309,6 +1282,9 @@ def handle_update_book_command(isbn, data):
             raise CommandError(f"No se encontró ningún libro con el ISBN {isbn} para actualizar", 404)
 
         conn.commit()
+        track_session(cur)
+        # Solo se evictan las entradas que contienen este ISBN
+        publish_changes([isbn])
     except MySQLdb.Error as e:
         conn.rollback()
         raise CommandError(f"Error MySQL: {e}", 500)
@@ -329,12 +1305,143 @@ def handle_delete_books_command(isbns):
              raise CommandError("No se encontraron libros con esos ISBNs para borrar", 404)
 
         conn.commit()
+        track_session(cur)
+        publish_changes(isbns)
+    except MySQLdb.Error as e:
+        conn.rollback()
+        raise CommandError(f"Error MySQL: {e}", 500)
+    finally:
+        cur.close(); conn.close()
+
+# --- Ajustes de stock ---
+
+# Suma atómica con condición: sin leer antes el stock, dos ventas a la vez
+# no se pisan (la segunda espera al bloqueo de fila de la primera y evalúa
+# la condición con el valor ya actualizado) y el stock nunca baja de 0.
+# Un stock NULL cuenta como 0.
+STOCK_UPDATE = ("UPDATE books SET stock = COALESCE(stock, 0) + %s "
+                "WHERE isbn=%s AND COALESCE(stock, 0) + %s >= 0")
+STOCK_BATCH_MAX = 1000
+
+def valid_stock_delta(delta):
+    # Con delta 0 el UPDATE no cambia la fila y rowcount sería 0, como un fallo
+    return isinstance(delta, int) and not isinstance(delta, bool) and delta != 0
+
+def parse_stock_items(items):
+    """
+    Valida los elementos {"isbn", "delta"} del ajuste por lotes.
+
+    Returns:
+        (items, error): [(isbn, delta)] y None, o None y el mensaje de error
+    """
+    parsed, seen = [], set()
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('isbn'), str):
+            return None, "Cada elemento necesita isbn y delta"
+        if not valid_stock_delta(item.get('delta')):
+            return None, f"delta inválido para {item['isbn']} (entero distinto de 0)"
+        # 'x' y 'X' son el mismo libro para la colación de MySQL
+        if isbn_key(item['isbn']) in seen:
+            return None, f"ISBN repetido en la petición: {item['isbn']}"
+        seen.add(isbn_key(item['isbn']))
+        parsed.append((item['isbn'], item['delta']))
+    return parsed, None
+
+def _stock_failure(cur, isbn):
+    """Tras un UPDATE sin filas: 404 si el libro no existe, 409 si no hay stock."""
+    cur.execute("SELECT stock FROM books WHERE isbn=%s", (isbn,))
+    row = cur.fetchone()
+    if row is None:
+        return CommandError(f"No se encontró ningún libro con el ISBN {isbn}", 404)
+    return CommandError(f"Stock insuficiente para {isbn} (disponible: {row[0] or 0})", 409)
+
+def handle_adjust_stock_command(isbn, delta):
+    """
+    Suma `delta` (con signo) al stock de un libro con un único UPDATE
+    condicional.
+
+    Returns:
+        int: Stock resultante
+    """
+    conn = get_db_connection_command()
+    if not conn: raise CommandError("Error DB (Command)", 500)
+    cur = conn.cursor()
+    try:
+        cur.execute(STOCK_UPDATE, (delta, isbn, delta))
+        if cur.rowcount == 0:
+            conn.rollback()
+            raise _stock_failure(cur, isbn)
+        # La ISBN tal como está guardada: la de la URL puede diferir en mayúsculas
+        cur.execute("SELECT isbn, stock FROM books WHERE isbn=%s", (isbn,))
+        stored, stock = cur.fetchone()
+        conn.commit()
+        track_session(cur)
+        publish_changes([stored])
+        return stock
+    except MySQLdb.Error as e:
+        conn.rollback()
+        raise CommandError(f"Error MySQL: {e}", 500)
+    finally:
+        cur.close(); conn.close()
+
+def handle_adjust_stock_batch_command(items):
+    """
+    Aplica muchos ajustes [(isbn, delta)] en una sola transacción: todos o
+    ninguno (p. ej. los libros de un pedido).
+
+    Un solo UPDATE con CASE recorre la clave primaria en orden, así que dos
+    lotes concurrentes bloquean sus filas en el mismo orden y no se
+    interbloquean, y la transacción retiene los bloqueos solo unos pocos
+    viajes a la BD. Si alguna fila no cumple la condición se deshace todo y
+    se indica qué libros fallaron.
+
+    Returns:
+        list: Un dict {'isbn', 'status', 'message', 'stock'} por libro, en
+        el orden recibido
+    """
+    isbns = [isbn for isbn, _ in items]
+    cases = ' '.join(['WHEN %s THEN %s'] * len(items))
+    case_params = [v for item in items for v in item]
+    in_list = ','.join(['%s'] * len(items))
+    sql = (f"UPDATE books SET stock = COALESCE(stock, 0) + CASE isbn {cases} END "
+           f"WHERE isbn IN ({in_list}) AND COALESCE(stock, 0) + CASE isbn {cases} END >= 0")
+
+    conn = get_db_connection_command()
+    if not conn: raise CommandError("Error DB (Command)", 500)
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, case_params + isbns + case_params)
+        applied = cur.rowcount == len(items)
+        if not applied:
+            conn.rollback()
+        cur.execute(f"SELECT isbn, stock FROM books WHERE isbn IN ({in_list})", isbns)
+        # Por isbn_key: el ISBN pedido puede diferir del guardado en mayúsculas
+        found = {isbn_key(isbn): (isbn, stock) for isbn, stock in cur.fetchall()}
+        stocks = {key: stock for key, (_, stock) in found.items()}
+        if applied:
+            conn.commit()
+            track_session(cur)
+            publish_changes([found[isbn_key(isbn)][0] for isbn in isbns])
     except MySQLdb.Error as e:
         conn.rollback()
         raise CommandError(f"Error MySQL: {e}", 500)
     finally:
         cur.close(); conn.close()
 
+    results = []
+    for isbn, delta in items:
+        stock = stocks.get(isbn_key(isbn))
+        if applied:
+            results.append({'isbn': isbn, 'status': 200, 'message': "Stock actualizado", 'stock': stock})
+        elif isbn_key(isbn) not in stocks:
+            results.append({'isbn': isbn, 'status': 404, 'message': "Libro no encontrado", 'stock': None})
+        elif (stock or 0) + delta < 0:
+            results.append({'isbn': isbn, 'status': 409, 'message': "Stock insuficiente", 'stock': stock})
+        else:
+            results.append({'isbn': isbn, 'status': 424, 'message': "No aplicado: falló otro libro del lote",
+                            'stock': stock})
+    return results
+
 # --- Endpoints de la API (Commands) ---
 
 @app.route('/api/books/insert', methods=['POST'])
@@ -352,6 +1459,23 @@ def insert_book():
     except CommandError as e:
         return create_message_xml(e.message, e.status_code)
 
+@app.route('/api/books/bulk', methods=['POST'])
+@token_required
+def bulk_insert_books():
+    data = request.get_json()
+    # Acepta una lista de libros o {"books": [...]}
+    books = data.get('books') if isinstance(data, dict) else data
+    if not isinstance(books, list) or not books:
+        return create_message_xml("Se esperaba una lista de libros", 400)
+    if len(books) > BULK_MAX_ITEMS:
+        return create_message_xml(f"Máximo {BULK_MAX_ITEMS} libros por petición", 413)
+
+    try:
+        results = handle_bulk_insert_books_command(books)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+    return create_bulk_results_xml(results)
+
 @app.route('/api/books/update/<isbn>', methods=['PUT'])
 @token_required
 def update_book(isbn):
@@ -364,6 +1488,38 @@ def update_book(isbn):
     except CommandError as e:
         return create_message_xml(e.message, e.status_code)
 
+@app.route('/api/books/<isbn>/stock', methods=['POST'])
+@token_required
+def adjust_stock(isbn):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not valid_stock_delta(data.get('delta')):
+        return create_message_xml("Se esperaba un delta entero distinto de 0", 400)
+
+    try:
+        stock = handle_adjust_stock_command(isbn, data['delta'])
+        return create_stock_xml(isbn, stock)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+
+@app.route('/api/books/stock', methods=['POST'])
+@token_required
+def adjust_stock_batch():
+    data = request.get_json(silent=True)
+    # Acepta una lista de {isbn, delta} o {"items": [...]}
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return create_message_xml("Se esperaba una lista de {isbn, delta}", 400)
+    if len(items) > STOCK_BATCH_MAX:
+        return create_message_xml(f"Máximo {STOCK_BATCH_MAX} libros por petición", 413)
+    items, error = parse_stock_items(items)
+    if error: return create_message_xml(error, 400)
+
+    try:
+        results = handle_adjust_stock_batch_command(items)
+    except CommandError as e:
+        return create_message_xml(e.message, e.status_code)
+    return create_stock_results_xml(results)
+
 @app.route('/api/books/delete', methods=['DELETE'])
 @token_required
 def delete_books():
@@ -377,6 +1533,39 @@ def delete_books():
     except CommandError as e:
         return create_message_xml(e.message, e.status_code)
 
+@app.route('/api/cache/status', methods=['GET'])
+@token_required
+def get_cache_status():
+    data = RESPONSE_CACHE.stats()
+    data.update({'catalog_version': RESPONSE_CACHE.catalog_version(),
+                 'rendered': RENDERED_CACHE.stats(),
+                 'compressed_files': COMPRESSED_FILES.stats(),
+                 'xslt': XSLT_RENDERER.stats()})
+    return jsonify(data)
+
+@app.route('/api/catalog/status', methods=['GET'])
+@token_required
+def get_catalog_status():
+    data = CATALOG_STORE.stats()
+    data.update({'backend': QUERY_BACKEND, 'search_index': SEARCH_INDEX})
+    return jsonify(data)
+
+@app.route('/api/replicas/status', methods=['GET'])
+@token_required
+def get_replicas_status():
+    return jsonify(READ_ROUTER.stats())
+
+@app.route('/debug/slow-queries', methods=['GET'])
+@token_required
+def get_slow_queries():
+    """Peores formas de query (?order=total_ms|max_ms|count, ?limit=20) con su EXPLAIN."""
+    try:
+        limit = int(request.args.get('limit', 20))
+        shapes = SLOW_QUERIES.top(limit, request.args.get('order', 'total_ms'))
+    except ValueError as e:
+        return create_message_xml(f"Parámetros inválidos: {e}", 400)
+    return jsonify({'threshold_ms': SLOW_QUERIES.threshold_ms, 'queries': shapes})
+
 # ==============================================================================
 # --- FIN DE IMPLEMENTACIÓN CQRS ---
 # ==============================================================================
@@ -387,6 +1576,49 @@ def home():
     # Asume que index.html está en una carpeta 'templates'
     return render_template('index.html')
 
-# --- Run ---
+# --- Arranque por proceso ---
+def startup():
+    """
+    Prepara este proceso antes de atender peticiones: migraciones (con
+    lock e idempotentes), cachés de dimensiones, hoja XSLT compilada,
+    sondeo de réplicas y catálogo en memoria.
+
+    Cada worker de serve.py importa el módulo después del fork, así que
+    sus conexiones, cachés e hilos de fondo son propios.
+    """
+    conn = get_db_connection_command()
+    if conn:
+        try:
+            migrate(conn)
+        except MySQLdb.Error as e:
+            print(f"Aviso: no se pudieron aplicar las migraciones: {e}")
+        finally:
+            conn.close()
+    warm_lookup_caches()
+    try:
+        XSLT_RENDERER.warm()
+    except Exception as e:
+        print(f"Aviso: no se pudo compilar la hoja XSLT: {e}")
+    READ_ROUTER.start()
+    if CATALOG_IN_MEMORY:
+        CATALOG_STORE.start()
+
+def shutdown():
+    """Para los hilos de fondo del proceso (apagado ordenado del worker)."""
+    CATALOG_STORE.stop()
+    READ_ROUTER.stop()
+
+def create_app():
+    """Punto de entrada WSGI: serve.py o gunicorn 'microserviciosCQRS:create_app()'."""
+    # gunicorn -w N sin serve.py: WEB_CONCURRENCY es su número de workers por defecto
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    if workers > 1 and RESPONSE_CACHE_URL.startswith('memory://'):
+        raise RuntimeError(f"{workers} workers con RESPONSE_CACHE_URL='memory://': cada proceso "
+                           "tendría su propia versión del catálogo; configura redis://")
+    startup()
+    return app
+
+# --- Run (servidor de desarrollo; en producción, serve.py) ---
 if __name__ == '__main__':
+    create_app()
     app.run(host='0.0.0.0', port=5000, debug=True)
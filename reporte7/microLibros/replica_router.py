@@ -0,0 +1,340 @@
+"""
+Enrutado de lecturas entre réplicas MySQL con garantía read-your-writes.
+
+- Un hilo de fondo sondea cada réplica (SHOW REPLICA STATUS) midiendo su
+  lag de replicación y la latencia del sondeo.
+- Cada lectura va a la réplica sana con menos conexiones en curso
+  ('least_connections') o con menor latencia ponderada por carga
+  ('latency'). Si ninguna réplica está sana o todas superan max_lag, la
+  lectura va a la primaria.
+- Tras un comando, session_token() devuelve un token opaco con el GTID
+  ejecutado en la primaria (y la hora del commit). Una lectura que trae ese
+  token solo se sirve desde una réplica que ya lo haya aplicado; si no hay
+  ninguna, desde la primaria. Sin token no se consulta el GTID.
+- Cada destino guarda sus conexiones ociosas para reutilizarlas: una
+  lectura no paga el connect+auth contra la réplica.
+"""
+
+import base64
+import json
+import threading
+import time
+
+import MySQLdb
+
+
+def _close_quietly(raw):
+    try:
+        raw.close()
+    except MySQLdb.Error:
+        pass
+
+
+class RoutedConnection:
+    """
+    Conexión prestada por el router; close() descuenta la carga del destino
+    y devuelve la conexión a su pool.
+    """
+
+    def __init__(self, raw, target):
+        self._raw = raw
+        self.target = target
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        target, self.target = self.target, None
+        if target is not None:
+            target.release()
+            target.checkin(self._raw)
+
+
+class ReadTarget:
+    """
+    Estado de un destino de lectura (réplica o primaria) y sus conexiones
+    ociosas.
+
+    Args:
+        name: Nombre del destino en las estadísticas
+        db_config: Parámetros para MySQLdb.connect()
+        pool_size: Conexiones ociosas que se conservan para reutilizar
+    """
+
+    # Una conexión ociosa más tiempo que esto se comprueba con ping() antes de usarla
+    HEALTH_CHECK_INTERVAL = 30.0
+
+    def __init__(self, name, db_config, pool_size=8):
+        self.name = name
+        self.db_config = dict(db_config)
+        self.pool_size = pool_size
+        self.healthy = True
+        self.lag = 0.0                 # segundos de retraso respecto a la primaria
+        self.latency = 0.0             # EWMA de la latencia del sondeo (s)
+        self.probed_at = None          # time.time() del último sondeo correcto
+        self.in_flight = 0
+        self.served = 0
+        self.errors = 0
+        self.connects = 0
+        self._lock = threading.Lock()
+        self._idle = []                # pila de (conexión, time.monotonic() de su último uso)
+        self._probe_conn = None
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+            self.served += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    # --- Pool de conexiones ---
+
+    def checkout(self):
+        """
+        Conexión ociosa sana o, si no hay, una nueva.
+
+        Raises:
+            MySQLdb.Error: Si no se puede conectar
+        """
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                break
+            raw, last_used = item
+            if time.monotonic() - last_used < self.HEALTH_CHECK_INTERVAL:
+                return raw
+            try:
+                raw.ping()
+                return raw
+            except MySQLdb.Error:
+                _close_quietly(raw)
+        raw = MySQLdb.connect(**self.db_config)
+        with self._lock:
+            self.connects += 1
+        return raw
+
+    def checkin(self, raw):
+        """Devuelve una conexión al pool (o la cierra si está rota, sobra o el destino cayó)."""
+        try:
+            # Sin transacción abierta: la siguiente lectura no hereda un snapshot antiguo
+            raw.rollback()
+        except MySQLdb.Error:
+            _close_quietly(raw)
+            return
+        with self._lock:
+            if self.healthy and len(self._idle) < self.pool_size:
+                self._idle.append((raw, time.monotonic()))
+                return
+        _close_quietly(raw)
+
+    def drain(self):
+        """Cierra las conexiones ociosas (p. ej. al marcar el destino como caído)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for raw, _ in idle:
+            _close_quietly(raw)
+
+    def caught_up_until(self):
+        """Instante (time.time()) hasta el que la réplica tiene todos los datos."""
+        if self.probed_at is None:
+            return 0.0
+        return self.probed_at - self.lag
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'host': self.db_config.get('host'),
+            'healthy': self.healthy,
+            'lag_seconds': self.lag,
+            'latency_ms': round(self.latency * 1000, 3),
+            'in_flight': self.in_flight,
+            'served': self.served,
+            'errors': self.errors,
+            'connects': self.connects,
+            'idle': len(self._idle),
+        }
+
+
+class ReplicaRouter:
+    """
+    Router de lecturas.
+
+    Args:
+        primary_config: Configuración de la BD primaria (destino de respaldo)
+        replica_configs: Lista de configuraciones de réplicas (puede estar vacía)
+        max_lag: Segundos de lag a partir de los cuales una réplica no se usa
+        probe_interval: Segundos entre sondeos
+        strategy: 'least_connections' o 'latency'
+    """
+
+    def __init__(self, primary_config, replica_configs=(), max_lag=5.0,
+                 probe_interval=2.0, strategy='least_connections'):
+        if strategy not in ('least_connections', 'latency'):
+            raise ValueError(f"Estrategia de balanceo desconocida: {strategy}")
+        self.primary = ReadTarget('primary', primary_config)
+        self.replicas = [ReadTarget(f'replica-{i}', cfg) for i, cfg in enumerate(replica_configs)]
+        self.max_lag = max_lag
+        self.probe_interval = probe_interval
+        self.strategy = strategy
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'primary_fallbacks': 0, 'token_misses': 0}
+
+    # --- Sondeo de réplicas ---
+
+    def start(self):
+        """Sondea una vez y lanza el hilo de sondeo periódico."""
+        if not self.replicas or (self._thread and self._thread.is_alive()):
+            return
+        self.probe_all()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='replica-prober', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for target in [self.primary] + self.replicas:
+            target.drain()
+
+    def _run(self):
+        while not self._stop.wait(self.probe_interval):
+            self.probe_all()
+
+    def probe_all(self):
+        for replica in self.replicas:
+            self.probe(replica)
+
+    def probe(self, replica):
+        """Mide lag y latencia de una réplica; la marca como caída si falla."""
+        try:
+            if replica._probe_conn is None:
+                replica._probe_conn = MySQLdb.connect(**replica.db_config)
+            started = time.perf_counter()
+            cur = replica._probe_conn.cursor(MySQLdb.cursors.DictCursor)
+            try:
+                try:
+                    cur.execute("SHOW REPLICA STATUS")
+                except MySQLdb.ProgrammingError:
+                    cur.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22
+                status = cur.fetchone()
+            finally:
+                cur.close()
+            elapsed = time.perf_counter() - started
+        except MySQLdb.Error:
+            replica.healthy = False
+            replica.errors += 1
+            replica.drain()
+            if replica._probe_conn is not None:
+                _close_quietly(replica._probe_conn)
+                replica._probe_conn = None
+            return
+
+        lag = None
+        if status:
+            lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        # Sin estado de réplica o con la replicación parada (lag NULL) no se usa
+        replica.healthy = lag is not None
+        if not replica.healthy:
+            replica.drain()
+        replica.lag = float(lag) if lag is not None else float('inf')
+        replica.latency = elapsed if not replica.latency else 0.8 * replica.latency + 0.2 * elapsed
+        replica.probed_at = time.time()
+
+    # --- Tokens de sesión ---
+
+    @staticmethod
+    def session_token(cur):
+        """
+        Token read-your-writes para emitir tras el commit de un comando.
+
+        Usa el cursor del comando (conexión a la primaria) para leer el GTID
+        ejecutado; si GTID no está activo el token solo lleva la hora.
+        """
+        gtid = None
+        try:
+            cur.execute("SELECT @@GLOBAL.gtid_executed")
+            row = cur.fetchone()
+            gtid = (row[0] if not isinstance(row, dict) else next(iter(row.values()))) or None
+        except MySQLdb.Error:
+            pass
+        raw = json.dumps({'t': time.time(), 'g': gtid}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def parse_session_token(token):
+        """Devuelve {'t', 'g'} o None si el token no es válido."""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            return {'t': float(data['t']), 'g': data.get('g')}
+        except (TypeError, ValueError, KeyError, AttributeError):
+            return None
+
+    # --- Enrutado ---
+
+    def _candidates(self):
+        healthy = [r for r in self.replicas if r.healthy and r.lag <= self.max_lag]
+        if self.strategy == 'latency':
+            key = lambda r: (r.latency or 0.001) * (1 + r.in_flight)
+        else:
+            key = lambda r: (r.in_flight, r.latency)
+        return sorted(healthy, key=key)
+
+    def _caught_up(self, raw, replica, session):
+        """Comprueba si la réplica ya tiene los escritos de la sesión."""
+        if session.get('g'):
+            cur = raw.cursor()
+            try:
+                cur.execute("SELECT GTID_SUBSET(%s, @@GLOBAL.gtid_executed)", (session['g'],))
+                return bool(cur.fetchone()[0])
+            finally:
+                cur.close()
+        return replica.caught_up_until() >= session['t']
+
+    def get_connection(self, session_token=None, force_primary=False):
+        """
+        Conexión de lectura según la estrategia, el lag y el token de sesión.
+
+        Raises:
+            MySQLdb.Error: Si tampoco se puede conectar a la primaria
+        """
+        session = self.parse_session_token(session_token) if session_token else None
+        if not force_primary:
+            for replica in self._candidates():
+                if session and not session.get('g') and replica.caught_up_until() < session['t']:
+                    continue
+                try:
+                    raw = replica.checkout()
+                except MySQLdb.Error:
+                    replica.healthy = False
+                    replica.errors += 1
+                    replica.drain()
+                    continue
+                try:
+                    if session and not self._caught_up(raw, replica, session):
+                        replica.checkin(raw)
+                        continue
+                except MySQLdb.Error:
+                    _close_quietly(raw)
+                    continue
+                replica.acquire()
+                return RoutedConnection(raw, replica)
+            if self.replicas:
+                self._stats['primary_fallbacks'] += 1
+                if session:
+                    self._stats['token_misses'] += 1
+
+        raw = self.primary.checkout()
+        self.primary.acquire()
+        return RoutedConnection(raw, self.primary)
+
+    def stats(self):
+        data = dict(self._stats)
+        data.update({
+            'strategy': self.strategy,
+            'max_lag_seconds': self.max_lag,
+            'targets': [self.primary.stats()] + [r.stats() for r in self.replicas],
+        })
+        return data
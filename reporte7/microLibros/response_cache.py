@@ -0,0 +1,497 @@
+"""
+Caché compartida de resultados de queries con invalidación precisa.
+
+Con varios workers de gunicorn una caché en memoria por proceso estaría
+fría e inconsistente, así que el almacenamiento es enchufable:
+
+- RedisBackend: cualquier servidor que hable el protocolo Redis
+  (requiere el paquete `redis`), compartido por todos los workers.
+- MemoryBackend: sustituto local en proceso con la misma interfaz, para
+  desarrollo y pruebas sin Redis.
+
+Las entradas se indexan por (endpoint, parámetro): ('all',),
+('isbn', X), ('author', A), ('format', F). Por cada ISBN presente en un
+resultado se guarda el conjunto de claves que lo contienen, de modo que un
+comando sobre el ISBN X borra solo esas claves.
+
+Cada invalidación incrementa además la versión del catálogo, que las
+queries usan como ETag: mientras no cambie, un If-None-Match se responde
+con 304 sin tocar MySQL ni ElementTree (ver RenderedCache). La versión y
+los ISBNs de cada invalidación quedan en un log acotado (changes_since())
+que sirve de feed de cambios al catálogo en memoria.
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from compression import compress, should_compress
+
+
+class MemoryBackend:
+    """Sustituto en proceso del subconjunto de Redis que usa la caché."""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key, now):
+        exp = self._expires.get(key)
+        if exp is not None and exp <= now:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+            return False
+        return key in self._data
+
+    def get(self, key):
+        with self._lock:
+            return self._data[key] if self._alive(key, time.monotonic()) else None
+
+    def mget(self, *keys):
+        with self._lock:
+            now = time.monotonic()
+            return [self._data[key] if self._alive(key, now) else None for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._alive(key, time.monotonic()):
+                return False
+            self._data[key] = value
+            if ex:
+                self._expires[key] = time.monotonic() + ex
+            else:
+                self._expires.pop(key, None)
+            return True
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data[key]) + 1 if self._alive(key, time.monotonic()) else 1
+            self._data[key] = str(value)
+            return value
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+
+    def sadd(self, key, *members):
+        with self._lock:
+            if not self._alive(key, time.monotonic()):
+                self._data[key] = set()
+            self._data[key].update(members)
+
+    def smembers(self, key):
+        with self._lock:
+            return set(self._data[key]) if self._alive(key, time.monotonic()) else set()
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if key in self._data:
+                self._expires[key] = time.monotonic() + seconds
+
+    def rpush(self, key, *values):
+        with self._lock:
+            if not self._alive(key, time.monotonic()):
+                self._data[key] = []
+            self._data[key].extend(values)
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            items = self._data[key] if self._alive(key, time.monotonic()) else []
+            return list(items[start:None if end == -1 else end + 1])
+
+    def ltrim(self, key, start, end):
+        with self._lock:
+            if self._alive(key, time.monotonic()):
+                self._data[key] = self._data[key][start:None if end == -1 else end + 1]
+
+
+class RedisBackend:
+    """Backend Redis (protocolo RESP) compartido entre procesos."""
+
+    def __init__(self, url):
+        import redis  # dependencia opcional, solo si se usa este backend
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._redis.get(key)
+
+    def mget(self, *keys):
+        return self._redis.mget(keys)
+
+    def set(self, key, value, ex=None, nx=False):
+        return bool(self._redis.set(key, value, ex=ex, nx=nx))
+
+    def incr(self, key):
+        return self._redis.incr(key)
+
+    def delete(self, *keys):
+        if keys:
+            self._redis.delete(*keys)
+
+    def sadd(self, key, *members):
+        if members:
+            self._redis.sadd(key, *members)
+
+    def smembers(self, key):
+        return {m.decode('utf-8') if isinstance(m, bytes) else m for m in self._redis.smembers(key)}
+
+    def expire(self, key, seconds):
+        self._redis.expire(key, seconds)
+
+    def rpush(self, key, *values):
+        if values:
+            self._redis.rpush(key, *values)
+
+    def lrange(self, key, start, end):
+        return self._redis.lrange(key, start, end)
+
+    def ltrim(self, key, start, end):
+        self._redis.ltrim(key, start, end)
+
+
+def create_backend(url):
+    """'memory://' -> MemoryBackend; 'redis://...' / 'rediss://...' -> RedisBackend."""
+    if not url or url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f"URL de caché no soportada: {url}")
+
+
+class ResponseCache:
+    """
+    Caché de filas de las queries con índice inverso ISBN -> claves.
+
+    Los errores del backend se registran y se tratan como fallo de caché:
+    el servicio sigue funcionando contra MySQL.
+
+    Args:
+        backend: MemoryBackend, RedisBackend u objeto con la misma interfaz
+        ttl: Segundos de vida de cada entrada (acota cualquier carrera)
+        settle_time: Segundos tras una invalidación durante los que no se
+            guardan resultados nuevos (p. ej. el lag máximo de las réplicas,
+            para no recachear datos de una réplica atrasada)
+        prefix: Prefijo de todas las claves
+    """
+
+    CHANGE_LOG_SIZE = 1000   # invalidaciones que se conservan en el log
+    LOST_CHANGE_AFTER = 5.0  # segundos tras los que un hueco en el log se da por perdido
+
+    def __init__(self, backend, ttl=300, settle_time=0.0, prefix='libros:'):
+        self.backend = backend
+        self.ttl = ttl
+        self.settle_time = settle_time
+        self.prefix = prefix
+        self._stats = {'hits': 0, 'misses': 0, 'invalidated_keys': 0, 'errors': 0}
+
+    def _key(self, parts):
+        return self.prefix + 'q:' + ':'.join(str(p) for p in parts)
+
+    def _index_key(self, isbn):
+        # MySQL compara los ISBN sin distinguir mayúsculas: un comando sobre
+        # '...x' debe borrar lo cacheado bajo el '...X' guardado
+        return f'{self.prefix}idx:isbn:{str(isbn).casefold()}'
+
+    def _error(self, e):
+        self._stats['errors'] += 1
+        print(f"Error de caché: {e}")
+
+    def fetch(self, parts, loader):
+        """
+        Devuelve las filas de `parts` desde la caché o, si no están, llama a
+        loader() y las guarda. Resultados None (error de BD) o vacíos no se
+        cachean.
+
+        Para no guardar un resultado que una invalidación concurrente ya
+        dejó obsoleto, se lee la generación (instante de la última
+        invalidación) antes de la query y solo se escribe si no cambió y ya
+        pasó settle_time desde ella.
+        """
+        key = self._key(parts)
+        try:
+            cached = self.backend.get(key)
+            if cached is not None:
+                self._stats['hits'] += 1
+                return json.loads(cached)
+            generation = self.backend.get(self.prefix + 'gen')
+        except Exception as e:
+            self._error(e)
+            return loader()
+
+        self._stats['misses'] += 1
+        rows = loader()
+        if not rows:
+            return rows
+        self._store_if_current(generation, [(key, rows)])
+        return rows
+
+    def fetch_many(self, name, values, loader):
+        """
+        Como fetch() para muchas claves (name, valor) a la vez: las cacheadas
+        se leen con un único MGET y las que faltan con una sola llamada a
+        loader(valores_que_faltan) -> {valor: filas}.
+
+        Returns:
+            dict: {valor: filas} de los encontrados, o None si loader falla
+        """
+        keys = [self._key((name, value)) for value in values]
+        try:
+            cached = self.backend.mget(*keys) if keys else []
+            generation = self.backend.get(self.prefix + 'gen')
+        except Exception as e:
+            self._error(e)
+            return loader(values)
+
+        found, missing = {}, []
+        for value, raw in zip(values, cached):
+            if raw is None:
+                missing.append(value)
+            else:
+                found[value] = json.loads(raw)
+        self._stats['hits'] += len(found)
+        self._stats['misses'] += len(missing)
+        if not missing:
+            return found
+        loaded = loader(missing)
+        if loaded is None:
+            return None
+        found.update(loaded)
+        self._store_if_current(generation, [(self._key((name, value)), rows)
+                                            for value, rows in loaded.items() if rows])
+        return found
+
+    def _store_if_current(self, generation, entries):
+        """
+        Guarda las entradas [(clave, filas)] y su índice por ISBN si no hubo
+        invalidaciones desde que se leyó `generation` y ya pasó settle_time.
+        """
+        try:
+            settled = (not self.settle_time or generation is None
+                       or time.time() - float(generation) >= self.settle_time)
+            if not entries or not settled or self.backend.get(self.prefix + 'gen') != generation:
+                return
+            for key, rows in entries:
+                self.backend.set(key, json.dumps(list(rows), default=str, separators=(',', ':')), ex=self.ttl)
+                for isbn in {str(row['isbn']) for row in rows}:
+                    index_key = self._index_key(isbn)
+                    self.backend.sadd(index_key, key)
+                    self.backend.expire(index_key, self.ttl)
+        except Exception as e:
+            self._error(e)
+
+    def _versions(self):
+        """(epoch, versión, generación); crea el epoch si el backend no lo tiene."""
+        keys = (self.prefix + 'epoch', self.prefix + 'version', self.prefix + 'gen')
+        epoch, version, generation = self.backend.mget(*keys)
+        if epoch is None:
+            self.backend.set(keys[0], uuid.uuid4().hex[:12], nx=True)
+            epoch, version, generation = self.backend.mget(*keys)
+        if isinstance(epoch, bytes):
+            epoch = epoch.decode('ascii')
+        return epoch, int(version or 0), generation
+
+    def version_tag(self):
+        """Versión actual 'epoch-n' sin comprobar settle_time (None si falla el backend)."""
+        try:
+            epoch, version, _ = self._versions()
+        except Exception as e:
+            self._error(e)
+            return None
+        return f"{epoch}-{version}"
+
+    def catalog_version(self):
+        """
+        Versión actual del catálogo como cadena 'epoch-n', apta para ETag.
+
+        El epoch se genera la primera vez que se usa el backend: con
+        MemoryBackend cada proceso tiene el suyo y con Redis se regenera si
+        se vacía, así que dos catálogos distintos nunca comparten versión.
+
+        Returns:
+            str o None si el backend falla o la última invalidación es más
+            reciente que settle_time (una réplica atrasada podría devolver
+            datos anteriores con la versión nueva).
+        """
+        try:
+            epoch, version, generation = self._versions()
+        except Exception as e:
+            self._error(e)
+            return None
+        if (self.settle_time and generation is not None
+                and time.time() - float(generation) < self.settle_time):
+            return None
+        return f"{epoch}-{version}"
+
+    def changes_since(self, tag):
+        """
+        ISBNs modificados desde la versión `tag` según el log de invalidaciones.
+
+        Dos comandos concurrentes pueden escribir sus entradas del log fuera
+        de orden, así que solo se avanza por versiones contiguas; un hueco
+        con entradas posteriores de hace más de LOST_CHANGE_AFTER segundos
+        se da por perdido (igual que uno al final del log pasado ese tiempo
+        desde la última invalidación).
+
+        Returns:
+            (tag_nuevo, isbns): isbns es None si hay que recargarlo todo
+            (tag None o de otro epoch, o log recortado o incompleto).
+
+        Raises:
+            Exception: Los errores del backend se propagan al llamador
+        """
+        epoch, version, generation = self._versions()
+        current = f"{epoch}-{version}"
+        if tag == current:
+            return current, set()
+        tag_epoch, _, tag_version = (tag or '').rpartition('-')
+        if tag_epoch != epoch or int(tag_version) > version:
+            return current, None
+
+        entries = {}
+        for raw in self.backend.lrange(self.prefix + 'changes', 0, -1):
+            if isinstance(raw, bytes):
+                raw = raw.decode('utf-8')
+            entry = json.loads(raw)
+            entries[entry['v']] = entry
+        reached = int(tag_version)
+        isbns = set()
+        while reached + 1 in entries:
+            reached += 1
+            isbns.update(entries[reached]['isbns'])
+        if reached < version:
+            # Sin entradas posteriores, la referencia es la última invalidación
+            later = [e['t'] for v, e in entries.items() if v > reached + 1]
+            since_gap = min(later) if later else float(generation or 0)
+            if (not entries or min(entries) > reached + 1
+                    or time.time() - since_gap > self.LOST_CHANGE_AFTER):
+                return current, None
+        return f"{epoch}-{reached}", isbns
+
+    def invalidate(self, isbns=(), keys=()):
+        """
+        Borra las entradas que contienen alguno de `isbns` y las claves
+        explícitas `keys` (tuplas como en fetch()) e incrementa la versión
+        del catálogo. Debe llamarse después del commit del comando.
+        """
+        try:
+            now = time.time()
+            self.backend.set(self.prefix + 'gen', f'{now:.6f}')
+            version = self.backend.incr(self.prefix + 'version')
+            log_key = self.prefix + 'changes'
+            self.backend.rpush(log_key, json.dumps({'v': version, 't': now, 'isbns': [str(i) for i in isbns]},
+                                                   separators=(',', ':')))
+            self.backend.ltrim(log_key, -self.CHANGE_LOG_SIZE, -1)
+            doomed = {self._key(parts) for parts in keys}
+            for isbn in isbns:
+                index_key = self._index_key(isbn)
+                doomed.update(self.backend.smembers(index_key))
+                doomed.add(index_key)
+            if doomed:
+                self.backend.delete(*doomed)
+            self._stats['invalidated_keys'] += len(doomed)
+        except Exception as e:
+            self._error(e)
+
+    def stats(self):
+        data = dict(self._stats)
+        data.update({'backend': type(self.backend).__name__, 'ttl': self.ttl})
+        return data
+
+
+def _older(version, current):
+    """True si `version` es anterior a `current` dentro del mismo epoch ('epoch-n')."""
+    if version is None or current is None:
+        return False
+    epoch, _, n = version.rpartition('-')
+    current_epoch, _, current_n = current.rpartition('-')
+    try:
+        return epoch == current_epoch and int(n) < int(current_n)
+    except ValueError:
+        return False
+
+
+class RenderedCache:
+    """
+    Cuerpos ya renderizados por (versión del catálogo, petición), en memoria
+    del proceso, junto con sus variantes comprimidas (gzip/brotli), que se
+    calculan la primera vez que se piden y se reutilizan hasta que cambie
+    la versión.
+
+    Solo se conservan los de la última versión vista: al guardar uno de una
+    versión más nueva (o de otro epoch) se descarta el resto. Un cuerpo de
+    una versión anterior (petición lenta que terminó tras un cambio) se
+    devuelve pero no se guarda.
+
+    Args:
+        max_entries: Máximo de respuestas guardadas (LRU)
+        max_bytes: Tamaño máximo de un cuerpo para guardarlo
+    """
+
+    def __init__(self, max_entries=256, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._version = None
+        self._entries = OrderedDict()  # clave -> (mimetype, {encoding o None: cuerpo})
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'compressions': 0}
+
+    def get(self, version, key, encoding=None):
+        """
+        Devuelve (body, mimetype, encoding) o None.
+
+        Con `encoding` ('gzip', 'br') devuelve la variante comprimida si el
+        cuerpo merece comprimirse; si no, el cuerpo tal cual y encoding None.
+        """
+        with self._lock:
+            entry = self._entries.get(key) if version == self._version else None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+        return self._variant(key, entry, encoding)
+
+    def put(self, version, key, body, mimetype, encoding=None):
+        """Guarda un cuerpo y devuelve lo mismo que get() (también si no se guardó)."""
+        entry = (mimetype, {None: body})
+        if len(body) > self.max_bytes:
+            return body, mimetype, None
+        with self._lock:
+            if version != self._version:
+                if _older(version, self._version):
+                    return self._variant(key, entry, encoding)
+                self._entries.clear()
+                self._version = version
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return self._variant(key, entry, encoding)
+
+    def _variant(self, key, entry, encoding):
+        mimetype, variants = entry
+        body = variants[None]
+        if encoding is None or not should_compress(mimetype, len(body)):
+            return body, mimetype, None
+        encoded = variants.get(encoding)
+        if encoded is None:
+            # Fuera del lock: dos peticiones simultáneas pueden comprimir
+            # a la vez, pero ninguna espera a la otra
+            encoded = compress(body, encoding, cached=True)
+            with self._lock:
+                variants[encoding] = encoded
+                self._stats['compressions'] += 1
+        return encoded, mimetype, encoding
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({'version': self._version, 'entries': len(self._entries),
+                         'bytes': sum(len(body) for _, variants in self._entries.values()
+                                      for body in variants.values())})
+        return data
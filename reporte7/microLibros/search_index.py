@@ -0,0 +1,220 @@
+"""
+Índice de búsqueda en memoria del catálogo.
+
+- Índice invertido token -> ISBNs sobre título y autores normalizados
+  (sin acentos y en minúsculas: "Fiódor" se encuentra con "fiodor").
+- Trie de prefijos sobre el vocabulario, para que el último término de la
+  búsqueda funcione como prefijo ("dostoy" encuentra "dostoyevski").
+- Trie de prefijos de los tokens de cada autor para el autocompletado.
+
+Lo mantiene CatalogStore (catalog_store.py) con add()/remove() a medida que
+aplica los cambios; no es seguro entre hilos por sí mismo.
+"""
+
+import re
+import unicodedata
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Minúsculas y sin diacríticos (NFKD sin marcas combinantes)."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def split_authors(authors):
+    return [name.strip() for name in (authors or '').split(',') if name.strip()]
+
+
+class _Node:
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.values = set()
+
+
+class PrefixTrie:
+    """Trie palabra -> conjunto de valores, con búsqueda por prefijo."""
+
+    def __init__(self):
+        self._root = _Node()
+
+    def insert(self, word, value):
+        node = self._root
+        for ch in word:
+            node = node.children.setdefault(ch, _Node())
+        node.values.add(value)
+
+    def remove(self, word, value):
+        path = [self._root]
+        for ch in word:
+            node = path[-1].children.get(ch)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].values.discard(value)
+        # Poda de los nodos que quedaron vacíos
+        for depth in range(len(word), 0, -1):
+            node = path[depth]
+            if node.values or node.children:
+                break
+            del path[depth - 1].children[word[depth - 1]]
+
+    def complete(self, prefix, limit):
+        """Hasta `limit` pares (palabra, valores) que empiezan por `prefix`, en orden alfabético."""
+        node = self._root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        found = []
+        stack = [(prefix, node)]
+        while stack and len(found) < limit:
+            word, node = stack.pop()
+            if node.values:
+                found.append((word, node.values))
+            for ch in sorted(node.children, reverse=True):
+                stack.append((word + ch, node.children[ch]))
+        return found
+
+
+class SearchIndex:
+    """
+    Índice invertido + autocompletado de autores.
+
+    Args:
+        max_expansions: Tokens del vocabulario en que se expande, como
+            máximo, el prefijo del último término de la búsqueda
+    """
+
+    def __init__(self, max_expansions=50):
+        self.max_expansions = max_expansions
+        self._postings = {}        # token -> set(isbn)
+        self._title_postings = {}  # token -> set(isbn) con el token en el título
+        self._title_tokens = {}    # isbn -> set(token) del título
+        self._book_tokens = {}     # isbn -> set(token) de título y autores
+        self._book_authors = {}    # isbn -> [autor]
+        self._vocabulary = PrefixTrie()
+        self._authors = PrefixTrie()
+        self._author_books = {}    # autor -> nº de libros
+
+    def __len__(self):
+        return len(self._book_tokens)
+
+    # --- Mantenimiento ---
+
+    def add(self, isbn, title, authors):
+        self.remove(isbn)
+        names = split_authors(authors)
+        title_tokens = set(tokenize(title))
+        tokens = title_tokens.union(*(tokenize(name) for name in names))
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                self._vocabulary.insert(token, token)
+            postings.add(isbn)
+        for token in title_tokens:
+            self._title_postings.setdefault(token, set()).add(isbn)
+        self._title_tokens[isbn] = title_tokens
+        self._book_tokens[isbn] = tokens
+        self._book_authors[isbn] = names
+        for name in names:
+            count = self._author_books.get(name, 0)
+            if not count:
+                for token in set(tokenize(name)):
+                    self._authors.insert(token, name)
+            self._author_books[name] = count + 1
+
+    def remove(self, isbn):
+        tokens = self._book_tokens.pop(isbn, None)
+        if tokens is None:
+            return
+        for token in self._title_tokens.pop(isbn):
+            postings = self._title_postings[token]
+            postings.discard(isbn)
+            if not postings:
+                del self._title_postings[token]
+        for token in tokens:
+            postings = self._postings[token]
+            postings.discard(isbn)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary.remove(token, token)
+        for name in self._book_authors.pop(isbn):
+            count = self._author_books[name] - 1
+            if count:
+                self._author_books[name] = count
+            else:
+                del self._author_books[name]
+                for token in set(tokenize(name)):
+                    self._authors.remove(token, name)
+
+    # --- Consultas ---
+
+    def search(self, query):
+        """
+        ISBNs que contienen todos los términos de `query` (el último como
+        prefijo), agrupados por cuántos términos aparecen en el título.
+
+        Returns:
+            dict: {nº de términos en el título: set(isbn)}
+        """
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        *exact, last = terms
+        expansions = [word for word, _ in self._vocabulary.complete(last, self.max_expansions)]
+        if not expansions:
+            return {}
+        # Conjuntos (todo el libro, solo título) por término
+        term_sets = [(self._postings.get(term, set()), self._title_postings.get(term, set()))
+                     for term in exact]
+        term_sets.append((set().union(*(self._postings[w] for w in expansions)),
+                          set().union(*(self._title_postings.get(w, ()) for w in expansions))))
+        matches = None
+        for postings, _ in sorted(term_sets, key=lambda t: len(t[0])):
+            matches = set(postings) if matches is None else matches & postings
+            if not matches:
+                return {}
+        scores = dict.fromkeys(matches, 0)
+        for _, in_title in term_sets:
+            for isbn in matches & in_title:
+                scores[isbn] += 1
+        tiers = {}
+        for isbn, score in scores.items():
+            tiers.setdefault(score, set()).add(isbn)
+        return tiers
+
+    def suggest_authors(self, prefix, limit=10):
+        """
+        Autores con algún nombre o apellido que empieza por cada término de
+        `prefix` ("fio dos" -> "Fiódor Dostoyevski"), ordenados por el token
+        que completa el último término y después por nombre.
+        """
+        terms = tokenize(prefix)
+        if not terms:
+            return []
+        *others, last = terms
+        found, seen = [], set()
+        for _, values in self._authors.complete(last, self.max_expansions):
+            for name in sorted(values - seen, key=normalize):
+                if others:
+                    tokens = tokenize(name)
+                    if not all(any(t.startswith(term) for t in tokens) for term in others):
+                        continue
+                seen.add(name)
+                found.append(name)
+                if len(found) >= limit:
+                    return found
+        return found
+
+    def stats(self):
+        return {'books': len(self._book_tokens), 'tokens': len(self._postings),
+                'authors': len(self._author_books)}
@@ -0,0 +1,175 @@
+"""
+Registro de queries lentas con EXPLAIN automático.
+
+Los cursores que entregan las funciones get_db_connection* (ver
+metrics.py) avisan a SlowQueryLog.record() con la duración de cada
+sentencia. Las que superan el umbral se escriben en la salida con sus
+parámetros y se agrupan por forma: el texto normalizado, con los espacios
+colapsados y las listas IN (%s,%s,...) y VALUES (...),(...) reducidas a
+una sola. Así las consultas GROUP_CONCAT casi idénticas de cada
+handle_*_query quedan separadas y atribuidas a su función.
+
+La primera vez que una forma es lenta se lanza EXPLAIN con los parámetros
+reales en un hilo aparte (la petición no espera) y el plan queda guardado
+con la forma. top() devuelve las peores formas para /debug/slow-queries.
+"""
+
+import queue
+import re
+import sys
+import threading
+import time
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*%s(?:\s*,\s*%s)+\s*\)', re.IGNORECASE)
+_VALUES_LIST = re.compile(r'\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+', re.IGNORECASE)
+_EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+# Funciones de negocio a las que se atribuye una sentencia: handle_get_books_query,
+# handle_insert_book_command... (no el handle_one_request de werkzeug o gunicorn)
+_HANDLER = re.compile(r'handle_\w+_(?:query|command)$')
+
+
+def query_shape(query):
+    """Texto normalizado de una sentencia (mismo para cualquier tamaño de IN/VALUES)."""
+    shape = _WHITESPACE.sub(' ', query).strip().rstrip(';').strip()
+    shape = _IN_LIST.sub('IN (%s, ...)', shape)
+    return _VALUES_LIST.sub(r'VALUES \1, ...', shape)
+
+
+def _preview(params, limit=200):
+    text = repr(params)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def _caller(skip_modules):
+    """
+    Primera función handle_*_query/handle_*_command de la pila; si no hay
+    (p. ej. una ruta con la SQL en línea), la primera fuera del instrumentado.
+    """
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        name = frame.f_code.co_name
+        if _HANDLER.match(name):
+            return name
+        if fallback is None and frame.f_globals.get('__name__') not in skip_modules:
+            fallback = name
+        frame = frame.f_back
+    return fallback or '?'
+
+
+class SlowQueryLog:
+    """
+    Formas de sentencias lentas con sus tiempos, parámetros y plan.
+
+    Args:
+        connect: Función que devuelve una conexión cruda (sin instrumentar)
+            para lanzar EXPLAIN
+        threshold_ms: Duración a partir de la cual una sentencia es lenta
+            (0 = desactivado)
+        max_shapes: Formas que se conservan (se descartan las de menos
+            tiempo total)
+        explain: False para no lanzar EXPLAIN
+    """
+
+    SKIP_MODULES = {'metrics', __name__}
+
+    def __init__(self, connect, threshold_ms=200, max_shapes=200, explain=True):
+        self.connect = connect
+        self.threshold_ms = threshold_ms
+        self.max_shapes = max_shapes
+        self.explain = explain
+        self._shapes = {}   # forma -> estadísticas
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=100)
+        self._worker = None
+
+    def record(self, query, params, seconds):
+        """Listener de los cursores instrumentados; casi gratis por debajo del umbral."""
+        elapsed_ms = seconds * 1000
+        if not self.threshold_ms or elapsed_ms < self.threshold_ms:
+            return
+        shape = query_shape(query)
+        handler = _caller(self.SKIP_MODULES)
+        print(f"Query lenta ({elapsed_ms:.1f} ms) en {handler}: {shape[:300]} params={_preview(params)}")
+        with self._lock:
+            entry = self._shapes.get(shape)
+            is_new = entry is None
+            if is_new:
+                if len(self._shapes) >= self.max_shapes:
+                    coolest = min(self._shapes, key=lambda s: self._shapes[s]['total_ms'])
+                    del self._shapes[coolest]
+                entry = self._shapes[shape] = {
+                    'shape': shape, 'handlers': [], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'first_seen': time.time(), 'explain': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['last_ms'] = elapsed_ms
+            entry['last_seen'] = time.time()
+            entry['last_params'] = _preview(params)
+            if handler not in entry['handlers']:
+                entry['handlers'].append(handler)
+        if (is_new and self.explain and shape.upper().startswith(_EXPLAINABLE)
+                and not isinstance(params, list)):
+            self._schedule_explain(shape, query, params)
+
+    # --- EXPLAIN en segundo plano ---
+
+    def _schedule_explain(self, shape, query, params):
+        try:
+            self._pending.put_nowait((shape, query, params))
+        except queue.Full:
+            return
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._explain_loop, name='slow-query-explain', daemon=True)
+            self._worker.start()
+
+    def _explain_loop(self):
+        while True:
+            shape, query, params = self._pending.get()
+            plan = self._run_explain(query, params)
+            with self._lock:
+                entry = self._shapes.get(shape)
+                if entry is not None:
+                    entry['explain'] = plan
+
+    def _run_explain(self, query, params):
+        """Filas de EXPLAIN como dicts, o {'error': ...}."""
+        try:
+            conn = self.connect()
+        except Exception as e:
+            return {'error': str(e)}
+        if not conn:
+            return {'error': "Sin conexión a la BD"}
+        cur = conn.cursor()
+        try:
+            cur.execute("EXPLAIN " + query.strip().rstrip(';'), params)
+            columns = [d[0] for d in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+        except Exception as e:
+            return {'error': str(e)}
+        finally:
+            cur.close(); conn.close()
+
+    # --- Consulta ---
+
+    def top(self, limit=20, order='total_ms'):
+        """Las `limit` (1..max_shapes) peores formas por total_ms, max_ms o count."""
+        if order not in ('total_ms', 'max_ms', 'count'):
+            raise ValueError("order debe ser total_ms, max_ms o count")
+        if not 1 <= limit <= self.max_shapes:
+            raise ValueError(f"limit debe estar entre 1 y {self.max_shapes}")
+        with self._lock:
+            entries = [dict(e, avg_ms=round(e['total_ms'] / e['count'], 3)) for e in self._shapes.values()]
+        entries.sort(key=lambda e: e[order], reverse=True)
+        for e in entries:
+            e['total_ms'] = round(e['total_ms'], 3)
+            e['max_ms'] = round(e['max_ms'], 3)
+            e['last_ms'] = round(e['last_ms'], 3)
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
@@ -102,8 +102,8 @@ document.addEventListener("DOMContentLoaded", () => {
       mainContainer.style.display = "flex";
       authStatus.textContent = `Autenticado como: ${email}`;
 
-      // Carga la app
-      initializeApp();
+      // Carga la app: el catálogo se pide al conectar con el feed de cambios
+      connectChanges();
 
     } catch (err) {
       loginStatus.textContent = err.message;
@@ -153,50 +153,28 @@ document.addEventListener("DOMContentLoaded", () => {
   async function initializeApp() {
     utils.loadConfig();
     try {
-      authorSelect.innerHTML = '<option value="">-- Selecciona Autor --</option>';
-      formatSelect.innerHTML = '<option value="">-- Selecciona Formato --</option>';
-
       const url = utils.getBaseApiUrl();
-      const res = await fetchProtected(url);
+      const res = await fetchCatalog(url);
 
       if (!res.ok) {
-        const xmlText = await res.text();
         const parser = new DOMParser();
-        const errorDoc = parser.parseFromString(xmlText, "application/xml");
+        const errorDoc = parser.parseFromString(res.text, "application/xml");
         const message = errorDoc.getElementsByTagName("message")[0]?.textContent || `Error ${res.status}`;
         throw new Error(message);
       }
 
-      const xml = await res.text();
+      // 304: el catálogo no cambió, los selects siguen siendo válidos
+      if (res.notModified) return;
 
+      // El catálogo queda en memoria; el feed de cambios lo mantiene al día
       const parser = new DOMParser();
-      const xmlDoc = parser.parseFromString(xml, "application/xml");
-      const authors = new Set();
-      const formats = new Set();
+      const xmlDoc = parser.parseFromString(res.text, "application/xml");
+      catalog.clear();
       for (let book of xmlDoc.getElementsByTagName("book")) {
-        const authorNode = book.getElementsByTagName("author")[0];
-        const formatNode = book.getElementsByTagName("format")[0];
-        if (authorNode && authorNode.textContent) {
-          authorNode.textContent.split(',').forEach(a => authors.add(a.trim()));
-        }
-        if (formatNode && formatNode.textContent) {
-          formats.add(formatNode.textContent);
-        }
+        const data = bookFromXml(book);
+        catalog.set(data.isbn, data);
       }
-      const sortedAuthors = [...authors].sort();
-      const sortedFormats = [...formats].sort();
-      sortedAuthors.forEach(a => {
-        const opt = document.createElement("option");
-        opt.value = a;
-        opt.textContent = a;
-        authorSelect.appendChild(opt);
-      });
-      sortedFormats.forEach(f => {
-        const opt = document.createElement("option");
-        opt.value = f;
-        opt.textContent = f;
-        formatSelect.appendChild(opt);
-      });
+      fillSelects();
 
     } catch (err) {
       console.error("Error cargando catálogo para selects:", err);
@@ -205,6 +183,37 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
+  /**
+   * Rellena los selects de autor y formato a partir del catálogo local
+   * (conserva la opción elegida)
+   */
+  function fillSelects() {
+    const selectedAuthor = authorSelect.value;
+    const selectedFormat = formatSelect.value;
+    authorSelect.innerHTML = '<option value="">-- Selecciona Autor --</option>';
+    formatSelect.innerHTML = '<option value="">-- Selecciona Formato --</option>';
+    const authors = new Set();
+    const formats = new Set();
+    for (const book of catalog.values()) {
+      splitAuthors(book.authors).forEach(a => authors.add(a));
+      if (book.format) formats.add(book.format);
+    }
+    [...authors].sort().forEach(a => {
+      const opt = document.createElement("option");
+      opt.value = a;
+      opt.textContent = a;
+      authorSelect.appendChild(opt);
+    });
+    [...formats].sort().forEach(f => {
+      const opt = document.createElement("option");
+      opt.value = f;
+      opt.textContent = f;
+      formatSelect.appendChild(opt);
+    });
+    authorSelect.value = selectedAuthor;
+    formatSelect.value = selectedFormat;
+  }
+
   // --- Wrapper de Fetch ---
   async function fetchProtected(url, options = {}) {
     if (!options.headers) {
@@ -231,9 +240,41 @@ document.addEventListener("DOMContentLoaded", () => {
     return response;
   }
 
+  // --- GET condicional (ETag) ---
+  // url -> { etag, text, count }: última respuesta correcta de cada consulta
+  const etagCache = new Map();
+
+  /**
+   * GET de una consulta enviando If-None-Match con el ETag guardado.
+   * Un 304 reutiliza el XML ya descargado (notModified = true).
+   */
+  async function fetchCatalog(url) {
+    const cached = etagCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    // 'no-store': la revalidación la hacemos aquí, no la caché del navegador
+    const res = await fetchProtected(url, { headers, cache: 'no-store' });
+
+    if (res.status === 304 && cached) {
+      return { ok: true, status: 200, text: cached.text, entry: cached, notModified: true };
+    }
+
+    const text = await res.text();
+    const etag = res.headers.get("ETag");
+    let entry = null;
+    if (res.ok && etag) {
+      entry = { etag, text, count: null };
+      etagCache.set(url, entry);
+    } else {
+      etagCache.delete(url);
+    }
+    return { ok: res.ok, status: res.status, text, entry, notModified: false };
+  }
+
   // --- Lógica de Carga de Resultados (GET) ---
-  async function loadResults(url) {
+  async function loadResults(url, matches) {
     if (!url) return;
+    // Vista que el feed de cambios mantendrá al día (null = no se parchea)
+    const view = currentView = matches ? { url, matches, isbns: new Set() } : null;
 
     resultsContainer.style.display = "none";
     statusInfo.style.display = "none";
@@ -242,8 +283,8 @@ document.addEventListener("DOMContentLoaded", () => {
     bookCount.textContent = "";
 
     try {
-      const res = await fetchProtected(url);
-      const xmlText = await res.text();
+      const res = await fetchCatalog(url);
+      const xmlText = res.text;
 
       if (!res.ok) {
         const parser = new DOMParser();
@@ -257,9 +298,19 @@ document.addEventListener("DOMContentLoaded", () => {
         return;
       }
 
-      const parser = new DOMParser();
-      const xmlDoc = parser.parseFromString(xmlText, "application/xml");
-      const count = xmlDoc.getElementsByTagName("book").length;
+      // El recuento se calcula una vez por versión (ETag) del resultado;
+      // una vista que se parchea necesita además sus ISBN
+      let count = res.entry ? res.entry.count : null;
+      if (count === null || view) {
+        const parser = new DOMParser();
+        const xmlDoc = parser.parseFromString(xmlText, "application/xml");
+        const bookNodes = xmlDoc.getElementsByTagName("book");
+        count = bookNodes.length;
+        if (res.entry) res.entry.count = count;
+        if (view) {
+          for (let book of bookNodes) view.isbns.add(book.getAttribute("isbn"));
+        }
+      }
 
       statusInfo.style.display = "block";
 
@@ -332,21 +383,23 @@ document.addEventListener("DOMContentLoaded", () => {
   resetConfigBtn.addEventListener("click", utils.resetConfig.bind(utils));
 
   // --- Asignación de Eventos (Consultas) ---
-  getAllBtn.addEventListener("click", () => loadResults(utils.getBaseApiUrl()));
+  getAllBtn.addEventListener("click", () => loadResults(utils.getBaseApiUrl(), () => true));
   getByIsbnBtn.addEventListener("click", () => {
     const isbn = isbnInput.value.trim();
     if (!isbn) return alert("Introduce un ISBN");
-    loadResults(`${utils.getBaseApiUrl()}/isbn/${isbn}`);
+    loadResults(`${utils.getBaseApiUrl()}/isbn/${isbn}`, book => book.isbn === isbn);
   });
   getByAuthorBtn.addEventListener("click", () => {
     const author = authorSelect.value.trim();
     if (!author) return alert("Selecciona un autor");
-    loadResults(`${utils.getBaseApiUrl()}/author/${author}`);
+    loadResults(`${utils.getBaseApiUrl()}/author/${author}`,
+                book => splitAuthors(book.authors).some(a => a.toLowerCase() === author.toLowerCase()));
   });
   getByFormatBtn.addEventListener("click", () => {
     const format = formatSelect.value.trim();
     if (!format) return alert("Selecciona un formato");
-    loadResults(`${utils.getBaseApiUrl()}/format/${format}`);
+    loadResults(`${utils.getBaseApiUrl()}/format/${format}`,
+                book => book.format.toLowerCase() === format.toLowerCase());
   });
 
   // --- Asignación de Eventos (Resultados) ---
@@ -404,7 +457,8 @@ document.addEventListener("DOMContentLoaded", () => {
       await showOperationStatus(insertStatus, response);
       if (response.ok) {
         requiredFields.forEach(f => f.value = "");
-        initializeApp();
+        // Con el feed activo el libro llega como evento; sin él se recarga
+        if (!feedActive) reloadCatalog();
       }
     } catch (err) {
       insertStatus.textContent = `Error de red: ${err.message}`;
@@ -461,6 +515,7 @@ document.addEventListener("DOMContentLoaded", () => {
       await showOperationStatus(deleteStatus, response);
       if (response.ok) {
         deleteIsbns.value = "";
+        if (!feedActive) reloadCatalog();
       }
     } catch (err) {
       deleteStatus.textContent = `Error de red: ${err.message}`;
@@ -474,6 +529,242 @@ document.addEventListener("DOMContentLoaded", () => {
   deleteBtn.addEventListener("click", handleDelete);
 
 
+  // ==== Catálogo local y feed de cambios (/api/books/changes) ====
+  // El catálogo se pide una sola vez (initializeApp) y queda en memoria
+  // (isbn -> libro). Cada inserción, modificación o borrado, de este
+  // cliente o de cualquier otro, llega como evento del feed con el estado
+  // del libro (o null si se borró): se parchean los selects y la tabla que
+  // se está viendo sin volver a pedir /api/books. Un evento 'reset' (el
+  // servidor no conserva los cambios desde nuestro último id) recarga todo.
+
+  const catalog = new Map();
+  const pendingChanges = [];   // eventos recibidos durante una recarga
+  const XML_FIELDS = [["title", "title"], ["authors", "author"], ["year", "year"],
+                      ["genre", "genre"], ["price", "price"], ["stock", "stock"],
+                      ["format", "format"]];
+  let currentView = null;      // { url, matches(libro), isbns } de la tabla mostrada
+  let catalogLoading = null;   // promesa de la recarga en curso
+  let feedActive = false;
+  let changeSource = null;
+  let lastEventId = null;
+  let xsltProcessor = null;
+
+  function splitAuthors(authors) {
+    return authors ? authors.split(',').map(a => a.trim()).filter(a => a) : [];
+  }
+
+  function asText(value) {
+    return value === null || value === undefined ? "" : String(value);
+  }
+
+  /** Libro del XML de /api/books con los mismos campos que los eventos */
+  function bookFromXml(node) {
+    const book = { isbn: node.getAttribute("isbn") };
+    for (const [key, tag] of XML_FIELDS) {
+      book[key] = node.getElementsByTagName(tag)[0]?.textContent || "";
+    }
+    return book;
+  }
+
+  /** Libro de un evento del feed (valores numéricos y null como texto) */
+  function bookFromEvent(isbn, data) {
+    const book = { isbn };
+    for (const [key] of XML_FIELDS) book[key] = asText(data[key]);
+    return book;
+  }
+
+  /** Documento <catalog> como el que devuelve el servidor */
+  function catalogXml(books) {
+    const doc = document.implementation.createDocument(null, "catalog", null);
+    for (const book of books) {
+      const node = doc.createElement("book");
+      node.setAttribute("isbn", book.isbn);
+      for (const [key, tag] of XML_FIELDS) {
+        const child = doc.createElement(tag);
+        child.textContent = book[key];
+        node.appendChild(child);
+      }
+      doc.documentElement.appendChild(node);
+    }
+    return doc;
+  }
+
+  /** La misma hoja libros.xsl que usa el navegador, cargada una vez */
+  async function getXslt() {
+    if (xsltProcessor || !window.XSLTProcessor) return xsltProcessor;
+    try {
+      const res = await fetch(new URL("/libros.xsl", utils.getRootApiUrl()));
+      if (!res.ok) return null;
+      const xsl = new DOMParser().parseFromString(await res.text(), "application/xml");
+      xsltProcessor = new XSLTProcessor();
+      xsltProcessor.importStylesheet(xsl);
+    } catch (err) {
+      console.error("Error cargando libros.xsl:", err);
+      xsltProcessor = null;
+    }
+    return xsltProcessor;
+  }
+
+  /**
+   * Rehace la tabla mostrada desde el catálogo local
+   * (mismo orden que el servidor: título y, a igualdad, ISBN)
+   */
+  async function renderView() {
+    const view = currentView;
+    const books = [...catalog.values()].filter(view.matches).sort((a, b) =>
+      a.title.toLowerCase().localeCompare(b.title.toLowerCase()) || a.isbn.localeCompare(b.isbn));
+    view.isbns = new Set(books.map(b => b.isbn));
+    const doc = catalogXml(books);
+    const xsl = await getXslt();
+    if (view !== currentView) return;   // el usuario cambió de consulta mientras tanto
+    if (!xsl) {
+      loadResults(view.url, view.matches);   // sin XSLT en el navegador: se vuelve a pedir
+      return;
+    }
+    statusInfo.style.display = "block";
+    bookCount.textContent = `Total de libros: ${books.length}`;
+    if (books.length === 0) {
+      resultsContainer.style.display = "none";
+      loadStatus.textContent = "No se encontró ningún dato para cargar";
+      loadStatus.style.color = "orange";
+      return;
+    }
+    loadStatus.textContent = "Datos actualizados en tiempo real";
+    loadStatus.style.color = "green";
+    if (resultsContainer.style.display !== "block") {
+      resultsContainer.style.display = "block";
+      resultsFrame.style.display = "block";
+      xmlSource.style.display = "none";
+      toggleResultsBtn.textContent = "Mostrar XML";
+    }
+    resultsFrame.srcdoc = xsl.transformToDocument(doc).documentElement.outerHTML;
+    xmlSource.textContent = formatXml(new XMLSerializer().serializeToString(doc));
+  }
+
+  /** Aplica un lote [{isbn, book}] al catálogo local, los selects y la tabla */
+  function applyChanges(changes) {
+    if (changes.length === 0) return;
+    let viewTouched = false;
+    for (const { isbn, book } of changes) {
+      const data = book ? bookFromEvent(isbn, book) : null;
+      if (currentView && (currentView.isbns.has(isbn) || (data && currentView.matches(data)))) {
+        viewTouched = true;
+      }
+      if (data) catalog.set(isbn, data);
+      else catalog.delete(isbn);
+    }
+    fillSelects();
+    if (viewTouched) renderView();
+  }
+
+  /** Recarga el catálogo entero; los eventos que llegan mientras tanto se aplican después */
+  async function reloadCatalog() {
+    if (catalogLoading) return catalogLoading;
+    catalogLoading = initializeApp();
+    try {
+      await catalogLoading;
+    } finally {
+      catalogLoading = null;
+    }
+    applyChanges(pendingChanges.splice(0));
+    if (currentView) renderView();
+  }
+
+  function onFeedMessage(type, payload) {
+    lastEventId = payload.seq;
+    if (type === "reset") {
+      reloadCatalog();
+    } else if (type === "ready") {
+      // El feed ya está escuchando: lo que cambie desde aquí llegará como evento
+      feedActive = true;
+      reloadCatalog();
+    } else if (catalogLoading) {
+      pendingChanges.push(...payload.changes);
+    } else {
+      applyChanges(payload.changes);
+    }
+  }
+
+  /** Conecta (o reconecta, si cambia la configuración) con el feed */
+  function connectChanges() {
+    const marker = changeSource = {};
+    feedActive = false;
+    lastEventId = null;
+    xsltProcessor = null;
+    streamChanges(`${utils.getRootApiUrl()}/books/changes`, marker);
+  }
+
+  /**
+   * Lee el feed SSE con fetchProtected: EventSource no puede mandar el
+   * header Authorization. Reanuda con Last-Event-ID cuando el servidor
+   * cierra el stream; sin ReadableStream en el navegador, o si el servidor
+   * ya tiene demasiados streams abiertos (503), usa long-poll. Un 404 (feed
+   * desactivado en el servidor) es definitivo: se deja de pedir y cada
+   * escritura recarga el catálogo (feedActive = false).
+   */
+  async function streamChanges(url, marker) {
+    let retryMs = 3000;
+    let streaming = !!window.TextDecoderStream;
+    while (changeSource === marker && accessToken) {
+      try {
+        const headers = { 'Accept': streaming ? 'text/event-stream' : 'application/json' };
+        if (lastEventId !== null) headers['Last-Event-ID'] = lastEventId;
+        const res = await fetchProtected(url, { headers, cache: 'no-store' });
+        if (changeSource !== marker) return;
+        if (res.status === 404) {
+          changeSource = null;
+          feedActive = false;
+          reloadCatalog();
+          return;
+        }
+        if (res.status === 503 && streaming) {
+          streaming = false;
+          continue;
+        }
+        if (!res.ok) throw new Error(`Error ${res.status}`);
+
+        if (!streaming || !res.body) {
+          const payload = await res.json();
+          if (lastEventId === null) onFeedMessage("ready", payload);
+          else onFeedMessage(payload.reset ? "reset" : "changes", payload);
+          continue;
+        }
+
+        const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = "";
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done || changeSource !== marker) {
+            reader.cancel();
+            break;
+          }
+          buffer += value.replace(/\r\n/g, "\n");
+          let end;
+          while ((end = buffer.indexOf("\n\n")) >= 0) {
+            const block = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            let type = "message";
+            let data = "";
+            for (const line of block.split("\n")) {
+              if (line.startsWith("event:")) type = line.slice(6).trim();
+              else if (line.startsWith("data:")) data += line.slice(5).trim();
+              else if (line.startsWith("retry:")) retryMs = parseInt(line.slice(6)) || retryMs;
+            }
+            if (data) onFeedMessage(type, JSON.parse(data));   // los ': ping' no llevan data
+          }
+        }
+        continue;   // fin normal del stream: se reanuda desde lastEventId
+      } catch (err) {
+        console.error("Error en el feed de cambios:", err);
+        feedActive = false;
+        if (!catalog.size) reloadCatalog();
+      }
+      await new Promise(resolve => setTimeout(resolve, retryMs));
+    }
+  }
+
+  saveConfigBtn.addEventListener("click", () => { if (accessToken) connectChanges(); });
+
   // =======================================================
   // ==== NUEVO: Lógica de Inicio de App
   // =======================================================
@@ -501,7 +792,7 @@ document.addEventListener("DOMContentLoaded", () => {
         mainContainer.style.display = "flex";
         // No tenemos el email, pero podemos poner un mensaje genérico
         authStatus.textContent = `Autenticado (sesión recuperada)`;
-        initializeApp(); // Carga la app (dropdowns, etc.)
+        connectChanges(); // Carga la app (dropdowns, etc.) al conectar con el feed
       } else {
         // 5. El refresh token falló (expiró o es inválido)
         console.log("El refresh token falló. Se requiere login.");
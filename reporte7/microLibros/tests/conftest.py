@@ -0,0 +1,24 @@
+"""
+Pruebas de microLibros sin MySQL ni Redis: la caché usa MemoryBackend y
+loadtest/standin_db.py (sqlite) se registra como MySQLdb.
+
+    python -m pytest reporte7/microLibros/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), os.path.join(HERE, '..', '..', '..', 'loadtest')]
+
+import standin_db  # noqa: E402
+
+standin_db.install()
+
+
+@pytest.fixture
+def db(tmp_path):
+    """BD sembrada nueva por prueba; devuelve las muestras de seed()."""
+    return standin_db.seed(str(tmp_path / 'libros.db'), books=20)
@@ -0,0 +1,98 @@
+import pytest
+
+from response_cache import MemoryBackend, RenderedCache, ResponseCache
+
+
+def book(isbn, title='T'):
+    return {'isbn': isbn, 'title': title}
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(MemoryBackend(), ttl=60)
+
+
+def loader(rows, calls):
+    def load():
+        calls.append(1)
+        return rows
+    return load
+
+
+def test_fetch_caches_until_invalidated(cache):
+    calls = []
+    assert cache.fetch(('isbn', 'A'), loader([book('A')], calls)) == [book('A')]
+    assert cache.fetch(('isbn', 'A'), loader([book('A')], calls)) == [book('A')]
+    assert len(calls) == 1
+    cache.invalidate(['A'])
+    cache.fetch(('isbn', 'A'), loader([book('A')], calls))
+    assert len(calls) == 2
+
+
+def test_invalidate_evicts_only_entries_with_that_isbn(cache):
+    cache.fetch(('all',), lambda: [book('A'), book('B')])
+    cache.fetch(('author', 'Ana'), lambda: [book('B')])
+    cache.fetch(('format', 'Ebook'), lambda: [book('C')])
+    cache.invalidate(['B'])
+    calls = []
+    cache.fetch(('all',), loader([book('A'), book('B')], calls))
+    cache.fetch(('author', 'Ana'), loader([book('B')], calls))
+    cache.fetch(('format', 'Ebook'), loader([book('C')], calls))
+    assert len(calls) == 2
+
+
+def test_empty_or_failed_results_are_not_cached(cache):
+    calls = []
+    cache.fetch(('author', 'Nadie'), loader([], calls))
+    cache.fetch(('author', 'Nadie'), loader(None, calls))
+    cache.fetch(('author', 'Nadie'), loader([], calls))
+    assert len(calls) == 3
+
+
+def test_fetch_many_loads_only_missing(cache):
+    cache.fetch_many('isbn', ['A'], lambda values: {v: [book(v)] for v in values})
+    asked = []
+    found = cache.fetch_many('isbn', ['A', 'B'], lambda values: asked.extend(values) or {'B': [book('B')]})
+    assert asked == ['B']
+    assert found == {'A': [book('A')], 'B': [book('B')]}
+
+
+def test_version_and_change_log(cache):
+    start = cache.catalog_version()
+    cache.invalidate(['A'])
+    cache.invalidate(['B', 'C'])
+    epoch = start.rpartition('-')[0]
+    assert cache.catalog_version() == f'{epoch}-2'
+    assert cache.changes_since(start) == (f'{epoch}-2', {'A', 'B', 'C'})
+    assert cache.changes_since(f'{epoch}-1') == (f'{epoch}-2', {'B', 'C'})
+    assert cache.changes_since('otro-0')[1] is None
+    assert cache.changes_since(None)[1] is None
+
+
+def test_write_during_query_is_not_cached(cache):
+    calls = []
+
+    def racing_load():
+        cache.invalidate(['A'])   # comando que confirma mientras corre la query
+        return [book('A', 'viejo')]
+
+    cache.fetch(('isbn', 'A'), racing_load)
+    cache.fetch(('isbn', 'A'), loader([book('A', 'nuevo')], calls))
+    assert len(calls) == 1
+
+
+def test_rendered_cache_ignores_older_versions():
+    rendered = RenderedCache()
+    rendered.put('e-2', 'k', b'nuevo', 'application/xml')
+    assert rendered.put('e-1', 'k', b'viejo', 'application/xml')[0] == b'viejo'
+    assert rendered.get('e-2', 'k')[0] == b'nuevo'
+    rendered.put('e-3', 'k2', b'otro', 'application/xml')
+    assert rendered.get('e-2', 'k') is None
+
+
+def test_invalidate_matches_isbn_case_insensitively(cache):
+    cache.fetch(('all',), lambda: [book('123X')])
+    cache.invalidate(['123x'])
+    calls = []
+    cache.fetch(('all',), loader([book('123X')], calls))
+    assert len(calls) == 1
@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_cors')
+pytest.importorskip('jwt')
+
+import MySQLdb  # noqa: E402
+
+import microserviciosCQRS as service  # noqa: E402
+
+
+def first_book():
+    conn = MySQLdb.connect()
+    cur = conn.cursor(MySQLdb.cursors.DictCursor)
+    cur.execute(service.CATALOG_QUERY.format(where="") + "ORDER BY b.isbn LIMIT 1")
+    row = cur.fetchone()
+    cur.close(); conn.close()
+    return row
+
+
+def test_search_without_index_falls_back_to_mysql(db):
+    book = first_book()
+    word = book['title'].split()[-1]
+    last_name = book['authors'].split(',')[0].split()[-1]
+    rows = service.handle_search_books_query(f"{word.lower()} {last_name[:3]}", 5)
+    assert book['isbn'] in [r['isbn'] for r in rows]
+    assert all(r['authors'] for r in rows)
+    assert service.handle_search_books_query("zzz_%", 5) == []
+
+
+def test_search_ranks_title_matches_first(db):
+    book = first_book()
+    word = book['title'].split()[-1]
+    rows = service.handle_search_books_query(word, 20)
+    in_title = [word.lower() in r['title'].lower() for r in rows]
+    assert in_title == sorted(in_title, reverse=True)
+
+
+def test_suggest_authors_without_index_matches_word_prefixes(db):
+    name = first_book()['authors'].split(',')[0]
+    first, *_, last = name.split()
+    names = service.handle_suggest_authors_query(f"{first[:3]} {last[:3]}", 10)
+    assert name in names
+    assert service.handle_suggest_authors_query("!", 10) == []
@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_cors')
+pytest.importorskip('jwt')
+
+import microserviciosCQRS as service  # noqa: E402
+
+STATUS_ROUTES = ['/api/books/changes/status', '/api/cache/status', '/api/catalog/status',
+                 '/api/replicas/status']
+
+
+@pytest.mark.parametrize('route', STATUS_ROUTES)
+def test_status_routes_require_token(route):
+    with service.app.test_client() as client:
+        response = client.get(route)
+    assert response.status_code == 401
+    assert b'Token es requerido' in response.data
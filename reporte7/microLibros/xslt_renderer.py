@@ -0,0 +1,117 @@
+"""
+Renderizado XSLT en el servidor con la hoja compilada en caché.
+
+En lugar de que el navegador descargue el XML y aplique /libros.xsl,
+?render=html aplica la hoja aquí con lxml. El objeto XSLT compilado se
+guarda en memoria y se recompila solo si el fichero cambia (mtime o
+tamaño, comprobados como mucho cada check_interval segundos).
+current_signature() identifica la hoja compilada (CRC32 de su contenido)
+para que los ETag y la caché del HTML cambien con ella.
+
+lxml es una dependencia opcional: sin ella `available` es False y el
+servicio sigue sirviendo XML.
+"""
+
+import os
+import threading
+import time
+import zlib
+
+try:
+    from lxml import etree
+except ImportError:  # dependencia opcional
+    etree = None
+
+
+class XsltRenderer:
+    """
+    Aplica una hoja XSLT compilada y cacheada.
+
+    Args:
+        path: Ruta del fichero .xsl
+        check_interval: Segundos entre comprobaciones de cambios del fichero
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._transform = None
+        self._signature = None
+        self._tag = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'renders': 0, 'compiles': 0, 'parse_ms': 0.0,
+                       'transform_ms': 0.0, 'serialize_ms': 0.0}
+
+    @property
+    def available(self):
+        return etree is not None
+
+    def _get_transform(self):
+        """XSLT compilado, recompilado si el fichero cambió desde la última comprobación."""
+        now = time.monotonic()
+        if self._transform is not None and now - self._checked_at < self.check_interval:
+            return self._transform
+        with self._lock:
+            st = os.stat(self.path)
+            signature = (st.st_mtime_ns, st.st_size)
+            if self._transform is None or signature != self._signature:
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+                self._transform = etree.XSLT(etree.fromstring(data, base_url=self.path))
+                self._signature = signature
+                self._tag = f"{zlib.crc32(data):08x}"
+                self._stats['compiles'] += 1
+            self._checked_at = now
+            return self._transform
+
+    def current_signature(self):
+        """
+        Firma de la hoja que se está aplicando (None sin lxml); puede
+        recompilarla si el fichero cambió.
+        """
+        if not self.available:
+            return None
+        self._get_transform()
+        return self._tag
+
+    def warm(self):
+        """Compila la hoja por adelantado (arranque de cada worker)."""
+        if self.available:
+            self._get_transform()
+
+    def render(self, xml_bytes):
+        """
+        Transforma un documento XML.
+
+        Returns:
+            (html, timings): bytes del HTML y {'parse', 'transform',
+            'serialize'} en milisegundos
+
+        Raises:
+            etree.Error: Si el XML o la hoja no son válidos
+        """
+        transform = self._get_transform()
+        t0 = time.perf_counter()
+        doc = etree.fromstring(xml_bytes)
+        t1 = time.perf_counter()
+        result = transform(doc)
+        t2 = time.perf_counter()
+        html = bytes(result)
+        t3 = time.perf_counter()
+        timings = {'parse': (t1 - t0) * 1000, 'transform': (t2 - t1) * 1000,
+                   'serialize': (t3 - t2) * 1000}
+        with self._lock:
+            self._stats['renders'] += 1
+            for phase, ms in timings.items():
+                self._stats[f'{phase}_ms'] += ms
+        return html, timings
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        renders = data['renders'] or 1
+        for phase in ('parse', 'transform', 'serialize'):
+            data[f'avg_{phase}_ms'] = round(data[f'{phase}_ms'] / renders, 3)
+        data.update({'available': self.available, 'path': self.path, 'signature': self._tag})
+        return data